@@ -8,6 +8,9 @@ import sqlite3
 import os
 import json
 
+from mondrian.job_results import ensure_results_schema
+from mondrian.query_indexes import ensure_query_indexes
+
 def migrate_database(db_path):
     """Apply migrations to existing database."""
     print(f"Applying migrations to: {db_path}")
@@ -27,6 +30,12 @@ def migrate_database(db_path):
     else:
         print("  ✓ enable_rag column already exists")
 
+    created = ensure_query_indexes(conn)
+    print(f"  ✓ Query indexes in place ({len(created)} created)")
+
+    ensure_results_schema(conn)
+    print("  ✓ Job results tables in place (move old payloads: python scripts/migrate_job_results.py)")
+
     conn.close()
     print("Migration complete!")
 
@@ -135,6 +144,10 @@ def init_database(db_path):
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_focus_areas_advisor_id ON focus_areas(advisor_id)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_advisor_usage_advisor_id ON advisor_usage(advisor_id)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_advisor_usage_last_used ON advisor_usage(last_used)')
+    ensure_query_indexes(conn)
+
+    # Job result payloads (see mondrian/job_results.py)
+    ensure_results_schema(conn)
 
     # Populate initial advisor data if advisors table is empty
     cursor.execute('SELECT COUNT(*) FROM advisors')
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Advisor Artifact Cache
+
+Process-wide cache for the per-advisor artifacts every analysis needs
+(system prompt, advisor row, disclaimer, top reference images, top book
+passages). These only change when an admin script runs, so the hot path
+serves them from memory instead of opening a SQLite connection per lookup.
+
+Change detection:
+  1. A persistent connection polls PRAGMA data_version, which moves whenever
+     another connection commits to the database (at most once per
+     CHECK_INTERVAL_SECONDS, so steady-state requests do no SQLite work).
+  2. Because job status writes also move data_version, the cache is only
+     cleared when advisor_artifacts_version - bumped by triggers on config,
+     advisors, dimensional_profiles and book_passages - has changed.
+  3. POST /cache/invalidate clears everything explicitly.
+"""
+
+import copy
+import sqlite3
+import threading
+import time
+import logging
+from typing import Any, Callable, Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+CHECK_INTERVAL_SECONDS = 1.0
+
+# Tables whose writes invalidate cached artifacts
+TRACKED_TABLES = ('config', 'advisors', 'dimensional_profiles', 'book_passages')
+
+VERSION_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS advisor_artifacts_version (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL DEFAULT 0
+    )
+"""
+
+TRIGGER_SQL = """
+    CREATE TRIGGER IF NOT EXISTS trg_advisor_artifacts_{table}_{op_lower}
+    AFTER {op} ON {table}
+    BEGIN
+        UPDATE advisor_artifacts_version SET version = version + 1 WHERE id = 1;
+    END
+"""
+
+
+def ensure_artifact_version_tracking(conn: sqlite3.Connection):
+    """Create the version row and triggers on the tracked tables that exist."""
+    existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    conn.execute(VERSION_TABLE_SQL)
+    conn.execute("INSERT OR IGNORE INTO advisor_artifacts_version (id, version) VALUES (1, 0)")
+    for table in TRACKED_TABLES:
+        if table not in existing:
+            continue
+        for op in ('INSERT', 'UPDATE', 'DELETE'):
+            conn.execute(TRIGGER_SQL.format(table=table, op=op, op_lower=op.lower()))
+    conn.commit()
+
+
+class AdvisorArtifactCache:
+    """Memoizes loader results until the tracked tables change."""
+
+    def __init__(self, db_path: str, check_interval: float = CHECK_INTERVAL_SECONDS):
+        """
+        Args:
+            db_path: SQLite database holding config/advisors/profiles/passages
+            check_interval: Minimum seconds between change checks
+        """
+        self.db_path = db_path
+        self.check_interval = check_interval
+        self._entries: Dict[Hashable, Any] = {}
+        self._lock = threading.RLock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._data_version = None
+        self._artifact_version = None
+        self._last_check = 0.0
+        # Bumped on every clear so a load racing an invalidation is not stored
+        self._generation = 0
+        self.stats = {'hits': 0, 'misses': 0, 'invalidations': 0, 'checks': 0}
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=5)
+            try:
+                ensure_artifact_version_tracking(self._conn)
+            except sqlite3.Error as e:
+                logger.warning(f"[AdvisorCache] Version triggers unavailable ({e}); relying on data_version")
+        return self._conn
+
+    def _read_versions(self):
+        conn = self._connect()
+        data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self._data_version and self._artifact_version is not None:
+            return data_version, self._artifact_version
+        try:
+            row = conn.execute("SELECT version FROM advisor_artifacts_version WHERE id = 1").fetchone()
+            artifact_version = row[0] if row else None
+        except sqlite3.Error:
+            # No version row: any commit to the database invalidates
+            artifact_version = ('data_version', data_version)
+        return data_version, artifact_version
+
+    def _check(self):
+        """Clear entries if tracked tables changed (throttled)."""
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return
+        self._last_check = now
+        self.stats['checks'] += 1
+        try:
+            data_version, artifact_version = self._read_versions()
+        except sqlite3.Error as e:
+            logger.warning(f"[AdvisorCache] Change check failed: {e}")
+            return
+        if self._artifact_version is not None and artifact_version != self._artifact_version:
+            logger.info(f"[AdvisorCache] Advisor data changed (version {artifact_version}) - clearing {len(self._entries)} entries")
+            self._entries.clear()
+            self._generation += 1
+            self.stats['invalidations'] += 1
+        self._data_version = data_version
+        self._artifact_version = artifact_version
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """
+        Return the cached value for key, calling loader on a miss.
+
+        Empty results (None, [], {}) are not cached, so a transient database
+        error inside a loader is retried on the next request. Values are
+        deep-copied on the way out because callers annotate them in place.
+        """
+        with self._lock:
+            self._check()
+            if key in self._entries:
+                self.stats['hits'] += 1
+                return copy.deepcopy(self._entries[key])
+            self.stats['misses'] += 1
+            generation = self._generation
+
+        value = loader()
+        if value:
+            with self._lock:
+                if generation == self._generation:
+                    self._entries[key] = value
+        return copy.deepcopy(value)
+
+    def invalidate(self, advisor_id: Optional[str] = None) -> int:
+        """
+        Drop cached entries (all, or only those for one advisor).
+
+        Keys are tuples of (kind, advisor_id, ...) for advisor-scoped artifacts.
+
+        Returns:
+            Number of entries removed
+        """
+        with self._lock:
+            if advisor_id is None:
+                removed = len(self._entries)
+                self._entries.clear()
+            else:
+                keys = [k for k in self._entries
+                        if isinstance(k, tuple) and len(k) > 1 and k[0] != 'config' and k[1] == advisor_id]
+                for k in keys:
+                    del self._entries[k]
+                removed = len(keys)
+            self._generation += 1
+            self.stats['invalidations'] += 1
+            # Force a fresh version read on the next lookup
+            self._last_check = 0.0
+        logger.info(f"[AdvisorCache] Invalidated {removed} entries" + (f" for advisor '{advisor_id}'" if advisor_id else ""))
+        return removed
+
+    def artifact_version(self) -> Hashable:
+        """
+        Token that changes when the tracked tables change or the cache is
+        invalidated (as of the last throttled check) - for artifacts derived
+        from the same tables but held elsewhere, e.g. the passage index.
+        """
+        with self._lock:
+            self._check()
+            return (self._generation, self._artifact_version)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+            stats['entries'] = len(self._entries)
+            stats['artifact_version'] = self._artifact_version
+        return stats
+
+
+_caches: Dict[str, AdvisorArtifactCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_artifact_cache(db_path: str) -> AdvisorArtifactCache:
+    """The process-wide artifact cache for db_path (created on first use)."""
+    with _caches_lock:
+        cache = _caches.get(db_path)
+        if cache is None:
+            cache = _caches[db_path] = AdvisorArtifactCache(db_path)
+        return cache
@@ -44,7 +44,21 @@ from mondrian.rag_retrieval import (
     get_user_dimensional_profile,
     get_images_with_embedding_retrieval,
     augment_prompt_with_rag_context,
-    augment_prompt_for_pass2
+    augment_prompt_for_pass2,
+    refresh_dimension_exemplars
+)
+from mondrian.db_pool import db_connection
+from mondrian.embedding_cache import get_embedding_cache
+from mondrian.advisor_cache import get_artifact_cache
+from mondrian.embedding_index import get_index_stats, set_embedding_quantization
+from mondrian.embedding_retrieval import set_hybrid_weights, set_clip_backend
+from mondrian.generation_progress import generation_tracker, progress_stopping_criteria
+from mondrian.model_registry import DEVICE_HEADROOM_GB, configure_model_registry, get_model_registry, module_nbytes
+from mondrian.rag_context_builder import (
+    RAGContextBuilder,
+    DEFAULT_MAX_CONTEXT_TOKENS,
+    render_quote_segment,
+    render_image_segment
 )
 
 import torch
@@ -68,6 +82,9 @@ logger = setup_service_logging('ai_advisor_service_linux')
 # Enable/disable reference images and advisor quotes in analysis
 ENABLE_CITATIONS = True  # Set to False to disable citation retrieval and display
 
+# Rank book passages per image (semantic index) instead of by static relevance_score
+SEMANTIC_PASSAGES = True
+
 
 # ============================================================================
 # Database Helper Functions
@@ -76,11 +93,8 @@ ENABLE_CITATIONS = True  # Set to False to disable citation retrieval and displa
 def get_config(db_path: str, key: str) -> Optional[str]:
     """Get a configuration value from the database config table"""
     try:
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT value FROM config WHERE key=?", (key,))
-        row = cursor.fetchone()
-        conn.close()
+        with db_connection(db_path) as conn:
+            row = conn.execute("SELECT value FROM config WHERE key=?", (key,)).fetchone()
         if row:
             value = row[0]
             if isinstance(value, bytes):
@@ -95,12 +109,8 @@ def get_config(db_path: str, key: str) -> Optional[str]:
 def get_advisor_from_db(db_path: str, advisor_id: str) -> Optional[Dict[str, Any]]:
     """Get advisor data from database advisors table"""
     try:
-        conn = sqlite3.connect(db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM advisors WHERE id = ?", (advisor_id,))
-        row = cursor.fetchone()
-        conn.close()
+        with db_connection(db_path, row_factory=sqlite3.Row) as conn:
+            row = conn.execute("SELECT * FROM advisors WHERE id = ?", (advisor_id,)).fetchone()
         if row:
             return dict(row)
         return None
@@ -111,7 +121,7 @@ def get_advisor_from_db(db_path: str, advisor_id: str) -> Optional[Dict[str, Any
 
 def get_disclaimer_text(db_path: str) -> str:
     """Get disclaimer text from database config, with fallback to default"""
-    disclaimer = get_config(db_path, "disclaimer")
+    disclaimer = cached_config("disclaimer") if db_path == DB_PATH else get_config(db_path, "disclaimer")
     if disclaimer:
         return disclaimer
     
@@ -119,6 +129,46 @@ def get_disclaimer_text(db_path: str) -> str:
     return """These recommendations are generated by AI and should be used as creative guidance. Individual artistic interpretation may vary."""
 
 
+# Prompt/RAG artifacts only change when admin scripts write the database
+advisor_artifact_cache = get_artifact_cache(DB_PATH)
+
+
+def cached_config(key: str) -> Optional[str]:
+    """get_config(DB_PATH, key) served from the advisor artifact cache"""
+    return advisor_artifact_cache.get_or_load(('config', key), lambda: get_config(DB_PATH, key))
+
+
+def cached_advisor(advisor_id: str) -> Optional[Dict[str, Any]]:
+    """get_advisor_from_db(DB_PATH, advisor_id) served from the advisor artifact cache"""
+    return advisor_artifact_cache.get_or_load(
+        ('advisor', advisor_id), lambda: get_advisor_from_db(DB_PATH, advisor_id)
+    )
+
+
+def cached_top_reference_images(advisor_id: str, max_total: int = 10) -> List[Dict[str, Any]]:
+    """get_top_reference_images served from the advisor artifact cache"""
+    return advisor_artifact_cache.get_or_load(
+        ('reference_images', advisor_id, max_total),
+        lambda: get_top_reference_images(DB_PATH, advisor_id, max_total=max_total)
+    )
+
+
+def cached_top_book_passages(advisor_id: str, max_passages: int = 6) -> List[Dict[str, Any]]:
+    """get_top_book_passages served from the advisor artifact cache"""
+    from mondrian.embedding_retrieval import cached_top_book_passages as cached_passages
+    return cached_passages(advisor_id, max_passages=max_passages, db_path=DB_PATH)
+
+
+def book_passages_for_image(advisor_id: str, image_path: str, max_passages: int = 6) -> List[Dict[str, Any]]:
+    """Book passages ranked for this image (static cached ordering when SEMANTIC_PASSAGES is off)"""
+    if not SEMANTIC_PASSAGES:
+        return cached_top_book_passages(advisor_id, max_passages=max_passages)
+    from mondrian.embedding_retrieval import get_book_passages_for_image
+    return get_book_passages_for_image(
+        advisor_id, user_image_path=image_path, max_passages=max_passages, db_path=DB_PATH
+    )
+
+
 class QwenAdvisor:
     """AI Advisor using Qwen2-VL or Qwen3-VL models with LoRA adapter"""
     
@@ -129,7 +179,8 @@ class QwenAdvisor:
     def __init__(self, model_name: str = "Qwen/Qwen2-VL-7B-Instruct", 
                  load_in_4bit: bool = True, device: Optional[str] = None,
                  adapter_path: Optional[str] = None, generation_config: Optional[Dict] = None,
-                 backend: str = 'bnb', max_ref_images: int = None, max_ref_quotes: int = None):
+                 backend: str = 'bnb', max_ref_images: int = None, max_ref_quotes: int = None,
+                 max_context_tokens: int = None):
         """
         Initialize Qwen advisor with specified configuration
         
@@ -142,6 +193,7 @@ class QwenAdvisor:
             backend: Inference backend ('bnb', 'vllm', 'awq')
             max_ref_images: Maximum reference images per response (from config)
             max_ref_quotes: Maximum reference quotes per response (from config)
+            max_context_tokens: Token budget for RAG reference materials (from config)
         """
         self.model_name = model_name
         self.load_in_4bit = load_in_4bit
@@ -199,6 +251,14 @@ class QwenAdvisor:
         self.model = None
         self.processor = None
         self._load_model()
+        self._register_models()
+        
+        # Token-budget-aware packing of RAG candidates (uses the loaded tokenizer)
+        self.rag_context_builder = RAGContextBuilder(
+            tokenizer=self.processor.tokenizer,
+            max_context_tokens=max_context_tokens or DEFAULT_MAX_CONTEXT_TOKENS
+        )
+        logger.info(f"RAG context budget: {self.rag_context_builder.max_context_tokens} tokens")
     
     def _log_gpu_info(self):
         """Log GPU information"""
@@ -343,6 +403,16 @@ class QwenAdvisor:
             logger.warning("Continuing with base model only")
             raise
     
+    def _register_models(self):
+        """Record the (pinned) Qwen model and LoRA adapter in the process-wide model registry"""
+        registry = get_model_registry()
+        total = module_nbytes(self.model)
+        adapter = module_nbytes(self.model, name_filter=lambda name: 'lora_' in name) if self.adapter_path else None
+        if adapter and (adapter['device'] or adapter['host']):
+            registry.register(f"adapter:{self.adapter_path}", None, device=self.device, nbytes=adapter)
+            total = {kind: total[kind] - adapter[kind] for kind in total}
+        registry.register(f"advisor:{self.model_name}", self.model, device=self.device, nbytes=total)
+    
     # NOTE: RAG retrieval methods moved to mondrian/rag_retrieval.py
     # Use module functions: deduplicate_reference_images, get_best_image_per_dimension, 
     # compute_visual_relevance, compute_case_studies, get_user_dimensional_profile,
@@ -396,52 +466,7 @@ class QwenAdvisor:
             Dict mapping dimension name to best image for that dimension
             e.g., {'composition': {...}, 'lighting': {...}, ...}
         """
-        try:
-            conn = sqlite3.connect(DB_PATH)
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            
-            result = {}
-            
-            for dim_name in DIMENSIONS:
-                db_column = DIMENSION_TO_DB_COLUMN.get(dim_name)
-                if not db_column:
-                    continue
-                
-                # Get the single best image for this dimension (score >= 8.0, ordered by score DESC)
-                query = f"""
-                    SELECT id, image_path, composition_score, lighting_score, 
-                           focus_sharpness_score, color_harmony_score,
-                           subject_isolation_score, depth_perspective_score,
-                           visual_balance_score, emotional_impact_score,
-                           overall_grade, image_description, image_title, date_taken, embedding
-                    FROM dimensional_profiles
-                    WHERE advisor_id = ?
-                      AND {db_column} >= 8.0
-                      AND {db_column} IS NOT NULL
-                    ORDER BY {db_column} DESC
-                    LIMIT 1
-                """
-                
-                cursor.execute(query, (advisor_id,))
-                row = cursor.fetchone()
-                
-                if row:
-                    img_dict = dict(row)
-                    # Don't include raw embedding in dict to avoid log clutter
-                    if 'embedding' in img_dict:
-                        img_dict['has_embedding'] = img_dict['embedding'] is not None
-                        del img_dict['embedding']
-                    result[dim_name] = img_dict
-            
-            conn.close()
-            
-            logger.info(f"[CaseStudy] Retrieved best images for {len(result)}/{len(DIMENSIONS)} dimensions")
-            return result
-            
-        except Exception as e:
-            logger.error(f"Failed to retrieve best images per dimension: {e}")
-            return {}
+        return get_best_image_per_dimension(DB_PATH, advisor_id)
 
     def _compute_visual_relevance(self, user_image_path: str, ref_image_path: str) -> float:
         """
@@ -607,23 +632,17 @@ class QwenAdvisor:
             Dictionary of dimensional scores, or None if not found
         """
         try:
-            conn = sqlite3.connect(DB_PATH)
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            
             # Get most recent profile for this image
-            cursor.execute("""
-                SELECT composition_score, lighting_score, focus_sharpness_score,
-                       color_harmony_score, subject_isolation_score, depth_perspective_score,
-                       visual_balance_score, emotional_impact_score
-                FROM dimensional_profiles
-                WHERE image_path = ?
-                ORDER BY created_at DESC
-                LIMIT 1
-            """, (image_path,))
-            
-            row = cursor.fetchone()
-            conn.close()
+            with db_connection(DB_PATH, row_factory=sqlite3.Row) as conn:
+                row = conn.execute("""
+                    SELECT composition_score, lighting_score, focus_sharpness_score,
+                           color_harmony_score, subject_isolation_score, depth_perspective_score,
+                           visual_balance_score, emotional_impact_score
+                    FROM dimensional_profiles
+                    WHERE image_path = ?
+                    ORDER BY created_at DESC
+                    LIMIT 1
+                """, (image_path,)).fetchone()
             
             if not row:
                 return None
@@ -714,13 +733,13 @@ class QwenAdvisor:
         """Create analysis prompt by loading from database"""
         
         # Load system prompt from config table
-        system_prompt = get_config(DB_PATH, "system_prompt")
+        system_prompt = cached_config("system_prompt")
         if not system_prompt:
             logger.warning("No system_prompt in database, using default")
             system_prompt = self._get_default_system_prompt()
         
         # Load advisor-specific prompt from advisors table
-        advisor_data = get_advisor_from_db(DB_PATH, advisor)
+        advisor_data = cached_advisor(advisor)
         advisor_prompt = ""
         if advisor_data and advisor_data.get('prompt'):
             advisor_prompt = advisor_data['prompt']
@@ -848,13 +867,20 @@ Provide ONLY the JSON above with your scores. No explanations, no comments."""
         # Generate response with timing
         inference_start = time.time()
         logger.info(f"[{job_id}] [_run_inference] Starting generation...")
-        with torch.no_grad():
-            output_ids = self.model.generate(
-                **inputs, 
-                **gen_config,
-                use_cache=True,
-                eos_token_id=self.processor.tokenizer.eos_token_id
-            )
+        generation_tracker.start(job_id)
+        try:
+            with torch.no_grad():
+                output_ids = self.model.generate(
+                    **inputs, 
+                    **gen_config,
+                    use_cache=True,
+                    eos_token_id=self.processor.tokenizer.eos_token_id,
+                    stopping_criteria=progress_stopping_criteria(generation_tracker, job_id)
+                )
+            if generation_tracker.cancelled(job_id):
+                raise RuntimeError(f"Generation for job {job_id} was cancelled (taken over by another worker)")
+        finally:
+            generation_tracker.finish(job_id)
         inference_time = time.time() - inference_start
         
         # Decode only the generated tokens (exclude input prompt)
@@ -908,9 +934,7 @@ Provide ONLY the JSON above with your scores. No explanations, no comments."""
             
             if ENABLE_CITATIONS:
                 try:
-                    reference_images = get_top_reference_images(
-                        DB_PATH, advisor, max_total=10
-                    )
+                    reference_images = cached_top_reference_images(advisor, max_total=10)
                     if reference_images is None:
                         raise RuntimeError("get_top_reference_images returned None")
                     logger.info(f"[{job_id}] [Single-Pass] Retrieved {len(reference_images)} reference image candidates")
@@ -920,13 +944,9 @@ Provide ONLY the JSON above with your scores. No explanations, no comments."""
                 
                 # Get top book passages across ALL dimensions
                 try:
-                    from mondrian.embedding_retrieval import get_top_book_passages
-                    book_passages = get_top_book_passages(
-                        advisor_id=advisor,
-                        max_passages=6
-                    )
+                    book_passages = book_passages_for_image(advisor, image_path, max_passages=6)
                     if book_passages is None:
-                        raise RuntimeError("get_top_book_passages returned None")
+                        raise RuntimeError("book_passages_for_image returned None")
                     logger.info(f"[{job_id}] [Single-Pass] Retrieved {len(book_passages)} quote candidates")
                 except Exception as e:
                     logger.error(f"[{job_id}] FAILED to retrieve book passages: {e}")
@@ -939,13 +959,21 @@ Provide ONLY the JSON above with your scores. No explanations, no comments."""
             # =================================================================
             logger.info("[Single-Pass] === Building RAG-Augmented Prompt ===")
             
-            # Build augmented prompt with all RAG context
+            # Pack candidates into the token budget, then build augmented prompt
             full_prompt = self._create_prompt(advisor, mode)
+            reference_images, book_passages, rag_context_stats = self._pack_rag_context(
+                advisor, full_prompt, reference_images, book_passages, job_id=job_id
+            )
             full_prompt = self._build_rag_prompt(
                 full_prompt, 
                 reference_images, 
                 book_passages
             )
+            rag_context_stats['prompt_tokens_after'] = self.rag_context_builder.count_tokens(full_prompt)
+            logger.info(
+                f"[{job_id}] [Single-Pass] Prompt tokens: {rag_context_stats['prompt_tokens_before']} -> "
+                f"{rag_context_stats['prompt_tokens_after']} after packing"
+            )
             
             # =================================================================
             # INFERENCE: Single pass with full context
@@ -970,6 +998,9 @@ Provide ONLY the JSON above with your scores. No explanations, no comments."""
                 'images': len(reference_images),
                 'quotes': len(book_passages)
             }
+            analysis['rag_context'] = rag_context_stats
+            analysis['prompt_tokens_before'] = rag_context_stats['prompt_tokens_before']
+            analysis['prompt_tokens_after'] = rag_context_stats['prompt_tokens_after']
             
             return analysis
             
@@ -978,6 +1009,31 @@ Provide ONLY the JSON above with your scores. No explanations, no comments."""
             logger.error(traceback.format_exc())
             raise
     
+    def _pack_rag_context(self, advisor: str, prompt: str, reference_images: List[Dict],
+                          book_passages: List[Dict], job_id: str = "unknown"):
+        """
+        Pack RAG candidates into the configured token budget.
+
+        Args:
+            advisor: Advisor ID (segment token counts are cached per advisor)
+            prompt: Base prompt the RAG context will be appended to
+            reference_images: Candidate reference images
+            book_passages: Candidate book passages
+
+        Returns:
+            (reference_images, book_passages, stats) where stats includes
+            prompt_tokens_before (the prompt with every candidate, as built
+            without packing)
+        """
+        unpacked_prompt = self._build_rag_prompt(prompt, reference_images, book_passages)
+        prompt_tokens_before = self.rag_context_builder.count_tokens(unpacked_prompt)
+
+        packed_images, packed_passages, stats = self.rag_context_builder.pack(
+            advisor, reference_images, book_passages
+        )
+        stats['prompt_tokens_before'] = prompt_tokens_before
+        return packed_images, packed_passages, stats
+
     def _build_rag_prompt(self, prompt: str, reference_images: List[Dict], 
                           book_passages: List[Dict]) -> str:
         """
@@ -993,19 +1049,7 @@ Provide ONLY the JSON above with your scores. No explanations, no comments."""
             rag_context += "You may cite UP TO 3 of these quotes total across all dimensions. Each dimension may cite ONE quote maximum. Never reuse quote IDs.\n\n"
             
             for idx, passage in enumerate(book_passages, 1):
-                book_title = passage['book_title']
-                text = passage['passage_text']
-                dims = passage['dimensions']
-                quote_id = f"QUOTE_{idx}"
-                
-                # Truncate to 75 words for preview
-                words = text.split()
-                preview = ' '.join(words[:75])
-                if len(words) > 75:
-                    preview += "..."
-                
-                rag_context += f"[{quote_id}] From \"{book_title}\" (relevant to: {', '.join(dims)})\n"
-                rag_context += f'  "{preview}"\n\n'
+                rag_context += render_quote_segment(f"QUOTE_{idx}", passage)
             
             rag_context += "**CITATION INSTRUCTION:** To cite a quote, include its ID in your JSON response: `\"quote_id\": \"QUOTE_1\"`\n"
             rag_context += "Cite ONLY when the quote directly supports your specific feedback for that dimension.\n"
@@ -1016,29 +1060,7 @@ Provide ONLY the JSON above with your scores. No explanations, no comments."""
             rag_context += "You may cite UP TO 3 of these images total across all dimensions. Each dimension may cite ONE image maximum. Never reuse image IDs.\n\n"
             
             for idx, img in enumerate(reference_images, 1):
-                img_title = img.get('image_title') or img.get('image_path', '').split('/')[-1]
-                year = img.get('date_taken', '')
-                location = img.get('location', '')
-                img_id = f"IMG_{idx}"
-                
-                # Get all dimension scores >= 8.0
-                strong_dims = []
-                for dim in ['composition', 'lighting', 'focus_sharpness', 'color_harmony', 
-                           'subject_isolation', 'depth_perspective', 'visual_balance', 'emotional_impact']:
-                    score = img.get(f"{dim}_score", 0)
-                    if score and score >= 8.0:
-                        dim_display = dim.replace('_', ' ').title()
-                        strong_dims.append(f"{dim_display}={score:.1f}")
-                
-                rag_context += f"[{img_id}] \"{img_title}\" ({year})\n"
-                if location:
-                    rag_context += f"  Location: {location}\n"
-                    
-                # Show what this image teaches (dimensions >= 8.0)
-                if strong_dims:
-                    rag_context += f"  📸 Master-level in: {', '.join(strong_dims)}\n"
-                    rag_context += f"  💡 When citing this image: Explain the SPECIFIC TECHNIQUE that creates this excellence and HOW the user can apply it.\n"
-                    rag_context += f"     Example: Don't say 'good composition' - say 'three-plane depth with foreground anchor'\n"
+                rag_context += render_image_segment(f"IMG_{idx}", img)
                 rag_context += "\n"
             
             rag_context += "**WHEN YOU CITE AN IMAGE (case_study_id):**\n"
@@ -1567,7 +1589,7 @@ Required JSON Structure:
             }
         
         # Load advisor data from database for bio
-        advisor_data = get_advisor_from_db(DB_PATH, advisor)
+        advisor_data = cached_advisor(advisor)
         
         # Extract weak dimensions from analysis and retrieve targeted reference images
         weak_dimension_indices = []
@@ -1708,14 +1730,29 @@ loading_status = {
     'message': 'Not started'
 }
 
-def init_advisor(model_name: str, load_in_4bit: bool, adapter_path: Optional[str] = None, generation_config: Optional[Dict] = None, backend: str = 'bnb', rag_config: Optional[Dict] = None):
+def init_advisor(model_name: str, load_in_4bit: bool, adapter_path: Optional[str] = None, generation_config: Optional[Dict] = None, backend: str = 'bnb', rag_config: Optional[Dict] = None, memory_config: Optional[Dict] = None):
     """Initialize the advisor service"""
-    global advisor, loading_status
+    global advisor, loading_status, SEMANTIC_PASSAGES
     try:
         loading_status['started'] = True
         loading_status['message'] = f'Loading model {model_name}...'
         loading_status['progress'] = 10
         
+        memory_config = memory_config or {}
+        configure_model_registry(
+            device_budget_gb=memory_config.get('device_budget_gb'),
+            host_budget_gb=memory_config.get('host_budget_gb'),
+            device_headroom_gb=memory_config.get('device_headroom_gb', DEVICE_HEADROOM_GB)
+        )
+        if rag_config and rag_config.get('embedding_quantization'):
+            set_embedding_quantization(rag_config['embedding_quantization'])
+        if rag_config and 'semantic_passages' in rag_config:
+            SEMANTIC_PASSAGES = bool(rag_config['semantic_passages'])
+        if rag_config and 'hybrid_visual_weight' in rag_config:
+            set_hybrid_weights(rag_config['hybrid_visual_weight'], rag_config.get('hybrid_score_weight', 0.4))
+        if rag_config and 'clip_backend' in rag_config:
+            set_clip_backend(rag_config['clip_backend'], rag_config.get('clip_onnx_int8', False))
+        
         advisor = QwenAdvisor(
             model_name=model_name,
             load_in_4bit=load_in_4bit,
@@ -1723,7 +1760,8 @@ def init_advisor(model_name: str, load_in_4bit: bool, adapter_path: Optional[str
             generation_config=generation_config,
             backend=backend,
             max_ref_images=rag_config.get('max_reference_images') if rag_config else None,
-            max_ref_quotes=rag_config.get('max_reference_quotes') if rag_config else None
+            max_ref_quotes=rag_config.get('max_reference_quotes') if rag_config else None,
+            max_context_tokens=rag_config.get('max_context_tokens') if rag_config else None
         )
         
         loading_status['completed'] = True
@@ -1805,6 +1843,50 @@ def model_status():
         "using_gpu": advisor.device == 'cuda',
         "gpu_memory_total": torch.cuda.get_device_properties(0).total_memory / (1024**3) if advisor.device == 'cuda' else None,
         "gpu_memory_used": torch.cuda.memory_allocated(0) / (1024**3) if advisor.device == 'cuda' else None,
+        "model_memory": get_model_registry().get_stats(),
+        "embedding_cache": get_embedding_cache().get_stats(),
+        "embedding_indexes": get_index_stats(),
+        "advisor_cache": advisor_artifact_cache.get_stats(),
+        "timestamp": datetime.now().isoformat()
+    }), 200
+
+
+@app.route('/generation/<job_id>', methods=['GET'])
+def generation_status(job_id: str):
+    """Progress of a job's generation (polled by job workers to keep their lease)"""
+    progress = generation_tracker.get(job_id)
+    if progress is None:
+        return jsonify({"job_id": job_id, "active": False}), 404
+    return jsonify(progress), 200
+
+
+@app.route('/generation/<job_id>/cancel', methods=['POST'])
+def cancel_generation(job_id: str):
+    """Stop a job's generation at its next decoding step (a job worker took the job over)"""
+    if not generation_tracker.cancel(job_id):
+        return jsonify({"job_id": job_id, "active": False}), 404
+    logger.warning(f"[{job_id}] Generation cancelled by a job worker")
+    return jsonify(generation_tracker.get(job_id) or {"job_id": job_id, "active": False}), 202
+
+
+@app.route('/cache/invalidate', methods=['POST'])
+def cache_invalidate():
+    """
+    Drop cached prompts and RAG artifacts after an admin change.
+    
+    Optional JSON body: {"advisor": "ansel"} to drop only that advisor's entries
+    (and rebuild only that advisor's case-study exemplars).
+    """
+    data = request.get_json(silent=True) or {}
+    advisor_id = data.get('advisor') or request.args.get('advisor')
+    removed = advisor_artifact_cache.invalidate(advisor_id)
+    # Case-study exemplars are rebuilt here and by the indexing scripts, never per request
+    exemplars = refresh_dimension_exemplars(DB_PATH, advisor_id)
+    return jsonify({
+        "status": "ok",
+        "advisor": advisor_id,
+        "removed": removed,
+        "exemplars": exemplars,
         "timestamp": datetime.now().isoformat()
     }), 200
 
@@ -1836,7 +1918,7 @@ def analyze():
         
         # Run analysis (always use single-pass)
         logger.info(f"[{job_id}] Analyzing image with advisor={advisor_name}, mode={mode_str}")
-        result = advisor.analyze_image(temp_path, advisor=advisor_name, mode=mode_str)
+        result = advisor.analyze_image(temp_path, advisor=advisor_name, mode=mode_str, job_id=job_id)
         
         # Clean up
         Path(temp_path).unlink()
@@ -1889,9 +1971,7 @@ def analyze_stream():
                 if ENABLE_CITATIONS:
                     # Get top reference images across ALL dimensions
                     try:
-                        reference_images = get_top_reference_images(
-                            DB_PATH, advisor_name, max_total=10
-                        )
+                        reference_images = cached_top_reference_images(advisor_name, max_total=10)
                         if reference_images is None:
                             raise RuntimeError("get_top_reference_images returned None")
                         logger.info(f"[Stream] Retrieved {len(reference_images)} reference image candidates")
@@ -1901,13 +1981,9 @@ def analyze_stream():
                     
                     # Get top book passages across ALL dimensions
                     try:
-                        from mondrian.embedding_retrieval import get_top_book_passages
-                        book_passages = get_top_book_passages(
-                            advisor_id=advisor_name,
-                            max_passages=6
-                        )
+                        book_passages = book_passages_for_image(advisor_name, temp_path, max_passages=6)
                         if book_passages is None:
-                            raise RuntimeError("get_top_book_passages returned None")
+                            raise RuntimeError("book_passages_for_image returned None")
                         logger.info(f"[Stream] Retrieved {len(book_passages)} quote candidates")
                     except Exception as e:
                         logger.error(f"[Stream] FAILED to retrieve book passages: {e}")
@@ -1918,7 +1994,10 @@ def analyze_stream():
                 # Create base analysis prompt
                 prompt = advisor._create_prompt(advisor_name, mode_str)
                 
-                # Build augmented prompt with all RAG context
+                # Pack candidates into the token budget, then build augmented prompt
+                reference_images, book_passages, rag_context_stats = advisor._pack_rag_context(
+                    advisor_name, prompt, reference_images, book_passages
+                )
                 prompt = advisor._build_rag_prompt(prompt, reference_images, book_passages)
                 
                 # Use chat template for proper image token handling
@@ -2022,6 +2101,10 @@ def analyze_stream():
                     book_passages=book_passages,
                     user_image_path=temp_path
                 )
+                rag_context_stats['prompt_tokens_after'] = advisor.rag_context_builder.count_tokens(prompt)
+                result['rag_context'] = rag_context_stats
+                result['prompt_tokens_before'] = rag_context_stats['prompt_tokens_before']
+                result['prompt_tokens_after'] = rag_context_stats['prompt_tokens_after']
                 
                 # =================================================================
                 # HTML GENERATION (mirroring non-streaming endpoint)
@@ -2030,7 +2113,7 @@ def analyze_stream():
                 dimensions = analysis_data.get('dimensions', [])
                 
                 # Load advisor data from database for bio
-                advisor_data = get_advisor_from_db(DB_PATH, advisor_name)
+                advisor_data = cached_advisor(advisor_name)
                 if not advisor_data:
                     raise RuntimeError(f"Failed to load advisor data for {advisor_name}")
                 
@@ -2171,6 +2254,7 @@ def main():
     # Load generation config from model_config.json
     generation_config = None
     rag_config = None
+    memory_config = None
     config_path = Path(__file__).parent.parent / 'model_config.json'
     if config_path.exists():
         try:
@@ -2188,7 +2272,8 @@ def main():
             # Load RAG config
             if 'rag' in config:
                 rag_config = config['rag']
-                logger.info(f"Loaded RAG config: max_images={rag_config.get('max_reference_images', 3)}, max_quotes={rag_config.get('max_reference_quotes', 3)}")
+                logger.info(f"Loaded RAG config: max_images={rag_config.get('max_reference_images', 3)}, max_quotes={rag_config.get('max_reference_quotes', 3)}, max_context_tokens={rag_config.get('max_context_tokens', DEFAULT_MAX_CONTEXT_TOKENS)}")
+            memory_config = config.get('memory')
         except Exception as e:
             logger.warning(f"Could not load model_config.json: {e}")
     
@@ -2216,7 +2301,7 @@ def main():
     # NOW load the model in the main thread
     try:
         logger.info("Loading model (this may take several minutes)...")
-        init_advisor(args.model, args.load_in_4bit, adapter_path=args.adapter, generation_config=generation_config, backend=args.backend, rag_config=rag_config)
+        init_advisor(args.model, args.load_in_4bit, adapter_path=args.adapter, generation_config=generation_config, backend=args.backend, rag_config=rag_config, memory_config=memory_config)
         
         # Keep the main thread alive
         flask_thread.join()
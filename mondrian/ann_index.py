@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Approximate Nearest-Neighbour (IVF) Index for Reference Embeddings
+
+Pure-NumPy inverted-file index used once an advisor's corpus is large enough
+that an exact scan stops being cheap. A spherical k-means coarse quantizer
+partitions the vectors into `nlist` cells; a query scans only the `nprobe`
+closest cells and scores those rows exactly.
+
+On-disk layout (one directory per advisor and embedding column):
+    embedding_indexes/<advisor>__<column>.ivf/
+        centroids.npy   (nlist, dim) float32
+        vectors.npy     (N, dim) float32, rows grouped by cell
+        ids.npy         (N,) dimensional_profiles.id, same order as vectors
+        offsets.npy     (nlist + 1,) int64 cell boundaries into vectors
+        meta.json       build parameters
+
+vectors.npy and ids.npy are memory-mapped at load time so service start-up
+does not read the whole index into RAM.
+
+Built by: python scripts/compute_embeddings.py --advisor ansel
+"""
+
+import json
+import shutil
+import time
+import logging
+from datetime import datetime
+from pathlib import Path
+from typing import Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Below this many rows the exact matmul is already sub-millisecond
+ANN_MIN_ROWS = 5000
+
+KMEANS_ITERATIONS = 12
+KMEANS_MAX_TRAIN = 50000
+ASSIGN_CHUNK = 16384
+
+
+def ann_index_path(db_path: str, advisor_id: str, column: str) -> Path:
+    """Directory holding the IVF index for an advisor/column pair."""
+    return Path(db_path).resolve().parent / 'embedding_indexes' / f"{advisor_id}__{column}.ivf"
+
+
+def default_nlist(n: int) -> int:
+    """Number of IVF cells for a corpus of n vectors (~sqrt(n))."""
+    return int(max(1, min(4096, round(np.sqrt(n)))))
+
+
+def default_nprobe(nlist: int) -> int:
+    """Cells scanned per query (~1/20 of cells, at least 8).
+
+    scripts/benchmark_ann_index.py on 100k clustered 512-d vectors: nprobe=16 of
+    316 cells gives recall@10 ~0.96 at ~6x lower latency than the exact scan.
+    """
+    return int(max(1, min(nlist, max(8, nlist // 20))))
+
+
+def _normalize(x: np.ndarray) -> np.ndarray:
+    return x / (np.linalg.norm(x, axis=-1, keepdims=True) + 1e-8)
+
+
+def _assign(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Nearest centroid (max inner product) for each row, computed in chunks."""
+    out = np.empty(vectors.shape[0], dtype=np.int64)
+    for start in range(0, vectors.shape[0], ASSIGN_CHUNK):
+        block = vectors[start:start + ASSIGN_CHUNK]
+        out[start:start + block.shape[0]] = np.argmax(block @ centroids.T, axis=1)
+    return out
+
+
+def train_centroids(vectors: np.ndarray, nlist: int, seed: int = 0) -> np.ndarray:
+    """Spherical k-means on (a sample of) pre-normalized vectors."""
+    rng = np.random.default_rng(seed)
+    n = vectors.shape[0]
+    train = vectors
+    if n > KMEANS_MAX_TRAIN:
+        train = vectors[rng.choice(n, KMEANS_MAX_TRAIN, replace=False)]
+
+    centroids = train[rng.choice(train.shape[0], nlist, replace=False)].copy()
+    for _ in range(KMEANS_ITERATIONS):
+        assign = _assign(train, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, train)
+        counts = np.bincount(assign, minlength=nlist)
+        empty = counts == 0
+        if empty.any():
+            # Re-seed empty cells with random training points
+            sums[empty] = train[rng.choice(train.shape[0], int(empty.sum()), replace=False)]
+        centroids = _normalize(sums).astype(np.float32)
+    return centroids
+
+
+class IVFIndex:
+    """Inverted-file index over normalized float32 vectors."""
+
+    def __init__(self, centroids: np.ndarray, vectors: np.ndarray, ids: np.ndarray,
+                 offsets: np.ndarray, meta: Optional[dict] = None):
+        self.centroids = centroids
+        self.vectors = vectors
+        self.ids = ids
+        self.offsets = offsets
+        self.meta = meta or {}
+
+    @property
+    def nlist(self) -> int:
+        return self.centroids.shape[0]
+
+    def __len__(self):
+        return self.vectors.shape[0]
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, ids, nlist: Optional[int] = None, seed: int = 0) -> 'IVFIndex':
+        """
+        Build an IVF index.
+
+        Args:
+            vectors: (N, dim) embeddings (normalized here)
+            ids: Row identifiers, same order as vectors
+            nlist: Number of cells (default ~sqrt(N))
+        """
+        start = time.perf_counter()
+        vectors = _normalize(np.asarray(vectors, dtype=np.float32)).astype(np.float32)
+        ids = np.asarray(ids).astype(str)
+        n = vectors.shape[0]
+        nlist = min(nlist or default_nlist(n), n)
+
+        centroids = train_centroids(vectors, nlist, seed=seed)
+        assign = _assign(vectors, centroids)
+        order = np.argsort(assign, kind='stable')
+        offsets = np.searchsorted(assign[order], np.arange(nlist + 1)).astype(np.int64)
+
+        meta = {
+            'count': int(n),
+            'dim': int(vectors.shape[1]),
+            'nlist': int(nlist),
+            'built_at': datetime.now().isoformat(),
+            'build_seconds': round(time.perf_counter() - start, 3),
+        }
+        return cls(centroids, vectors[order], ids[order], offsets, meta)
+
+    def save(self, path: Path):
+        """Write the index directory atomically (build in .tmp then rename)."""
+        path = Path(path)
+        tmp = path.with_name(path.name + '.tmp')
+        if tmp.exists():
+            shutil.rmtree(tmp)
+        tmp.mkdir(parents=True)
+        np.save(tmp / 'centroids.npy', self.centroids)
+        np.save(tmp / 'vectors.npy', self.vectors)
+        np.save(tmp / 'ids.npy', self.ids)
+        np.save(tmp / 'offsets.npy', self.offsets)
+        with open(tmp / 'meta.json', 'w') as f:
+            json.dump(self.meta, f, indent=2)
+        if path.exists():
+            shutil.rmtree(path)
+        tmp.rename(path)
+
+    @classmethod
+    def load(cls, path: Path, mmap: bool = True) -> 'IVFIndex':
+        """Load an index directory, memory-mapping the vectors and ids."""
+        path = Path(path)
+        mode = 'r' if mmap else None
+        with open(path / 'meta.json') as f:
+            meta = json.load(f)
+        return cls(
+            centroids=np.load(path / 'centroids.npy'),
+            vectors=np.load(path / 'vectors.npy', mmap_mode=mode),
+            ids=np.load(path / 'ids.npy', mmap_mode=mode),
+            offsets=np.load(path / 'offsets.npy'),
+            meta=meta,
+        )
+
+    def search(self, query: np.ndarray, top_k: int = 4, nprobe: Optional[int] = None,
+               allowed: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Approximate top-k by inner product over the nprobe closest cells.
+
+        Args:
+            query: Query vector (normalized here)
+            top_k: Number of results
+            nprobe: Cells to scan (default: default_nprobe(nlist))
+            allowed: Optional boolean mask over index positions
+
+        Returns:
+            (positions, similarities) sorted by similarity descending
+        """
+        q = _normalize(np.asarray(query, dtype=np.float32).reshape(-1))
+        nprobe = min(nprobe or default_nprobe(self.nlist), self.nlist)
+
+        cell_sims = self.centroids @ q
+        cells = np.argpartition(-cell_sims, nprobe - 1)[:nprobe] if nprobe < self.nlist else np.arange(self.nlist)
+
+        starts = self.offsets[cells]
+        ends = self.offsets[cells + 1]
+        positions = np.concatenate([np.arange(s, e) for s, e in zip(starts, ends)]) if len(cells) else np.zeros(0, dtype=np.int64)
+        positions.sort()  # sequential reads from the memory map
+
+        if allowed is not None and positions.size:
+            positions = positions[allowed[positions]]
+        if positions.size == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        sims = np.asarray(self.vectors[positions]) @ q
+        k = min(top_k, sims.shape[0])
+        top = np.argpartition(-sims, k - 1)[:k] if k < sims.shape[0] else np.arange(sims.shape[0])
+        top = top[np.argsort(-sims[top], kind='stable')]
+        return positions[top], sims[top]
+
+
+def load_ann_index(db_path: str, advisor_id: str, column: str) -> Optional[IVFIndex]:
+    """Load a persisted IVF index if one exists for this advisor/column."""
+    path = ann_index_path(db_path, advisor_id, column)
+    if not (path / 'meta.json').exists():
+        return None
+    try:
+        index = IVFIndex.load(path, mmap=True)
+        logger.info(f"[ANN] Memory-mapped {path.name}: {len(index)} vectors, nlist={index.nlist}")
+        return index
+    except Exception as e:
+        logger.warning(f"[ANN] Failed to load {path}: {e}")
+        return None
+
+
+def build_ann_index(db_path: str, advisor_id: str, column: str = 'embedding',
+                    nlist: Optional[int] = None) -> Optional[Path]:
+    """
+    Build and persist the IVF index for one advisor/column from dimensional_profiles.
+
+    Returns:
+        Index directory, or None if the advisor has no vectors for this column
+    """
+    from mondrian.embedding_index import AdvisorEmbeddingIndex
+
+    exact = AdvisorEmbeddingIndex(db_path, advisor_id, column).load()
+    if len(exact) == 0:
+        return None
+
+    ids = [row['id'] for row in exact.metadata]
+    index = IVFIndex.build(exact.vectors, ids, nlist=nlist)
+    index.meta.update({'advisor_id': advisor_id, 'column': column})
+
+    path = ann_index_path(db_path, advisor_id, column)
+    index.save(path)
+    logger.info(f"[ANN] Built {path.name}: {len(index)} vectors, nlist={index.nlist} "
+                f"in {index.meta['build_seconds']}s")
+    return path
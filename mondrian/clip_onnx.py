@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+ONNX Runtime CLIP Encoder
+
+CPU inference path for CLIP ViT-B/32 on nodes without CUDA: the vision and
+text towers are exported once by scripts/export_clip_onnx.py (optionally with
+int8 dynamic quantization) and run with ONNX Runtime, so the request path
+needs neither PyTorch nor a PyTorch CLIP model in memory.
+
+Image preprocessing is done here in NumPy/PIL and mirrors CLIPImageProcessor
+(shortest edge -> 224 bicubic, center crop 224, CLIP mean/std); the parity
+check in scripts/benchmark_clip_onnx.py compares the full pipeline against
+the PyTorch model.
+
+Layout:
+    models/onnx/clip-vit-base-patch32/
+        vision.onnx, vision.int8.onnx   pixel_values (N,3,224,224) -> image_embeds (N,512)
+        text.onnx, text.int8.onnx       input_ids, attention_mask (N,L) -> text_embeds (N,512)
+        export.json                     model, transformers version, opset
+"""
+
+import os
+import json
+import threading
+import logging
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+
+from mondrian.model_registry import get_model_registry
+
+logger = logging.getLogger(__name__)
+
+CLIP_MODEL_NAME = "openai/clip-vit-base-patch32"
+
+ONNX_DIR = Path(__file__).parent.parent / 'models' / 'onnx' / 'clip-vit-base-patch32'
+
+IMAGE_SIZE = 224
+CLIP_MEAN = np.array([0.48145466, 0.4578275, 0.40821073], dtype=np.float32)
+CLIP_STD = np.array([0.26862954, 0.26130258, 0.27577711], dtype=np.float32)
+
+
+def onnx_paths(model_dir: Path = ONNX_DIR, quantized: bool = False):
+    """(vision, text) model files for the fp32 or int8 export."""
+    suffix = '.int8.onnx' if quantized else '.onnx'
+    return Path(model_dir) / f"vision{suffix}", Path(model_dir) / f"text{suffix}"
+
+
+def preprocess_images(images: list) -> np.ndarray:
+    """PIL images -> (N, 3, 224, 224) float32 pixel_values, as CLIPImageProcessor."""
+    from PIL import Image
+
+    batch = np.empty((len(images), 3, IMAGE_SIZE, IMAGE_SIZE), dtype=np.float32)
+    for i, image in enumerate(images):
+        image = image.convert('RGB')
+        width, height = image.size
+        short, long = (width, height) if width <= height else (height, width)
+        new_long = int(IMAGE_SIZE * long / short)
+        size = (IMAGE_SIZE, new_long) if width <= height else (new_long, IMAGE_SIZE)
+        image = image.resize(size, resample=Image.BICUBIC)
+
+        left = (image.size[0] - IMAGE_SIZE) // 2
+        top = (image.size[1] - IMAGE_SIZE) // 2
+        image = image.crop((left, top, left + IMAGE_SIZE, top + IMAGE_SIZE))
+
+        pixels = np.asarray(image, dtype=np.float32) / 255.0
+        batch[i] = ((pixels - CLIP_MEAN) / CLIP_STD).transpose(2, 0, 1)
+    return batch
+
+
+class OnnxClipEncoder:
+    """CLIP vision/text towers on ONNX Runtime (CPU)."""
+
+    def __init__(self, model_dir: Path = ONNX_DIR, quantized: bool = False,
+                 threads: Optional[int] = None):
+        """
+        Args:
+            model_dir: Directory written by scripts/export_clip_onnx.py
+            quantized: Use the int8 export
+            threads: intra-op threads (default: ONNX Runtime's choice)
+        """
+        import onnxruntime as ort
+
+        vision_path, text_path = onnx_paths(model_dir, quantized)
+        if not vision_path.exists():
+            raise FileNotFoundError(
+                f"{vision_path} not found. "
+                f"Run: python scripts/export_clip_onnx.py{' --int8' if quantized else ''}"
+            )
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self._options = options
+        self._text_path = text_path
+        self._text_session = None
+        self._tokenizer = None
+        self.quantized = quantized
+        self.vision = ort.InferenceSession(str(vision_path), options, providers=['CPUExecutionProvider'])
+        self._vision_path = vision_path
+
+        export_info = Path(model_dir) / 'export.json'
+        self.info = json.loads(export_info.read_text()) if export_info.exists() else {}
+
+    @property
+    def version_tag(self) -> str:
+        """Suffix for embedding cache keys, so ONNX vectors are not mixed with PyTorch ones."""
+        return 'onnx-int8' if self.quantized else 'onnx'
+
+    def model_bytes(self) -> int:
+        """Size of the loaded model files."""
+        paths = [self._vision_path] + ([self._text_path] if self._text_session is not None else [])
+        return sum(path.stat().st_size for path in paths)
+
+    def encode_images(self, images: list) -> np.ndarray:
+        """L2-normalized (N, 512) float32 image embeddings."""
+        pixel_values = preprocess_images(images)
+        (embeds,) = self.vision.run(['image_embeds'], {'pixel_values': pixel_values})
+        return embeds / np.linalg.norm(embeds, axis=1, keepdims=True)
+
+    def encode_texts(self, texts: List[str]) -> np.ndarray:
+        """L2-normalized (N, 512) float32 CLIP text embeddings."""
+        import onnxruntime as ort
+
+        if self._text_session is None:
+            from transformers import CLIPTokenizerFast
+            self._tokenizer = CLIPTokenizerFast.from_pretrained(CLIP_MODEL_NAME)
+            self._text_session = ort.InferenceSession(str(self._text_path), self._options,
+                                                      providers=['CPUExecutionProvider'])
+        tokens = self._tokenizer(texts, padding=True, truncation=True, max_length=77, return_tensors='np')
+        (embeds,) = self._text_session.run(['text_embeds'], {
+            'input_ids': tokens['input_ids'].astype(np.int64),
+            'attention_mask': tokens['attention_mask'].astype(np.int64),
+        })
+        return embeds / np.linalg.norm(embeds, axis=1, keepdims=True)
+
+
+_encoder_failed = set()
+_encoder_lock = threading.Lock()
+
+
+def _onnx_nbytes(encoder: 'OnnxClipEncoder'):
+    """Host bytes of the loaded ONNX sessions (approximated by their model files)."""
+    return {'device': 0, 'host': encoder.model_bytes()}
+
+
+def get_onnx_clip_encoder(quantized: bool = False) -> Optional[OnnxClipEncoder]:
+    """
+    Shared ONNX encoder (held by the model registry), or None if onnxruntime
+    or the exported model is missing.
+
+    A failed load is logged as a warning once and not retried, so callers
+    fall back to PyTorch cheaply.
+    """
+    with _encoder_lock:
+        if quantized in _encoder_failed:
+            return None
+        name = 'clip-onnx-int8' if quantized else 'clip-onnx'
+        threads = int(os.environ.get('CLIP_ONNX_THREADS', 0)) or None
+        try:
+            return get_model_registry().acquire(
+                name, lambda: OnnxClipEncoder(quantized=quantized, threads=threads),
+                device='cpu', size_fn=_onnx_nbytes
+            )
+        except ImportError as e:
+            logger.warning(f"[ClipOnnx] onnxruntime not installed ({e}) - CLIP falls back to PyTorch. "
+                           f"Run: pip install onnxruntime")
+            _encoder_failed.add(quantized)
+            return None
+        except FileNotFoundError as e:
+            logger.warning(f"[ClipOnnx] ONNX CLIP model not exported - CLIP falls back to PyTorch: {e}")
+            _encoder_failed.add(quantized)
+            return None
+
+
+_cuda = None
+
+
+def cuda_available() -> bool:
+    """True if PyTorch can see a CUDA device (False when torch is not installed)."""
+    global _cuda
+    if _cuda is None:
+        try:
+            import torch
+            _cuda = bool(torch.cuda.is_available())
+        except ImportError:
+            _cuda = False
+    return _cuda
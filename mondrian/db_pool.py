@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Shared SQLite Connection Pool
+
+All services read and write the same mondrian.db: the job workers write
+progress several times per job while every open SSE stream polls the job row
+and the queue monitor scans the table. Opening a fresh connection per query
+re-parses the schema and re-prepares every statement, and in the default
+rollback-journal mode a writer blocks all readers.
+
+db_connection() hands out pooled connections configured once:
+
+- journal_mode=WAL: readers never block the writer and vice versa
+- synchronous=NORMAL: durable across crashes in WAL mode, fsync only at
+  checkpoints
+- busy timeout of DATABASE_LOCK_TIMEOUT: concurrent writers wait for the
+  lock instead of failing with "database is locked"
+- mmap_size and a prepared-statement cache (sqlite3 cached_statements), so
+  the hot queries (job status polls) skip re-preparing
+
+A thread holds one connection for the duration of a db_connection() block;
+nested blocks on the same thread reuse it and leave the transaction to the
+outermost block, which alone commits or rolls back. Connections are returned to the
+pool afterwards rather than kept per thread forever, because Flask's
+threaded server starts a new thread per request. Pools are per process
+(sqlite connections must not cross fork()).
+
+Usage:
+    with db_connection(db_path) as conn:
+        conn.execute(...)          # committed on exit, rolled back on error
+
+    with db_connection(db_path, row_factory=sqlite3.Row) as conn:
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from mondrian.timeouts import DATABASE_LOCK_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+# Idle connections kept per database (more can be open while busy)
+POOL_MAX_IDLE = 8
+# Prepared statements cached per connection
+CACHED_STATEMENTS = 256
+# Memory-mapped I/O for reads (bytes)
+MMAP_SIZE = 256 * 1024 * 1024
+
+
+class ConnectionPool:
+    """Pool of configured connections to one database file."""
+
+    def __init__(self, db_path: str, max_idle: int = POOL_MAX_IDLE,
+                 busy_timeout: float = DATABASE_LOCK_TIMEOUT):
+        """
+        Args:
+            db_path: SQLite database file
+            max_idle: Connections kept open between uses
+            busy_timeout: Seconds to wait for a lock before "database is locked"
+        """
+        self.db_path = db_path
+        self.max_idle = max_idle
+        self.busy_timeout = busy_timeout
+        self._idle: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.stats = {'opened': 0, 'reused': 0, 'closed': 0}
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout,
+                               check_same_thread=False, cached_statements=CACHED_STATEMENTS)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+        except sqlite3.Error as e:
+            # Read-only database or filesystem without shared memory: keep the defaults
+            logger.warning(f"[DBPool] Could not enable WAL on {self.db_path}: {e}")
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout * 1000)}")
+        with self._lock:
+            self.stats['opened'] += 1
+        return conn
+
+    def _checkout(self) -> sqlite3.Connection:
+        with self._lock:
+            if self._idle:
+                self.stats['reused'] += 1
+                return self._idle.pop()
+        return self._open()
+
+    def _checkin(self, conn: sqlite3.Connection):
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+            self.stats['closed'] += 1
+        conn.close()
+
+    @contextmanager
+    def connection(self, row_factory=None) -> Iterator[sqlite3.Connection]:
+        """
+        Borrow a connection for this thread; the outermost block commits on
+        exit and rolls back on error (nested blocks do neither, so they never
+        end a transaction the caller still has open).
+
+        Args:
+            row_factory: Row factory for this block (e.g. sqlite3.Row)
+        """
+        conn = getattr(self._local, 'conn', None)
+        owner = conn is None
+        if owner:
+            conn = self._checkout()
+            self._local.conn = conn
+        previous_factory = conn.row_factory
+        conn.row_factory = row_factory
+        try:
+            if owner:
+                with conn:
+                    yield conn
+            else:
+                yield conn
+        finally:
+            conn.row_factory = previous_factory
+            if owner:
+                self._local.conn = None
+                self._checkin(conn)
+
+    def close(self):
+        """Close idle connections (busy ones are closed when returned)."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self.max_idle = 0
+        for conn in idle:
+            conn.close()
+
+
+_pools: Dict[Tuple[int, str], ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path: str) -> ConnectionPool:
+    """The pool for db_path in this process (created on first use)."""
+    key = (os.getpid(), os.path.abspath(db_path))
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = _pools[key] = ConnectionPool(db_path)
+    return pool
+
+
+def db_connection(db_path: str, row_factory=None):
+    """
+    Borrow a pooled connection to db_path (context manager).
+
+    Args:
+        db_path: SQLite database file
+        row_factory: Row factory for this block (e.g. sqlite3.Row)
+    """
+    return get_pool(db_path).connection(row_factory=row_factory)
+
+
+def get_pool_stats() -> Dict[str, Any]:
+    """Per-database pool counters for this process."""
+    pid = os.getpid()
+    return {path: dict(pool.stats, idle=len(pool._idle))
+            for (owner_pid, path), pool in _pools.items() if owner_pid == pid}
+
+
+def close_pools(db_path: Optional[str] = None):
+    """Close this process's pools (all, or the one for db_path)."""
+    pid = os.getpid()
+    target = os.path.abspath(db_path) if db_path else None
+    with _pools_lock:
+        for key in [k for k in _pools if k[0] == pid and (target is None or k[1] == target)]:
+            _pools.pop(key).close()
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Content-Hash Embedding Cache
+
+Two-tier cache for CLIP image and MiniLM text embeddings:
+  1. In-process LRU (OrderedDict) for repeated lookups within a service
+  2. On-disk SQLite store (embedding_cache.db) shared across processes and
+     restarts, so a re-uploaded image is never embedded twice
+
+Keys are "<model_name>@<model_version>:<sha256 of content>". The version is
+the installed library version (transformers / sentence-transformers), read
+from package metadata so a lookup never has to load the model itself.
+"""
+
+import hashlib
+import sqlite3
+import threading
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from importlib import metadata
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Disk tier lives next to mondrian.db but in its own file to avoid lock contention
+CACHE_DB_PATH = str(Path(__file__).parent.parent / 'embedding_cache.db')
+
+DEFAULT_LRU_SIZE = 512
+
+_package_versions: Dict[str, str] = {}
+
+
+def package_version(package: str) -> str:
+    """Installed version of a package ('unknown' if not installed)."""
+    if package not in _package_versions:
+        try:
+            _package_versions[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            _package_versions[package] = 'unknown'
+    return _package_versions[package]
+
+
+def content_hash(data: bytes) -> str:
+    """SHA-256 hex digest of raw content (image bytes or UTF-8 text)."""
+    return hashlib.sha256(data).hexdigest()
+
+
+class EmbeddingCache:
+    """LRU + SQLite embedding cache keyed by model and content hash."""
+
+    def __init__(self, db_path: Optional[str] = CACHE_DB_PATH, lru_size: int = DEFAULT_LRU_SIZE):
+        """
+        Args:
+            db_path: SQLite file for the disk tier (None disables it)
+            lru_size: Maximum entries held in memory
+        """
+        self.db_path = db_path
+        self.lru_size = lru_size
+        self._lru: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'stores': 0}
+        self._disk_ready = False
+        if db_path:
+            self._init_disk()
+
+    def _init_disk(self):
+        try:
+            conn = self._conn()
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS embedding_cache (
+                    key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    model_version TEXT NOT NULL,
+                    dim INTEGER NOT NULL,
+                    vector BLOB NOT NULL,
+                    created_at TEXT NOT NULL
+                )
+            """)
+            conn.commit()
+            self._disk_ready = True
+        except sqlite3.Error as e:
+            logger.warning(f"[EmbeddingCache] Disk tier disabled ({self.db_path}): {e}")
+
+    def _conn(self) -> sqlite3.Connection:
+        """One connection per thread for the disk tier."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def make_key(model: str, model_version: str, digest: str) -> str:
+        return f"{model}@{model_version}:{digest}"
+
+    def get(self, model: str, model_version: str, digest: str) -> Optional[np.ndarray]:
+        """Look up an embedding; promotes disk hits into the LRU."""
+        key = self.make_key(model, model_version, digest)
+        with self._lock:
+            vec = self._lru.get(key)
+            if vec is not None:
+                self._lru.move_to_end(key)
+                self.stats['memory_hits'] += 1
+                return vec
+
+        if self._disk_ready:
+            try:
+                row = self._conn().execute(
+                    "SELECT vector FROM embedding_cache WHERE key = ?", (key,)
+                ).fetchone()
+            except sqlite3.Error as e:
+                logger.warning(f"[EmbeddingCache] Disk lookup failed: {e}")
+                row = None
+            if row is not None:
+                vec = np.frombuffer(row[0], dtype=np.float32)
+                with self._lock:
+                    self.stats['disk_hits'] += 1
+                    self._remember(key, vec)
+                return vec
+
+        with self._lock:
+            self.stats['misses'] += 1
+        return None
+
+    def put(self, model: str, model_version: str, digest: str, vector: np.ndarray):
+        """Store an embedding in both tiers."""
+        key = self.make_key(model, model_version, digest)
+        vec = np.ascontiguousarray(vector, dtype=np.float32).reshape(-1)
+        vec.setflags(write=False)
+        with self._lock:
+            self._remember(key, vec)
+            self.stats['stores'] += 1
+
+        if self._disk_ready:
+            try:
+                conn = self._conn()
+                conn.execute("""
+                    INSERT OR REPLACE INTO embedding_cache (key, model, model_version, dim, vector, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, (key, model, model_version, int(vec.shape[0]), vec.tobytes(), datetime.now().isoformat()))
+                conn.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"[EmbeddingCache] Disk store failed: {e}")
+
+    def _remember(self, key: str, vec: np.ndarray):
+        self._lru[key] = vec
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
+
+    def get_stats(self) -> Dict[str, float]:
+        """Hit/miss counters plus hit rate and LRU occupancy."""
+        with self._lock:
+            stats = dict(self.stats)
+            stats['memory_entries'] = len(self._lru)
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = round((stats['memory_hits'] + stats['disk_hits']) / lookups, 4) if lookups else 0.0
+        return stats
+
+    def clear_memory(self):
+        with self._lock:
+            self._lru.clear()
+
+
+_cache: Optional[EmbeddingCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """Process-wide embedding cache."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = EmbeddingCache()
+    return _cache
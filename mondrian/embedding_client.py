@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Embedding Service Client
+
+Talks to mondrian/embedding_service.py so that processes needing CLIP or
+MiniLM vectors (the advisor service, scripts/compute_embeddings.py,
+scripts/import_book_passages.py) share one copy of the models instead of
+each paying the model memory and cold load.
+
+The service address comes from EMBEDDING_SERVICE_URL
+(default http://127.0.0.1:5008; "unix:///path/to.sock" for a Unix socket).
+get_embedding_client() returns None while the service is unreachable, so
+callers fall back to loading the model in-process; an unreachable service is
+re-probed at most every RETRY_INTERVAL_SECONDS.
+"""
+
+import os
+import json
+import socket
+import threading
+import time
+import http.client
+import logging
+from typing import Dict, Optional, Sequence, Tuple
+from urllib.parse import urlparse
+
+import numpy as np
+
+from mondrian.timeouts import EMBEDDING_SERVICE_TIMEOUT, SERVICE_HEALTH_CHECK_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EMBEDDING_SERVICE_URL = "http://127.0.0.1:5008"
+
+RETRY_INTERVAL_SECONDS = 30.0
+
+
+class EmbeddingServiceError(RuntimeError):
+    """The embedding service rejected a request or could not be reached."""
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str, timeout: float):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self.sock = sock
+
+
+class EmbeddingServiceClient:
+    """Blocking client for the embedding service (one connection per thread)."""
+
+    def __init__(self, url: str = DEFAULT_EMBEDDING_SERVICE_URL,
+                 timeout: float = EMBEDDING_SERVICE_TIMEOUT):
+        self.url = url
+        self.timeout = timeout
+        parsed = urlparse(url)
+        if parsed.scheme == 'unix':
+            self._socket_path = parsed.path
+            self._host, self._port = None, None
+        elif parsed.scheme == 'http':
+            self._socket_path = None
+            self._host, self._port = parsed.hostname, parsed.port or 80
+        else:
+            raise ValueError(f"Unsupported embedding service URL: {url}")
+        self._local = threading.local()
+        # "<model>@<version>" per kind, as reported by the service
+        self.model_keys: Dict[str, str] = {}
+
+    def _connection(self, timeout: float) -> http.client.HTTPConnection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            if self._socket_path:
+                conn = _UnixHTTPConnection(self._socket_path, timeout)
+            else:
+                conn = http.client.HTTPConnection(self._host, self._port, timeout=timeout)
+            self._local.conn = conn
+        conn.timeout = timeout
+        return conn
+
+    def _request(self, method: str, path: str, body: bytes = None,
+                 headers: Dict[str, str] = None, timeout: float = None) -> Tuple[int, Dict[str, str], bytes]:
+        timeout = self.timeout if timeout is None else timeout
+        # Retry once on a fresh connection if a kept-alive one was closed
+        for attempt in range(2):
+            conn = self._connection(timeout)
+            try:
+                conn.request(method, path, body=body, headers=headers or {})
+                response = conn.getresponse()
+                return response.status, dict(response.getheaders()), response.read()
+            except (OSError, http.client.HTTPException) as e:
+                conn.close()
+                self._local.conn = None
+                if attempt == 1:
+                    raise EmbeddingServiceError(f"Embedding service {self.url} unreachable: {e}") from e
+
+    def _vectors(self, kind: str, status: int, headers: Dict[str, str], body: bytes) -> np.ndarray:
+        if status != 200:
+            try:
+                message = json.loads(body).get('error', body[:200])
+            except ValueError:
+                message = body[:200]
+            raise EmbeddingServiceError(f"Embedding service returned {status}: {message}")
+        rows, dim = (int(n) for n in headers['X-Embedding-Shape'].split(','))
+        self.model_keys[kind] = headers.get('X-Embedding-Model', '')
+        return np.frombuffer(body, dtype='<f4').reshape(rows, dim).astype(np.float32, copy=False)
+
+    def health(self) -> Optional[dict]:
+        """Service /health payload, or None if it is not reachable/ready."""
+        try:
+            status, _, body = self._request('GET', '/health', timeout=SERVICE_HEALTH_CHECK_TIMEOUT)
+        except EmbeddingServiceError:
+            return None
+        if status != 200:
+            return None
+        data = json.loads(body)
+        self.model_keys.update(data.get('models', {}))
+        return data
+
+    def embed_images(self, images: Sequence[bytes]) -> np.ndarray:
+        """
+        CLIP embeddings for encoded image files (JPEG/PNG bytes).
+
+        Returns:
+            (len(images), 512) L2-normalized float32 rows
+        """
+        status, headers, body = self._request('POST', '/embed/image', body=b''.join(images), headers={
+            'Content-Type': 'application/octet-stream',
+            'X-Image-Lengths': ','.join(str(len(data)) for data in images),
+        })
+        return self._vectors('image', status, headers, body)
+
+    def embed_texts(self, texts: Sequence[str]) -> np.ndarray:
+        """
+        MiniLM embeddings for texts.
+
+        Returns:
+            (len(texts), 384) L2-normalized float32 rows
+        """
+        status, headers, body = self._request('POST', '/embed/text', body=json.dumps({'texts': list(texts)}).encode('utf-8'),
+                                              headers={'Content-Type': 'application/json'})
+        return self._vectors('text', status, headers, body)
+
+
+_client: Optional[EmbeddingServiceClient] = None
+_client_checked_at: Optional[float] = None
+_client_lock = threading.Lock()
+
+
+def get_embedding_client(url: Optional[str] = None) -> Optional[EmbeddingServiceClient]:
+    """
+    Shared client if the embedding service is up, else None.
+
+    Args:
+        url: Service URL (default: EMBEDDING_SERVICE_URL or http://127.0.0.1:5008)
+    """
+    global _client, _client_checked_at
+    url = url or os.environ.get('EMBEDDING_SERVICE_URL', DEFAULT_EMBEDDING_SERVICE_URL)
+    with _client_lock:
+        if _client is not None and _client.url == url:
+            return _client
+        if _client_checked_at is not None and time.monotonic() - _client_checked_at < RETRY_INTERVAL_SECONDS:
+            return None
+        _client_checked_at = time.monotonic()
+        client = EmbeddingServiceClient(url)
+        if client.health() is None:
+            logger.info(f"[EmbeddingClient] No embedding service at {url} - loading models in-process")
+            return None
+        logger.info(f"[EmbeddingClient] Using embedding service at {url}")
+        _client = client
+        return client
+
+
+def reset_embedding_client(retry_now: bool = False):
+    """
+    Forget the shared client after the service went away.
+
+    Args:
+        retry_now: Probe again on the next call instead of after RETRY_INTERVAL_SECONDS
+    """
+    global _client, _client_checked_at
+    with _client_lock:
+        _client = None
+        _client_checked_at = None if retry_now else time.monotonic()
@@ -0,0 +1,692 @@
+#!/usr/bin/env python3
+"""
+In-Memory Embedding Index for dimensional_profiles
+
+Holds one NumPy matrix of pre-normalized float32 vectors per
+(database, advisor, embedding column) together with the row metadata and
+the 8 dimension scores, so that similarity retrieval is a single matmul
+plus argpartition instead of a full-table BLOB scan per request.
+
+Invalidation: SQLite triggers on dimensional_profiles bump the written
+advisor's counter in dimensional_profiles_advisor_version. Lookups read the
+counters (at most once per VERSION_CHECK_INTERVAL, on a pooled connection)
+and reload an advisor's matrix when its counter has moved, so writes made by
+scripts/compute_embeddings.py or other processes are picked up automatically
+without invalidating other advisors.
+
+Large corpora: when a persisted IVF index (mondrian/ann_index.py) matches the
+loaded rows, search() scans only the closest cells and falls back to the
+exact matmul if the filtered probe yields fewer than top_k rows.
+
+Vectors written to the memory-mapped embedding store
+(mondrian/embedding_store.py) are referenced by pointer; when an advisor's
+rows cover the store's slots in order, the index matrix is a zero-copy view
+of the memory map. Legacy BLOB rows are still read and normalized here.
+
+Quantization ('int8'): coarse scoring runs over per-row scaled int8 vectors
+held in memory (1/4 of float32) and only the top candidates are rescored
+exactly against the float32 vectors, which stay in the memory-mapped store.
+Advisors whose rows are not in the store keep plain float32 search, since
+their vectors would be resident anyway. ranking_overlap() compares the two
+paths.
+
+Hybrid retrieval (hybrid_search) blends similarity with the gap between
+each row's dimension scores and the user's, computed over the whole score
+matrix in the same pass as the similarity matmul.
+"""
+
+import sqlite3
+import threading
+import time
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from mondrian.advisor_cache import CHECK_INTERVAL_SECONDS
+from mondrian.ann_index import ANN_MIN_ROWS, ann_index_path, load_ann_index
+from mondrian.db_pool import db_connection
+from mondrian.embedding_store import REF_COLUMNS, get_store, has_ref_columns, parse_ref
+
+logger = logging.getLogger(__name__)
+
+# Score columns held in the per-row score matrix (order matters for filters)
+SCORE_COLUMNS = [
+    'composition_score', 'lighting_score', 'focus_sharpness_score',
+    'color_harmony_score', 'subject_isolation_score', 'depth_perspective_score',
+    'visual_balance_score', 'emotional_impact_score'
+]
+
+# Row metadata returned with every hit (embedding BLOBs are never returned)
+METADATA_COLUMNS = [
+    'id', 'image_path', 'image_title', 'date_taken', 'image_description',
+] + SCORE_COLUMNS + ['overall_grade']
+
+EMBEDDING_COLUMNS = ('embedding', 'text_embedding')
+
+VERSION_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS dimensional_profiles_advisor_version (
+        advisor_id TEXT PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0
+    )
+"""
+
+# Bump the counter of the advisor(s) a write touched ('' for rows without one)
+VERSION_TRIGGERS_SQL = [
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_dimensional_profiles_advisor_version_insert
+    AFTER INSERT ON dimensional_profiles
+    BEGIN
+        INSERT OR IGNORE INTO dimensional_profiles_advisor_version (advisor_id) VALUES (COALESCE(NEW.advisor_id, ''));
+        UPDATE dimensional_profiles_advisor_version SET version = version + 1
+        WHERE advisor_id = COALESCE(NEW.advisor_id, '');
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_dimensional_profiles_advisor_version_update
+    AFTER UPDATE ON dimensional_profiles
+    BEGIN
+        INSERT OR IGNORE INTO dimensional_profiles_advisor_version (advisor_id) VALUES (COALESCE(OLD.advisor_id, ''));
+        INSERT OR IGNORE INTO dimensional_profiles_advisor_version (advisor_id) VALUES (COALESCE(NEW.advisor_id, ''));
+        UPDATE dimensional_profiles_advisor_version SET version = version + 1
+        WHERE advisor_id IN (COALESCE(OLD.advisor_id, ''), COALESCE(NEW.advisor_id, ''));
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_dimensional_profiles_advisor_version_delete
+    AFTER DELETE ON dimensional_profiles
+    BEGIN
+        INSERT OR IGNORE INTO dimensional_profiles_advisor_version (advisor_id) VALUES (COALESCE(OLD.advisor_id, ''));
+        UPDATE dimensional_profiles_advisor_version SET version = version + 1
+        WHERE advisor_id = COALESCE(OLD.advisor_id, '');
+    END
+    """,
+]
+
+# The database-wide counter this replaced (every write invalidated every advisor)
+LEGACY_VERSION_SQL = [
+    "DROP TRIGGER IF EXISTS trg_dimensional_profiles_version_insert",
+    "DROP TRIGGER IF EXISTS trg_dimensional_profiles_version_update",
+    "DROP TRIGGER IF EXISTS trg_dimensional_profiles_version_delete",
+    "DROP TABLE IF EXISTS dimensional_profiles_version",
+]
+
+# Minimum seconds between reads of the version counters (as AdvisorArtifactCache)
+VERSION_CHECK_INTERVAL = CHECK_INTERVAL_SECONDS
+
+QUANTIZATION_MODES = ('none', 'int8')
+
+# Candidates rescored exactly after int8 coarse scoring: max(top_k * factor, min)
+RESCORE_FACTOR = 8
+RESCORE_MIN = 64
+
+# Rows upcast per block during int8 coarse scoring (bounds the float32 temporary)
+QUANT_CHUNK = 8192
+
+_quantization = 'none'
+
+_indexes: Dict[Tuple[str, str, str, str], 'AdvisorEmbeddingIndex'] = {}
+_indexes_lock = threading.Lock()
+# One lock per index key, so loading one advisor does not block searches of others
+_load_locks: Dict[Tuple[str, str, str, str], threading.Lock] = {}
+# db_path -> whether version tracking could be installed (attempted once per path)
+_version_tracking: Dict[str, bool] = {}
+_version_tracking_lock = threading.Lock()
+# db_path -> (monotonic time read, {advisor_id: version})
+_versions: Dict[str, Tuple[float, Dict[str, int]]] = {}
+_versions_lock = threading.Lock()
+
+
+def ensure_version_tracking(db_path: str) -> bool:
+    """
+    Create the per-advisor version counters and triggers if missing (once
+    per database path; a failure is not retried).
+
+    Returns:
+        True if version tracking is available for this database
+    """
+    ready = _version_tracking.get(db_path)
+    if ready is not None:
+        return ready
+    with _version_tracking_lock:
+        ready = _version_tracking.get(db_path)
+        if ready is not None:
+            return ready
+        try:
+            with db_connection(db_path) as conn:
+                for sql in LEGACY_VERSION_SQL:
+                    conn.execute(sql)
+                conn.execute(VERSION_TABLE_SQL)
+                for sql in VERSION_TRIGGERS_SQL:
+                    conn.execute(sql)
+            ready = True
+        except sqlite3.Error as e:
+            logger.warning(f"[EmbeddingIndex] Could not set up version tracking on {db_path}: {e}")
+            ready = False
+        _version_tracking[db_path] = ready
+        return ready
+
+
+def get_profiles_version(db_path: str, advisor_id: str, max_age: float = 0.0) -> Tuple:
+    """
+    Return a token that changes whenever the advisor's dimensional_profiles rows change.
+
+    Uses the trigger-maintained per-advisor counter, read for all advisors
+    at once on a pooled connection; falls back to a per-advisor
+    COUNT/MAX(rowid) fingerprint when triggers could not be installed.
+
+    Args:
+        db_path: Path to SQLite database
+        advisor_id: Advisor whose rows to track
+        max_age: Seconds a previous read of the counters may be reused
+    """
+    if not ensure_version_tracking(db_path):
+        with db_connection(db_path) as conn:
+            row = conn.execute(
+                "SELECT COUNT(*), MAX(rowid) FROM dimensional_profiles WHERE advisor_id = ?",
+                (advisor_id,)
+            ).fetchone()
+        return ('f', row[0], row[1])
+
+    now = time.monotonic()
+    with _versions_lock:
+        cached = _versions.get(db_path)
+    if cached is not None and now - cached[0] < max_age:
+        versions = cached[1]
+    else:
+        with db_connection(db_path) as conn:
+            versions = dict(conn.execute("SELECT advisor_id, version FROM dimensional_profiles_advisor_version"))
+        with _versions_lock:
+            _versions[db_path] = (now, versions)
+    return ('a', versions.get(advisor_id, 0))
+
+
+class AdvisorEmbeddingIndex:
+    """Pre-normalized embedding matrix plus row metadata for one advisor."""
+
+    def __init__(self, db_path: str, advisor_id: str, column: str = 'embedding',
+                 quantization: str = 'none'):
+        if column not in EMBEDDING_COLUMNS:
+            raise ValueError(f"Unknown embedding column: {column}")
+        if quantization not in QUANTIZATION_MODES:
+            raise ValueError(f"Unknown quantization: {quantization}")
+        self.db_path = db_path
+        self.advisor_id = advisor_id
+        self.column = column
+        self.quantization = quantization
+        self.qvectors = None
+        self.qscales = None
+        # Store slot per row when vectors is the whole (unaligned) store view
+        self.row_slots = None
+        self.version = None
+        self.vectors = np.zeros((0, 0), dtype=np.float32)
+        self.scores = np.zeros((0, len(SCORE_COLUMNS)), dtype=np.float32)
+        self.metadata: List[Dict[str, Any]] = []
+        self.total_with_embedding = 0
+        self.ann = None
+        self.ann_row_map = None
+        self._row_of_id = None
+
+    def load(self, version=None):
+        """Load all embeddings for the advisor (store views or legacy BLOBs)."""
+        start = time.perf_counter()
+        with db_connection(self.db_path, row_factory=sqlite3.Row) as conn:
+            ref_column = REF_COLUMNS[self.column] if has_ref_columns(conn) else None
+            if ref_column:
+                # Only read the BLOB for rows that have not moved to the store
+                vector_select = (f"{ref_column} AS vector_ref, "
+                                 f"CASE WHEN {ref_column} IS NULL THEN {self.column} END AS vector_blob")
+                has_vector = f"({self.column} IS NOT NULL OR {ref_column} IS NOT NULL)"
+            else:
+                vector_select = f"NULL AS vector_ref, {self.column} AS vector_blob"
+                has_vector = f"{self.column} IS NOT NULL"
+            rows = conn.execute(f"""
+                SELECT {', '.join(METADATA_COLUMNS)}, {vector_select}
+                FROM dimensional_profiles
+                WHERE advisor_id = ? AND {has_vector}
+            """, (self.advisor_id,)).fetchall()
+
+        self.total_with_embedding = len(rows)
+
+        # Match the legacy filter: only fully scored profiles are candidates
+        rows = [row for row in rows if row['composition_score'] is not None]
+        refs = [parse_ref(row['vector_ref']) if row['vector_ref'] else None for row in rows]
+        store_names = {ref[0] for ref in refs if ref is not None}
+
+        if rows and None not in refs and len(store_names) == 1:
+            # Order rows by slot so a fully covered store is used as-is
+            order = sorted(range(len(rows)), key=lambda i: refs[i][1])
+            rows = [rows[i] for i in order]
+            slots = np.fromiter((refs[i][1] for i in order), dtype=np.int64, count=len(order))
+            matrix, self.row_slots = self._store_vectors(store_names.pop(), slots)
+        else:
+            matrix, rows = self._row_vectors(rows, refs)
+            self.row_slots = None
+
+        if matrix is not None and len(rows):
+            self.vectors = matrix
+            self.metadata = [{col: row[col] for col in METADATA_COLUMNS} for row in rows]
+            self.scores = np.asarray(
+                [[np.nan if row[col] is None else row[col] for col in SCORE_COLUMNS] for row in rows],
+                dtype=np.float32
+            )
+        else:
+            self.vectors = np.zeros((0, 0), dtype=np.float32)
+            self.scores = np.zeros((0, len(SCORE_COLUMNS)), dtype=np.float32)
+            self.metadata = []
+            self.row_slots = None
+        self.version = version
+        self._row_of_id = None
+
+        if self.quantization == 'int8' and len(self.metadata):
+            if isinstance(self.vectors, np.memmap):
+                self._quantize()
+            else:
+                # The float32 rows are needed for rescoring: int8 on top of a
+                # resident copy only adds memory (and is slower than the matmul)
+                logger.info(
+                    f"[EmbeddingIndex] {self.advisor_id}/{self.column} is not in the embedding store - "
+                    f"using float32 instead of int8. "
+                    f"Run: python scripts/compute_embeddings.py --advisor {self.advisor_id} --migrate-to-store"
+                )
+                self.quantization = 'none'
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        logger.info(
+            f"[EmbeddingIndex] Loaded {len(self.metadata)} {self.column} vectors for "
+            f"advisor '{self.advisor_id}' in {elapsed_ms:.1f}ms"
+            + (f" (int8, {self.memory_bytes() / 1e6:.1f}MB resident)" if self.qvectors is not None else "")
+        )
+        return self
+
+    def _store_vectors(self, name: str, slots: np.ndarray) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+        """
+        Store rows for the given slots.
+
+        Returns:
+            (matrix, row_slots): a zero-copy view when slots are 0..n-1; with int8
+            quantization the whole store view plus the slot map (nothing copied
+            into memory); otherwise a gathered copy
+        """
+        store = get_store(self.db_path, name)
+        if store is None or (len(slots) and slots[-1] >= len(store)):
+            logger.warning(
+                f"[EmbeddingIndex] Embedding store {name} is missing or behind the database. "
+                f"Run: python scripts/compute_embeddings.py --advisor {self.advisor_id}"
+            )
+            return None, None
+        if np.array_equal(slots, np.arange(len(slots))):
+            return store.vectors[:len(slots)], None
+        if self.quantization != 'none':
+            return store.vectors, slots
+        return store.vectors[slots], None
+
+    def _row_vectors(self, rows: list, refs: list) -> Tuple[Optional[np.ndarray], list]:
+        """Per-row vectors for mixed store/BLOB rows (normalized here)."""
+        vectors = []
+        kept = []
+        for row, ref in zip(rows, refs):
+            if ref is not None:
+                store = get_store(self.db_path, ref[0])
+                if store is None or ref[1] >= len(store):
+                    logger.warning(f"[EmbeddingIndex] Skipping {row['id']}: dangling pointer {row['vector_ref']}")
+                    continue
+                vec = store.get(ref[1])
+            else:
+                vec = np.frombuffer(row['vector_blob'], dtype=np.float32)
+            if vectors and vec.shape[0] != vectors[0].shape[0]:
+                logger.warning(f"[EmbeddingIndex] Skipping {row['id']}: {self.column} has dim {vec.shape[0]}")
+                continue
+            vectors.append(vec)
+            kept.append(row)
+        if not vectors:
+            return None, []
+        matrix = np.vstack(vectors).astype(np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / (norms + 1e-8), kept
+
+    def _quantize(self):
+        """Per-row symmetric int8 quantization of the normalized vectors."""
+        n, dim = len(self.metadata), self.vectors.shape[1]
+        self.qvectors = np.empty((n, dim), dtype=np.int8)
+        self.qscales = np.empty(n, dtype=np.float32)
+        for start in range(0, n, QUANT_CHUNK):
+            rows = np.arange(start, min(start + QUANT_CHUNK, n))
+            block = self.exact_vectors(rows)
+            scales = np.abs(block).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            self.qscales[rows] = scales
+            self.qvectors[rows] = np.round(block / scales[:, None]).astype(np.int8)
+
+    def exact_vectors(self, rows: np.ndarray) -> np.ndarray:
+        """float32 vectors for index rows (read through the store slot map if needed)."""
+        if self.row_slots is not None:
+            return np.asarray(self.vectors[self.row_slots[rows]])
+        return np.asarray(self.vectors[rows])
+
+    def memory_bytes(self) -> int:
+        """Resident bytes of the scoring structures (memory-mapped store vectors excluded)."""
+        total = self.scores.nbytes
+        if self.qvectors is not None:
+            total += self.qvectors.nbytes + self.qscales.nbytes
+            if self.row_slots is not None:
+                total += self.row_slots.nbytes
+        if not isinstance(self.vectors, np.memmap):
+            total += self.vectors.nbytes
+        elif self.qvectors is None:
+            # Every exact query scans the whole map, so it is effectively resident
+            total += len(self) * self.vectors.shape[1] * self.vectors.itemsize
+        return total
+
+    def __len__(self):
+        return len(self.metadata)
+
+    def rows_for_ids(self, ids: List[str]) -> np.ndarray:
+        """Index rows for profile ids (ids without a vector are skipped)."""
+        if self._row_of_id is None:
+            self._row_of_id = {row['id']: i for i, row in enumerate(self.metadata)}
+        rows = [self._row_of_id[i] for i in ids if i in self._row_of_id]
+        return np.asarray(rows, dtype=np.int64)
+
+    def attach_ann(self, min_rows: int = ANN_MIN_ROWS) -> bool:
+        """
+        Attach the persisted IVF index if the corpus is large enough and it is current.
+
+        Returns:
+            True if approximate search is enabled for this index
+        """
+        self.ann = None
+        self.ann_row_map = None
+        if len(self) < min_rows:
+            return False
+
+        ann = load_ann_index(self.db_path, self.advisor_id, self.column)
+        if ann is None:
+            logger.info(
+                f"[EmbeddingIndex] No ANN index for {self.advisor_id}/{self.column} ({len(self)} rows). "
+                f"Run: python scripts/compute_embeddings.py --advisor {self.advisor_id} --build-ann-only"
+            )
+            return False
+
+        row_of_id = {row['id']: i for i, row in enumerate(self.metadata)}
+        row_map = np.fromiter((row_of_id.get(str(i), -1) for i in ann.ids), dtype=np.int64, count=len(ann))
+        if len(ann) != len(self) or (row_map < 0).any():
+            logger.warning(
+                f"[EmbeddingIndex] ANN index {ann_index_path(self.db_path, self.advisor_id, self.column).name} "
+                f"is stale ({len(ann)} vs {len(self)} rows) - using exact search. "
+                f"Run: python scripts/compute_embeddings.py --advisor {self.advisor_id} --build-ann-only"
+            )
+            return False
+
+        self.ann = ann
+        self.ann_row_map = row_map
+        return True
+
+    def filter_mask(self, score_columns: Optional[List[str]] = None,
+                    min_score: float = 8.0) -> Optional[np.ndarray]:
+        """
+        Boolean mask of rows scoring >= min_score in ANY of score_columns.
+
+        Returns:
+            None when no filter applies (all rows are candidates)
+        """
+        if not score_columns:
+            return None
+        col_idx = [SCORE_COLUMNS.index(c) for c in score_columns if c in SCORE_COLUMNS]
+        if not col_idx:
+            return None
+        # NaN (NULL) compares False, matching SQL semantics
+        with np.errstate(invalid='ignore'):
+            return (self.scores[:, col_idx] >= min_score).any(axis=1)
+
+    def search(self, query: np.ndarray, top_k: int = 4,
+               mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Exact cosine top-k over the (optionally masked) matrix.
+
+        Args:
+            query: Query vector (normalized here)
+            top_k: Number of results
+            mask: Optional boolean row mask
+
+        Returns:
+            (row_indices, similarities) sorted by similarity descending
+        """
+        if len(self) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        q = np.asarray(query, dtype=np.float32).reshape(-1)
+        q = q / (np.linalg.norm(q) + 1e-8)
+
+        if self.ann is not None:
+            allowed = None if mask is None else mask[self.ann_row_map]
+            positions, sims = self.ann.search(q, top_k=top_k, allowed=allowed)
+            available = len(self) if mask is None else int(mask.sum())
+            if len(positions) >= min(top_k, available):
+                # Rescore against the live vectors in case rows were re-embedded since the build
+                rows = self.ann_row_map[positions]
+                sims = self.exact_vectors(rows) @ q
+                order = np.argsort(-sims, kind='stable')
+                return rows[order], sims[order]
+
+        if self.qvectors is not None:
+            return self._search_quantized(q, top_k, mask)
+
+        if mask is None:
+            candidates = None
+            sims = self.vectors @ q
+        else:
+            candidates = np.flatnonzero(mask)
+            if candidates.size == 0:
+                return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+            sims = self.vectors[candidates] @ q
+
+        k = min(top_k, sims.shape[0])
+        if k < sims.shape[0]:
+            top = np.argpartition(-sims, k - 1)[:k]
+        else:
+            top = np.arange(sims.shape[0])
+        top = top[np.argsort(-sims[top], kind='stable')]
+
+        rows = top if candidates is None else candidates[top]
+        return rows, sims[top]
+
+    def _coarse_similarities(self, q: np.ndarray, candidates: np.ndarray, masked: bool) -> np.ndarray:
+        """Approximate similarities from the int8 vectors (upcast block by block)."""
+        coarse = np.empty(candidates.size, dtype=np.float32)
+        for start in range(0, candidates.size, QUANT_CHUNK):
+            block = candidates[start:start + QUANT_CHUNK]
+            qblock = self.qvectors[block] if masked else self.qvectors[start:start + QUANT_CHUNK]
+            coarse[start:start + block.size] = (qblock.astype(np.float32) @ q) * self.qscales[block]
+        return coarse
+
+    def _search_quantized(self, q: np.ndarray, top_k: int,
+                          mask: Optional[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        """int8 coarse scoring, then exact float32 rescoring of the best candidates."""
+        candidates = np.arange(len(self)) if mask is None else np.flatnonzero(mask)
+        if candidates.size == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        coarse = self._coarse_similarities(q, candidates, mask is not None)
+        shortlist = candidates[_top_unsorted(coarse, max(top_k * RESCORE_FACTOR, RESCORE_MIN))]
+
+        sims = self.exact_vectors(shortlist) @ q
+        top = _top_sorted(sims, top_k)
+        return shortlist[top], sims[top]
+
+    def hybrid_search(self, query: np.ndarray, gap_columns: List[str], user_scores: List[float],
+                      top_k: int = 4, visual_weight: float = 0.6, score_weight: float = 0.4,
+                      mask: Optional[np.ndarray] = None,
+                      max_gap: float = 10.0) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Rank rows by visual similarity blended with the dimensional gap, in one pass.
+
+        hybrid = visual_weight * cosine + score_weight * min(gap / max_gap, 1), where
+        gap is the largest (row score - user score) over gap_columns, floored at 0.
+        Every candidate row is scored (the ANN index is not used, since a large gap
+        can outrank a closer image); NULL scores contribute no gap.
+
+        Args:
+            query: Query vector (normalized here)
+            gap_columns: Score columns to measure the gap on
+            user_scores: User score per gap column
+            top_k: Number of results
+            visual_weight: Weight for visual similarity
+            score_weight: Weight for the normalized gap
+            mask: Optional boolean row mask
+            max_gap: Gap that maps to a full score_weight
+
+        Returns:
+            (row_indices, hybrid_scores, similarities, gaps) sorted by hybrid score descending
+        """
+        empty = np.zeros(0, dtype=np.float32)
+        if len(self) == 0:
+            return np.zeros(0, dtype=np.int64), empty, empty, empty
+
+        q = np.asarray(query, dtype=np.float32).reshape(-1)
+        q = q / (np.linalg.norm(q) + 1e-8)
+
+        candidates = np.arange(len(self)) if mask is None else np.flatnonzero(mask)
+        if candidates.size == 0:
+            return np.zeros(0, dtype=np.int64), empty, empty, empty
+
+        col_idx = [SCORE_COLUMNS.index(c) for c in gap_columns]
+        if col_idx:
+            scores = self.scores[:, col_idx] if mask is None else self.scores[np.ix_(candidates, col_idx)]
+            diff = scores - np.asarray(user_scores, dtype=np.float32)
+            diff[np.isnan(diff)] = 0.0
+            gaps = np.maximum(diff.max(axis=1), 0.0)
+        else:
+            gaps = np.zeros(candidates.size, dtype=np.float32)
+        bonus = score_weight * np.minimum(gaps / max_gap, 1.0)
+
+        if self.qvectors is not None:
+            coarse = self._coarse_similarities(q, candidates, mask is not None)
+            shortlist = _top_unsorted(visual_weight * coarse + bonus,
+                                      max(top_k * RESCORE_FACTOR, RESCORE_MIN))
+            sims = self.exact_vectors(candidates[shortlist]) @ q
+            candidates, gaps, bonus = candidates[shortlist], gaps[shortlist], bonus[shortlist]
+        elif mask is None:
+            sims = self.vectors @ q
+        else:
+            sims = self.vectors[candidates] @ q
+
+        hybrid = visual_weight * sims + bonus
+        top = _top_sorted(hybrid, top_k)
+        return candidates[top], hybrid[top], sims[top], gaps[top]
+
+    def results(self, rows: np.ndarray, sims: np.ndarray, similarity_key: str) -> List[Dict[str, Any]]:
+        """Materialize result dicts (copies of row metadata plus similarity)."""
+        out = []
+        for row, sim in zip(rows, sims):
+            item = dict(self.metadata[int(row)])
+            item[similarity_key] = float(sim)
+            out.append(item)
+        return out
+
+
+def _top_unsorted(values: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k largest values, in no particular order."""
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    if k >= values.shape[0]:
+        return np.arange(values.shape[0])
+    return np.argpartition(-values, k - 1)[:k]
+
+
+def _top_sorted(values: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k largest values, largest first."""
+    top = _top_unsorted(values, k)
+    return top[np.argsort(-values[top], kind='stable')]
+
+
+def set_embedding_quantization(mode: str):
+    """Default quantization for indexes loaded by get_embedding_index (from model_config.json rag section)."""
+    global _quantization
+    if mode not in QUANTIZATION_MODES:
+        raise ValueError(f"Unknown quantization: {mode} (expected one of {QUANTIZATION_MODES})")
+    _quantization = mode
+
+
+def get_embedding_index(db_path: str, advisor_id: str, column: str = 'embedding',
+                        quantization: Optional[str] = None) -> AdvisorEmbeddingIndex:
+    """
+    Return the cached index for an advisor, reloading it if dimensional_profiles changed.
+
+    Args:
+        db_path: Path to SQLite database
+        advisor_id: Advisor to index
+        column: 'embedding' (CLIP) or 'text_embedding' (MiniLM)
+        quantization: 'none' or 'int8' (default: set_embedding_quantization())
+    """
+    quantization = quantization or _quantization
+    # Throttled: writes are picked up within VERSION_CHECK_INTERVAL
+    version = get_profiles_version(db_path, advisor_id, max_age=VERSION_CHECK_INTERVAL)
+    key = (db_path, advisor_id, column, quantization)
+
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is not None and index.version == version:
+            return index
+        load_lock = _load_locks.setdefault(key, threading.Lock())
+
+    with load_lock:
+        # Another thread may have loaded it while this one waited
+        with _indexes_lock:
+            index = _indexes.get(key)
+        if index is not None and index.version == version:
+            return index
+        index = AdvisorEmbeddingIndex(db_path, advisor_id, column, quantization).load(version)
+        index.attach_ann()
+        with _indexes_lock:
+            _indexes[key] = index
+        return index
+
+
+def get_index_stats() -> List[Dict[str, Any]]:
+    """Row counts and resident memory of the cached indexes (for /model-status)."""
+    with _indexes_lock:
+        indexes = list(_indexes.values())
+    return [{
+        'advisor_id': index.advisor_id,
+        'column': index.column,
+        'quantization': index.quantization,
+        'rows': len(index),
+        'ann': index.ann is not None,
+        'memory_mb': round(index.memory_bytes() / 1e6, 2),
+    } for index in indexes]
+
+
+def ranking_overlap(reference: AdvisorEmbeddingIndex, candidate: AdvisorEmbeddingIndex,
+                    queries: np.ndarray, top_k: int = 10) -> float:
+    """
+    Mean overlap@k of candidate's top-k ids with reference's (1.0 = identical sets).
+
+    Used to check that the int8 path returns the same references as float32.
+    """
+    overlaps = []
+    for q in np.atleast_2d(queries):
+        ref_rows, _ = reference.search(q, top_k=top_k)
+        cand_rows, _ = candidate.search(q, top_k=top_k)
+        ref_ids = {reference.metadata[int(r)]['id'] for r in ref_rows}
+        cand_ids = {candidate.metadata[int(r)]['id'] for r in cand_rows}
+        if ref_ids:
+            overlaps.append(len(ref_ids & cand_ids) / len(ref_ids))
+    return float(np.mean(overlaps)) if overlaps else 1.0
+
+
+def invalidate_embedding_index(db_path: Optional[str] = None, advisor_id: Optional[str] = None):
+    """Drop cached indexes (all, per database, or per advisor)."""
+    with _versions_lock:
+        # The next lookup reads the counters again
+        if db_path is None:
+            _versions.clear()
+        else:
+            _versions.pop(db_path, None)
+    with _indexes_lock:
+        for key in list(_indexes):
+            if db_path is not None and key[0] != db_path:
+                continue
+            if advisor_id is not None and key[1] != advisor_id:
+                continue
+            del _indexes[key]
@@ -3,27 +3,68 @@
 Embedding-Based Reference Image Retrieval
 
 This module provides functions to retrieve advisor reference images
-using visual (CLIP) and text embeddings for semantic similarity.
+using visual (CLIP) and text embeddings for semantic similarity, and
+book passages ranked per image (mondrian/passage_index.py).
 
 Used by ai_advisor_service_linux.py for RAG modes.
 """
 
 import os
+import time
 import sqlite3
 import numpy as np
 from typing import List, Dict, Any, Optional, Tuple
 import logging
 
+from mondrian.db_pool import db_connection
+from mondrian.embedding_index import get_embedding_index
+from mondrian.passage_index import get_passage_index
+from mondrian.advisor_cache import get_artifact_cache
+from mondrian.embedding_cache import get_embedding_cache, content_hash, package_version
+from mondrian.embedding_client import EmbeddingServiceError, get_embedding_client, reset_embedding_client
+from mondrian.clip_onnx import cuda_available, get_onnx_clip_encoder
+from mondrian.model_registry import get_model_registry
+
 logger = logging.getLogger(__name__)
 
 # Embedding dimensions
 CLIP_DIM = 512  # clip-vit-base-patch32
 TEXT_DIM = 384  # all-MiniLM-L6-v2
 
-# Lazy loaded models
-_clip_model = None
-_clip_processor = None
-_text_model = None
+CLIP_MODEL_NAME = "openai/clip-vit-base-patch32"
+TEXT_MODEL_NAME = "all-MiniLM-L6-v2"
+
+# Map dimension names to score columns
+DIM_TO_COL = {
+    'composition': 'composition_score',
+    'lighting': 'lighting_score',
+    'focus': 'focus_sharpness_score',
+    'focus_sharpness': 'focus_sharpness_score',
+    'color': 'color_harmony_score',
+    'color_harmony': 'color_harmony_score',
+    'subject_isolation': 'subject_isolation_score',
+    'depth': 'depth_perspective_score',
+    'depth_perspective': 'depth_perspective_score',
+    'visual_balance': 'visual_balance_score',
+    'balance': 'visual_balance_score',
+    'emotional_impact': 'emotional_impact_score',
+}
+
+# Default blend for hybrid retrieval (overridable via model_config.json rag section)
+HYBRID_VISUAL_WEIGHT = 0.6
+HYBRID_SCORE_WEIGHT = 0.4
+
+_hybrid_weights = (HYBRID_VISUAL_WEIGHT, HYBRID_SCORE_WEIGHT)
+
+# Reference images whose description embeddings stand in for the user image's text
+PASSAGE_QUERY_NEIGHBOURS = 8
+
+# Passage retrieval budget (index lookup, query projection and search; encoding excluded)
+PASSAGE_LATENCY_BUDGET_MS = 5.0
+
+# CLIP image encoder: 'auto' (ONNX Runtime when there is no CUDA), 'onnx' or 'torch'
+CLIP_BACKENDS = ('auto', 'onnx', 'torch')
+_clip_backend = ('auto', False)
 
 
 def cosine_similarity(a: np.ndarray, b: np.ndarray) -> float:
@@ -42,80 +83,186 @@ def load_embedding_from_blob(blob: bytes, dim: int) -> Optional[np.ndarray]:
         return None
 
 
+def score_column(dim: str) -> Optional[str]:
+    """Score column for a dimension name (e.g. 'Focus' -> 'focus_sharpness_score')."""
+    return DIM_TO_COL.get(dim.lower().replace(' ', '_').replace('&', ''))
+
+
+def set_hybrid_weights(visual_weight: float, score_weight: float):
+    """Default visual/gap weights for get_images_hybrid_retrieval."""
+    global _hybrid_weights
+    if visual_weight < 0 or score_weight < 0:
+        raise ValueError(f"Hybrid weights must be non-negative, got {visual_weight}/{score_weight}")
+    _hybrid_weights = (float(visual_weight), float(score_weight))
+
+
+def set_clip_backend(backend: str, int8: bool = False):
+    """
+    Select the in-process CLIP image encoder.
+
+    Args:
+        backend: 'auto' (ONNX Runtime on CPU-only nodes, PyTorch with CUDA), 'onnx' or 'torch'
+        int8: Use the int8-quantized ONNX export
+    """
+    global _clip_backend
+    if backend not in CLIP_BACKENDS:
+        raise ValueError(f"Unknown CLIP backend '{backend}' (expected one of {CLIP_BACKENDS})")
+    _clip_backend = (backend, bool(int8))
+
+
+def get_onnx_image_encoder():
+    """ONNX CLIP encoder if the configured backend selects it and it is exported, else None"""
+    backend, int8 = _clip_backend
+    if backend == 'torch' or (backend == 'auto' and cuda_available()):
+        return None
+    return get_onnx_clip_encoder(quantized=int8)
+
+
+def _aux_device() -> str:
+    """Preferred device for auxiliary models (the registry keeps them on the host if it is full)"""
+    return 'cuda' if cuda_available() else 'cpu'
+
+
+def _load_clip():
+    from transformers import CLIPProcessor, CLIPModel
+    logger.info("Loading CLIP model...")
+    return CLIPModel.from_pretrained(CLIP_MODEL_NAME).eval(), CLIPProcessor.from_pretrained(CLIP_MODEL_NAME)
+
+
+def _load_text_model():
+    from sentence_transformers import SentenceTransformer
+    logger.info("Loading text embedding model...")
+    return SentenceTransformer(TEXT_MODEL_NAME, device='cpu')
+
+
 def get_clip_model():
-    """Lazy load CLIP model"""
-    global _clip_model, _clip_processor
-    if _clip_model is None:
-        try:
-            from transformers import CLIPProcessor, CLIPModel
-            import torch
-            
-            logger.info("Loading CLIP model...")
-            _clip_model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32")
-            _clip_processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch32")
-            
-            if torch.cuda.is_available():
-                _clip_model = _clip_model.cuda()
-                logger.info("CLIP model loaded on CUDA")
-            else:
-                logger.info("CLIP model loaded on CPU")
-        except Exception as e:
-            logger.error(f"Failed to load CLIP model: {e}")
-            return None, None
-    return _clip_model, _clip_processor
+    """Lazy load CLIP model (held by the model registry, see mondrian/model_registry.py)"""
+    try:
+        return get_model_registry().acquire('clip', _load_clip, device=_aux_device())
+    except Exception as e:
+        logger.error(f"Failed to load CLIP model: {e}")
+        return None, None
 
 
 def get_text_model():
-    """Lazy load text embedding model"""
-    global _text_model
-    if _text_model is None:
-        try:
-            from sentence_transformers import SentenceTransformer
-            logger.info("Loading text embedding model...")
-            _text_model = SentenceTransformer('all-MiniLM-L6-v2')
-            logger.info("Text model loaded")
-        except Exception as e:
-            logger.error(f"Failed to load text model: {e}")
-            return None
-    return _text_model
+    """Lazy load text embedding model (held by the model registry)"""
+    try:
+        return get_model_registry().acquire('text', _load_text_model, device=_aux_device())
+    except Exception as e:
+        logger.error(f"Failed to load text model: {e}")
+        return None
+
+
+def _service_model_version(client, kind: str) -> str:
+    """Version part of the model key the embedding service reports for `kind` ('' until it reported one)"""
+    return client.model_keys.get(kind, '').rpartition('@')[2]
 
 
 def compute_image_embedding(image_path: str) -> Optional[np.ndarray]:
-    """Compute CLIP embedding for an image at runtime"""
+    """Compute CLIP embedding for an image at runtime (cached by file content hash)"""
+    try:
+        with open(image_path, 'rb') as f:
+            image_bytes = f.read()
+    except OSError as e:
+        logger.error(f"Failed to compute CLIP embedding: {e}")
+        return None
+    
+    cache = get_embedding_cache()
+    digest = content_hash(image_bytes)
+    onnx_encoder = get_onnx_image_encoder()
+    
     from PIL import Image
-    import torch
+    import io
+    
+    # The embedding service may run another encoder (ONNX, int8): its vectors
+    # are cached under the model key it reports, never under the local one
+    client = get_embedding_client() if onnx_encoder is None else None
+    if client is not None:
+        service_version = _service_model_version(client, 'image')
+        if service_version:
+            cached = cache.get(CLIP_MODEL_NAME, service_version, digest)
+            if cached is not None:
+                return cached
+        try:
+            embedding = client.embed_images([image_bytes])[0]
+            service_version = _service_model_version(client, 'image')
+            if service_version:
+                cache.put(CLIP_MODEL_NAME, service_version, digest, embedding)
+            return embedding
+        except EmbeddingServiceError as e:
+            logger.warning(f"[EmbeddingClient] {e} - falling back to in-process CLIP")
+            reset_embedding_client()
+    
+    model_version = package_version('transformers')
+    if onnx_encoder is not None:
+        model_version = f"{model_version}+{onnx_encoder.version_tag}"
+    cached = cache.get(CLIP_MODEL_NAME, model_version, digest)
+    if cached is not None:
+        return cached
+    
+    if onnx_encoder is not None:
+        try:
+            image = Image.open(io.BytesIO(image_bytes)).convert('RGB')
+            embedding = onnx_encoder.encode_images([image])[0]
+            cache.put(CLIP_MODEL_NAME, model_version, digest, embedding)
+            return embedding
+        except Exception as e:
+            logger.error(f"Failed to compute CLIP embedding with ONNX Runtime: {e}")
+            return None
     
-    model, processor = get_clip_model()
-    if model is None:
-        return None
+    import torch
     
     try:
-        image = Image.open(image_path).convert('RGB')
-        inputs = processor(images=image, return_tensors="pt")
-        
-        if torch.cuda.is_available():
-            inputs = {k: v.cuda() for k, v in inputs.items()}
-        
-        with torch.no_grad():
-            image_features = model.get_image_features(**inputs)
+        with get_model_registry().use('clip', _load_clip, device=_aux_device()) as (model, processor):
+            image = Image.open(io.BytesIO(image_bytes)).convert('RGB')
+            device = next(model.parameters()).device
+            inputs = {k: v.to(device) for k, v in processor(images=image, return_tensors="pt").items()}
+            
+            with torch.no_grad():
+                image_features = model.get_image_features(**inputs)
         
         embedding = image_features.cpu().numpy().flatten()
-        embedding = embedding / np.linalg.norm(embedding)
-        return embedding.astype(np.float32)
+        embedding = (embedding / np.linalg.norm(embedding)).astype(np.float32)
+        cache.put(CLIP_MODEL_NAME, model_version, digest, embedding)
+        return embedding
     except Exception as e:
         logger.error(f"Failed to compute CLIP embedding: {e}")
         return None
 
 
 def compute_text_embedding(text: str) -> Optional[np.ndarray]:
-    """Compute text embedding at runtime"""
-    model = get_text_model()
-    if model is None:
-        return None
+    """Compute text embedding at runtime (cached by text content hash)"""
+    cache = get_embedding_cache()
+    digest = content_hash(text.encode('utf-8'))
+    
+    # Service vectors under the service's model key, as for images
+    client = get_embedding_client()
+    if client is not None:
+        service_version = _service_model_version(client, 'text')
+        if service_version:
+            cached = cache.get(TEXT_MODEL_NAME, service_version, digest)
+            if cached is not None:
+                return cached
+        try:
+            embedding = client.embed_texts([text])[0]
+            service_version = _service_model_version(client, 'text')
+            if service_version:
+                cache.put(TEXT_MODEL_NAME, service_version, digest, embedding)
+            return embedding
+        except EmbeddingServiceError as e:
+            logger.warning(f"[EmbeddingClient] {e} - falling back to in-process text model")
+            reset_embedding_client()
+    
+    model_version = package_version('sentence-transformers')
+    cached = cache.get(TEXT_MODEL_NAME, model_version, digest)
+    if cached is not None:
+        return cached
     
     try:
-        embedding = model.encode(text, normalize_embeddings=True)
-        return embedding.astype(np.float32)
+        with get_model_registry().use('text', _load_text_model, device=_aux_device()) as model:
+            embedding = model.encode(text, normalize_embeddings=True).astype(np.float32)
+        cache.put(TEXT_MODEL_NAME, model_version, digest, embedding)
+        return embedding
     except Exception as e:
         logger.error(f"Failed to compute text embedding: {e}")
         return None
@@ -146,17 +293,10 @@ def get_similar_images_by_visual_embedding(
     Raises:
         RuntimeError: If no embeddings found in database
     """
-    # First check if embeddings exist in database
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT COUNT(*) FROM dimensional_profiles 
-        WHERE advisor_id = ? AND embedding IS NOT NULL
-    """, (advisor_id,))
-    count = cursor.fetchone()[0]
-    conn.close()
-    
-    if count == 0:
+    # In-memory index (reloaded automatically when dimensional_profiles changes)
+    index = get_embedding_index(db_path, advisor_id, 'embedding')
+    
+    if index.total_with_embedding == 0:
         raise RuntimeError(
             f"Embedding system not initialized: No image embeddings found for advisor '{advisor_id}'. "
             "Run: python scripts/compute_embeddings.py --advisor ansel"
@@ -170,75 +310,19 @@ def get_similar_images_by_visual_embedding(
             "Check that the image file exists and is valid."
         )
     
-    # Map dimension names to columns
-    dim_to_col = {
-        'composition': 'composition_score',
-        'lighting': 'lighting_score',
-        'focus': 'focus_sharpness_score',
-        'focus_sharpness': 'focus_sharpness_score',
-        'color': 'color_harmony_score',
-        'color_harmony': 'color_harmony_score',
-        'subject_isolation': 'subject_isolation_score',
-        'depth': 'depth_perspective_score',
-        'depth_perspective': 'depth_perspective_score',
-        'visual_balance': 'visual_balance_score',
-        'balance': 'visual_balance_score',
-        'emotional_impact': 'emotional_impact_score',
-    }
-    
-    # Build score filter
-    score_filters = []
-    if weak_dimensions:
-        for dim in weak_dimensions[:3]:
-            col = dim_to_col.get(dim.lower().replace(' ', '_').replace('&', ''))
-            if col:
-                score_filters.append(f"{col} >= {min_score}")
-    
-    where_clause = f"WHERE advisor_id = ? AND embedding IS NOT NULL AND composition_score IS NOT NULL"
-    if score_filters:
-        where_clause += f" AND ({' OR '.join(score_filters)})"
-    
-    # Fetch candidates
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    
-    cursor.execute(f"""
-        SELECT id, image_path, image_title, date_taken, image_description,
-               composition_score, lighting_score, focus_sharpness_score,
-               color_harmony_score, subject_isolation_score, depth_perspective_score,
-               visual_balance_score, emotional_impact_score, overall_grade,
-               embedding
-        FROM dimensional_profiles
-        {where_clause}
-    """, (advisor_id,))
-    
-    rows = cursor.fetchall()
-    conn.close()
-    
-    if not rows:
-        logger.info(f"No images with embeddings found for advisor {advisor_id}")
-        return []
+    # Build score filter (OR across up to 3 weak dimensions)
+    score_columns = [col for col in map(score_column, (weak_dimensions or [])[:3]) if col]
     
-    # Compute similarities
-    results = []
-    for row in rows:
-        ref_embedding = load_embedding_from_blob(row['embedding'], CLIP_DIM)
-        if ref_embedding is None:
-            continue
-        
-        similarity = cosine_similarity(user_embedding, ref_embedding)
-        
-        img_dict = dict(row)
-        del img_dict['embedding']  # Don't include raw embedding in result
-        img_dict['visual_similarity'] = float(similarity)
-        results.append(img_dict)
+    mask = index.filter_mask(score_columns, min_score)
+    rows, sims = index.search(user_embedding, top_k=top_k, mask=mask)
     
-    # Sort by similarity descending
-    results.sort(key=lambda x: x['visual_similarity'], reverse=True)
+    if len(rows) == 0:
+        logger.info(f"No images with embeddings found for advisor {advisor_id}")
+        return []
     
-    logger.info(f"Found {len(results)} visually similar images, returning top {top_k}")
-    return results[:top_k]
+    candidate_count = len(index) if mask is None else int(mask.sum())
+    logger.info(f"Found {candidate_count} visually similar images, returning top {top_k}")
+    return index.results(rows, sims, 'visual_similarity')
 
 
 def get_similar_images_by_text_embedding(
@@ -264,17 +348,10 @@ def get_similar_images_by_text_embedding(
     Raises:
         RuntimeError: If no text embeddings found in database
     """
-    # First check if text embeddings exist in database
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT COUNT(*) FROM dimensional_profiles 
-        WHERE advisor_id = ? AND text_embedding IS NOT NULL
-    """, (advisor_id,))
-    count = cursor.fetchone()[0]
-    conn.close()
-    
-    if count == 0:
+    # In-memory index (reloaded automatically when dimensional_profiles changes)
+    index = get_embedding_index(db_path, advisor_id, 'text_embedding')
+    
+    if index.total_with_embedding == 0:
         raise RuntimeError(
             f"Embedding system not initialized: No text embeddings found for advisor '{advisor_id}'. "
             "Run: python scripts/compute_embeddings.py --advisor ansel"
@@ -288,49 +365,14 @@ def get_similar_images_by_text_embedding(
             "Check that sentence-transformers is installed."
         )
     
-    # Fetch candidates
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        SELECT id, image_path, image_title, date_taken, image_description,
-               composition_score, lighting_score, focus_sharpness_score,
-               color_harmony_score, subject_isolation_score, depth_perspective_score,
-               visual_balance_score, emotional_impact_score, overall_grade,
-               text_embedding
-        FROM dimensional_profiles
-        WHERE advisor_id = ?
-          AND text_embedding IS NOT NULL
-          AND composition_score IS NOT NULL
-    """, (advisor_id,))
-    
-    rows = cursor.fetchall()
-    conn.close()
+    rows, sims = index.search(query_embedding, top_k=top_k)
     
-    if not rows:
+    if len(rows) == 0:
         logger.info(f"No images with text embeddings found for advisor {advisor_id}")
         return []
     
-    # Compute similarities
-    results = []
-    for row in rows:
-        ref_embedding = load_embedding_from_blob(row['text_embedding'], TEXT_DIM)
-        if ref_embedding is None:
-            continue
-        
-        similarity = cosine_similarity(query_embedding, ref_embedding)
-        
-        img_dict = dict(row)
-        del img_dict['text_embedding']
-        img_dict['text_similarity'] = float(similarity)
-        results.append(img_dict)
-    
-    # Sort by similarity descending
-    results.sort(key=lambda x: x['text_similarity'], reverse=True)
-    
-    logger.info(f"Found {len(results)} text-similar images, returning top {top_k}")
-    return results[:top_k]
+    logger.info(f"Found {len(index)} text-similar images, returning top {top_k}")
+    return index.results(rows, sims, 'text_similarity')
 
 
 def get_images_hybrid_retrieval(
@@ -340,12 +382,16 @@ def get_images_hybrid_retrieval(
     weak_dimensions: List[str],
     user_scores: Dict[str, float],
     top_k: int = 4,
-    visual_weight: float = 0.6,
-    score_weight: float = 0.4
+    visual_weight: Optional[float] = None,
+    score_weight: Optional[float] = None
 ) -> List[Dict[str, Any]]:
     """
     Hybrid retrieval: combine visual similarity with dimensional gap scores.
     
+    Every image excelling in one of the first 3 weak dimensions is scored
+    (not just the visual top 20) in one vectorized pass over the advisor's
+    embedding and score matrices.
+    
     Args:
         db_path: Path to SQLite database
         user_image_path: Path to user's image
@@ -353,8 +399,8 @@ def get_images_hybrid_retrieval(
         weak_dimensions: User's weak dimensions
         user_scores: Dict of user's scores per dimension
         top_k: Number of results to return
-        visual_weight: Weight for visual similarity (0-1)
-        score_weight: Weight for gap score (0-1)
+        visual_weight: Weight for visual similarity (default: set_hybrid_weights())
+        score_weight: Weight for gap score (default: set_hybrid_weights())
     
     Returns:
         List of reference images sorted by hybrid score
@@ -362,59 +408,152 @@ def get_images_hybrid_retrieval(
     Raises:
         RuntimeError: If embeddings not initialized
     """
-    # Get visually similar images (will raise RuntimeError if no embeddings)
-    visual_results = get_similar_images_by_visual_embedding(
-        db_path, user_image_path, advisor_id, weak_dimensions, top_k=20
+    default_visual, default_score = _hybrid_weights
+    visual_weight = default_visual if visual_weight is None else visual_weight
+    score_weight = default_score if score_weight is None else score_weight
+    
+    index = get_embedding_index(db_path, advisor_id, 'embedding')
+    if index.total_with_embedding == 0:
+        raise RuntimeError(
+            f"Embedding system not initialized: No image embeddings found for advisor '{advisor_id}'. "
+            "Run: python scripts/compute_embeddings.py --advisor ansel"
+        )
+    
+    user_embedding = compute_image_embedding(user_image_path)
+    if user_embedding is None:
+        raise RuntimeError(
+            "Could not compute user image embedding. "
+            "Check that the image file exists and is valid."
+        )
+    
+    # Candidate pool: images scoring >= 8 in any of the first 3 weak dimensions
+    filter_columns = [col for col in map(score_column, weak_dimensions[:3]) if col]
+    mask = index.filter_mask(filter_columns, 8.0)
+    
+    # Gap is measured on every weak dimension the user has a score for
+    gap_columns = []
+    for col in map(score_column, weak_dimensions):
+        if col and col not in gap_columns and col.replace('_score', '') in user_scores:
+            gap_columns.append(col)
+    gap_user_scores = [user_scores[col.replace('_score', '')] for col in gap_columns]
+    
+    rows, hybrid, sims, gaps = index.hybrid_search(
+        user_embedding, gap_columns, gap_user_scores, top_k=top_k,
+        visual_weight=visual_weight, score_weight=score_weight, mask=mask
     )
     
-    if not visual_results:
+    if len(rows) == 0:
         raise RuntimeError(
             "No visual similarity results found. This may indicate corrupted embeddings."
         )
     
-    # Map dimension names to columns
-    dim_to_col = {
-        'composition': 'composition_score',
-        'lighting': 'lighting_score',
-        'focus': 'focus_sharpness_score',
-        'focus_sharpness': 'focus_sharpness_score',
-        'color': 'color_harmony_score',
-        'color_harmony': 'color_harmony_score',
-        'subject_isolation': 'subject_isolation_score',
-        'depth': 'depth_perspective_score',
-        'depth_perspective': 'depth_perspective_score',
-        'visual_balance': 'visual_balance_score',
-        'balance': 'visual_balance_score',
-        'emotional_impact': 'emotional_impact_score',
-    }
-    
-    # Calculate hybrid score for each result
-    for img in visual_results:
-        # Calculate max gap across weak dimensions
-        max_gap = 0
-        for dim in weak_dimensions:
-            col = dim_to_col.get(dim.lower().replace(' ', '_').replace('&', ''))
-            if col and col.replace('_score', '') in user_scores:
-                user_score = user_scores.get(col.replace('_score', ''), 5)
-                ref_score = img.get(col, 0) or 0
-                gap = ref_score - user_score
-                max_gap = max(max_gap, gap)
-        
-        # Normalize gap to 0-1 (assuming max gap of 10)
-        normalized_gap = min(max_gap / 10.0, 1.0)
-        
-        # Hybrid score
-        visual_sim = img.get('visual_similarity', 0)
-        hybrid_score = (visual_weight * visual_sim) + (score_weight * normalized_gap)
-        
-        img['max_gap'] = max_gap
-        img['hybrid_score'] = hybrid_score
+    results = index.results(rows, sims, 'visual_similarity')
+    for img, gap, score in zip(results, gaps, hybrid):
+        img['max_gap'] = float(gap)
+        img['hybrid_score'] = float(score)
+    
+    candidate_count = len(index) if mask is None else int(mask.sum())
+    logger.info(f"Hybrid retrieval: scored {candidate_count} images, returning top {len(results)}")
+    return results
+
+
+def image_text_query(db_path: str, user_embedding: np.ndarray, advisor_id: str) -> Optional[np.ndarray]:
+    """
+    Project the user image (its CLIP embedding) into the passage (MiniLM) space.
+    
+    CLIP and MiniLM vectors live in different spaces, so the query is the
+    similarity-weighted mean of the description embeddings of the advisor's
+    visually nearest reference images.
+    
+    Returns:
+        Query vector, or None if either index is empty
+    """
+    visual = get_embedding_index(db_path, advisor_id, 'embedding')
+    text = get_embedding_index(db_path, advisor_id, 'text_embedding')
+    if len(visual) == 0 or len(text) == 0:
+        return None
     
-    # Sort by hybrid score
-    visual_results.sort(key=lambda x: x['hybrid_score'], reverse=True)
+    rows, sims = visual.search(user_embedding, top_k=PASSAGE_QUERY_NEIGHBOURS)
+    weights = {visual.metadata[int(r)]['id']: max(float(s), 0.0) for r, s in zip(rows, sims)}
+    text_rows = text.rows_for_ids(list(weights))
+    if len(text_rows) == 0:
+        return None
     
-    logger.info(f"Hybrid retrieval: returning top {top_k} images")
-    return visual_results[:top_k]
+    w = np.asarray([weights[text.metadata[int(r)]['id']] for r in text_rows], dtype=np.float32)
+    if w.sum() <= 0:
+        w = np.ones_like(w)
+    return (w[:, None] * text.exact_vectors(text_rows)).sum(axis=0)
+
+
+def get_book_passages_for_image(
+    advisor_id: str,
+    user_image_path: Optional[str] = None,
+    query_text: Optional[str] = None,
+    max_passages: int = 6,
+    db_path: str = None
+) -> List[Dict]:
+    """
+    Book passages ranked for one image, with relevance_score as a prior.
+    
+    The query is the generated description (query_text) when available,
+    otherwise the image projected through its nearest reference images'
+    descriptions. Falls back to the static get_top_book_passages ordering
+    (from the advisor artifact cache) when no query can be built or no
+    passages have embeddings.
+    
+    Args:
+        advisor_id: ID of the advisor (e.g., "ansel")
+        user_image_path: Path to the user's image
+        query_text: Description of the image (e.g., from the model)
+        max_passages: Maximum passages to return (default 6)
+        db_path: Path to database (default: mondrian.db)
+    
+    Returns:
+        List of dicts with keys: passage_text, book_title, dimensions, relevance_score
+        (plus semantic_similarity and passage_score when ranked semantically)
+    """
+    if db_path is None:
+        db_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'mondrian.db')
+    
+    try:
+        start = time.perf_counter()
+        index = get_passage_index(db_path, advisor_id)
+        if len(index) > 0:
+            # Encoding is outside the latency budget
+            encode_start = time.perf_counter()
+            if query_text:
+                query = compute_text_embedding(query_text)
+            elif user_image_path:
+                query = compute_image_embedding(user_image_path)
+            else:
+                query = None
+            encode_ms = (time.perf_counter() - encode_start) * 1000
+            if query is not None and not query_text:
+                query = image_text_query(db_path, query, advisor_id)
+            
+            if query is not None and query.shape[0] == index.dim:
+                passages = index.search(query, top_k=max_passages)
+                elapsed_ms = (time.perf_counter() - start) * 1000 - encode_ms
+                if elapsed_ms > PASSAGE_LATENCY_BUDGET_MS:
+                    logger.warning(f"[PassageIndex] Passage retrieval took {elapsed_ms:.1f}ms "
+                                   f"(budget {PASSAGE_LATENCY_BUDGET_MS}ms, {len(index)} passages)")
+                logger.info(f"Retrieved {len(passages)} book passages by semantic similarity in {elapsed_ms:.2f}ms "
+                            f"(+{encode_ms:.1f}ms encoding)")
+                return passages
+    except Exception as e:
+        logger.warning(f"[PassageIndex] Semantic passage retrieval failed, using static order: {e}")
+    
+    return cached_top_book_passages(advisor_id, max_passages=max_passages, db_path=db_path)
+
+
+def cached_top_book_passages(advisor_id: str, max_passages: int = 6, db_path: str = None) -> List[Dict]:
+    """get_top_book_passages served from the advisor artifact cache"""
+    if db_path is None:
+        db_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'mondrian.db')
+    return get_artifact_cache(db_path).get_or_load(
+        ('book_passages', advisor_id, max_passages),
+        lambda: get_top_book_passages(advisor_id=advisor_id, max_passages=max_passages, db_path=db_path)
+    )
 
 
 def get_top_book_passages(advisor_id: str, max_passages: int = 6, db_path: str = None) -> List[Dict]:
@@ -435,10 +574,6 @@ def get_top_book_passages(advisor_id: str, max_passages: int = 6, db_path: str =
     
     logger.info(f"Retrieving top book passages for advisor {advisor_id} (single-pass)")
     
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    
     # Get top passages by relevance score (no dimension filter)
     query = """
         SELECT passage_text, book_title, dimension_tags, relevance_score
@@ -448,9 +583,8 @@ def get_top_book_passages(advisor_id: str, max_passages: int = 6, db_path: str =
         LIMIT ?
     """
     
-    cursor.execute(query, (advisor_id, max_passages))
-    rows = cursor.fetchall()
-    conn.close()
+    with db_connection(db_path, row_factory=sqlite3.Row) as conn:
+        rows = conn.execute(query, (advisor_id, max_passages)).fetchall()
     
     passages = []
     for row in rows:
@@ -489,10 +623,6 @@ def get_book_passages_for_dimensions(advisor_id, weak_dimensions, max_passages=2
     
     logger.info(f"Retrieving book passages for advisor {advisor_id}, dimensions: {weak_dimensions}")
     
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    
     # Build query to find passages matching any of the weak dimensions
     # dimension_tags is stored as JSON array
     dimension_conditions = []
@@ -514,9 +644,8 @@ def get_book_passages_for_dimensions(advisor_id, weak_dimensions, max_passages=2
     """
     params.append(max_passages)
     
-    cursor.execute(query, params)
-    rows = cursor.fetchall()
-    conn.close()
+    with db_connection(db_path, row_factory=sqlite3.Row) as conn:
+        rows = conn.execute(query, params).fetchall()
     
     passages = []
     for row in rows:
@@ -539,8 +668,11 @@ __all__ = [
     'get_similar_images_by_visual_embedding',
     'get_similar_images_by_text_embedding',
     'get_images_hybrid_retrieval',
+    'set_hybrid_weights',
+    'set_clip_backend',
     'get_book_passages_for_dimensions',
     'get_top_book_passages',  # Single-pass RAG
+    'get_book_passages_for_image',
     'cosine_similarity',
     'load_embedding_from_blob'
 ]
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+Mondrian Embedding Service
+Holds the CLIP image model and the MiniLM text model once per machine and
+serves float32 embeddings to the advisor service and the offline scripts
+(see mondrian/embedding_client.py). Runs on port 5008, or on a Unix socket.
+
+Concurrent requests are coalesced: a MicroBatcher per model waits up to
+BATCH_WINDOW_MS after the first queued request for others to arrive, then
+runs one forward pass over all of them (up to MAX_BATCH items) and hands
+each caller its own rows.
+
+Protocol:
+    POST /embed/image   body: concatenated image files,
+                        X-Image-Lengths: "<bytes>,<bytes>,..."
+                        (or multipart/form-data with one or more 'images' files)
+    POST /embed/text    JSON {"texts": ["...", ...]}
+    Response:           application/octet-stream, little-endian float32 rows
+                        X-Embedding-Shape: "<n>,<dim>"
+                        X-Embedding-Model: "<model>@<package version>"
+    GET  /health        models, batching statistics
+
+Usage:
+    python3 mondrian/embedding_service.py --port 5008
+    python3 mondrian/embedding_service.py --socket /tmp/mondrian-embedding.sock
+"""
+
+import io
+import sys
+import queue
+import argparse
+import threading
+import time
+import logging
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+from flask import Flask, request, jsonify, Response
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from mondrian.embedding_cache import package_version
+from mondrian.clip_onnx import get_onnx_clip_encoder
+
+logger = logging.getLogger(__name__)
+
+app = Flask(__name__)
+
+CLIP_MODEL_NAME = "openai/clip-vit-base-patch32"
+TEXT_MODEL_NAME = "all-MiniLM-L6-v2"
+
+# Coalescing window after the first queued request, and forward-pass size cap
+BATCH_WINDOW_MS = 5.0
+MAX_BATCH = 64
+
+
+class _Pending:
+    """One caller's items waiting for a batch."""
+
+    def __init__(self, items: list):
+        self.items = items
+        self.done = threading.Event()
+        self.result: Optional[np.ndarray] = None
+        self.error: Optional[BaseException] = None
+
+
+class MicroBatcher:
+    """Coalesces concurrent submit() calls into batched encode_fn calls."""
+
+    def __init__(self, encode_fn: Callable[[list], np.ndarray], name: str,
+                 max_batch: int = MAX_BATCH, window_ms: float = BATCH_WINDOW_MS):
+        """
+        Args:
+            encode_fn: Maps a list of items to an (n, dim) float32 array
+            name: Label for logs and stats
+            max_batch: Most items per encode_fn call
+            window_ms: How long to wait for more requests after the first
+        """
+        self.encode_fn = encode_fn
+        self.name = name
+        self.max_batch = max_batch
+        self.window = window_ms / 1000.0
+        self._queue: "queue.Queue[_Pending]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name=f"batcher-{name}", daemon=True)
+        self._thread.start()
+        self.stats = {'requests': 0, 'items': 0, 'batches': 0, 'encode_seconds': 0.0}
+
+    def submit(self, items: list) -> np.ndarray:
+        """Queue items and block until their rows are computed."""
+        if not items:
+            raise ValueError("No items to embed")
+        pending = _Pending(list(items))
+        self._queue.put(pending)
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def _collect(self) -> List[_Pending]:
+        """Block for one request, then gather others until the window closes or the batch is full."""
+        batch = [self._queue.get()]
+        count = len(batch[0].items)
+        deadline = time.monotonic() + self.window
+        while count < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                pending = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(pending)
+            count += len(pending.items)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            items = [item for pending in batch for item in pending.items]
+            start = time.perf_counter()
+            try:
+                # Requests larger than max_batch are split into several forward passes
+                chunks = [np.asarray(self.encode_fn(items[i:i + self.max_batch]), dtype=np.float32)
+                          for i in range(0, len(items), self.max_batch)]
+                vectors = np.vstack(chunks)
+                offset = 0
+                for pending in batch:
+                    pending.result = vectors[offset:offset + len(pending.items)]
+                    offset += len(pending.items)
+            except Exception as e:
+                logger.error(f"[EmbeddingService] {self.name} batch of {len(items)} failed: {e}")
+                for pending in batch:
+                    pending.error = e
+            self.stats['requests'] += len(batch)
+            self.stats['items'] += len(items)
+            self.stats['batches'] += 1
+            self.stats['encode_seconds'] += time.perf_counter() - start
+            for pending in batch:
+                pending.done.set()
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = dict(self.stats)
+        stats['mean_batch_items'] = round(stats['items'] / stats['batches'], 2) if stats['batches'] else 0.0
+        stats['queued'] = self._queue.qsize()
+        return stats
+
+
+# ============================================================================
+# Models
+# ============================================================================
+
+_clip_model = None
+_clip_processor = None
+_text_model = None
+_device = 'cpu'
+
+# Set by load_models() (tests may install their own batchers)
+image_batcher: Optional[MicroBatcher] = None
+text_batcher: Optional[MicroBatcher] = None
+model_keys = {
+    'image': f"{CLIP_MODEL_NAME}@{package_version('transformers')}",
+    'text': f"{TEXT_MODEL_NAME}@{package_version('sentence-transformers')}",
+}
+
+
+def encode_images(images: list) -> np.ndarray:
+    """CLIP forward pass over decoded PIL images; L2-normalized float32 rows"""
+    import torch
+
+    inputs = _clip_processor(images=images, return_tensors="pt")
+    inputs = {k: v.to(_device) for k, v in inputs.items()}
+    with torch.no_grad():
+        features = _clip_model.get_image_features(**inputs)
+    embeddings = features.cpu().numpy().astype(np.float32)
+    return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+
+def encode_texts(texts: list) -> np.ndarray:
+    """MiniLM encoding; L2-normalized float32 rows"""
+    return np.asarray(
+        _text_model.encode(texts, batch_size=len(texts), normalize_embeddings=True),
+        dtype=np.float32
+    )
+
+
+def load_models(window_ms: float = BATCH_WINDOW_MS, max_batch: int = MAX_BATCH,
+                clip_backend: str = 'auto', clip_int8: bool = False):
+    """
+    Load CLIP and MiniLM once and start their batchers.
+
+    Args:
+        clip_backend: 'auto' (ONNX Runtime export on CPU, PyTorch on CUDA), 'onnx' or 'torch'
+        clip_int8: Use the int8-quantized ONNX export
+    """
+    global _clip_model, _clip_processor, _text_model, _device, image_batcher, text_batcher
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    _device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    onnx_encoder = None
+    if clip_backend == 'onnx' or (clip_backend == 'auto' and _device == 'cpu'):
+        onnx_encoder = get_onnx_clip_encoder(quantized=clip_int8)
+    if onnx_encoder is not None:
+        logger.info(f"[EmbeddingService] Using ONNX Runtime {CLIP_MODEL_NAME} ({onnx_encoder.version_tag})")
+        model_keys['image'] = f"{CLIP_MODEL_NAME}@{package_version('transformers')}+{onnx_encoder.version_tag}"
+        encode_image_batch = onnx_encoder.encode_images
+    else:
+        from transformers import CLIPProcessor, CLIPModel
+        logger.info(f"[EmbeddingService] Loading {CLIP_MODEL_NAME} on {_device}...")
+        _clip_model = CLIPModel.from_pretrained(CLIP_MODEL_NAME).to(_device).eval()
+        _clip_processor = CLIPProcessor.from_pretrained(CLIP_MODEL_NAME)
+        encode_image_batch = encode_images
+    logger.info(f"[EmbeddingService] Loading {TEXT_MODEL_NAME} on {_device}...")
+    _text_model = SentenceTransformer(TEXT_MODEL_NAME, device=_device)
+
+    image_batcher = MicroBatcher(encode_image_batch, 'image', max_batch=max_batch, window_ms=window_ms)
+    text_batcher = MicroBatcher(encode_texts, 'text', max_batch=max_batch, window_ms=window_ms)
+    logger.info(f"[EmbeddingService] Models ready (batch window {window_ms}ms, max batch {max_batch})")
+
+
+# ============================================================================
+# Routes
+# ============================================================================
+
+def _vectors_response(vectors: np.ndarray, kind: str) -> Response:
+    vectors = np.ascontiguousarray(vectors, dtype='<f4')
+    return Response(vectors.tobytes(), mimetype='application/octet-stream', headers={
+        'X-Embedding-Shape': f"{vectors.shape[0]},{vectors.shape[1]}",
+        'X-Embedding-Model': model_keys[kind],
+    })
+
+
+def _request_images() -> List[bytes]:
+    """Image payloads from a length-prefixed body or multipart 'images' files."""
+    if request.files:
+        return [f.read() for f in request.files.getlist('images')]
+    lengths = request.headers.get('X-Image-Lengths', '')
+    body = request.get_data()
+    sizes = [int(n) for n in lengths.split(',') if n.strip()]
+    if sum(sizes) != len(body):
+        raise ValueError(f"X-Image-Lengths sums to {sum(sizes)} but body has {len(body)} bytes")
+    images, offset = [], 0
+    for size in sizes:
+        images.append(body[offset:offset + size])
+        offset += size
+    return images
+
+
+@app.route('/embed/image', methods=['POST'])
+def embed_image():
+    """Embed one or more images (decoded here, encoded in a shared batch)"""
+    from PIL import Image
+
+    if image_batcher is None:
+        return jsonify({"error": "Models not loaded"}), 503
+    try:
+        payloads = _request_images()
+        if not payloads:
+            return jsonify({"error": "No images provided"}), 400
+        images = [Image.open(io.BytesIO(data)).convert('RGB') for data in payloads]
+    except Exception as e:
+        return jsonify({"error": f"Could not read images: {e}"}), 400
+    try:
+        return _vectors_response(image_batcher.submit(images), 'image')
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/embed/text', methods=['POST'])
+def embed_text():
+    """Embed one or more texts"""
+    if text_batcher is None:
+        return jsonify({"error": "Models not loaded"}), 503
+    texts = (request.get_json(silent=True) or {}).get('texts')
+    if not texts or not all(isinstance(t, str) for t in texts):
+        return jsonify({"error": "Expected JSON {\"texts\": [\"...\"]}"}), 400
+    try:
+        return _vectors_response(text_batcher.submit(texts), 'text')
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/health', methods=['GET'])
+def health():
+    ready = image_batcher is not None and text_batcher is not None
+    return jsonify({
+        "status": "healthy" if ready else "loading",
+        "device": _device,
+        "models": model_keys,
+        "batching": {
+            'image': image_batcher.get_stats() if image_batcher else None,
+            'text': text_batcher.get_stats() if text_batcher else None,
+        },
+    }), 200 if ready else 503
+
+
+def main():
+    global logger
+    parser = argparse.ArgumentParser(description='Mondrian Embedding Service (CLIP + MiniLM)')
+    parser.add_argument('--port', type=int, default=5008, help='Service port')
+    parser.add_argument('--host', default='127.0.0.1', help='Host to bind to')
+    parser.add_argument('--socket', default=None, help='Serve on this Unix socket instead of host:port')
+    parser.add_argument('--batch-window-ms', type=float, default=BATCH_WINDOW_MS,
+                        help='How long to wait for concurrent requests before a forward pass')
+    parser.add_argument('--max-batch', type=int, default=MAX_BATCH, help='Most items per forward pass')
+    parser.add_argument('--clip-backend', default='auto', choices=['auto', 'onnx', 'torch'],
+                        help='CLIP image encoder (auto: ONNX Runtime export when there is no CUDA)')
+    parser.add_argument('--clip-int8', action='store_true', help='Use the int8-quantized ONNX export')
+    args = parser.parse_args()
+
+    from mondrian.logging_config import setup_service_logging
+    logger = setup_service_logging('embedding_service')
+
+    load_models(window_ms=args.batch_window_ms, max_batch=args.max_batch,
+                clip_backend=args.clip_backend, clip_int8=args.clip_int8)
+
+    host = f"unix://{args.socket}" if args.socket else args.host
+    logger.info(f"Embedding service starting on {args.socket or f'{args.host}:{args.port}'}")
+    app.run(host=host, port=args.port, threaded=True, debug=False, use_reloader=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,448 @@
+#!/usr/bin/env python3
+"""
+Memory-Mapped Embedding Store
+
+One contiguous float32 matrix per (advisor, model) on disk, opened with
+mmap so retrieval gets zero-copy views instead of copying BLOBs out of
+SQLite and re-parsing them on every load.
+
+On-disk layout:
+    embedding_store/<advisor>__<model>/
+        vectors.npy   (capacity, dim) float32, L2-normalized rows
+        ids.txt       row id per slot, one per line (append-only id map)
+        meta.json     count, dim, capacity, model, advisor_id
+
+SQLite rows keep only a pointer ("<store name>:<slot>") in
+dimensional_profiles.embedding_ref / text_embedding_ref (and
+image_captions.embedding_ref); the BLOB column is left NULL.
+
+Writes (scripts/compute_embeddings.py, tools/rag/ingest_npy_embeddings.py)
+only append: a re-embedded row gets a new slot and its old slot is left as
+it is (superseded), since readers may hold zero-copy views of it and SQLite
+pointers refer to it until the new ones are committed. The matrix grows by
+doubling its capacity (a copy swapped in with os.replace) so appends are
+amortized O(1). New slots become visible to readers when meta.json is
+replaced (publish()), which writers do after committing the pointers to
+them; a writer that finds slots an interrupted run wrote but did not
+publish adopts them. Single writer per store is assumed.
+
+Superseded slots are reclaimed by compact_store() (scripts/compute_embeddings.py
+--compact-store): it writes the referenced vectors into a new generation of
+the store (<advisor>__<model>@<n>, slots 0..n-1 in table order), repoints
+every SQLite pointer to it in one transaction, then makes it the generation
+writers open (<advisor>__<model>.current) and deletes the old one.
+"""
+
+import json
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import logging
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+STORE_DIRNAME = 'embedding_store'
+
+INITIAL_CAPACITY = 1024
+
+# BLOB column -> pointer column
+REF_COLUMNS = {
+    'embedding': 'embedding_ref',
+    'text_embedding': 'text_embedding_ref',
+}
+
+# Every (table, column) holding store pointers (rewritten by compact_store)
+POINTER_COLUMNS = [
+    ('dimensional_profiles', 'embedding_ref'),
+    ('dimensional_profiles', 'text_embedding_ref'),
+    ('image_captions', 'embedding_ref'),
+]
+
+# Separates a store's base name from its compaction generation
+GENERATION_SEP = '@'
+
+# Vectors copied per chunk while compacting
+COMPACT_CHUNK_ROWS = 4096
+
+
+def store_root(db_path: str) -> Path:
+    """Store directory next to the database."""
+    return Path(db_path).resolve().parent / STORE_DIRNAME
+
+
+def store_name(advisor_id: str, model: str) -> str:
+    """Directory name for an (advisor, model) store."""
+    return f"{advisor_id}__{re.sub(r'[^A-Za-z0-9._-]+', '-', model)}"
+
+
+def base_name(name: str) -> str:
+    """Store name without its compaction generation."""
+    return name.split(GENERATION_SEP, 1)[0]
+
+
+def current_store_name(db_path: str, base: str) -> str:
+    """Generation of a store that writers append to (the base name until compacted)."""
+    try:
+        return (store_root(db_path) / f"{base}.current").read_text().strip() or base
+    except FileNotFoundError:
+        return base
+
+
+def make_ref(name: str, slot: int) -> str:
+    return f"{name}:{int(slot)}"
+
+
+def parse_ref(ref: str) -> Tuple[str, int]:
+    name, slot = ref.rsplit(':', 1)
+    return name, int(slot)
+
+
+def _normalize(x: np.ndarray) -> np.ndarray:
+    return x / (np.linalg.norm(x, axis=-1, keepdims=True) + 1e-8)
+
+
+class EmbeddingStore:
+    """Memory-mapped (advisor, model) embedding matrix plus its id map."""
+
+    def __init__(self, path: Path, writable: bool = False):
+        self.path = Path(path)
+        self.writable = writable
+        with open(self.path / 'meta.json') as f:
+            self.meta = json.load(f)
+        self._matrix = np.load(self.path / 'vectors.npy', mmap_mode='r+' if writable else 'r')
+        self._ids: Optional[List[str]] = None
+        self._slot_of: Optional[Dict[str, int]] = None
+        if writable:
+            self._recover()
+
+    @property
+    def name(self) -> str:
+        return self.path.name
+
+    @property
+    def count(self) -> int:
+        return int(self.meta['count'])
+
+    @property
+    def dim(self) -> int:
+        return int(self.meta['dim'])
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """Zero-copy (count, dim) view of the memory map."""
+        return self._matrix[:self.count]
+
+    def get(self, slot: int) -> np.ndarray:
+        """Zero-copy view of one stored vector."""
+        if not 0 <= slot < self.count:
+            raise IndexError(f"Slot {slot} out of range for store {self.name} ({self.count} rows)")
+        return self._matrix[slot]
+
+    @property
+    def ids(self) -> List[str]:
+        if self._ids is None:
+            with open(self.path / 'ids.txt') as f:
+                # Lines past count belong to an interrupted write
+                self._ids = f.read().splitlines()[:self.count]
+        return self._ids
+
+    def _recover(self):
+        """
+        Adopt slots an interrupted write left past count (their vectors were
+        flushed before their ids were written, and pointers to them may have
+        been committed) and drop a partially written id line.
+        """
+        with open(self.path / 'ids.txt') as f:
+            text = f.read()
+        ids = text.split('\n')[:-1]
+        if len(ids) < self.count:
+            raise ValueError(f"Store {self.name} id map has {len(ids)} ids for {self.count} rows")
+        ids = ids[:int(self.meta['capacity'])]
+        if len(ids) > self.count or (text and not text.endswith('\n')):
+            with open(self.path / 'ids.txt', 'w') as f:
+                f.write(''.join(f"{row_id}\n" for row_id in ids))
+        self._ids = ids
+        if len(ids) > self.count:
+            logger.info(f"[EmbeddingStore] {self.name}: adopting {len(ids) - self.count} unpublished slots")
+            self.publish()
+
+    def slot_of(self, row_id: str) -> Optional[int]:
+        """Latest slot written for a row id"""
+        if self._slot_of is None:
+            self._slot_of = {row_id: i for i, row_id in enumerate(self.ids)}
+        return self._slot_of.get(row_id)
+
+    @classmethod
+    def create(cls, path: Path, dim: int, advisor_id: str, model: str) -> 'EmbeddingStore':
+        """Create an empty store directory."""
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        matrix = np.lib.format.open_memmap(path / 'vectors.npy', mode='w+', dtype=np.float32,
+                                           shape=(INITIAL_CAPACITY, dim))
+        matrix.flush()
+        del matrix
+        (path / 'ids.txt').write_text('')
+        meta = {
+            'advisor_id': advisor_id,
+            'model': model,
+            'dim': int(dim),
+            'count': 0,
+            'capacity': INITIAL_CAPACITY,
+            'updated_at': datetime.now().isoformat(),
+        }
+        _write_json_atomic(path / 'meta.json', meta)
+        return cls(path, writable=True)
+
+    @classmethod
+    def open_for_write(cls, db_path: str, advisor_id: str, model: str, dim: int) -> 'EmbeddingStore':
+        """Open (creating if needed) the store for an advisor/model pair."""
+        path = store_root(db_path) / current_store_name(db_path, store_name(advisor_id, model))
+        if not (path / 'meta.json').exists():
+            return cls.create(path, dim, advisor_id, model)
+        store = cls(path, writable=True)
+        if store.dim != dim:
+            raise ValueError(f"Store {store.name} has dim {store.dim}, got {dim}")
+        return store
+
+    def _grow(self, needed: int):
+        """Double capacity until `needed` rows fit, copying into a new file."""
+        capacity = int(self.meta['capacity'])
+        while capacity < needed:
+            capacity *= 2
+        tmp = self.path / 'vectors.npy.tmp'
+        written = len(self.ids)
+        grown = np.lib.format.open_memmap(tmp, mode='w+', dtype=np.float32, shape=(capacity, self.dim))
+        grown[:written] = self._matrix[:written]
+        grown.flush()
+        del grown
+        self._matrix = None
+        os.replace(tmp, self.path / 'vectors.npy')
+        self._matrix = np.load(self.path / 'vectors.npy', mmap_mode='r+')
+        self.meta['capacity'] = capacity
+
+    def upsert(self, row_ids: Sequence[str], vectors: np.ndarray, publish: bool = True) -> List[int]:
+        """
+        Append vectors for row ids (a row written before gets a new slot; the
+        old one is left for readers still using it).
+
+        Args:
+            row_ids: Row identifiers (dimensional_profiles.id / image_captions.id)
+            vectors: (len(row_ids), dim) embeddings (normalized here)
+            publish: Make the new slots visible now. Pass False when pointers
+                     to them are committed to SQLite afterwards, and call
+                     publish() after the commit
+
+        Returns:
+            Slot per row id, in input order
+        """
+        if not self.writable:
+            raise RuntimeError(f"Store {self.name} was opened read-only")
+        vectors = _normalize(np.asarray(vectors, dtype=np.float32).reshape(len(row_ids), -1))
+        if vectors.shape[1] != self.dim:
+            raise ValueError(f"Store {self.name} has dim {self.dim}, got {vectors.shape[1]}")
+
+        self.slot_of('')  # build the id -> slot map
+        start = len(self.ids)
+        new_ids = [str(row_id) for row_id in row_ids]
+        if start + len(new_ids) > int(self.meta['capacity']):
+            self._grow(start + len(new_ids))
+
+        # Vectors reach the file before their ids: an id line means its slot is complete
+        self._matrix[start:start + len(new_ids)] = vectors
+        self._matrix.flush()
+        with open(self.path / 'ids.txt', 'a') as f:
+            f.write(''.join(f"{row_id}\n" for row_id in new_ids))
+
+        slots = list(range(start, start + len(new_ids)))
+        self._ids.extend(new_ids)
+        self._slot_of.update(zip(new_ids, slots))
+        if publish:
+            self.publish()
+        return slots
+
+    @property
+    def superseded(self) -> int:
+        """Slots holding an older vector of a row that has been written again"""
+        self.slot_of('')
+        return len(self.ids) - len(self._slot_of)
+
+    def publish(self):
+        """Make every written slot visible to readers (replaces meta.json)."""
+        self.meta['count'] = len(self.ids)
+        self.meta['superseded'] = self.superseded
+        self.meta['updated_at'] = datetime.now().isoformat()
+        _write_json_atomic(self.path / 'meta.json', self.meta)
+
+
+def _write_json_atomic(path: Path, data: dict):
+    tmp = path.with_name(path.name + '.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp, path)
+
+
+def compact_store(db_path: str, base: str) -> Dict[str, object]:
+    """
+    Rewrite a store with only the slots SQLite points to, so an advisor's
+    rows cover slots 0..n-1 again (zero-copy index view) after re-embeds.
+
+    The database write lock is held from reading the pointers to committing
+    the new ones, so no writer commits pointers to the old generation
+    meanwhile. Readers resolve pointers to whichever generation they name.
+
+    Args:
+        db_path: SQLite database holding the pointers
+        base: Store name without generation (store_name(advisor_id, model))
+
+    Returns:
+        {'store': name written, 'rows': slots kept, 'dropped': slots reclaimed}
+    """
+    root = store_root(db_path)
+    family = sorted(path.name for path in root.glob(f"{base}*")
+                    if path.is_dir() and base_name(path.name) == base)
+    if not family:
+        raise FileNotFoundError(f"No embedding store {base} under {root}")
+    generation = max(int(name.rpartition(GENERATION_SEP)[2]) if GENERATION_SEP in name else 0
+                     for name in family) + 1
+    target_name = f"{base}{GENERATION_SEP}{generation}"
+
+    conn = sqlite3.connect(db_path, timeout=30)
+    target = None
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        pointers = []  # (table, column, rowid, source name, source slot)
+        for table, column in POINTER_COLUMNS:
+            columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+            if column not in columns:
+                continue
+            for rowid, ref in conn.execute(
+                f"SELECT rowid, {column} FROM {table} WHERE {column} IS NOT NULL ORDER BY rowid"
+            ):
+                name, slot = parse_ref(ref)
+                if base_name(name) == base:
+                    pointers.append((table, column, rowid, name, slot))
+
+        # Writable: adopts slots an interrupted run committed pointers to but did not publish
+        sources = {name: EmbeddingStore(root / name, writable=True) for name in family}
+        written = sum(len(store) for store in sources.values())
+        new_slot: Dict[Tuple[str, int], int] = {}
+        for _, _, _, name, slot in pointers:
+            new_slot.setdefault((name, slot), len(new_slot))
+
+        current = current_store_name(db_path, base)
+        if family == [current] and written == len(new_slot) and all(
+            key == (current, slot) for key, slot in new_slot.items()
+        ):
+            conn.rollback()
+            return {'store': current, 'rows': written, 'dropped': 0}
+
+        meta = sources[current].meta if current in sources else next(iter(sources.values())).meta
+        target = EmbeddingStore.create(root / target_name, int(meta['dim']), meta['advisor_id'], meta['model'])
+        keys = list(new_slot)
+        for start in range(0, len(keys), COMPACT_CHUNK_ROWS):
+            chunk = keys[start:start + COMPACT_CHUNK_ROWS]
+            target.upsert([sources[name].ids[slot] for name, slot in chunk],
+                          np.stack([sources[name].get(slot) for name, slot in chunk]), publish=False)
+        # Nothing points to the new generation before the commit below
+        target.publish()
+
+        for (table, column), rows in _group_pointers(pointers).items():
+            conn.executemany(
+                f"UPDATE {table} SET {column} = ? WHERE rowid = ?",
+                [(make_ref(target_name, new_slot[(name, slot)]), rowid) for rowid, name, slot in rows]
+            )
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        if target is not None:
+            shutil.rmtree(root / target_name, ignore_errors=True)
+        raise
+    finally:
+        conn.close()
+
+    (root / f"{base}.current.tmp").write_text(target_name)
+    os.replace(root / f"{base}.current.tmp", root / f"{base}.current")
+    with _stores_lock:
+        for name in family:
+            _stores.pop((str(root), name), None)
+    for name in family:
+        shutil.rmtree(root / name, ignore_errors=True)
+
+    logger.info(f"[EmbeddingStore] Compacted {base}: {len(new_slot)} rows kept, "
+                f"{written - len(new_slot)} superseded/unreferenced slots dropped -> {target_name}")
+    return {'store': target_name, 'rows': len(new_slot), 'dropped': written - len(new_slot)}
+
+
+def _group_pointers(pointers: list) -> Dict[Tuple[str, str], List[Tuple[int, str, int]]]:
+    grouped: Dict[Tuple[str, str], List[Tuple[int, str, int]]] = {}
+    for table, column, rowid, name, slot in pointers:
+        grouped.setdefault((table, column), []).append((rowid, name, slot))
+    return grouped
+
+
+_stores: Dict[Tuple[str, str], Tuple[float, EmbeddingStore]] = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(db_path: str, name: str) -> Optional[EmbeddingStore]:
+    """
+    Read-only store by name, reopened whenever its meta.json changes.
+
+    Returns:
+        None if the store does not exist
+    """
+    path = store_root(db_path) / name
+    try:
+        mtime = os.stat(path / 'meta.json').st_mtime_ns
+    except FileNotFoundError:
+        return None
+    key = (str(store_root(db_path)), name)
+    with _stores_lock:
+        cached = _stores.get(key)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        try:
+            store = EmbeddingStore(path)
+        except (OSError, ValueError) as e:
+            logger.warning(f"[EmbeddingStore] Failed to open {path}: {e}")
+            return None
+        _stores[key] = (mtime, store)
+        return store
+
+
+def load_vector(db_path: str, ref: Optional[str]) -> Optional[np.ndarray]:
+    """Resolve a "<store>:<slot>" pointer to a zero-copy vector view."""
+    if not ref:
+        return None
+    try:
+        name, slot = parse_ref(ref)
+        store = get_store(db_path, name)
+        return None if store is None else store.get(slot)
+    except (ValueError, IndexError) as e:
+        logger.warning(f"[EmbeddingStore] Bad embedding pointer {ref!r}: {e}")
+        return None
+
+
+def has_ref_columns(conn, table: str = 'dimensional_profiles') -> bool:
+    """True if the table already has the store pointer column(s)."""
+    columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})").fetchall()}
+    return 'embedding_ref' in columns
+
+
+def ensure_ref_columns(conn, table: str = 'dimensional_profiles'):
+    """Add pointer columns for each embedding column the table has."""
+    columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})").fetchall()}
+    for blob_column, ref_column in REF_COLUMNS.items():
+        if blob_column in columns and ref_column not in columns:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {ref_column} TEXT DEFAULT NULL")
+    conn.commit()
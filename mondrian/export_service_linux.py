@@ -12,11 +12,13 @@ import logging
 import argparse
 import re
 import base64
-import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
 from io import BytesIO
 from pathlib import Path
 from datetime import datetime
-from typing import Optional
+from typing import Optional, Tuple
 import requests
 
 try:
@@ -36,12 +38,24 @@ from flask_cors import CORS
 
 # Configure logging
 from mondrian.logging_config import setup_service_logging
+from mondrian.db_pool import db_connection
+from mondrian.timeouts import COMPLETED_ARTIFACT_MAX_AGE
 logger = setup_service_logging('export_service_linux')
 
 # Service URLs
 JOB_SERVICE_URL = "http://127.0.0.1:5005"
 AI_ADVISOR_URL = "http://127.0.0.1:5100"
 
+# A completed job's export never changes: clients keep it and revalidate with If-None-Match
+IMMUTABLE_CACHE_CONTROL = f"private, max-age={COMPLETED_ARTIFACT_MAX_AGE}, immutable"
+NO_STORE_HEADERS = {
+    'Cache-Control': 'no-cache, no-store, must-revalidate, max-age=0',
+    'Pragma': 'no-cache',
+    'Expires': '0',
+}
+# ETags of completed exports remembered, so a revalidation is answered without re-rendering
+EXPORT_ETAG_CACHE_SIZE = 1024
+
 app = Flask(__name__)
 CORS(app)
 
@@ -51,11 +65,8 @@ CORS(app)
 def get_config(db_path: str, key: str) -> Optional[str]:
     """Get a configuration value from the database config table"""
     try:
-        conn = sqlite3.connect(db_path, timeout=5)
-        cursor = conn.cursor()
-        cursor.execute("SELECT value FROM config WHERE key = ?", (key,))
-        result = cursor.fetchone()
-        conn.close()
+        with db_connection(db_path) as conn:
+            result = conn.execute("SELECT value FROM config WHERE key = ?", (key,)).fetchone()
         if result:
             value = result[0]
             if isinstance(value, bytes):
@@ -93,6 +104,8 @@ class ExportService:
         self.image_quality = 75  # JPEG quality 0-100
         self.max_pdf_size_mb = 2.0  # Maximum PDF size in MB
         self.max_images_in_pdf = 15  # Maximum number of images to include (user photo + case studies)
+        self.export_etags = OrderedDict()  # (job_id, format, version) -> (etag, weak) of completed exports, LRU
+        self._etags_lock = threading.Lock()
     
     def compress_base64_image(self, base64_str: str, max_kb: int = 30) -> str:
         """
@@ -362,7 +375,61 @@ class ExportService:
             logger.error(f"Error generating PDF: {e}")
             return None
     
-    def generate_consolidated_export_html(self, job_id: str, db_path: str = None) -> str:
+    def get_job_status(self, job_id: str) -> Optional[dict]:
+        """Fetch a job's status row (no result payloads) from job service"""
+        try:
+            response = requests.get(f"{self.job_service_url}/status/{job_id}", timeout=10)
+            if response.status_code == 200:
+                return response.json()
+            return None
+        except Exception as e:
+            logger.error(f"Error fetching job status: {e}")
+            return None
+    
+    def export_version(self, db_path: str = None) -> str:
+        """
+        Version of what an export is rendered from besides the job: the
+        disclaimer. Remembered ETags are keyed by it, so changing the
+        disclaimer re-renders every export.
+        """
+        return hashlib.sha256(get_disclaimer_text(db_path).encode('utf-8')).hexdigest()[:16]
+    
+    def get_export_etag(self, job_id: str, format_type: str, version: str) -> Optional[Tuple[str, bool]]:
+        """ETag (and whether it is weak) of a completed job's export, if one was rendered"""
+        key = (job_id, format_type, version)
+        with self._etags_lock:
+            etag = self.export_etags.get(key)
+            if etag:
+                self.export_etags.move_to_end(key)
+            return etag
+    
+    def remember_export_etag(self, job_id: str, format_type: str, version: str, etag: str, weak: bool):
+        """Record the ETag of a completed job's export (it only changes with version)"""
+        key = (job_id, format_type, version)
+        with self._etags_lock:
+            self.export_etags[key] = (etag, weak)
+            self.export_etags.move_to_end(key)
+            while len(self.export_etags) > EXPORT_ETAG_CACHE_SIZE:
+                self.export_etags.popitem(last=False)
+    
+    def invalidate_export_etags(self, job_id: Optional[str] = None) -> int:
+        """
+        Forget remembered ETags (of one job, or all).
+        
+        Returns:
+            Number of entries removed
+        """
+        with self._etags_lock:
+            if job_id is None:
+                removed = len(self.export_etags)
+                self.export_etags.clear()
+                return removed
+            keys = [key for key in self.export_etags if key[0] == job_id]
+            for key in keys:
+                del self.export_etags[key]
+            return len(keys)
+    
+    def generate_consolidated_export_html(self, job_id: str, db_path: str = None, job: Optional[dict] = None) -> str:
         """
         Generate consolidated export HTML with:
         - Summary at top (Top 3 Recommendations)
@@ -372,12 +439,14 @@ class ExportService:
         - Disclaimer (pulled from database config)
         
         Optimized for PDF/image export with clean, simple styling and compressed images.
+        Pass job (from get_job_data) if already fetched.
         """
         
         # Get disclaimer text from database (with fallback to default)
         disclaimer_text = get_disclaimer_text(db_path)
         
-        job = self.get_job_data(job_id)
+        if job is None:
+            job = self.get_job_data(job_id)
         if not job:
             return self._error_html(f"Job {job_id} not found")
         
@@ -984,6 +1053,9 @@ def export_consolidated(job_id: str):
     - Full CSS rendering
     - Compressed images (max 1.5MB total)
     - Professional formatting
+    
+    A completed job's export is immutable: it carries a content-hash ETag
+    and Cache-Control: immutable, and If-None-Match is answered with 304.
     """
     
     try:
@@ -1008,54 +1080,62 @@ def export_consolidated(job_id: str):
                 "export_formats": ["html", "pdf" if HAS_WEASYPRINT else "html", "json"]
             }), 200
         
-        elif format_type == 'pdf':
+        if format_type == 'pdf' and not HAS_WEASYPRINT:
+            return jsonify({
+                "error": "PDF generation not available. Install weasyprint: pip install weasyprint",
+                "fallback": "Use format=html and print to PDF from browser"
+            }), 503
+        
+        # Completed exports never change: a revalidation of one rendered
+        # before is answered from the job's status row, without fetching
+        # payloads or rendering. The status check catches deleted jobs
+        format_type = 'pdf' if format_type == 'pdf' else 'html'
+        version = export_service.export_version()
+        remembered = export_service.get_export_etag(job_id, format_type, version)
+        if remembered:
+            not_modified = export_not_modified(*remembered)
+            if not_modified:
+                status = export_service.get_job_status(job_id)
+                if status and status.get('status') == 'completed':
+                    return not_modified
+                export_service.invalidate_export_etags(job_id)
+        
+        job = export_service.get_job_data(job_id)
+        completed = bool(job) and job.get('status') == 'completed'
+        html = export_service.generate_consolidated_export_html(job_id, job=job)
+        
+        # Strong ETag: hash of the export HTML. The PDF rendered from it is
+        # equivalent but not byte-identical between renders, so its ETag is weak
+        etag = hashlib.sha256(html.encode('utf-8')).hexdigest()
+        weak = format_type == 'pdf'
+        if weak:
+            etag = f"{etag}-pdf"
+        if completed:
+            export_service.remember_export_etag(job_id, format_type, version, etag, weak)
+            not_modified = export_not_modified(etag, weak)
+            if not_modified:
+                return not_modified
+            headers = {'Cache-Control': IMMUTABLE_CACHE_CONTROL}
+        else:
+            # Not completed (or missing): the page will change
+            headers = dict(NO_STORE_HEADERS)
+        
+        if format_type == 'pdf':
             # Generate and return PDF
-            if not HAS_WEASYPRINT:
-                return jsonify({
-                    "error": "PDF generation not available. Install weasyprint: pip install weasyprint",
-                    "fallback": "Use format=html and print to PDF from browser"
-                }), 503
-            
-            html = export_service.generate_consolidated_export_html(job_id)
             pdf_bytes = export_service.generate_pdf_from_html(html, job_id)
             
             if not pdf_bytes:
                 return jsonify({"error": "Failed to generate PDF"}), 500
             
-            # Create response with cache-busting headers and filename
-            import hashlib
-            timestamp = int(datetime.now().timestamp())
-            content_hash = hashlib.md5(f"{job_id}{timestamp}".encode()).hexdigest()[:6]
-            
-            response = Response(
-                pdf_bytes,
-                mimetype='application/pdf',
-                headers={
-                    'Cache-Control': 'no-cache, no-store, must-revalidate, max-age=0',
-                    'Pragma': 'no-cache',
-                    'Expires': '0',
-                    'Content-Disposition': f'attachment; filename="analysis-{job_id[:8]}-{content_hash}.pdf"',
-                    'Last-Modified': datetime.now().strftime('%a, %d %b %Y %H:%M:%S GMT'),
-                    'ETag': f'"{job_id}-{timestamp}"'
-                }
-            )
-            return response
-        
+            headers['Content-Disposition'] = f'attachment; filename="analysis-{job_id[:8]}-{etag[:6]}.pdf"'
+            response = Response(pdf_bytes, mimetype='application/pdf', headers=headers)
         else:
             # Return consolidated HTML (default)
-            html = export_service.generate_consolidated_export_html(job_id)
-            
-            return Response(
-                html,
-                mimetype='text/html; charset=utf-8',
-                headers={
-                    'Cache-Control': 'no-cache, no-store, must-revalidate, max-age=0',
-                    'Pragma': 'no-cache',
-                    'Expires': '0',
-                    'Last-Modified': datetime.now().strftime('%a, %d %b %Y %H:%M:%S GMT'),
-                    'ETag': f'"{job_id}-{int(datetime.now().timestamp())}"'
-                }
-            )
+            response = Response(html, mimetype='text/html; charset=utf-8', headers=headers)
+        
+        if completed:
+            response.set_etag(etag, weak=weak)
+        return response
     
     except Exception as e:
         logger.error(f"Export error for job {job_id}: {e}")
@@ -1088,6 +1168,34 @@ def export_metadata(job_id: str):
         return jsonify({"error": str(e)}), 500
 
 
+@app.route('/cache/invalidate', methods=['POST'])
+def cache_invalidate():
+    """
+    Forget remembered export ETags after an admin change (e.g. to an advisor's
+    info), so the next request re-renders.
+    
+    Optional JSON body: {"job_id": "..."} to drop only that job's entries.
+    """
+    data = request.get_json(silent=True) or {}
+    job_id = data.get('job_id') or request.args.get('job_id')
+    removed = export_service.invalidate_export_etags(job_id)
+    return jsonify({
+        "status": "ok",
+        "job_id": job_id,
+        "removed": removed,
+        "timestamp": datetime.now().isoformat()
+    }), 200
+
+
+def export_not_modified(etag: str, weak: bool) -> Optional[Response]:
+    """304 for a request whose If-None-Match matches a completed export's ETag"""
+    if not request.if_none_match.contains_weak(etag):
+        return None
+    response = Response(status=304, headers={'Cache-Control': IMMUTABLE_CACHE_CONTROL})
+    response.set_etag(etag, weak=weak)
+    return response
+
+
 # ==================== MAIN ====================
 
 def main():
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Generation Progress Tracking
+
+The advisor service records, per job, when generation started and when the
+model last produced a token. Job workers poll GET /generation/<job_id> from
+their lease heartbeat (mondrian/job_queue.py LeaseHeartbeat) and only renew
+the job's lease while generation is making progress, so a hung generation
+lets the lease lapse and the job is re-run elsewhere, while a long but
+healthy thinking run keeps its lease however long it takes.
+
+The worker that takes over such a job first cancels the stalled generation
+(POST /generation/<job_id>/cancel): the stopping criteria end it at the next
+decoding step, so the advisor does not run the same job twice.
+"""
+
+import threading
+import time
+from typing import Any, Dict, Optional, Set
+
+
+class GenerationTracker:
+    """Thread-safe per-job generation progress."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._active: Dict[str, Dict[str, float]] = {}
+        self._cancelled: Set[str] = set()
+
+    def start(self, job_id: str):
+        now = time.monotonic()
+        with self._lock:
+            self._active[job_id] = {'started': now, 'last_step': now, 'tokens': 0}
+
+    def step(self, job_id: str, tokens: int = 1):
+        with self._lock:
+            entry = self._active.get(job_id)
+            if entry is not None:
+                entry['tokens'] += tokens
+                entry['last_step'] = time.monotonic()
+
+    def finish(self, job_id: str):
+        with self._lock:
+            self._active.pop(job_id, None)
+            self._cancelled.discard(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        """Ask an active generation to stop; False if the job is not generating."""
+        with self._lock:
+            if job_id not in self._active:
+                return False
+            self._cancelled.add(job_id)
+            return True
+
+    def cancelled(self, job_id: str) -> bool:
+        with self._lock:
+            return job_id in self._cancelled
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Progress of an active generation, or None if the job is not generating."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._active.get(job_id)
+            if entry is None:
+                return None
+            return {
+                'job_id': job_id,
+                'active': True,
+                'tokens': int(entry['tokens']),
+                'elapsed_seconds': round(now - entry['started'], 2),
+                'idle_seconds': round(now - entry['last_step'], 2),
+                'cancelled': job_id in self._cancelled,
+            }
+
+
+def progress_stopping_criteria(tracker: GenerationTracker, job_id: str):
+    """
+    stopping_criteria for model.generate() that records one step per decoding
+    step and stops generation only once the job was cancelled.
+    """
+    import torch
+    from transformers import StoppingCriteria, StoppingCriteriaList
+
+    class _ProgressCriteria(StoppingCriteria):
+        def __call__(self, input_ids, scores, **kwargs):
+            tracker.step(job_id)
+            stop = tracker.cancelled(job_id)
+            return torch.full((input_ids.shape[0],), stop, dtype=torch.bool, device=input_ids.device)
+
+    return StoppingCriteriaList([_ProgressCriteria()])
+
+
+generation_tracker = GenerationTracker()
@@ -0,0 +1,488 @@
+#!/usr/bin/env python3
+"""
+Job Update Bus
+
+In-process publish/subscribe for job progress, used by the job service
+(mondrian/job_service_v2.3.py): workers publish an event whenever they
+change a job, and each open /stream/<job_id> connection waits on the bus
+instead of re-reading the full job row from SQLite twice a second.
+
+Event types:
+    status    - status / progress_percentage / current_step (and error)
+    thinking  - a piece of llm_thinking: {'offset', 'text'}, the text
+                replaces whatever followed `offset` (so replays are idempotent)
+    complete  - analysis finished: {'analysis_html'}
+    done      - no more events for this job (completed or failed)
+
+Every event gets an id "<epoch>-<seq>": seq increases per process, epoch
+changes on restart. The last JOB_EVENT_BUFFER events per job are kept, so a
+client reconnecting with Last-Event-ID gets exactly what it missed; if the
+id is from another process lifetime or older than the buffer, replay()
+reports a gap and the client is sent a fresh snapshot instead.
+JobStreamEncoder turns a connection's events into the wire format and
+JobStream runs one connection, whichever server (threaded or ASGI) holds it.
+
+The bus also keeps each job's latest state (a snapshot built from its
+events). Jobs changed by another process (a worker on another node, a
+direct database update) are picked up by sync(): streams periodically read
+a narrow status projection and sync() publishes only what actually changed,
+once per job however many clients are watching.
+"""
+
+import asyncio
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from mondrian.timeouts import JOB_STREAM_KEEPALIVE_INTERVAL, JOB_STREAM_RESYNC_INTERVAL
+
+# Events kept per job for Last-Event-ID replay
+JOB_EVENT_BUFFER = 128
+# Jobs with buffered events (least recently updated dropped first)
+JOB_EVENT_MAX_JOBS = 1000
+
+TERMINAL_STATUSES = ('completed', 'failed', 'done')
+
+
+@dataclass
+class JobEvent:
+    id: str
+    seq: int
+    job_id: str
+    type: str
+    data: Dict[str, Any]
+    timestamp: float = field(default_factory=time.time)
+
+
+class _Channel:
+    def __init__(self, buffer_size: int):
+        self.events: deque = deque(maxlen=buffer_size)
+        self.state: Dict[str, Any] = {}
+        self.last_sync = 0.0
+        # seq of the newest event that fell out of the buffer
+        self.dropped_seq = 0
+
+
+class JobEventBus:
+    """Per-job ring buffers of events plus a wake-up for waiting streams."""
+
+    def __init__(self, buffer_size: int = JOB_EVENT_BUFFER, max_jobs: int = JOB_EVENT_MAX_JOBS):
+        self.buffer_size = buffer_size
+        self.max_jobs = max_jobs
+        self.epoch = uuid.uuid4().hex[:8]
+        self._seq = 0
+        self._channels: "OrderedDict[str, _Channel]" = OrderedDict()
+        self._cond = threading.Condition()
+        # asyncio streams waiting per job: {job_id: {(loop, asyncio.Event)}}
+        self._async_waiters: Dict[str, set] = {}
+        self.stats = {'published': 0, 'replayed': 0, 'gaps': 0, 'synced': 0}
+
+    def _channel(self, job_id: str) -> _Channel:
+        channel = self._channels.get(job_id)
+        if channel is None:
+            channel = self._channels[job_id] = _Channel(self.buffer_size)
+            while len(self._channels) > self.max_jobs:
+                self._channels.popitem(last=False)
+        else:
+            self._channels.move_to_end(job_id)
+        return channel
+
+    @staticmethod
+    def _apply(state: Dict[str, Any], event_type: str, data: Dict[str, Any]):
+        if event_type == 'status':
+            state.update(data)
+            if data.get('status') not in TERMINAL_STATUSES:
+                state.pop('done', None)  # Failed job picked up again for a retry
+        elif event_type == 'thinking':
+            text = state.get('llm_thinking', '')
+            state['llm_thinking'] = text[:data['offset']] + data['text']
+        elif event_type == 'complete':
+            state['analysis_html'] = data.get('analysis_html', '')
+        elif event_type == 'done':
+            state['done'] = True
+
+    def publish(self, job_id: str, event_type: str, **data) -> JobEvent:
+        """
+        Record an event for job_id and wake its streams.
+
+        Returns:
+            The published event
+        """
+        with self._cond:
+            self._seq += 1
+            seq = self._seq
+            event = JobEvent(id=f"{self.epoch}-{seq}", seq=seq, job_id=job_id, type=event_type, data=data)
+            channel = self._channel(job_id)
+            if len(channel.events) == channel.events.maxlen:
+                channel.dropped_seq = channel.events[0].seq
+            channel.events.append(event)
+            self._apply(channel.state, event_type, data)
+            self.stats['published'] += 1
+            self._cond.notify_all()
+            for loop, wakeup in self._async_waiters.get(job_id, ()):
+                loop.call_soon_threadsafe(wakeup.set)
+        return event
+
+    def publish_thinking(self, job_id: str, text: str) -> Optional[JobEvent]:
+        """Publish the part of the job's thinking text not yet published (None if unchanged)."""
+        with self._cond:
+            known = self._channel(job_id).state.get('llm_thinking', '')
+            offset = len(known) if text.startswith(known) else 0
+            if text == known:
+                return None
+            return self.publish(job_id, 'thinking', offset=offset, text=text[offset:])
+
+    def cursor(self, job_id: str) -> str:
+        """Id of the job's latest event (replay from here sees only newer events)."""
+        with self._cond:
+            channel = self._channels.get(job_id)
+            if channel is None or not channel.events:
+                return f"{self.epoch}-{self._seq}"
+            return channel.events[-1].id
+
+    def _parse(self, event_id: Optional[str]) -> Optional[int]:
+        """seq of an id issued by this bus, or None."""
+        if not event_id:
+            return None
+        epoch, _, seq = str(event_id).partition('-')
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        return int(seq)
+
+    def replay(self, job_id: str, last_event_id: Optional[str]) -> Tuple[List[JobEvent], bool]:
+        """
+        Events after last_event_id.
+
+        Returns:
+            (events, complete): complete is False if events may have been
+            missed (unknown id, other process lifetime, job not buffered,
+            or buffer overrun)
+        """
+        seq = self._parse(last_event_id)
+        with self._cond:
+            channel = self._channels.get(job_id)
+            if seq is None:
+                self.stats['gaps'] += 1
+                return [], False
+            if channel is None:
+                # Nothing known about the job here (never published or evicted)
+                self.stats['gaps'] += 1
+                return [], False
+            newer = [e for e in channel.events if e.seq > seq]
+            if seq < channel.dropped_seq:
+                # Some events after seq have already fallen out of the buffer
+                self.stats['gaps'] += 1
+                return newer, False
+            self.stats['replayed'] += len(newer)
+            return newer, True
+
+    def _newer(self, job_id: str, seq: int) -> Optional[List[JobEvent]]:
+        channel = self._channels.get(job_id)
+        if channel is None or not channel.events or channel.events[-1].seq <= seq:
+            return None
+        return [e for e in channel.events if e.seq > seq]
+
+    def wait(self, job_id: str, last_event_id: str, timeout: float) -> List[JobEvent]:
+        """Block until the job has events after last_event_id (or timeout); returns them."""
+        seq = self._parse(last_event_id) or 0
+        with self._cond:
+            events = self._cond.wait_for(lambda: self._newer(job_id, seq), timeout=timeout)
+        return events or []
+
+    async def wait_async(self, job_id: str, last_event_id: str, timeout: float) -> List[JobEvent]:
+        """wait() for asyncio: suspends the calling task instead of blocking a thread."""
+        seq = self._parse(last_event_id) or 0
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self._cond:
+            events = self._newer(job_id, seq)
+            if events:
+                return events
+            self._async_waiters.setdefault(job_id, set()).add(waiter)
+        try:
+            await asyncio.wait_for(waiter[1].wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._cond:
+                waiters = self._async_waiters.get(job_id)
+                if waiters is not None:
+                    waiters.discard(waiter)
+                    if not waiters:
+                        del self._async_waiters[job_id]
+        with self._cond:
+            return self._newer(job_id, seq) or []
+
+    def snapshot(self, job_id: str) -> Dict[str, Any]:
+        """Latest state of the job as seen through its events (may be partial)."""
+        with self._cond:
+            channel = self._channels.get(job_id)
+            return dict(channel.state) if channel else {}
+
+    def claim_sync(self, job_id: str, interval: float) -> bool:
+        """True for at most one caller per job per interval: that caller should sync()."""
+        now = time.monotonic()
+        with self._cond:
+            channel = self._channel(job_id)
+            if now - channel.last_sync < interval:
+                return False
+            channel.last_sync = now
+            return True
+
+    def sync(self, job_id: str, status: str, progress_percentage: Optional[int],
+             current_step: Optional[str]) -> Optional[JobEvent]:
+        """Publish a status event if the job's stored state differs from the bus's."""
+        data = {'status': status, 'progress_percentage': progress_percentage, 'current_step': current_step}
+        with self._cond:
+            state = self._channel(job_id).state
+            if all(state.get(k) == v for k, v in data.items()):
+                return None
+            self.stats['synced'] += 1
+            return self.publish(job_id, 'status', **data)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return dict(self.stats, jobs=len(self._channels), epoch=self.epoch,
+                        async_waiters=sum(len(w) for w in self._async_waiters.values()))
+
+
+class JobStreamEncoder:
+    """
+    Renders one /stream connection's SSE events from bus events.
+
+    llm_thinking is sent in full only in the first status_update of a
+    connection that could not resume; after that it grows through
+    thinking_delta events, {"offset": n, "text": "..."} meaning "keep the
+    first n characters and append text" (safe to apply twice), and
+    status_update carries llm_thinking_length instead of the text. Bytes
+    sent for thinking are therefore proportional to its length, not to
+    length x updates.
+
+    Compact mode (mobile clients): status_update carries only the fields
+    that changed, analysis_complete carries analysis_url instead of the
+    HTML, keepalives are SSE comments and JSON has no whitespace.
+    """
+
+    def __init__(self, job_id: str, state: Dict[str, Any], analysis_url: str,
+                 compact: bool = False, resumed: bool = False):
+        self.job_id = job_id
+        self.state = state
+        self.analysis_url = analysis_url
+        self.compact = compact
+        # Status fields last sent (compact diffs) and thinking length the client has;
+        # a resumed client has the thinking its replayed deltas start from
+        self._sent: Dict[str, Any] = {}
+        self._sent_thinking = None if resumed else len(state.get('llm_thinking') or '')
+
+    def _sse(self, event_id: Optional[str], event: str, payload: Dict[str, Any]) -> str:
+        data = json.dumps(payload, separators=(',', ':')) if self.compact else json.dumps(payload)
+        prefix = f"id: {event_id}\n" if event_id else ''
+        return f"{prefix}event: {event}\ndata: {data}\n\n"
+
+    def connected(self) -> str:
+        return self._sse(None, 'connected', {'type': 'connected', 'job_id': self.job_id})
+
+    def status_update(self, event_id: str, full_thinking: bool = False) -> Optional[str]:
+        """status_update for the current state (None in compact mode if nothing changed)."""
+        status = self.state.get('status')
+        fields = {
+            "status": status,
+            "progress_percentage": self.state.get('progress_percentage') or 0,
+            "current_step": self.state.get('current_step') or '',
+        }
+        if self.compact:
+            job_data = {k: v for k, v in fields.items() if self._sent.get(k) != v}
+        else:
+            job_data = dict(fields, current_advisor=1, total_advisors=1,
+                            step_phase="analyzing" if status == "analyzing" else "processing",
+                            analysis_url=self.analysis_url)
+        if full_thinking:
+            job_data['llm_thinking'] = self.state.get('llm_thinking') or ''
+        elif not self.compact:
+            job_data['llm_thinking_length'] = len(self.state.get('llm_thinking') or '')
+        if not job_data:
+            return None
+        self._sent.update(fields)
+        payload = {"type": "status_update", "job_id": self.job_id, "job_data": job_data}
+        if not self.compact:
+            payload["timestamp"] = time.time()
+        return self._sse(event_id, 'status_update', payload)
+
+    def thinking_delta(self, event_id: str, offset: int) -> Optional[str]:
+        """Thinking text from offset (or from what the client has, if less)."""
+        text = self.state.get('llm_thinking') or ''
+        if self._sent_thinking is not None:
+            offset = min(offset, self._sent_thinking)
+        if offset >= len(text) and self._sent_thinking == len(text):
+            return None
+        self._sent_thinking = len(text)
+        return self._sse(event_id, 'thinking_delta', {"type": "thinking_delta", "job_id": self.job_id,
+                                                      "offset": offset, "text": text[offset:]})
+
+    def batch(self, events: List[JobEvent]) -> Tuple[List[str], Optional[str]]:
+        """
+        Apply a batch of bus events and render it: at most one thinking_delta
+        and one status_update however many events (a burst, or a replay).
+
+        Returns:
+            (SSE chunks, id of the done event or None)
+        """
+        thinking_from = None
+        status_changed = False
+        done_id = None
+        cursor = None
+        for event in events:
+            if event.type == 'done':
+                done_id = event.id
+                break
+            cursor = event.id
+            JobEventBus._apply(self.state, event.type, event.data)
+            if event.type == 'thinking':
+                offset = event.data['offset']
+                thinking_from = offset if thinking_from is None else min(thinking_from, offset)
+            status_changed = status_changed or event.type == 'status'
+        chunks = []
+        if thinking_from is not None:
+            chunks.append(self.thinking_delta(cursor, thinking_from))
+        if status_changed:
+            chunks.append(self.status_update(cursor))
+        return [chunk for chunk in chunks if chunk], done_id
+
+    def finish(self, event_id: str) -> List[str]:
+        """analysis_complete (if completed) and done."""
+        chunks = []
+        if self.state.get('status') == 'completed':
+            analysis_complete_event = {"type": "analysis_complete", "job_id": self.job_id}
+            if self.compact:
+                analysis_complete_event["analysis_url"] = self.analysis_url
+            else:
+                analysis_complete_event["analysis_html"] = self.state.get('analysis_html') or ''
+            chunks.append(self._sse(event_id, 'analysis_complete', analysis_complete_event))
+        chunks.append(self._sse(event_id, 'done', {'type': 'done', 'job_id': self.job_id}))
+        return chunks
+
+    def keepalive(self, event_id: str) -> str:
+        """Periodic liveness update (no thinking text)."""
+        if self.compact:
+            return ": keepalive\n\n"
+        return self.status_update(event_id)
+
+
+class JobStream:
+    """
+    One /stream connection, independent of how it is served: the threaded
+    Flask route waits on the bus with wait(), the ASGI server
+    (mondrian/job_service_asgi.py) with wait_async().
+
+    Usage:
+        stream = JobStream(bus, job_id, load_job, resync, analysis_url, last_event_id)
+        chunks = stream.open()   # None if the job does not exist
+        while not stream.finished:
+            events = bus.wait(job_id, stream.cursor, timeout=stream.keepalive_interval)
+            chunks = stream.on_events(events) if events else stream.on_idle()
+
+    open() and on_idle() may read the database (load_job, resync); the
+    other methods only touch memory.
+    """
+
+    def __init__(self, bus: JobEventBus, job_id: str,
+                 load_job: Callable[[str], Optional[Dict[str, Any]]], resync: Callable[[str], bool],
+                 analysis_url: str, last_event_id: Optional[str] = None, compact: bool = False,
+                 keepalive_interval: float = JOB_STREAM_KEEPALIVE_INTERVAL,
+                 resync_interval: float = JOB_STREAM_RESYNC_INTERVAL):
+        self.bus = bus
+        self.job_id = job_id
+        self.load_job = load_job
+        self.resync = resync
+        self.analysis_url = analysis_url
+        self.last_event_id = last_event_id
+        self.compact = compact
+        self.keepalive_interval = keepalive_interval
+        self.resync_interval = resync_interval
+        self.cursor: Optional[str] = None
+        self.finished = False
+        self.encoder: Optional[JobStreamEncoder] = None
+        self._last_sent = 0.0
+
+    def open(self) -> Optional[List[str]]:
+        """
+        Resume from last_event_id if possible, else read the job once.
+
+        Returns:
+            The first SSE chunks, or None if the job does not exist
+        """
+        job_id = self.job_id
+        replayed, resumed = self.bus.replay(job_id, self.last_event_id) if self.last_event_id else ([], False)
+        state = self.bus.snapshot(job_id) if resumed else {}
+
+        if not state.get('status'):
+            resumed = False
+            # Take the cursor before reading so no event between the two is lost
+            self.cursor = self.bus.cursor(job_id)
+            job = self.load_job(job_id)
+            if not job:
+                return None
+            state = {key: job.get(key) for key in ('status', 'progress_percentage', 'current_step', 'llm_thinking', 'analysis_html')}
+        else:
+            self.cursor = self.last_event_id
+
+        self.encoder = JobStreamEncoder(job_id, state, self.analysis_url, compact=self.compact, resumed=resumed)
+        self._last_sent = time.time()
+        if not resumed:
+            # Initial status update (with the full thinking text) immediately after connected
+            chunks = [self.encoder.connected(), self.encoder.status_update(self.cursor, full_thinking=True)]
+            if state.get('status') in TERMINAL_STATUSES:
+                chunks += self.encoder.finish(self.cursor)
+                self.finished = True
+            return chunks
+        if not replayed and state.get('done'):
+            # Reconnected after the job finished
+            self.finished = True
+            return self.encoder.finish(self.cursor)
+        return self.on_events(replayed)
+
+    def on_events(self, events: List[JobEvent]) -> List[str]:
+        """Chunks for events from the bus (ends the stream on done)."""
+        chunks, done_id = self.encoder.batch(events)
+        if done_id:
+            chunks += self.encoder.finish(done_id)
+            self.cursor = done_id
+            self.finished = True
+        elif events:
+            self.cursor = events[-1].id
+        if chunks:
+            self._last_sent = time.time()
+        return chunks
+
+    def on_idle(self) -> List[str]:
+        """
+        Called when a wait timed out: picks up changes made outside this
+        process and sends a keepalive while the job is analyzing.
+        """
+        if self.claim_resync():
+            chunks = self.resync_now()
+            if chunks is not None:
+                return chunks
+        return self.keepalive()
+
+    def claim_resync(self) -> bool:
+        """True if this stream should read the database now (one stream per job per interval)."""
+        return self.bus.claim_sync(self.job_id, self.resync_interval)
+
+    def resync_now(self) -> Optional[List[str]]:
+        """Read the job's status (blocking) and return what changed, or None if nothing did."""
+        if not self.resync(self.job_id):
+            self.finished = True
+            return []
+        events = self.bus.wait(self.job_id, self.cursor, timeout=0)
+        return self.on_events(events) if events else None
+
+    def keepalive(self) -> List[str]:
+        # Periodic update so the iOS UI sees the job is alive (no thinking text)
+        if self.encoder.state.get('status') == 'analyzing' and time.time() - self._last_sent >= self.keepalive_interval:
+            self._last_sent = time.time()
+            return [self.encoder.keepalive(self.cursor)]
+        return []
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+Job Queue Primitives
+
+Used by the job service workers (mondrian/job_service_v2.3.py):
+
+- claim_next_job() moves the oldest runnable job to 'analyzing' and stamps
+  it with a lease (owner + expiry) in a single UPDATE ... RETURNING, so any
+  number of workers, threads or processes, can share the jobs table without
+  two of them picking up the same job.
+- Each claim increments lease_token, a fencing token: every later write by
+  the worker is conditioned on it (fenced_update), so a worker that lost its
+  lease and finishes late cannot overwrite the job after it was re-run.
+- LeaseHeartbeat renews the lease every JOB_HEARTBEAT_INTERVAL while the
+  job is being generated, so leases can be short (JOB_LEASE_TIMEOUT): a
+  crashed worker's job is re-claimed within about a minute, while a long
+  healthy run keeps its lease indefinitely. A worker taking over a job whose
+  generation stalled cancels that generation first (job service
+  stop_stalled_generation), so the advisor does not run the job twice.
+- JobNotifier wakes idle workers as soon as /upload or POST /jobs queues a
+  job, instead of each worker polling the table every second. Workers
+  still re-check every JOB_QUEUE_IDLE_WAIT seconds for jobs queued by other
+  processes and for expired leases.
+
+Leases compare wall-clock timestamps, so hosts sharing one database need
+synchronized clocks (NTP); skew well below JOB_LEASE_TIMEOUT is harmless.
+"""
+
+import sqlite3
+import threading
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Optional
+
+from mondrian.db_pool import db_connection
+from mondrian.timeouts import JOB_HEARTBEAT_INTERVAL, JOB_LEASE_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+# Attempts before a job stays 'failed'
+MAX_JOB_ATTEMPTS = 3
+
+# pending/queued and retryable failed jobs, and 'analyzing' jobs whose lease
+# expired. One IN list (not an OR per status) so it is a single index search.
+_CLAIMABLE = """
+    status IN ('pending', 'queued', 'failed', 'analyzing')
+    AND COALESCE(retry_count, 0) < :max_attempts
+    AND (status != 'analyzing' OR lease_expires_at IS NULL OR lease_expires_at < :now)
+"""
+
+# Covers the claim lookup (and the queue counts by status)
+CLAIM_INDEX_SQL = """
+    CREATE INDEX IF NOT EXISTS idx_jobs_claim
+    ON jobs (status, created_at, retry_count, lease_expires_at, id)
+"""
+
+_CLAIM_COLUMNS = "id, filename, advisor, mode, error, COALESCE(retry_count, 0), current_step, enable_rag, lease_token"
+
+# Other recurring reads of the jobs table (indexed, see mondrian/query_indexes.py)
+RECENT_JOBS_SQL = """
+    SELECT id, filename, status, advisor, mode, created_at, model, adapter FROM jobs
+    ORDER BY created_at DESC LIMIT ?
+"""
+
+# Status columns of one job (the result payloads live in mondrian/job_results.py)
+JOB_STATUS_SQL = """
+    SELECT id, filename, status, advisor, mode, created_at, current_step, progress_percentage, enable_rag,
+           error, model, adapter, prompt_tokens_before, prompt_tokens_after
+    FROM jobs WHERE id = ?
+"""
+
+ACTIVE_JOBS_SQL = """
+    SELECT id, filename, status, advisor, mode, current_step
+    FROM jobs
+    WHERE status IN ('processing', 'analyzing')
+    ORDER BY created_at DESC
+    LIMIT ?
+"""
+
+STALE_JOBS_SQL = """
+    SELECT id, status, last_activity, filename, advisor, mode, COALESCE(retry_count, 0) as retry_count
+    FROM jobs
+    WHERE status IN ('analyzing', 'processing')
+      AND last_activity < ?
+      AND (lease_expires_at IS NULL OR lease_expires_at < ?)
+"""
+
+# current_step of a job taken over from a worker whose lease expired
+RECOVERING_STEP = "Recovering interrupted analysis..."
+
+_RETURNING_SUPPORTED = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+
+class LeaseLost(RuntimeError):
+    """The job was re-claimed by another worker; this worker must not write to it."""
+
+
+def ensure_lease_columns(conn: sqlite3.Connection):
+    """Add the lease columns and the claim index to jobs if missing (see scripts/migrations/add_job_leases.sql, add_hot_query_indexes.sql)."""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+    if 'lease_owner' not in columns:
+        logger.info("Adding 'lease_owner' column to jobs table")
+        conn.execute("ALTER TABLE jobs ADD COLUMN lease_owner TEXT DEFAULT NULL")
+    if 'lease_expires_at' not in columns:
+        logger.info("Adding 'lease_expires_at' column to jobs table")
+        conn.execute("ALTER TABLE jobs ADD COLUMN lease_expires_at TEXT DEFAULT NULL")
+    if 'lease_token' not in columns:
+        logger.info("Adding 'lease_token' column to jobs table")
+        conn.execute("ALTER TABLE jobs ADD COLUMN lease_token INTEGER DEFAULT 0")
+    conn.execute(CLAIM_INDEX_SQL)
+    # Superseded by idx_jobs_claim
+    conn.execute("DROP INDEX IF EXISTS idx_jobs_status_created_at")
+    conn.commit()
+
+
+def _job_dict(row) -> Dict[str, Any]:
+    return {
+        'id': row[0],
+        'filename': row[1],
+        'advisor': row[2],
+        'mode': row[3],
+        'previous_error': row[4],
+        'retry_count': row[5],
+        'recovered': row[6] == RECOVERING_STEP,
+        'enable_rag': bool(row[7]),
+        'lease_token': row[8],
+    }
+
+
+def claim_next_job(conn: sqlite3.Connection, owner: str,
+                   lease_seconds: float = JOB_LEASE_TIMEOUT) -> Optional[Dict[str, Any]]:
+    """
+    Atomically claim the oldest runnable job for `owner`.
+
+    Runnable: pending/queued or retryable failed jobs, and 'analyzing' jobs
+    whose lease has expired (their worker died). Taking over an expired
+    lease counts as a retry, so a job that keeps killing its worker ends up
+    failed instead of looping.
+
+    Args:
+        conn: Connection to the jobs database
+        owner: Lease owner id (unique per worker)
+        lease_seconds: How long the claim is valid without being renewed
+
+    Returns:
+        The claimed job (id, filename, advisor, mode, previous_error,
+        retry_count, recovered, enable_rag, lease_token), or None
+    """
+    now = datetime.now()
+    params = {
+        'owner': owner,
+        'now': now.isoformat(),
+        'expires': (now + timedelta(seconds=lease_seconds)).isoformat(),
+        'max_attempts': MAX_JOB_ATTEMPTS,
+        'recovering': RECOVERING_STEP,
+    }
+    # SET expressions see the row before the update
+    update = """
+        UPDATE jobs SET status = 'analyzing', lease_owner = :owner, lease_expires_at = :expires,
+                        lease_token = COALESCE(lease_token, 0) + 1,
+                        retry_count = COALESCE(retry_count, 0) + (status = 'analyzing'),
+                        current_step = CASE WHEN status = 'analyzing' THEN :recovering ELSE current_step END,
+                        progress_percentage = 10, last_activity = :now
+    """
+    # Pinned: with ANALYZE statistics the planner would scan by created_at (see mondrian/query_indexes.py)
+    next_job = f"SELECT id FROM jobs INDEXED BY idx_jobs_claim WHERE {_CLAIMABLE} ORDER BY created_at ASC LIMIT 1"
+
+    if _RETURNING_SUPPORTED:
+        rows = conn.execute(f"{update} WHERE id = ({next_job}) RETURNING {_CLAIM_COLUMNS}", params).fetchall()
+        conn.commit()
+        return _job_dict(rows[0]) if rows else None
+
+    # SQLite < 3.35: take the write lock first so the SELECT and UPDATE are atomic
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute(next_job, params).fetchone()
+        if row:
+            conn.execute(f"{update} WHERE id = :id", dict(params, id=row[0]))
+            row = conn.execute(f"SELECT {_CLAIM_COLUMNS} FROM jobs WHERE id = ?", (row[0],)).fetchone()
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return _job_dict(row) if row else None
+
+
+def fenced_update(conn: sqlite3.Connection, job_id: str, lease_token: int, assignments: str, params: tuple = ()):
+    """
+    UPDATE jobs SET <assignments> for a job this worker still holds, and commit.
+    Writes made earlier in the same transaction (e.g. save_job_results) are
+    committed with it, or rolled back if the lease was lost.
+
+    Args:
+        assignments: SET clause, e.g. "current_step = ?, last_activity = ?"
+        params: Parameters for the SET clause
+
+    Raises:
+        LeaseLost: The job has since been claimed under a newer lease_token
+    """
+    cursor = conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ? AND lease_token = ?",
+                          (*params, job_id, lease_token))
+    if cursor.rowcount == 0:
+        conn.rollback()
+        raise LeaseLost(f"Job {job_id} is no longer held under lease token {lease_token}")
+    conn.commit()
+
+
+def renew_lease(conn: sqlite3.Connection, job_id: str, lease_token: int,
+                lease_seconds: float = JOB_LEASE_TIMEOUT) -> bool:
+    """Extend the lease; False if the job was re-claimed meanwhile."""
+    now = datetime.now()
+    cursor = conn.execute(
+        "UPDATE jobs SET lease_expires_at = ?, last_activity = ? WHERE id = ? AND lease_token = ? AND status = 'analyzing'",
+        ((now + timedelta(seconds=lease_seconds)).isoformat(), now.isoformat(), job_id, lease_token)
+    )
+    conn.commit()
+    return cursor.rowcount == 1
+
+
+class LeaseHeartbeat:
+    """
+    Renews a job's lease from a background thread while the job runs.
+
+    Usage:
+        with LeaseHeartbeat(db_path, job_id, token, alive=generation_alive) as heartbeat:
+            ... long call ...
+        if heartbeat.lost: ...
+    """
+
+    def __init__(self, db_path: str, job_id: str, lease_token: int,
+                 alive: Optional[Callable[[], bool]] = None,
+                 interval: float = JOB_HEARTBEAT_INTERVAL, lease_seconds: float = JOB_LEASE_TIMEOUT):
+        """
+        Args:
+            db_path: Jobs database
+            job_id: Claimed job
+            lease_token: Fencing token returned by claim_next_job
+            alive: Checked before each renewal; when it returns False (e.g. the
+                   generation stalled) the lease is left to expire
+            interval: Seconds between renewals
+            lease_seconds: Lease length set by each renewal
+        """
+        self.db_path = db_path
+        self.job_id = job_id
+        self.lease_token = lease_token
+        self.alive = alive
+        self.interval = interval
+        self.lease_seconds = lease_seconds
+        self.lost = False
+        self.beats = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"lease-{job_id[:8]}", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            if self.alive is not None and not self.alive():
+                logger.warning(f"[LeaseHeartbeat] Job {self.job_id} not making progress - letting its lease expire")
+                continue
+            try:
+                # A pooled connection per renewal, not held between beats
+                with db_connection(self.db_path) as conn:
+                    renewed = renew_lease(conn, self.job_id, self.lease_token, self.lease_seconds)
+                if not renewed:
+                    logger.warning(f"[LeaseHeartbeat] Lost lease on job {self.job_id} (re-claimed elsewhere)")
+                    self.lost = True
+                    return
+                self.beats += 1
+            except sqlite3.Error as e:
+                logger.warning(f"[LeaseHeartbeat] Could not renew lease on job {self.job_id}: {e}")
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+
+def queue_counts(conn: sqlite3.Connection) -> Dict[str, int]:
+    """Number of jobs per status (one pass over idx_jobs_claim)."""
+    return {status: count for status, count in conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status")}
+
+
+class JobNotifier:
+    """Wakes idle workers when a job is queued (in-process)."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._generation = 0
+
+    @property
+    def generation(self) -> int:
+        """Read before looking for work; pass to wait() to not miss a notify in between."""
+        with self._cond:
+            return self._generation
+
+    def notify(self):
+        with self._cond:
+            self._generation += 1
+            self._cond.notify_all()
+
+    def wait(self, since: int, timeout: float) -> bool:
+        """
+        Block until notify() has been called after `since` was read, or timeout.
+
+        Returns:
+            True if woken by a notification
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: self._generation != since, timeout=timeout)
@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+Job Results Store
+
+The large per-job payloads (analysis and summary HTML, advisor bio, thinking,
+prompts, model output) live outside the jobs row, so status reads and the
+job queue's scans only touch small rows. Storage is content-addressed:
+
+    result_blobs   hash (SHA-256 of the text) -> text, stored once
+    job_results    (job_id, field) -> hash
+
+Identical text is stored once however many fields or jobs refer to it: the
+prompt and llm_prompt of a job are usually the same text, and every job of
+an advisor shares its bio. The full model response is stored once as
+llm_response; llm_outputs keeps only its own metadata and analysis_markdown
+is rebuilt from the summary and the response when read, instead of each
+holding another copy of the prompt and response.
+
+Blobs of RESULT_COMPRESS_MIN_BYTES or more are stored gzip-compressed
+(encoding = 'gzip'). load_job_results() returns text; load_result_document()
+returns the stored bytes as they are, so the job service can send them to a
+client that accepts gzip without decompressing and recompressing.
+
+Rows written before this store existed keep their payloads in the jobs
+columns; load_job_results() falls back to those until
+scripts/migrate_job_results.py moves them.
+"""
+
+import gzip
+import hashlib
+import json
+import sqlite3
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+# Fields as returned by the job service (get_job)
+RESULT_FIELDS = ('prompt', 'llm_prompt', 'analysis_markdown', 'llm_thinking', 'analysis_html',
+                 'advisor_bio', 'llm_outputs', 'summary_html', 'advisor_bio_html')
+
+# Stored but not returned on their own: the model's full response
+RESPONSE_FIELD = 'llm_response'
+
+# llm_outputs keys stored as references to other fields (listed under '$refs')
+_OUTPUT_REFS = {'prompt': 'prompt', 'response': RESPONSE_FIELD}
+
+# Blobs at least this large are stored gzip-compressed. Written once, read
+# many times: compress hard.
+RESULT_COMPRESS_MIN_BYTES = 1024
+RESULT_COMPRESS_LEVEL = 9
+
+RESULTS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS result_blobs (
+    hash TEXT PRIMARY KEY,
+    content TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at TEXT,
+    encoding TEXT DEFAULT NULL
+);
+CREATE TABLE IF NOT EXISTS job_results (
+    job_id TEXT NOT NULL,
+    field TEXT NOT NULL,
+    blob_hash TEXT NOT NULL REFERENCES result_blobs(hash),
+    PRIMARY KEY (job_id, field)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_job_results_blob ON job_results (blob_hash);
+"""
+
+
+def ensure_results_schema(conn: sqlite3.Connection):
+    """Create result_blobs and job_results if missing (see scripts/migrations/add_result_compression.sql)."""
+    conn.executescript(RESULTS_SCHEMA)
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(result_blobs)")}
+    if 'encoding' not in columns:
+        conn.execute("ALTER TABLE result_blobs ADD COLUMN encoding TEXT DEFAULT NULL")
+        conn.commit()
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def encode_content(text: str) -> Tuple[Union[str, bytes], Optional[str]]:
+    """
+    How a text is stored: gzip bytes when it is large enough and gzip makes
+    it smaller, otherwise the text itself.
+
+    Returns:
+        (content, encoding) - encoding is 'gzip' or None
+    """
+    raw = text.encode('utf-8')
+    if len(raw) >= RESULT_COMPRESS_MIN_BYTES:
+        # mtime=0: the same text always compresses to the same bytes
+        packed = gzip.compress(raw, compresslevel=RESULT_COMPRESS_LEVEL, mtime=0)
+        if len(packed) < len(raw):
+            return packed, 'gzip'
+    return text, None
+
+
+def decode_content(content: Union[str, bytes], encoding: Optional[str]) -> str:
+    """Text of stored content (see encode_content)."""
+    if encoding == 'gzip':
+        return gzip.decompress(content).decode('utf-8')
+    return content.decode('utf-8') if isinstance(content, bytes) else content
+
+
+@dataclass
+class ResultDocument:
+    """One stored result, as stored (for sending without re-encoding)."""
+    hash: str                # SHA-256 of the text
+    data: bytes              # Stored bytes: gzip when encoding is 'gzip', else UTF-8 text
+    encoding: Optional[str]  # 'gzip' or None
+    size: int                # Bytes of the text
+
+    def text(self) -> str:
+        return decode_content(self.data, self.encoding)
+
+
+def format_analysis_markdown(advisor: str, summary: str, response: str) -> str:
+    """The analysis_markdown of a completed job."""
+    return f"""# {advisor.title()} Analysis\n\n## Summary\n{summary}\n\n## Full Analysis\n{response}"""
+
+
+def save_job_results(conn: sqlite3.Connection, job_id: str, results: Dict[str, Optional[str]]) -> Dict[str, str]:
+    """
+    Store a job's payloads (replacing the fields given). Empty values are
+    not stored and read back as ''.
+
+    llm_outputs may include 'prompt' and 'response'; when they match the
+    job's prompt and llm_response fields they are stored only there.
+
+    Args:
+        conn: Database connection (caller commits)
+        job_id: Job the results belong to
+        results: Field name -> text (RESULT_FIELDS and llm_response)
+
+    Returns:
+        Field name -> content hash of what was stored
+    """
+    results = dict(results)
+    outputs = results.get('llm_outputs')
+    if outputs:
+        try:
+            parsed = json.loads(outputs)
+        except ValueError:
+            parsed = None
+        if isinstance(parsed, dict):
+            refs = []
+            for key, field in _OUTPUT_REFS.items():
+                if key in parsed and (results.get(field) is None or parsed[key] == results[field]):
+                    results[field] = parsed.pop(key)
+                    refs.append(key)
+            if refs:
+                parsed['$refs'] = refs
+            results['llm_outputs'] = json.dumps(parsed)
+
+    now = datetime.now().isoformat()
+    stored = {}
+    for field, text in results.items():
+        if not text:
+            conn.execute("DELETE FROM job_results WHERE job_id = ? AND field = ?", (job_id, field))
+            continue
+        digest = content_hash(text)
+        if not conn.execute("SELECT 1 FROM result_blobs WHERE hash = ?", (digest,)).fetchone():
+            content, encoding = encode_content(text)
+            conn.execute(
+                "INSERT OR IGNORE INTO result_blobs (hash, content, size, created_at, encoding) VALUES (?, ?, ?, ?, ?)",
+                (digest, content, len(text.encode('utf-8')), now, encoding)
+            )
+        conn.execute("INSERT OR REPLACE INTO job_results (job_id, field, blob_hash) VALUES (?, ?, ?)",
+                     (job_id, field, digest))
+        stored[field] = digest
+    return stored
+
+
+def _legacy_results(conn: sqlite3.Connection, job_id: str, fields: Iterable[str]) -> Dict[str, str]:
+    """Payloads still in the jobs row (written before the results store)."""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+    wanted = [f for f in fields if f in columns]
+    if not wanted:
+        return {}
+    row = conn.execute(f"SELECT {', '.join(wanted)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return {f: value for f, value in zip(wanted, row or ()) if value}
+
+
+def load_job_results(conn: sqlite3.Connection, job_id: str,
+                     fields: Optional[Iterable[str]] = None) -> Dict[str, str]:
+    """
+    A job's payloads, reading only the fields asked for.
+
+    Args:
+        conn: Database connection
+        job_id: Job to read
+        fields: Subset of RESULT_FIELDS (default all)
+
+    Returns:
+        Field name -> text ('' when not stored), for every requested field
+    """
+    fields = list(fields or RESULT_FIELDS)
+    # Derived fields need their parts
+    needed = set(fields)
+    if 'llm_outputs' in needed:
+        needed |= {'prompt', RESPONSE_FIELD}
+    if 'analysis_markdown' in needed:
+        needed |= {'llm_outputs', RESPONSE_FIELD}
+
+    placeholders = ', '.join('?' * len(needed))
+    stored = {field: decode_content(content, encoding) for field, content, encoding in conn.execute(
+        f"""SELECT r.field, b.content, b.encoding FROM job_results r JOIN result_blobs b ON b.hash = r.blob_hash
+            WHERE r.job_id = ? AND r.field IN ({placeholders})""",
+        (job_id, *needed)
+    )}
+    if not stored and not conn.execute("SELECT 1 FROM job_results WHERE job_id = ? LIMIT 1", (job_id,)).fetchone():
+        legacy = _legacy_results(conn, job_id, fields)
+        return {field: legacy.get(field, '') for field in fields}
+
+    results = {field: stored.get(field, '') for field in fields}
+    response = stored.get(RESPONSE_FIELD, '')
+    outputs = None
+    if stored.get('llm_outputs'):
+        outputs = json.loads(stored['llm_outputs'])
+    if 'llm_outputs' in results and outputs is not None:
+        refs = outputs.pop('$refs', [])
+        outputs = {**{key: stored.get(_OUTPUT_REFS[key], '') for key in refs}, **outputs}
+        results['llm_outputs'] = json.dumps(outputs)
+    if 'analysis_markdown' in results and not stored.get('analysis_markdown') and (response or outputs is not None):
+        advisor = conn.execute("SELECT advisor FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        results['analysis_markdown'] = format_analysis_markdown(
+            (advisor[0] if advisor else '') or '', (outputs or {}).get('summary', ''), response
+        )
+    return results
+
+
+def load_result_document(conn: sqlite3.Connection, job_id: str, field: str) -> Optional[ResultDocument]:
+    """
+    One stored field of a job without decoding it (analysis_html,
+    summary_html...; not the derived llm_outputs or analysis_markdown).
+
+    Returns:
+        The document, or None if the job has no such result
+    """
+    row = conn.execute(
+        """SELECT b.hash, b.content, b.encoding, b.size FROM job_results r JOIN result_blobs b ON b.hash = r.blob_hash
+           WHERE r.job_id = ? AND r.field = ?""",
+        (job_id, field)
+    ).fetchone()
+    if row:
+        digest, content, encoding, size = row
+        return ResultDocument(digest, content.encode('utf-8') if isinstance(content, str) else content, encoding, size)
+    if conn.execute("SELECT 1 FROM job_results WHERE job_id = ? LIMIT 1", (job_id,)).fetchone():
+        return None
+    text = _legacy_results(conn, job_id, [field]).get(field)
+    if not text:
+        return None
+    data = text.encode('utf-8')
+    return ResultDocument(content_hash(text), data, None, len(data))
+
+
+def result_hash(conn: sqlite3.Connection, job_id: str, field: str) -> Optional[str]:
+    """
+    Content hash of one stored field (an ETag), from the job_results key
+    alone: the blob is not read. Jobs not yet migrated hash their column.
+    """
+    row = conn.execute("SELECT blob_hash FROM job_results WHERE job_id = ? AND field = ?", (job_id, field)).fetchone()
+    if row:
+        return row[0]
+    if conn.execute("SELECT 1 FROM job_results WHERE job_id = ? LIMIT 1", (job_id,)).fetchone():
+        return None
+    text = _legacy_results(conn, job_id, [field]).get(field)
+    return content_hash(text) if text else None
+
+
+def compress_result_blobs(conn: sqlite3.Connection, batch_size: int = 100) -> int:
+    """
+    Compress blobs stored as plain text (written before compression, or by
+    an older version). Commits per batch.
+
+    Returns:
+        Number of blobs compressed
+    """
+    compressed = 0
+    last = ''
+    while True:
+        rows = conn.execute(
+            "SELECT hash, content FROM result_blobs WHERE encoding IS NULL AND size >= ? AND hash > ? "
+            "ORDER BY hash LIMIT ?",
+            (RESULT_COMPRESS_MIN_BYTES, last, batch_size)
+        ).fetchall()
+        if not rows:
+            return compressed
+        for digest, content in rows:
+            packed, encoding = encode_content(decode_content(content, None))
+            if encoding:
+                conn.execute("UPDATE result_blobs SET content = ?, encoding = ? WHERE hash = ?",
+                             (packed, encoding, digest))
+                compressed += 1
+        conn.commit()
+        last = rows[-1][0]
+
+
+def delete_job_results(conn: sqlite3.Connection, job_ids: Optional[List[str]] = None) -> int:
+    """
+    Remove results of the given jobs (all jobs if None) and the blobs no
+    job refers to any more.
+
+    Returns:
+        Number of blobs removed
+    """
+    if job_ids is None:
+        conn.execute("DELETE FROM job_results")
+    else:
+        conn.executemany("DELETE FROM job_results WHERE job_id = ?", [(job_id,) for job_id in job_ids])
+    return conn.execute(
+        "DELETE FROM result_blobs WHERE hash NOT IN (SELECT blob_hash FROM job_results)"
+    ).rowcount
+
+
+def results_stats(conn: sqlite3.Connection) -> Dict[str, int]:
+    """
+    Bytes referenced (what the jobs rows would hold) vs distinct text
+    stored (stored_bytes) vs what that takes after compression
+    (compressed_bytes).
+    """
+    stored, compressed, blobs = conn.execute(
+        "SELECT COALESCE(SUM(size), 0), COALESCE(SUM(LENGTH(CAST(content AS BLOB))), 0), COUNT(*) FROM result_blobs"
+    ).fetchone()
+    referenced, refs = conn.execute(
+        "SELECT COALESCE(SUM(b.size), 0), COUNT(*) FROM job_results r JOIN result_blobs b ON b.hash = r.blob_hash"
+    ).fetchone()
+    return {'blobs': blobs, 'stored_bytes': stored, 'compressed_bytes': compressed,
+            'references': refs, 'referenced_bytes': referenced}
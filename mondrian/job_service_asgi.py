@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+ASGI Serving Mode for the Job Service
+
+Under the Flask development server every open /stream/<job_id> holds a
+thread for as long as its client watches the job, so concurrent viewers are
+capped by thread count. JobServiceASGI serves the same Flask app as an ASGI
+application instead (python mondrian/job_service_v2.3.py --asgi):
+
+- GET /stream/<job_id> runs on the event loop. An idle stream is a
+  suspended task waiting on the job event bus (JobEventBus.wait_async), so
+  one process holds thousands of them. Its database reads (the first read
+  of the job, periodic resyncs) run in the thread pool.
+- Every other route (/upload, /status, /analysis, advisor images...) is
+  the unchanged Flask view, called in a bounded thread pool: the event loop
+  reads the request body and sends the response, the thread only runs the
+  view (SQLite access, image resizing).
+
+Speaks plain ASGI (no framework); serving it needs uvicorn.
+
+Usage:
+    python mondrian/job_service_v2.3.py --port 5005 --asgi
+    python scripts/loadtest_job_streams.py      # threaded vs ASGI
+"""
+
+import os
+import sys
+import json
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import Any, Callable, Dict, List, Tuple
+from urllib.parse import parse_qsl
+
+from werkzeug.datastructures import Headers, MultiDict
+
+from mondrian.job_events import JobEventBus, JobStream
+
+logger = logging.getLogger(__name__)
+
+# Threads running Flask views and stream database reads; --asgi-threads overrides
+ASGI_THREADS = int(os.environ.get('MONDRIAN_ASGI_THREADS', 32))
+# Pending connections the listening socket queues (bursts of reconnecting clients)
+ASGI_BACKLOG = 4096
+
+STREAM_PREFIX = '/stream/'
+SSE_RESPONSE_HEADERS = [
+    (b'content-type', b'text/event-stream; charset=utf-8'),
+    (b'cache-control', b'no-cache'),
+    (b'x-accel-buffering', b'no'),
+]
+
+
+def wsgi_environ(scope: Dict[str, Any], body: bytes) -> Dict[str, Any]:
+    """WSGI environ for an ASGI HTTP scope and its (fully read) body."""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+        elif name != 'CONTENT_LENGTH':
+            key = f"HTTP_{name}"
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def call_wsgi(wsgi_app: Callable, environ: Dict[str, Any]) -> Tuple[int, List[Tuple[bytes, bytes]], bytes]:
+    """
+    Run a WSGI app to completion (blocking; called in the thread pool).
+
+    Returns:
+        (status code, headers, body)
+    """
+    response = {}
+    chunks = []
+
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split(' ', 1)[0])
+        response['headers'] = [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]
+        return chunks.append
+
+    result = wsgi_app(environ, start_response)
+    try:
+        for chunk in result:
+            chunks.append(chunk)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return response['status'], response['headers'], b''.join(chunks)
+
+
+class JobServiceASGI:
+    """
+    ASGI application: /stream/<job_id> on the event loop, everything else
+    through the Flask app in a thread pool.
+
+    Args:
+        wsgi_app: The job service's Flask app
+        open_stream: Builds the JobStream for a request: (job_id, host, args, headers)
+        bus: The bus the job service publishes to
+        threads: Thread pool size for Flask views and stream database reads
+    """
+
+    def __init__(self, wsgi_app: Callable, open_stream: Callable[..., JobStream], bus: JobEventBus,
+                 threads: int = ASGI_THREADS):
+        self.wsgi_app = wsgi_app
+        self.open_stream = open_stream
+        self.bus = bus
+        self.threads = threads
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='asgi-view')
+        self.open_streams = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            path = scope['path']
+            if scope['method'] == 'GET' and path.startswith(STREAM_PREFIX) and '/' not in path[len(STREAM_PREFIX):]:
+                await self._stream(scope, receive, send, path[len(STREAM_PREFIX):])
+            else:
+                await self._wsgi(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _wsgi(self, scope, receive, send):
+        body = bytearray()
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+
+        loop = asyncio.get_running_loop()
+        status, headers, payload = await loop.run_in_executor(
+            self.executor, call_wsgi, self.wsgi_app, wsgi_environ(scope, bytes(body))
+        )
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': payload})
+
+    async def _stream(self, scope, receive, send, job_id: str):
+        loop = asyncio.get_running_loop()
+        headers = Headers([(k.decode('latin-1'), v.decode('latin-1')) for k, v in scope.get('headers', [])])
+        args = MultiDict(parse_qsl(scope.get('query_string', b'').decode('latin-1')))
+        stream = self.open_stream(job_id, headers.get('Host', 'localhost'), args, headers)
+
+        first = await loop.run_in_executor(self.executor, stream.open)
+        if first is None:
+            await send({'type': 'http.response.start', 'status': 404,
+                        'headers': [(b'content-type', b'application/json')]})
+            await send({'type': 'http.response.body', 'body': json.dumps({"error": "Job not found"}).encode()})
+            return
+
+        await send({'type': 'http.response.start', 'status': 200, 'headers': SSE_RESPONSE_HEADERS})
+
+        async def pump():
+            chunks = first
+            while True:
+                if chunks:
+                    await send({'type': 'http.response.body', 'body': ''.join(chunks).encode(), 'more_body': True})
+                if stream.finished:
+                    return
+                events = await self.bus.wait_async(job_id, stream.cursor, timeout=stream.keepalive_interval)
+                if events:
+                    chunks = stream.on_events(events)
+                elif stream.claim_resync():
+                    chunks = await loop.run_in_executor(self.executor, stream.resync_now)
+                    if chunks is None:
+                        chunks = stream.keepalive()
+                else:
+                    chunks = stream.keepalive()
+
+        async def disconnected():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+
+        self.open_streams += 1
+        sender = asyncio.ensure_future(pump())
+        watcher = asyncio.ensure_future(disconnected())
+        try:
+            await asyncio.wait({sender, watcher}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            self.open_streams -= 1
+            watcher.cancel()
+            if not sender.done():
+                sender.cancel()  # Client went away
+            # Let the cancelled tasks unregister from the bus before returning
+            await asyncio.gather(sender, watcher, return_exceptions=True)
+
+        if not sender.cancelled():
+            error = sender.exception()
+            if error is not None:
+                logger.error(f"[ASGI] Stream {job_id} failed: {error}")
+                return
+            await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {'open_streams': self.open_streams, 'threads': self.threads}
+
+
+def serve(app: JobServiceASGI, host: str, port: int, log_level: str = 'info'):
+    """Serve the ASGI app with uvicorn (blocks)."""
+    try:
+        import uvicorn
+    except ImportError as e:
+        raise RuntimeError("ASGI mode needs uvicorn. Run: pip install uvicorn") from e
+
+    uvicorn.run(app, host=host, port=port, log_level=log_level, backlog=ASGI_BACKLOG,
+                timeout_graceful_shutdown=5)
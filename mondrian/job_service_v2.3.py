@@ -6,6 +6,7 @@ Manages background processing of analysis jobs with AI Advisor integration
 
 import os
 import sys
+import gzip
 import json
 import logging
 import argparse
@@ -14,6 +15,7 @@ from datetime import datetime
 import sqlite3
 from typing import Optional, Dict, Any
 import uuid
+import socket
 import threading
 import time
 import requests
@@ -25,11 +27,31 @@ from io import BytesIO
 
 # Configure logging
 from mondrian.logging_config import setup_service_logging
+from mondrian.db_pool import db_connection, get_pool_stats
+from mondrian.job_queue import (
+    ACTIVE_JOBS_SQL, JOB_STATUS_SQL, RECENT_JOBS_SQL, STALE_JOBS_SQL,
+    MAX_JOB_ATTEMPTS, JobNotifier, LeaseHeartbeat, LeaseLost, claim_next_job, ensure_lease_columns, fenced_update,
+    queue_counts
+)
+from mondrian.job_events import TERMINAL_STATUSES, JobEventBus, JobStream
+from mondrian.job_results import (
+    RESULT_COMPRESS_MIN_BYTES, RESULT_FIELDS, ResultDocument, delete_job_results, ensure_results_schema,
+    load_job_results, load_result_document, result_hash, save_job_results
+)
+from mondrian.query_indexes import ensure_query_indexes
+from mondrian.timeouts import (
+    AI_ADVISOR_REQUEST_TIMEOUT, GENERATION_CANCEL_WAIT, GENERATION_STALL_TIMEOUT, JOB_QUEUE_IDLE_WAIT,
+    COMPLETED_ARTIFACT_MAX_AGE, JOB_STREAM_KEEPALIVE_INTERVAL, JOB_STREAM_RESYNC_INTERVAL,
+    SERVICE_HEALTH_CHECK_TIMEOUT
+)
 logger = setup_service_logging('job_service_v2.3')
 
 # AI Advisor service URL
 AI_ADVISOR_URL = "http://127.0.0.1:5100"
 
+# Concurrent job workers (each holds one job at a time); --workers overrides
+JOB_WORKERS = int(os.environ.get('MONDRIAN_JOB_WORKERS', 1))
+
 # Helper function to resize images for thumbnails
 def resize_image_for_web(image_path: str, max_width: int = 800, max_height: int = 800, quality: int = 85) -> BytesIO:
     """
@@ -107,7 +129,7 @@ class JobDatabase:
     
     def _init_db(self):
         """Initialize database schema - add missing columns if needed"""
-        with sqlite3.connect(self.db_path) as conn:
+        with db_connection(self.db_path) as conn:
             cursor = conn.cursor()
             
             # Check if error column exists
@@ -144,13 +166,33 @@ class JobDatabase:
                 logger.info("Adding 'adapter' column to jobs table")
                 conn.execute("ALTER TABLE jobs ADD COLUMN adapter TEXT DEFAULT NULL")
                 conn.commit()
+
+            # Prompt token counts before/after RAG context packing
+            if 'prompt_tokens_before' not in columns:
+                logger.info("Adding 'prompt_tokens_before' column to jobs table")
+                conn.execute("ALTER TABLE jobs ADD COLUMN prompt_tokens_before INTEGER DEFAULT NULL")
+                conn.commit()
+
+            if 'prompt_tokens_after' not in columns:
+                logger.info("Adding 'prompt_tokens_after' column to jobs table")
+                conn.execute("ALTER TABLE jobs ADD COLUMN prompt_tokens_after INTEGER DEFAULT NULL")
+                conn.commit()
+
+            # Worker leases (atomic claim, see mondrian/job_queue.py)
+            ensure_lease_columns(conn)
+
+            # Indexes for the recurring queries (see mondrian/query_indexes.py)
+            ensure_query_indexes(conn)
+
+            # Result payloads (see mondrian/job_results.py)
+            ensure_results_schema(conn)
     
     def create_job(self, advisor: str, mode: str, image_path: str, enable_rag: bool = True) -> str:
         """Create a new job"""
         job_id = str(uuid.uuid4())
         now = datetime.now().isoformat()
         
-        with sqlite3.connect(self.db_path) as conn:
+        with db_connection(self.db_path) as conn:
             conn.execute("""
                 INSERT INTO jobs (id, filename, advisor, mode, status, created_at, last_activity, enable_rag)
                 VALUES (?, ?, ?, ?, ?, ?, ?, ?)
@@ -171,25 +213,14 @@ class JobDatabase:
         
         return job_id
     
-    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
-        """Get job details"""
+    def get_job_status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Job status columns only (no result payloads) - for polling"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.row_factory = sqlite3.Row  # Better error messages
-                cursor = conn.execute(
-                    """SELECT id, filename, status, advisor, mode, created_at, current_step, progress_percentage, enable_rag,
-                              prompt, llm_prompt, analysis_markdown, llm_thinking, analysis_html, advisor_bio, llm_outputs,
-                              summary_html, advisor_bio_html, model, adapter
-                       FROM jobs WHERE id = ?""",
-                    (job_id,)
-                )
-                row = cursor.fetchone()
+            with db_connection(self.db_path) as conn:
+                row = conn.execute(JOB_STATUS_SQL, (job_id,)).fetchone()
         except sqlite3.DatabaseError as e:
             logger.error(f"Database error retrieving job {job_id}: {e}")
             return None
-        except Exception as e:
-            logger.error(f"Unexpected error retrieving job {job_id}: {e}")
-            return None
 
         if not row:
             return None
@@ -204,24 +235,58 @@ class JobDatabase:
             'current_step': row[6],
             'progress_percentage': row[7],
             'enable_rag': bool(row[8]),
-            'prompt': row[9] or '',
-            'llm_prompt': row[10] or '',
-            'analysis_markdown': row[11] or '',
-            'llm_thinking': row[12] or '',
-            'analysis_html': row[13] or '',
-            'advisor_bio': row[14] or '',
-            'llm_outputs': row[15] or '',
-            'summary_html': row[16] or '',
-            'advisor_bio_html': row[17] or '',
-            'model': row[18] or '',
-            'adapter': row[19] or ''
+            'error': row[9],
+            'model': row[10] or '',
+            'adapter': row[11] or '',
+            'prompt_tokens_before': row[12],
+            'prompt_tokens_after': row[13]
         }
+
+    def get_job(self, job_id: str, fields: Optional[tuple] = RESULT_FIELDS) -> Optional[Dict[str, Any]]:
+        """
+        Get job details: the status columns plus result payloads.
+
+        Args:
+            job_id: Job to read
+            fields: Result payloads to include (see mondrian/job_results.py);
+                    only these are read
+        """
+        job = self.get_job_status(job_id)
+        if job is None or not fields:
+            return job
+        try:
+            with db_connection(self.db_path) as conn:
+                job.update(load_job_results(conn, job_id, fields))
+        except sqlite3.DatabaseError as e:
+            logger.error(f"Database error retrieving results of job {job_id}: {e}")
+            return None
+        return job
+
+    def get_result_document(self, job_id: str, field: str) -> Optional[ResultDocument]:
+        """One result payload as stored (possibly gzip) - for sending as is"""
+        with db_connection(self.db_path) as conn:
+            return load_result_document(conn, job_id, field)
+
+    def get_result_hash(self, job_id: str, field: str) -> Optional[str]:
+        """Content hash of one result payload, without reading it - for ETags"""
+        with db_connection(self.db_path) as conn:
+            return result_hash(conn, job_id, field)
+    
+    def get_job_progress(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Status columns only (no result payloads) - for change checks"""
+        with db_connection(self.db_path) as conn:
+            row = conn.execute(
+                "SELECT status, progress_percentage, current_step FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if not row:
+            return None
+        return {'status': row[0], 'progress_percentage': row[1], 'current_step': row[2]}
     
     def update_job(self, job_id: str, status: str, result: Optional[Dict] = None, error: Optional[str] = None):
         """Update job status"""
         now = datetime.now().isoformat()
         
-        with sqlite3.connect(self.db_path) as conn:
+        with db_connection(self.db_path) as conn:
             conn.execute("""
                 UPDATE jobs SET status = ?, last_activity = ?
                 WHERE id = ?
@@ -232,11 +297,8 @@ class JobDatabase:
     
     def list_jobs(self, limit: int = 100) -> list:
         """List recent jobs"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.execute("""
-                SELECT id, filename, status, advisor, mode, created_at, model, adapter FROM jobs
-                ORDER BY created_at DESC LIMIT ?
-            """, (limit,))
+        with db_connection(self.db_path) as conn:
+            cursor = conn.execute(RECENT_JOBS_SQL, (limit,))
             rows = cursor.fetchall()
 
         return [
@@ -255,8 +317,9 @@ class JobDatabase:
     
     def clear_jobs(self):
         """Clear all jobs"""
-        with sqlite3.connect(self.db_path) as conn:
+        with db_connection(self.db_path) as conn:
             conn.execute("DELETE FROM jobs")
+            delete_job_results(conn)
             conn.commit()
         
         logger.info("Cleared all jobs")
@@ -269,6 +332,120 @@ CORS(app)
 # Global job database
 job_db = None
 
+# Wakes idle workers when a job is queued
+job_notifier = JobNotifier()
+
+# Job progress events for /stream (see mondrian/job_events.py)
+job_events = JobEventBus()
+
+SSE_HEADERS = {
+    'Cache-Control': 'no-cache',
+    'X-Accel-Buffering': 'no',
+    'Connection': 'keep-alive'
+}
+
+# Result payloads a stream starts from (the rest is status columns)
+STREAM_FIELDS = ('llm_thinking', 'analysis_html')
+# GET /jobs/<id> leaves out the HTML; /summary and /analysis serve it
+JOB_DETAIL_FIELDS = tuple(f for f in RESULT_FIELDS if f not in ('analysis_html', 'summary_html'))
+
+# gzip level for responses compressed per request (GET /jobs/<id> JSON);
+# stored results are already compressed (see mondrian/job_results.py)
+RESPONSE_GZIP_LEVEL = 6
+
+
+def accepts_encoding(encoding: str) -> bool:
+    """Whether the request's Accept-Encoding allows encoding (q > 0)"""
+    return request.accept_encodings[encoding] > 0
+
+
+def gzip_response(response: Response) -> Response:
+    """Compress a response for clients that accept gzip (small bodies are left as they are)"""
+    response.vary.add('Accept-Encoding')
+    if (accepts_encoding('gzip') and 'Content-Encoding' not in response.headers
+            and response.content_length and response.content_length >= RESULT_COMPRESS_MIN_BYTES):
+        response.set_data(gzip.compress(response.get_data(), compresslevel=RESPONSE_GZIP_LEVEL))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
+# A completed job's analysis and summary never change
+IMMUTABLE_CACHE_CONTROL = f"private, max-age={COMPLETED_ARTIFACT_MAX_AGE}, immutable"
+
+
+def send_result_document(job: Dict[str, Any], field: str) -> Optional[Response]:
+    """
+    Response for a stored HTML result, None if the job has none.
+
+    The ETag is the content hash of the text (with -gzip for the compressed
+    representation). A request whose If-None-Match carries it gets a 304
+    from the job_results key alone, without the payload being read.
+    Otherwise the stored gzip bytes go out as they are when the client
+    accepts gzip, decompressed for other clients.
+    """
+    digest = job_db.get_result_hash(job['id'], field)
+    if not digest:
+        return None
+
+    headers = {
+        'Cache-Control': IMMUTABLE_CACHE_CONTROL if job['status'] == 'completed' else 'no-cache',
+        'Vary': 'Accept-Encoding',
+    }
+    for etag in (f"{digest}-gzip", digest):
+        if request.if_none_match.contains_weak(etag):
+            return Response(status=304, headers={**headers, 'ETag': f'"{etag}"'})
+
+    document = job_db.get_result_document(job['id'], field)
+    if not document:
+        return None
+    if document.encoding and accepts_encoding(document.encoding):
+        headers['Content-Encoding'] = document.encoding
+        headers['ETag'] = f'"{document.hash}-{document.encoding}"'
+        body = document.data
+    else:
+        headers['ETag'] = f'"{document.hash}"'
+        body = document.text()
+    return Response(body, mimetype='text/html; charset=utf-8', headers=headers)
+
+
+def publish_job_status(job_id: str, status: str, progress_percentage: Optional[int] = None,
+                       current_step: Optional[str] = None, error: Optional[str] = None):
+    """Publish a status event; terminal failures also end the job's streams"""
+    job_events.publish(job_id, 'status', status=status, progress_percentage=progress_percentage,
+                       current_step=current_step, error=error)
+    if status in TERMINAL_STATUSES and status != 'completed':
+        job_events.publish(job_id, 'done')
+
+
+def publish_job_result(job_id: str, thinking: str, analysis_html: str):
+    """Publish a completed job's thinking and analysis, then end its streams"""
+    job_events.publish_thinking(job_id, thinking or '')
+    job_events.publish(job_id, 'status', status='completed', progress_percentage=100,
+                       current_step='Analysis complete', error=None)
+    job_events.publish(job_id, 'complete', analysis_html=analysis_html or '')
+    job_events.publish(job_id, 'done')
+
+
+def resync_job_events(job_id: str) -> bool:
+    """
+    Publish changes made to the job outside this process (another node's
+    worker, stale-job recovery elsewhere) by reading its status columns.
+
+    Returns:
+        False if the job no longer exists
+    """
+    progress = job_db.get_job_progress(job_id)
+    if progress is None:
+        return False
+    if progress['status'] == 'completed' and not job_events.snapshot(job_id).get('done'):
+        job = job_db.get_job(job_id, fields=STREAM_FIELDS)
+        publish_job_result(job_id, job.get('llm_thinking', ''), job.get('analysis_html', ''))
+        return True
+    event = job_events.sync(job_id, progress['status'], progress['progress_percentage'], progress['current_step'])
+    if event and progress['status'] in TERMINAL_STATUSES:
+        job_events.publish(job_id, 'done')
+    return True
+
 def init_db(db_path: str = "mondrian.db"):
     """Initialize job database"""
     global job_db
@@ -282,7 +459,9 @@ def health():
     return jsonify({
         "status": "UP",
         "service": "job_service",
-        "timestamp": datetime.now().isoformat()
+        "timestamp": datetime.now().isoformat(),
+        "db_pool": get_pool_stats(),
+        "job_events": job_events.get_stats()
     }), 200
 
 
@@ -293,7 +472,7 @@ def get_advisors():
         import base64
         
         db_path = job_db.db_path if job_db else "mondrian.db"
-        with sqlite3.connect(db_path) as conn:
+        with db_connection(db_path) as conn:
             conn.row_factory = sqlite3.Row
             # Only fetch enabled advisors - strict check: enabled = 1 only
             cursor = conn.execute("""
@@ -375,7 +554,7 @@ def get_advisor_detail(advisor_id):
         import base64
         
         db_path = job_db.db_path if job_db else "mondrian.db"
-        with sqlite3.connect(db_path) as conn:
+        with db_connection(db_path) as conn:
             conn.row_factory = sqlite3.Row
             # Check that advisor is enabled before returning details
             cursor = conn.execute("""
@@ -747,11 +926,13 @@ def upload_image():
         
         # If auto_analyze is true, update status to 'queued' to trigger immediate processing
         if auto_analyze:
-            with sqlite3.connect(job_db.db_path) as conn:
+            with db_connection(job_db.db_path) as conn:
                 conn.execute("""
                     UPDATE jobs SET status = 'queued' WHERE id = ?
                 """, (job_id,))
                 conn.commit()
+            publish_job_status(job_id, 'queued')
+            job_notifier.notify()
             logger.info(f"[UPLOAD] Job queued: {job_id}")
         
         # Format response - use get_base_url() helper for consistency
@@ -988,7 +1169,7 @@ def list_jobs():
 
 
 @app.route('/jobs/<job_id>', methods=['GET'])
-def get_job(job_id: str):
+def get_job(job_id: str, payload_fields: tuple = JOB_DETAIL_FIELDS):
     """Get job details - returns JSON job metadata (excludes HTML content)
     
     Query params:
@@ -997,18 +1178,22 @@ def get_job(job_id: str):
     For HTML content, use dedicated endpoints:
         - GET /summary/{job_id} - Quick preview HTML (top 3 recommendations)
         - GET /analysis/{job_id} - Full detailed analysis HTML
+    
+    payload_fields: Result payloads included in the JSON (/status passes none)
     """
     if not job_db:
         logger.error(f"[STATUS] Job database not initialized when checking job {job_id}")
         return jsonify({"error": "Database not initialized"}), 503
     
-    job = job_db.get_job(job_id)
+    # Check if requesting HTML detail view (for debugging)
+    view = request.args.get('view', 'json')
+    job = job_db.get_job(job_id, fields=payload_fields if view != 'detail' else RESULT_FIELDS)
     
     if not job:
         logger.warning(f"[STATUS] Job not found: {job_id} (checking DB at {job_db.db_path})")
         # Additional debugging
         try:
-            with sqlite3.connect(job_db.db_path) as conn:
+            with db_connection(job_db.db_path) as conn:
                 cursor = conn.execute("SELECT COUNT(*) FROM jobs")
                 count = cursor.fetchone()[0]
                 logger.warning(f"[STATUS] Total jobs in database: {count}")
@@ -1016,15 +1201,12 @@ def get_job(job_id: str):
             logger.error(f"[STATUS] Failed to check job count: {e}")
         return jsonify({"error": "Job not found"}), 404
     
-    # Check if requesting HTML detail view (for debugging)
-    view = request.args.get('view', 'json')
     if view == 'detail':
         return render_job_detail_html(job)
     
-    # Always exclude large HTML fields to optimize polling performance
+    # Large HTML fields are never included, to optimize polling performance
     # Clients must use /summary/{job_id} or /analysis/{job_id} to get HTML
-    job_response = {k: v for k, v in job.items() if k not in ('analysis_html', 'summary_html')}
-    return jsonify(job_response), 200
+    return gzip_response(jsonify(job)), 200
 
 
 def render_job_detail_html(job):
@@ -1231,160 +1413,93 @@ def render_job_detail_html(job):
 
 @app.route('/status/<job_id>', methods=['GET'])
 def get_job_status(job_id: str):
-    """Get job status - alias for /jobs/<job_id> for backwards compatibility"""
-    return get_job(job_id)
+    """
+    Get job status - /jobs/<job_id> without the result payloads (a read of
+    the jobs row only); ?view=detail still renders the full job
+    """
+    return get_job(job_id, payload_fields=())
+
+
+def open_job_stream(job_id: str, host: str, args, headers) -> JobStream:
+    """
+    Build the JobStream for a /stream request (shared by the Flask route and
+    the ASGI server).
+
+    Args:
+        job_id: Job to stream
+        host: Host header, for the analysis URL
+        args: Query parameters (compact, last_event_id)
+        headers: Request headers (Last-Event-ID)
+    """
+    base_url = f"http://{host.split(':')[0]}:5005"
+    return JobStream(
+        job_events, job_id,
+        load_job=lambda job_id: job_db.get_job(job_id, fields=STREAM_FIELDS),
+        resync=resync_job_events,
+        analysis_url=f"{base_url}/analysis/{job_id}",
+        last_event_id=headers.get('Last-Event-ID') or args.get('last_event_id'),
+        compact=args.get('compact', '').lower() in ('1', 'true', 'yes'),
+    )
 
 
 @app.route('/stream/<job_id>', methods=['GET'])
 def stream_job_updates(job_id: str):
-    """Stream job updates via Server-Sent Events (SSE)"""
+    """
+    Stream job updates via Server-Sent Events (SSE)
+
+    Updates come from the in-process event bus (job_events), published by the
+    workers; the job row is read once per connection, plus a status-only
+    check every JOB_STREAM_RESYNC_INTERVAL for changes made by other
+    processes. Events carry an id, so a client reconnecting with
+    Last-Event-ID (or ?last_event_id=) is sent only what it missed.
+
+    llm_thinking goes out in full only when a connection starts without
+    resuming, then as thinking_delta events; ?compact=1 selects the
+    mobile-sized format (see JobStreamEncoder in mondrian/job_events.py).
+
+    Each connection holds a server thread; with --asgi the same stream is
+    served from an event loop (mondrian/job_service_asgi.py).
+    """
     if not job_db:
         return jsonify({"error": "Database not initialized"}), 503
 
-    job = job_db.get_job(job_id)
-    if not job:
+    stream = open_job_stream(job_id, request.host, request.args, request.headers)
+    first = stream.open()
+    if first is None:
         return jsonify({"error": "Job not found"}), 404
 
-    # Compute base_url outside generator (request context available here)
-    base_url = f"http://{request.host.split(':')[0]}:5005"
-
     def generate():
         """Generator function that yields SSE events"""
-        import time
-        from datetime import datetime
-
-        # Send connected event
-        connected_event = {
-            "type": "connected",
-            "job_id": job_id
-        }
-        yield f"event: connected\ndata: {json.dumps(connected_event)}\n\n"
-
-        last_status = job.get('status')
-        last_progress = job.get('progress_percentage', 0)
-        last_thinking = job.get('llm_thinking', '')
-        last_step = job.get('current_step', '')
-        last_update_time = time.time()
-        update_interval = 3  # Send status updates every 3 seconds for iOS UI
-
-        # Send initial status update immediately after connected
-        initial_update_event = {
-            "type": "status_update",
-            "job_id": job_id,
-            "timestamp": datetime.now().timestamp(),
-            "job_data": {
-                "status": last_status,
-                "progress_percentage": last_progress,
-                "current_step": last_step,
-                "llm_thinking": last_thinking,
-                "current_advisor": 1,
-                "total_advisors": 1,
-                "step_phase": "analyzing" if last_status == "analyzing" else "processing",
-                "analysis_url": f"{base_url}/analysis/{job_id}"
-            }
-        }
-        yield f"event: status_update\ndata: {json.dumps(initial_update_event)}\n\n"
-        logger.debug(f"🔄 Initial stream update: status={last_status}, progress={last_progress}%, step={last_step}")
-
-        while True:
-            job_data = job_db.get_job(job_id)
-            if not job_data:
-                break
-            
-            current_status = job_data.get('status')
-            current_progress = job_data.get('progress_percentage', 0)
-            current_thinking = job_data.get('llm_thinking', '')
-            current_step = job_data.get('current_step', '')
-            current_time = time.time()
-            
-            # Send status update if changed OR if periodic update interval reached (for progress/step updates)
-            status_changed = (current_status != last_status or
-                            current_progress != last_progress or
-                            current_step != last_step or
-                            current_thinking != last_thinking)
-
-            periodic_update = (current_time - last_update_time) >= update_interval and current_status == "analyzing"
-
-            if status_changed or periodic_update:
-                
-                status_update_event = {
-                    "type": "status_update",
-                    "job_id": job_id,
-                    "timestamp": datetime.now().timestamp(),
-                    "job_data": {
-                        "status": current_status,
-                        "progress_percentage": current_progress,
-                        "current_step": current_step,
-                        "llm_thinking": current_thinking,
-                        "current_advisor": 1,
-                        "total_advisors": 1,
-                        "step_phase": "analyzing" if current_status == "analyzing" else "processing",
-                        "analysis_url": f"{base_url}/analysis/{job_id}"
-                    }
-                }
-                yield f"event: status_update\ndata: {json.dumps(status_update_event)}\n\n"
-                logger.debug(f"🔄 Stream update: status={current_status}, progress={current_progress}%, thinking_len={len(current_thinking)}")
-                
-                last_status = current_status
-                last_progress = current_progress
-                last_thinking = current_thinking
-                last_step = current_step
-                last_update_time = current_time
-            
-            # Check if job is complete
-            if current_status in ['completed', 'failed', 'done']:
-                # Send analysis_complete event
-                if current_status == 'completed':
-                    analysis_complete_event = {
-                        "type": "analysis_complete",
-                        "job_id": job_id,
-                        "analysis_html": job_data.get('analysis_html', '')
-                    }
-                    yield f"event: analysis_complete\ndata: {json.dumps(analysis_complete_event)}\n\n"
-                
-                # Send final done event
-                done_event = {
-                    "type": "done",
-                    "job_id": job_id
-                }
-                yield f"event: done\ndata: {json.dumps(done_event)}\n\n"
-                break
-            
-            time.sleep(0.5)  # Check every 0.5 seconds for responsiveness
+        yield from first
+        while not stream.finished:
+            events = job_events.wait(job_id, stream.cursor, timeout=JOB_STREAM_KEEPALIVE_INTERVAL)
+            yield from (stream.on_events(events) if events else stream.on_idle())
     
     return app.response_class(
         generate(),
         mimetype="text/event-stream",
-        headers={
-            'Cache-Control': 'no-cache',
-            'X-Accel-Buffering': 'no',
-            'Connection': 'keep-alive'
-        }
+        headers=SSE_HEADERS
     )
 
 
 @app.route('/analysis/<job_id>', methods=['GET'])
 def get_analysis(job_id: str):
-    """Get analysis results for a job - returns full HTML analysis"""
+    """Get analysis results for a job - returns full HTML analysis (conditional GET: see send_result_document)"""
     if not job_db:
         return jsonify({"error": "Database not initialized"}), 503
     
-    job = job_db.get_job(job_id)
+    job = job_db.get_job_status(job_id)
     
     if not job:
         return jsonify({"error": "Job not found"}), 404
     
-    # Return the full analysis HTML with proper content-type
-    analysis_html = job.get('analysis_html', '')
+    # Return the full analysis HTML with proper content-type (gzip as stored when accepted)
+    response = send_result_document(job, 'analysis_html')
     
-    if not analysis_html:
+    if not response:
         return jsonify({"error": "No analysis available"}), 404
     
-    return Response(
-        analysis_html,
-        mimetype='text/html; charset=utf-8',
-        headers={'Cache-Control': 'no-cache'}
-    )
+    return response
 
 
 @app.route('/summary/<job_id>', methods=['GET'])
@@ -1396,7 +1511,7 @@ def get_summary(job_id: str):
     if not job_db:
         return jsonify({"error": "Database not initialized"}), 503
     
-    job = job_db.get_job(job_id)
+    job = job_db.get_job_status(job_id)
     
     if not job:
         return jsonify({"error": "Job not found"}), 404
@@ -1404,16 +1519,12 @@ def get_summary(job_id: str):
     if job['status'] != 'completed':
         return jsonify({"error": "Job not completed"}), 400
     
-    summary_html = job.get('summary_html', '')
+    response = send_result_document(job, 'summary_html')
     
-    if not summary_html:
+    if not response:
         return jsonify({"error": "No summary available"}), 404
     
-    return Response(
-        summary_html,
-        mimetype='text/html; charset=utf-8',
-        headers={'Cache-Control': 'no-cache'}
-    )
+    return response
 
 
 @app.route('/jobs', methods=['POST'])
@@ -1433,6 +1544,8 @@ def create_job():
             return jsonify({"error": "image_path required"}), 400
         
         job_id = job_db.create_job(advisor, mode, image_path)
+        publish_job_status(job_id, 'pending')
+        job_notifier.notify()
         
         return jsonify({
             "job_id": job_id,
@@ -1459,8 +1572,14 @@ def update_job(job_id: str):
         error = data.get('error')
         
         job_db.update_job(job_id, status, result, error)
+        if status in ('pending', 'queued'):
+            job_notifier.notify()
         
         job = job_db.get_job(job_id)
+        if job and status == 'completed':
+            publish_job_result(job_id, job.get('llm_thinking', ''), job.get('analysis_html', ''))
+        elif job:
+            publish_job_status(job_id, status, job.get('progress_percentage'), job.get('current_step'), error)
         return jsonify(job), 200
         
     except Exception as e:
@@ -1482,9 +1601,64 @@ def clear_jobs():
     }), 200
 
 
-def process_job_worker(db_path: str):
-    """Background worker that processes pending jobs"""
-    logger.info("Job processor started")
+def advisor_generation_alive(job_id: str) -> bool:
+    """
+    Lease heartbeat check: False only if the advisor reports this job's
+    generation as stalled (no token for GENERATION_STALL_TIMEOUT).
+
+    Before/after generation (retrieval, post-processing) the advisor does not
+    list the job; the /analyze request is still in flight, so that counts as alive.
+    """
+    try:
+        response = requests.get(f"{AI_ADVISOR_URL}/generation/{job_id}", timeout=SERVICE_HEALTH_CHECK_TIMEOUT)
+    except requests.RequestException:
+        return True  # The /analyze call itself will fail if the advisor is gone
+    if response.status_code != 200:
+        return True
+    return response.json().get('idle_seconds', 0) < GENERATION_STALL_TIMEOUT
+
+
+def stop_stalled_generation(job_id: str) -> bool:
+    """
+    Before re-running a job taken over from an expired lease: cancel the
+    previous generation if the advisor is still running it, so the job is not
+    generated twice.
+
+    Returns:
+        True once the advisor no longer generates the job, False if it is still
+        generating after GENERATION_CANCEL_WAIT
+    """
+    try:
+        response = requests.post(f"{AI_ADVISOR_URL}/generation/{job_id}/cancel", timeout=SERVICE_HEALTH_CHECK_TIMEOUT)
+        if response.status_code != 202:
+            return True
+        logger.warning(f"Cancelled the stalled generation of job {job_id}")
+        deadline = time.monotonic() + GENERATION_CANCEL_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(1)
+            response = requests.get(f"{AI_ADVISOR_URL}/generation/{job_id}", timeout=SERVICE_HEALTH_CHECK_TIMEOUT)
+            if response.status_code != 200:
+                return True
+    except requests.RequestException:
+        return True  # Advisor down: nothing is generating
+    return False
+
+
+def fenced_write(db_path: str, job_id: str, lease_token: int, assignments: str, params: tuple = ()):
+    """fenced_update() on a pooled connection borrowed for this write only."""
+    with db_connection(db_path) as conn:
+        fenced_update(conn, job_id, lease_token, assignments, params)
+
+
+def process_job_worker(db_path: str, worker_id: str = 'worker-0'):
+    """
+    Background worker that processes queued jobs.
+
+    Args:
+        db_path: Jobs database
+        worker_id: Lease owner id, unique across workers and processes
+    """
+    logger.info(f"Job processor {worker_id} started")
     
     # Wait for AI Advisor service to be ready before processing jobs
     ai_ready = False
@@ -1514,57 +1688,55 @@ def process_job_worker(db_path: str):
     
     while True:
         try:
-            with sqlite3.connect(db_path) as conn:
-                # Find pending jobs or jobs with retries available
-                # Include 'analyzing' status for recovery (in case of connection drops)
-                # Fetch all needed fields in one query to avoid race conditions
-                cursor = conn.execute("""
-                    SELECT id, filename, advisor, mode, error, COALESCE(retry_count, 0), status, last_activity FROM jobs
-                    WHERE (status IN ('pending', 'queued', 'analyzing') AND COALESCE(retry_count, 0) = 0)
-                       OR (status = 'failed' AND COALESCE(retry_count, 0) < 3)
-                    ORDER BY created_at ASC
-                    LIMIT 1
-                """)
-                job = cursor.fetchone()
-
-                if not job:
-                    time.sleep(1)
+            # Claim the oldest runnable job (atomic; safe with several workers)
+            wake_generation = job_notifier.generation
+            with db_connection(db_path) as conn:
+                job = claim_next_job(conn, worker_id)
+
+            if not job:
+                # Sleep until /upload or POST /jobs queues something
+                job_notifier.wait(wake_generation, timeout=JOB_QUEUE_IDLE_WAIT)
+                continue
+
+            job_id, filename, advisor, mode = job['id'], job['filename'], job['advisor'], job['mode']
+            previous_error, retry_count, enable_rag = job['previous_error'], job['retry_count'], job['enable_rag']
+
+            if job['recovered']:
+                logger.warning(f"[{worker_id}] Recovering job {job_id} after its previous worker's lease expired")
+                if not stop_stalled_generation(job_id):
+                    # Not re-dispatched while the old generation runs; the lease
+                    # lapses and the job is re-claimed (as another attempt) later
+                    logger.warning(f"[{worker_id}] Job {job_id} is still generating - not re-running it yet")
                     continue
 
-                job_id, filename, advisor, mode, previous_error, retry_count, current_status, last_activity = job
-
-                # If job is stuck in analyzing state, log recovery attempt
-                if current_status == 'analyzing':
-                    logger.warning(f"Recovering stuck job {job_id} from 'analyzing' state (last activity: {last_activity})")
-
-                if retry_count > 0:
-                    logger.info(f"Processing job {job_id}: {advisor} ({mode}) - RETRY {retry_count}/3 (prev error: {previous_error})")
-                else:
-                    logger.info(f"Processing job {job_id}: {advisor} ({mode})")
-                
-                # Update job status with current step
-                advisor_title = advisor.replace('_', ' ').title()
-                initial_message = f"Summoning {advisor_title}..."
-                conn.execute("""
-                    UPDATE jobs SET status = ?, current_step = ?, progress_percentage = ?, last_activity = ?, error = ?
-                    WHERE id = ?
-                """, ('analyzing', initial_message, 10, datetime.now().isoformat(), None, job_id))
-                conn.commit()
-                
-                # Update analyzing status
-                conn.execute("""
-                    UPDATE jobs SET current_step = ?, progress_percentage = ?, last_activity = ?
-                    WHERE id = ?
-                """, (f"Analyzing with {advisor_title}...", 30, datetime.now().isoformat(), job_id))
-                conn.commit()
-                
-                # Call AI Advisor service
-                try:
-                    # Get enable_rag from job record
-                    cursor = conn.execute("SELECT enable_rag FROM jobs WHERE id = ?", (job_id,))
-                    enable_rag_row = cursor.fetchone()
-                    enable_rag = bool(enable_rag_row[0]) if enable_rag_row else False
-                    
+            if retry_count > 0:
+                logger.info(f"[{worker_id}] Processing job {job_id}: {advisor} ({mode}) - RETRY {retry_count}/{MAX_JOB_ATTEMPTS} (prev error: {previous_error})")
+            else:
+                logger.info(f"[{worker_id}] Processing job {job_id}: {advisor} ({mode})")
+            
+            # Every write below is fenced on the lease token: if the lease
+            # lapsed and another worker re-ran the job, these become no-ops.
+            # Each borrows a pooled connection only for the write, not for
+            # the /analyze call in between
+            lease_token = job['lease_token']
+            publish_job_status(job_id, 'analyzing', 10, job['current_step'])
+            
+            # Update job status with current step
+            advisor_title = advisor.replace('_', ' ').title()
+            initial_message = f"Summoning {advisor_title}..."
+            fenced_write(db_path, job_id, lease_token, "current_step = ?, last_activity = ?, error = ?",
+                         (initial_message, datetime.now().isoformat(), None))
+            publish_job_status(job_id, 'analyzing', 10, initial_message)
+            
+            # Update analyzing status
+            analyzing_message = f"Analyzing with {advisor_title}..."
+            fenced_write(db_path, job_id, lease_token, "current_step = ?, progress_percentage = ?, last_activity = ?",
+                         (analyzing_message, 30, datetime.now().isoformat()))
+            publish_job_status(job_id, 'analyzing', 30, analyzing_message)
+            
+            # Call AI Advisor service
+            try:
+                with LeaseHeartbeat(db_path, job_id, lease_token, alive=lambda: advisor_generation_alive(job_id)):
                     with open(filename, 'rb') as f:
                         response = requests.post(
                             f"{AI_ADVISOR_URL}/analyze",
@@ -1572,117 +1744,130 @@ def process_job_worker(db_path: str):
                             data={
                                 'advisor': advisor,
                                 'mode': mode,
-                                'enable_rag': str(enable_rag).lower()
+                                'enable_rag': str(enable_rag).lower(),
+                                'job_id': job_id
                             },
-                            timeout=300
+                            timeout=AI_ADVISOR_REQUEST_TIMEOUT
                         )
+                
+                if response.status_code == 200:
+                    # Update processing status
+                    fenced_write(db_path, job_id, lease_token, "current_step = ?, progress_percentage = ?, last_activity = ?",
+                                 ("Processing analysis...", 70, datetime.now().isoformat()))
+                    publish_job_status(job_id, 'analyzing', 70, "Processing analysis...")
                     
-                    if response.status_code == 200:
-                        # Update processing status
-                        conn.execute("""
-                            UPDATE jobs SET current_step = ?, progress_percentage = ?, last_activity = ?
-                            WHERE id = ?
-                        """, ("Processing analysis...", 70, datetime.now().isoformat(), job_id))
-                        conn.commit()
-                        
-                        analysis_data = response.json()
-                        
-                        # Extract all analysis fields
-                        analysis_html = analysis_data.get('analysis_html', '')
-                        summary_html = analysis_data.get('summary_html', '')
-                        advisor_bio = analysis_data.get('advisor_bio', '')
-                        advisor_bio_html = analysis_data.get('advisor_bio_html', '')
-                        thinking = analysis_data.get('llm_thinking', '')
-                        prompt = analysis_data.get('prompt', '')
-                        llm_prompt = analysis_data.get('llm_prompt', '')
-                        full_response = analysis_data.get('full_response', '')
-                        summary = analysis_data.get('summary', '')
-                        model = analysis_data.get('model', '')
-                        adapter = analysis_data.get('adapter', '')
-
-                        # Prepare llm_outputs as JSON string
-                        llm_outputs = json.dumps({
-                            'prompt': prompt,
-                            'response': full_response,
-                            'summary': summary,
-                            'model': model,
-                            'timestamp': analysis_data.get('timestamp', '')
-                        })
+                    analysis_data = response.json()
+                    
+                    # Extract all analysis fields
+                    analysis_html = analysis_data.get('analysis_html', '')
+                    summary_html = analysis_data.get('summary_html', '')
+                    advisor_bio = analysis_data.get('advisor_bio', '')
+                    advisor_bio_html = analysis_data.get('advisor_bio_html', '')
+                    thinking = analysis_data.get('llm_thinking', '')
+                    prompt = analysis_data.get('prompt', '')
+                    llm_prompt = analysis_data.get('llm_prompt', '')
+                    full_response = analysis_data.get('full_response', '')
+                    summary = analysis_data.get('summary', '')
+                    model = analysis_data.get('model', '')
+                    adapter = analysis_data.get('adapter', '')
+                    prompt_tokens_before = analysis_data.get('prompt_tokens_before')
+                    prompt_tokens_after = analysis_data.get('prompt_tokens_after')
+
+                    # Prepare llm_outputs as JSON string
+                    llm_outputs = json.dumps({
+                        'prompt': prompt,
+                        'response': full_response,
+                        'summary': summary,
+                        'model': model,
+                        'timestamp': analysis_data.get('timestamp', ''),
+                        'rag_context': analysis_data.get('rag_context')
+                    })
 
-                        # Create markdown summary for analysis_markdown field
-                        analysis_markdown = f"""# {advisor.title()} Analysis\n\n## Summary\n{summary}\n\n## Full Analysis\n{full_response}"""
-
-                        # Update job with all results including summary_html and advisor_bio_html
-                        conn.execute("""
-                            UPDATE jobs SET status = ?, current_step = ?, progress_percentage = ?,
-                                           analysis_html = ?, summary_html = ?,
-                                           advisor_bio = ?, advisor_bio_html = ?, llm_thinking = ?,
-                                           prompt = ?, llm_prompt = ?, llm_outputs = ?,
-                                           analysis_markdown = ?, model = ?, adapter = ?,
-                                           last_activity = ?
-                            WHERE id = ?
+                    # Payloads go to the results store (prompt and response stored
+                    # once, analysis_markdown rebuilt on read), in the same
+                    # transaction as the status update below
+                    with db_connection(db_path) as conn:
+                        save_job_results(conn, job_id, {
+                            'analysis_html': analysis_html, 'summary_html': summary_html,
+                            'advisor_bio': advisor_bio, 'advisor_bio_html': advisor_bio_html,
+                            'llm_thinking': thinking, 'prompt': prompt, 'llm_prompt': llm_prompt,
+                            'llm_response': full_response, 'llm_outputs': llm_outputs
+                        })
+                        fenced_update(conn, job_id, lease_token, """
+                            status = ?, current_step = ?, progress_percentage = ?,
+                            model = ?, adapter = ?,
+                            prompt_tokens_before = ?, prompt_tokens_after = ?,
+                            last_activity = ?, lease_owner = NULL, lease_expires_at = NULL
                         """, ('completed', 'Analysis complete', 100,
-                              analysis_html, summary_html, advisor_bio, advisor_bio_html,
-                              thinking, prompt, llm_prompt, llm_outputs, analysis_markdown,
-                              model, adapter,
-                              datetime.now().isoformat(), job_id))
-                        conn.commit()
-                        logger.info(f"Job {job_id} completed successfully with summary")
-                    else:
-                        error_msg = f"AI Advisor returned {response.status_code}"
-                        # Increment retry count for transient failures
-                        current_retry = retry_count + 1
-                        if current_retry < 3:
-                            conn.execute("""
-                                UPDATE jobs SET status = ?, error = ?, retry_count = ?, last_activity = ?
-                                WHERE id = ?
-                            """, ('queued', error_msg, current_retry, datetime.now().isoformat(), job_id))
-                            logger.warning(f"Job {job_id} failed temporarily: {error_msg} - will retry ({current_retry}/3)")
-                        else:
-                            conn.execute("""
-                                UPDATE jobs SET status = ?, error = ?, retry_count = ?, last_activity = ?
-                                WHERE id = ?
-                            """, ('failed', error_msg, current_retry, datetime.now().isoformat(), job_id))
-                            logger.error(f"Job {job_id} failed permanently after {current_retry} retries: {error_msg}")
-                        conn.commit()
-                        
-                except Exception as e:
-                    error_msg = str(e)
+                              model, adapter, prompt_tokens_before, prompt_tokens_after,
+                              datetime.now().isoformat()))
+                    publish_job_result(job_id, thinking, analysis_html)
+                    logger.info(f"Job {job_id} completed successfully with summary")
+                else:
+                    error_msg = f"AI Advisor returned {response.status_code}"
                     # Increment retry count for transient failures
                     current_retry = retry_count + 1
-                    if current_retry < 3 and "Connection refused" in error_msg:
-                        conn.execute("""
-                            UPDATE jobs SET status = ?, error = ?, retry_count = ?, last_activity = ?
-                            WHERE id = ?
-                        """, ('queued', error_msg, current_retry, datetime.now().isoformat(), job_id))
-                        logger.warning(f"Job {job_id} connection failed: {e} - will retry ({current_retry}/3)")
+                    if current_retry < MAX_JOB_ATTEMPTS:
+                        fenced_write(db_path, job_id, lease_token, """
+                            status = ?, error = ?, retry_count = ?, last_activity = ?,
+                            lease_owner = NULL, lease_expires_at = NULL
+                        """, ('queued', error_msg, current_retry, datetime.now().isoformat()))
+                        publish_job_status(job_id, 'queued', error=error_msg)
+                        logger.warning(f"Job {job_id} failed temporarily: {error_msg} - will retry ({current_retry}/{MAX_JOB_ATTEMPTS})")
                     else:
-                        conn.execute("""
-                            UPDATE jobs SET status = ?, error = ?, retry_count = ?, last_activity = ?
-                            WHERE id = ?
-                        """, ('failed', error_msg, current_retry, datetime.now().isoformat(), job_id))
-                        logger.error(f"Job {job_id} error: {e}")
-                    
+                        fenced_write(db_path, job_id, lease_token, """
+                            status = ?, error = ?, retry_count = ?, last_activity = ?,
+                            lease_owner = NULL, lease_expires_at = NULL
+                        """, ('failed', error_msg, current_retry, datetime.now().isoformat()))
+                        publish_job_status(job_id, 'failed', error=error_msg)
+                        logger.error(f"Job {job_id} failed permanently after {current_retry} retries: {error_msg}")
+            
+            except LeaseLost:
+                raise
+            except Exception as e:
+                error_msg = str(e)
+                # Increment retry count for transient failures
+                current_retry = retry_count + 1
+                if current_retry < MAX_JOB_ATTEMPTS and "Connection refused" in error_msg:
+                    fenced_write(db_path, job_id, lease_token, """
+                        status = ?, error = ?, retry_count = ?, last_activity = ?,
+                        lease_owner = NULL, lease_expires_at = NULL
+                    """, ('queued', error_msg, current_retry, datetime.now().isoformat()))
+                    publish_job_status(job_id, 'queued', error=error_msg)
+                    logger.warning(f"Job {job_id} connection failed: {e} - will retry ({current_retry}/{MAX_JOB_ATTEMPTS})")
+                else:
+                    fenced_write(db_path, job_id, lease_token, """
+                        status = ?, error = ?, retry_count = ?, last_activity = ?,
+                        lease_owner = NULL, lease_expires_at = NULL
+                    """, ('failed', error_msg, current_retry, datetime.now().isoformat()))
+                    publish_job_status(job_id, 'failed', error=error_msg)
+                    logger.error(f"Job {job_id} error: {e}")
+                
+        except LeaseLost as e:
+            # Another worker re-ran the job after our lease lapsed; its result stands
+            logger.warning(f"[{worker_id}] Discarding result: {e}")
         except Exception as e:
             logger.error(f"Worker error: {e}")
             time.sleep(1)
 
 
 def check_and_recover_stale_jobs(db_path: str, stale_threshold_minutes: int = 5):
-    """Check for jobs stuck in analyzing/processing state and recover them"""
+    """
+    Check for jobs stuck in analyzing/processing state and recover them.
+
+    Jobs whose lease is still valid are being heartbeated by a live worker and
+    are left alone however long they run; expired leases are normally
+    re-claimed by the next idle worker, so this mainly catches jobs without a
+    lease (claimed before leases existed) and expired jobs out of retries.
+    """
     try:
         from datetime import datetime, timedelta
         
-        with sqlite3.connect(db_path) as conn:
+        with db_connection(db_path) as conn:
             # Find jobs that have been in analyzing/processing state too long
             stale_cutoff = (datetime.now() - timedelta(minutes=stale_threshold_minutes)).isoformat()
             
-            cursor = conn.execute("""
-                SELECT id, status, last_activity, filename, advisor, mode, COALESCE(retry_count, 0) as retry_count
-                FROM jobs
-                WHERE status IN ('analyzing', 'processing')
-                  AND last_activity < ?
-            """, (stale_cutoff,))
+            cursor = conn.execute(STALE_JOBS_SQL, (stale_cutoff, datetime.now().isoformat()))
             
             stale_jobs = cursor.fetchall()
             
@@ -1693,28 +1878,35 @@ def check_and_recover_stale_jobs(db_path: str, stale_threshold_minutes: int = 5)
                 filename = job[3]
                 retry_count = job[6]
                 
-                logger.warning(f"🔧 Detected stale job {job_id[:8]}... stuck in '{status}' for >5min (last activity: {last_activity})")
+                logger.warning(f"🔧 Detected stale job {job_id[:8]}... stuck in '{status}' with no live lease (last activity: {last_activity})")
                 
                 # Mark as failed or queued for retry
                 current_retry = retry_count + 1
-                if current_retry < 3:
-                    error_msg = f"Job timed out after 5 minutes in '{status}' state"
+                if current_retry < MAX_JOB_ATTEMPTS:
+                    error_msg = f"Job abandoned in '{status}' state (no live worker lease)"
                     conn.execute("""
                         UPDATE jobs SET status = 'queued', error = ?, retry_count = ?, 
-                                       last_activity = ?, current_step = 'Recovering from timeout...'
+                                       last_activity = ?, current_step = 'Recovering from timeout...',
+                                       lease_owner = NULL, lease_expires_at = NULL, lease_token = COALESCE(lease_token, 0) + 1
                         WHERE id = ?
                     """, (error_msg, current_retry, datetime.now().isoformat(), job_id))
-                    logger.info(f"   ↳ Queued for retry {current_retry}/3")
+                    publish_job_status(job_id, 'queued', current_step='Recovering from timeout...', error=error_msg)
+                    logger.info(f"   ↳ Queued for retry {current_retry}/{MAX_JOB_ATTEMPTS}")
                 else:
-                    error_msg = f"Job permanently failed after timing out (5+ minutes in '{status}' state)"
+                    error_msg = f"Job permanently failed after being abandoned in '{status}' state (no live worker lease)"
                     conn.execute("""
                         UPDATE jobs SET status = 'failed', error = ?, retry_count = ?, 
-                                       last_activity = ?, current_step = 'Failed: Timeout'
+                                       last_activity = ?, current_step = 'Failed: Timeout',
+                                       lease_owner = NULL, lease_expires_at = NULL, lease_token = COALESCE(lease_token, 0) + 1
                         WHERE id = ?
                     """, (error_msg, current_retry, datetime.now().isoformat(), job_id))
+                    publish_job_status(job_id, 'failed', current_step='Failed: Timeout', error=error_msg)
                     logger.error(f"   ↳ Marked as failed after {current_retry} retries")
                 
                 conn.commit()
+            
+            if stale_jobs:
+                job_notifier.notify()
                 
     except Exception as e:
         logger.error(f"Error checking for stale jobs: {e}")
@@ -1734,42 +1926,24 @@ def monitor_queue_status(db_path: str):
                 check_and_recover_stale_jobs(db_path, stale_threshold_minutes=5)
                 check_counter = 0
             
-            with sqlite3.connect(db_path) as conn:
+            with db_connection(db_path) as conn:
                 conn.row_factory = sqlite3.Row
                 
-                # Get queue statistics
-                cursor = conn.execute("SELECT COUNT(*) as total FROM jobs")
-                total = cursor.fetchone()['total']
-                
-                cursor = conn.execute("SELECT COUNT(*) as count FROM jobs WHERE status = 'pending'")
-                pending = cursor.fetchone()['count']
-                
-                cursor = conn.execute("SELECT COUNT(*) as count FROM jobs WHERE status = 'queued'")
-                queued = cursor.fetchone()['count']
-                
-                cursor = conn.execute("SELECT COUNT(*) as count FROM jobs WHERE status = 'processing'")
-                processing = cursor.fetchone()['count']
-                
-                cursor = conn.execute("SELECT COUNT(*) as count FROM jobs WHERE status = 'analyzing'")
-                analyzing = cursor.fetchone()['count']
-                
-                cursor = conn.execute("SELECT COUNT(*) as count FROM jobs WHERE status IN ('completed', 'done')")
-                completed = cursor.fetchone()['count']
-                
-                cursor = conn.execute("SELECT COUNT(*) as count FROM jobs WHERE status = 'failed'")
-                failed = cursor.fetchone()['count']
+                # Get queue statistics (one pass over the status index)
+                counts = queue_counts(conn)
+                total = sum(counts.values())
+                pending = counts.get('pending', 0)
+                queued = counts.get('queued', 0)
+                processing = counts.get('processing', 0)
+                analyzing = counts.get('analyzing', 0)
+                completed = counts.get('completed', 0) + counts.get('done', 0)
+                failed = counts.get('failed', 0)
                 
                 # Log queue status
                 logger.info(f"📊 Queue: {total} total | {pending} pending | {queued} queued | {processing} processing | {analyzing} analyzing | {completed} completed | {failed} failed")
                 
                 # Get active jobs
-                cursor = conn.execute("""
-                    SELECT id, filename, status, advisor, mode, current_step, llm_thinking 
-                    FROM jobs 
-                    WHERE status IN ('processing', 'analyzing') 
-                    ORDER BY created_at DESC 
-                    LIMIT 3
-                """)
+                cursor = conn.execute(ACTIVE_JOBS_SQL, (3,))
                 active_jobs = cursor.fetchall()
                 
                 if active_jobs:
@@ -1779,12 +1953,13 @@ def monitor_queue_status(db_path: str):
                         filename = job['filename'].split('/')[-1][:40] if job['filename'] else 'unknown'
                         mode = job['mode'] or 'baseline'
                         step = job['current_step'] or 'Starting...'
-                        thinking_len = len(job['llm_thinking'] or '')
+                        thinking = job_events.snapshot(job['id']).get('llm_thinking') or ''
+                        thinking_len = len(thinking)
                         
                         logger.info(f"    • {job_id_short}... ({job['status']}) {filename} [{mode}]")
                         logger.info(f"      Step: {step}")
                         if thinking_len > 0:
-                            thinking_preview = (job['llm_thinking'][:60] + '...') if thinking_len > 60 else job['llm_thinking']
+                            thinking_preview = (thinking[:60] + '...') if thinking_len > 60 else thinking
                             logger.info(f"      🧠 Thinking ({thinking_len} chars): {thinking_preview}")
                 
         except Exception as e:
@@ -1793,14 +1968,19 @@ def monitor_queue_status(db_path: str):
         time.sleep(4)  # Log status every 4 seconds
 
 
-def start_job_processor(db_path: str):
-    """Start background job processor thread"""
-    processor = threading.Thread(
-        target=process_job_worker,
-        args=(db_path,),
-        daemon=True
-    )
-    processor.start()
+def start_job_processor(db_path: str, workers: int = JOB_WORKERS):
+    """Start background job processor threads"""
+    owner_prefix = f"{socket.gethostname()}:{os.getpid()}"
+    processors = []
+    for i in range(max(1, workers)):
+        processor = threading.Thread(
+            target=process_job_worker,
+            args=(db_path, f"{owner_prefix}:worker-{i}"),
+            name=f"job-worker-{i}",
+            daemon=True
+        )
+        processor.start()
+        processors.append(processor)
     
     # Also start queue status monitor
     monitor = threading.Thread(
@@ -1810,7 +1990,7 @@ def start_job_processor(db_path: str):
     )
     monitor.start()
     
-    return processor
+    return processors
 
 
 @app.errorhandler(500)
@@ -1827,6 +2007,10 @@ def main():
     parser.add_argument('--db', default='mondrian.db', help='Database path')
     parser.add_argument('--host', default='0.0.0.0', help='Host to bind to')
     parser.add_argument('--debug', action='store_true', help='Debug mode')
+    parser.add_argument('--workers', type=int, default=JOB_WORKERS, help='Concurrent job workers')
+    parser.add_argument('--asgi', action='store_true', default=os.environ.get('MONDRIAN_JOB_SERVICE_ASGI') == '1',
+                        help='Serve with uvicorn (SSE streams on an event loop instead of a thread each)')
+    parser.add_argument('--asgi-threads', type=int, default=None, help='ASGI mode: threads for Flask views and database reads')
     
     args = parser.parse_args()
     
@@ -1841,7 +2025,7 @@ def main():
     # Only try to read from config if using the default path and it's a fresh installation
     if db_path == 'mondrian.db':
         try:
-            with sqlite3.connect(db_path) as conn:
+            with db_connection(db_path) as conn:
                 cursor = conn.execute("SELECT value FROM config WHERE key = 'db_path'")
                 config_db_path = cursor.fetchone()
                 if config_db_path and config_db_path[0] != db_path:
@@ -1858,9 +2042,16 @@ def main():
     init_db(db_path)
     
     # Start background job processor
-    start_job_processor(db_path)
-    logger.info("Background job processor started")
+    start_job_processor(db_path, workers=args.workers)
+    logger.info(f"Background job processor started ({args.workers} worker{'s' if args.workers != 1 else ''})")
     
+    if args.asgi:
+        from mondrian.job_service_asgi import ASGI_THREADS, JobServiceASGI, serve
+        asgi_app = JobServiceASGI(app, open_job_stream, job_events, threads=args.asgi_threads or ASGI_THREADS)
+        logger.info(f"Starting ASGI server on {args.host}:{args.port} ({asgi_app.threads} view threads)")
+        serve(asgi_app, args.host, args.port, log_level='debug' if args.debug else 'info')
+        return
+
     logger.info(f"Starting Flask server on {args.host}:{args.port}")
     app.run(host=args.host, port=args.port, debug=args.debug)
 
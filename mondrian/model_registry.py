@@ -0,0 +1,413 @@
+#!/usr/bin/env python3
+"""
+Process-Wide Model Registry
+
+Every model the advisor process holds (the Qwen model and its LoRA adapter,
+CLIP, the MiniLM text model, the ONNX CLIP encoder) is registered here with
+its resident bytes on the accelerator ("device") and in host RAM ("host").
+
+The Qwen model and adapter are pinned. Auxiliary models are loaded on the
+host and moved to their preferred device only if that fits the device
+budget; to make room, least-recently-used auxiliary models are offloaded to
+the host, and when the host budget is exceeded the least-recently-used ones
+are unloaded (and reloaded by their loader on next use). Models in use (see
+ModelRegistry.use) are never moved or unloaded, and nothing is evicted for a
+model that would not fit even then. Loaders run outside the registry lock.
+
+Budgets come from the "memory" section of model_config.json (see
+configure_model_registry); by default the device budget is the GPU's total
+memory minus DEVICE_HEADROOM_GB for activations and the KV cache, and the
+host budget is unlimited.
+"""
+
+import gc
+import time
+import threading
+import logging
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Device memory left free for activations / KV cache when no budget is configured
+DEVICE_HEADROOM_GB = 1.5
+
+GB = 1024 ** 3
+
+
+def _modules(obj) -> List[Any]:
+    """torch modules held by obj (a module, or a tuple/list such as (model, processor))."""
+    if hasattr(obj, 'named_parameters'):
+        return [obj]
+    if isinstance(obj, (tuple, list)):
+        return [item for item in obj if hasattr(item, 'named_parameters')]
+    return []
+
+
+def module_nbytes(obj, name_filter: Optional[Callable[[str], bool]] = None) -> Dict[str, int]:
+    """
+    Resident parameter and buffer bytes of the torch modules in obj.
+
+    Args:
+        obj: Module or tuple/list containing modules
+        name_filter: Only count tensors whose qualified name passes (e.g. LoRA weights)
+
+    Returns:
+        {'device': bytes, 'host': bytes} (tensors on the meta device are not counted)
+    """
+    sizes = {'device': 0, 'host': 0}
+    for module in _modules(obj):
+        tensors = list(module.named_parameters()) + list(module.named_buffers())
+        for name, tensor in tensors:
+            if name_filter is not None and not name_filter(name):
+                continue
+            device_type = tensor.device.type
+            if device_type == 'meta':
+                continue
+            sizes['host' if device_type == 'cpu' else 'device'] += tensor.nelement() * tensor.element_size()
+    return sizes
+
+
+def _release_device_memory():
+    gc.collect()
+    try:
+        import torch
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+    except ImportError:
+        pass
+
+
+class _Entry:
+    def __init__(self, name: str, loader: Optional[Callable[[], Any]], device: str, pinned: bool,
+                 size_fn: Callable[[Any], Dict[str, int]]):
+        self.name = name
+        self.loader = loader
+        self.device = device
+        self.pinned = pinned
+        self.size_fn = size_fn
+        self.obj = None
+        self.nbytes = {'device': 0, 'host': 0}
+        self.last_nbytes = 0  # total size at last measurement, used to make room before a reload
+        self.last_used = 0.0
+        self.in_use = 0
+        self.loading: Optional[threading.Event] = None  # set while a thread runs the loader
+        self.promote_failed_at: Optional[int] = None  # room epoch of the last promotion that did not fit
+        self.loads = 0
+        self.offloads = 0
+        self.unloads = 0
+
+    @property
+    def loaded(self) -> bool:
+        return self.obj is not None
+
+    def measure(self):
+        self.nbytes = self.size_fn(self.obj) if self.obj is not None else {'device': 0, 'host': 0}
+        if self.obj is not None:
+            self.last_nbytes = self.nbytes['device'] + self.nbytes['host']
+
+
+class ModelRegistry:
+    """Tracks resident bytes per model and enforces device/host memory budgets."""
+
+    def __init__(self, device_budget: Optional[int] = None, host_budget: Optional[int] = None):
+        """
+        Args:
+            device_budget: Bytes of accelerator memory models may occupy (None = unlimited)
+            host_budget: Bytes of host RAM models may occupy (None = unlimited)
+        """
+        self.device_budget = device_budget
+        self.host_budget = host_budget
+        self._entries: Dict[str, _Entry] = {}
+        self._lock = threading.RLock()
+        # Bumped whenever room may have appeared (budget change, eviction, a model released)
+        self._room_epoch = 0
+
+    def configure(self, device_budget: Optional[int] = None, host_budget: Optional[int] = None):
+        """Set budgets and evict whatever no longer fits."""
+        with self._lock:
+            self.device_budget = device_budget
+            self.host_budget = host_budget
+            self._room_epoch += 1
+            self._make_room('device', 0)
+            self._make_room('host', 0)
+
+    # ------------------------------------------------------------------
+    # Registration and access
+    # ------------------------------------------------------------------
+
+    def register(self, name: str, obj: Any, device: str = 'cuda', pinned: bool = True,
+                 nbytes: Optional[Dict[str, int]] = None):
+        """
+        Record a model loaded outside the registry (e.g. the Qwen model).
+
+        Args:
+            name: Registry key
+            obj: The model (None if only its bytes are tracked, as for an adapter merged into another model)
+            device: Device the model runs on
+            pinned: Never offload or unload it
+            nbytes: {'device': ..., 'host': ...} if not measurable from obj
+        """
+        size_fn = (lambda _obj: dict(nbytes)) if nbytes is not None else module_nbytes
+        with self._lock:
+            entry = _Entry(name, None, device, pinned, size_fn)
+            entry.obj = obj if obj is not None else object()
+            entry.loads = 1
+            entry.last_used = time.monotonic()
+            entry.measure()
+            self._entries[name] = entry
+            logger.info(f"[ModelRegistry] Registered {name}: {self._describe(entry)}")
+            self._make_room('device', 0, keep=entry)
+            self._make_room('host', 0, keep=entry)
+
+    def acquire(self, name: str, loader: Callable[[], Any], device: str = 'cpu',
+                size_fn: Callable[[Any], Dict[str, int]] = module_nbytes) -> Any:
+        """
+        Return the model, loading or moving it to `device` if needed.
+
+        The loader runs outside the registry lock, so other models stay
+        available meanwhile; concurrent callers for the same model wait for
+        the one load.
+
+        Prefer use() when the model is used for longer than a call, so that
+        another thread cannot offload it meanwhile.
+
+        Args:
+            name: Registry key
+            loader: Builds the model on the host
+            device: Preferred device ('cuda' or 'cpu'); the model stays on the
+                    host if it does not fit the device budget
+            size_fn: Measures {'device', 'host'} bytes (default: torch parameters and buffers)
+        """
+        while True:
+            with self._lock:
+                entry = self._entries.get(name)
+                if entry is None:
+                    entry = _Entry(name, loader, device, False, size_fn)
+                    self._entries[name] = entry
+                entry.last_used = time.monotonic()
+                if entry.loaded:
+                    self._place(entry)
+                    return entry.obj
+                loading = entry.loading
+                if loading is None:
+                    entry.loading = loading = threading.Event()
+                    self._make_room('host', entry.last_nbytes, keep=entry)
+                    break
+            # Another thread is loading it
+            loading.wait()
+
+        start = time.perf_counter()
+        try:
+            obj = entry.loader()
+        finally:
+            with self._lock:
+                entry.loading = None
+            loading.set()
+        with self._lock:
+            entry.obj = obj
+            entry.loads += 1
+            entry.measure()
+            logger.info(f"[ModelRegistry] Loaded {entry.name} in {time.perf_counter() - start:.1f}s: {self._describe(entry)}")
+            self._make_room('host', 0, keep=entry)
+            self._place(entry)
+            return entry.obj
+
+    @contextmanager
+    def use(self, name: str, loader: Callable[[], Any], device: str = 'cpu',
+            size_fn: Callable[[Any], Dict[str, int]] = module_nbytes) -> Iterator[Any]:
+        """acquire() for the duration of a with-block, protecting the model from eviction."""
+        while True:
+            obj = self.acquire(name, loader, device, size_fn)
+            with self._lock:
+                entry = self._entries[name]
+                # Unless it was evicted between acquire() and here
+                if entry.obj is obj:
+                    entry.in_use += 1
+                    break
+        try:
+            yield obj
+        finally:
+            with self._lock:
+                entry.in_use -= 1
+                entry.last_used = time.monotonic()
+                if entry.in_use == 0:
+                    self._room_epoch += 1
+
+    def unload(self, name: str) -> bool:
+        """Drop a model (pinned or not); returns False if it was not loaded."""
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None or not entry.loaded:
+                return False
+            self._unload(entry)
+            return True
+
+    # ------------------------------------------------------------------
+    # Budget enforcement (called with the lock held)
+    # ------------------------------------------------------------------
+
+    def _usage(self, kind: str) -> int:
+        return sum(entry.nbytes[kind] for entry in self._entries.values())
+
+    def _budget(self, kind: str) -> Optional[int]:
+        return self.device_budget if kind == 'device' else self.host_budget
+
+    def _evictable(self, kind: str, keep: Optional[_Entry]) -> List[_Entry]:
+        """Auxiliary models resident on `kind` that may be offloaded/unloaded, LRU first."""
+        return sorted(
+            (e for e in self._entries.values()
+             if e is not keep and not e.pinned and e.in_use == 0 and e.nbytes[kind] > 0),
+            key=lambda e: e.last_used
+        )
+
+    def _make_room(self, kind: str, needed: int, keep: Optional[_Entry] = None) -> bool:
+        """
+        Offload/unload LRU auxiliary models until `needed` more bytes fit on `kind`.
+
+        Nothing is evicted unless evicting would be enough: when even all
+        evictable models together do not free enough, returns False untouched.
+        """
+        budget = self._budget(kind)
+        if budget is None:
+            return True
+        usage = self._usage(kind)
+        if usage + needed <= budget:
+            return True
+        victims = self._evictable(kind, keep)
+        if usage - sum(v.nbytes[kind] for v in victims) + needed > budget:
+            if needed == 0:
+                logger.warning(f"[ModelRegistry] {kind} usage {usage / GB:.2f} GB exceeds budget "
+                               f"{budget / GB:.2f} GB (remaining models are pinned or in use)")
+            return False
+        for victim in victims:
+            if self._usage(kind) + needed <= budget:
+                break
+            if victim.nbytes[kind] == 0:
+                continue  # already evicted while making room for an offload
+            if kind == 'device' and self._offloadable(victim) and self._make_room('host', victim.nbytes['device'], keep=victim):
+                self._offload(victim)
+            else:
+                self._unload(victim)
+        return self._usage(kind) + needed <= budget
+
+    def _place(self, entry: _Entry):
+        """Promote a loaded model that sits on the host but prefers the device."""
+        if entry.device != 'cpu' and entry.nbytes['device'] == 0 and entry.nbytes['host'] > 0:
+            entry.in_use += 1  # not evictable while making room for itself
+            try:
+                self._promote(entry)
+            finally:
+                entry.in_use -= 1
+
+    def _promote(self, entry: _Entry):
+        """
+        Move a host-resident model to its preferred device if the device budget
+        allows (not retried until room may have appeared, see _room_epoch).
+        """
+        if entry.promote_failed_at == self._room_epoch:
+            return
+        if not self._make_room('device', entry.nbytes['host'], keep=entry):
+            logger.info(f"[ModelRegistry] Keeping {entry.name} on host: does not fit the device budget")
+            entry.promote_failed_at = self._room_epoch
+            return
+        entry.promote_failed_at = None
+        self._move(entry, entry.device)
+        self._make_room('host', 0, keep=entry)
+
+    def _offloadable(self, entry: _Entry) -> bool:
+        return bool(_modules(entry.obj)) and entry.loader is not None
+
+    def _offload(self, entry: _Entry):
+        logger.info(f"[ModelRegistry] Offloading {entry.name} to host ({entry.nbytes['device'] / 1e6:.0f} MB)")
+        self._move(entry, 'cpu')
+        entry.offloads += 1
+        self._room_epoch += 1
+        _release_device_memory()
+
+    def _unload(self, entry: _Entry):
+        logger.info(f"[ModelRegistry] Unloading {entry.name} ({entry.last_nbytes / 1e6:.0f} MB)")
+        entry.obj = None
+        entry.unloads += 1
+        entry.measure()
+        self._room_epoch += 1
+        _release_device_memory()
+
+    def _move(self, entry: _Entry, device: str):
+        for module in _modules(entry.obj):
+            module.to(device)
+        entry.measure()
+
+    @staticmethod
+    def _describe(entry: _Entry) -> str:
+        return f"device {entry.nbytes['device'] / 1e6:.0f} MB, host {entry.nbytes['host'] / 1e6:.0f} MB"
+
+    # ------------------------------------------------------------------
+    # Reporting
+    # ------------------------------------------------------------------
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Budgets, totals and per-model residency (for /model-status)."""
+        now = time.monotonic()
+        with self._lock:
+            models = {}
+            for entry in self._entries.values():
+                if not entry.loaded:
+                    resident = None
+                elif entry.nbytes['device'] > 0:
+                    resident = 'device'
+                else:
+                    resident = 'host'
+                models[entry.name] = {
+                    'resident': resident,
+                    'preferred_device': entry.device,
+                    'pinned': entry.pinned,
+                    'device_mb': round(entry.nbytes['device'] / 1e6, 1),
+                    'host_mb': round(entry.nbytes['host'] / 1e6, 1),
+                    'in_use': entry.in_use,
+                    'idle_seconds': round(now - entry.last_used, 1),
+                    'loads': entry.loads,
+                    'offloads': entry.offloads,
+                    'unloads': entry.unloads,
+                }
+            return {
+                'device_budget_mb': round(self.device_budget / 1e6, 1) if self.device_budget is not None else None,
+                'host_budget_mb': round(self.host_budget / 1e6, 1) if self.host_budget is not None else None,
+                'device_used_mb': round(self._usage('device') / 1e6, 1),
+                'host_used_mb': round(self._usage('host') / 1e6, 1),
+                'models': models,
+            }
+
+
+_registry = ModelRegistry()
+
+
+def get_model_registry() -> ModelRegistry:
+    """Process-wide model registry."""
+    return _registry
+
+
+def configure_model_registry(device_budget_gb: Optional[float] = None, host_budget_gb: Optional[float] = None,
+                             device_headroom_gb: float = DEVICE_HEADROOM_GB):
+    """
+    Set the process-wide budgets.
+
+    Args:
+        device_budget_gb: Accelerator memory for models; None = total GPU memory minus headroom
+        host_budget_gb: Host RAM for models; None = unlimited
+        device_headroom_gb: Memory kept free for activations when device_budget_gb is None
+    """
+    device_budget = int(device_budget_gb * GB) if device_budget_gb is not None else None
+    if device_budget is None:
+        try:
+            import torch
+            if torch.cuda.is_available():
+                total = torch.cuda.get_device_properties(0).total_memory
+                device_budget = max(0, int(total - device_headroom_gb * GB))
+        except ImportError:
+            pass
+    host_budget = int(host_budget_gb * GB) if host_budget_gb is not None else None
+    _registry.configure(device_budget, host_budget)
+    logger.info(f"[ModelRegistry] Budgets: device "
+                f"{f'{device_budget / GB:.2f} GB' if device_budget is not None else 'unlimited'}, host "
+                f"{f'{host_budget / GB:.2f} GB' if host_budget is not None else 'unlimited'}")
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+In-Memory Book Passage Index
+
+Holds the MiniLM embeddings of an advisor's book_passages as one
+pre-normalized float32 matrix, so quotes can be chosen per image instead of
+every analysis getting the same ORDER BY relevance_score list.
+
+Scoring: (1 - prior_weight) * cosine(query, passage) + prior_weight * prior,
+where prior is the passage's relevance_score scaled to [0, 1] within the
+advisor. Passages are a few hundred rows, so a search is one small matmul
+(well under a millisecond).
+
+Invalidation: the index is reloaded when advisor_artifacts_version (bumped
+by triggers on book_passages, see mondrian/advisor_cache.py) has moved, as
+seen by the advisor artifact cache's throttled check, or after
+/cache/invalidate.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+import logging
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from mondrian.advisor_cache import get_artifact_cache
+from mondrian.db_pool import db_connection
+
+logger = logging.getLogger(__name__)
+
+# Weight of the curated relevance_score relative to semantic similarity
+PASSAGE_PRIOR_WEIGHT = 0.2
+
+_indexes: Dict[Tuple[str, str], 'AdvisorPassageIndex'] = {}
+_indexes_lock = threading.Lock()
+# One lock per advisor, so loading one index does not block searches of others
+_load_locks: Dict[Tuple[str, str], threading.Lock] = {}
+
+
+def get_passages_version(db_path: str):
+    """
+    Token that changes whenever book_passages (or other advisor artifacts)
+    change: the advisor artifact cache's throttled version check, so a
+    lookup does no SQLite work between checks.
+    """
+    return get_artifact_cache(db_path).artifact_version()
+
+
+class AdvisorPassageIndex:
+    """Pre-normalized passage embedding matrix plus passage metadata for one advisor."""
+
+    def __init__(self, db_path: str, advisor_id: str):
+        self.db_path = db_path
+        self.advisor_id = advisor_id
+        self.version = None
+        self.vectors = np.zeros((0, 0), dtype=np.float32)
+        self.priors = np.zeros(0, dtype=np.float32)
+        self.passages: List[Dict[str, Any]] = []
+
+    def load(self, version=None):
+        """Load all embedded passages for the advisor."""
+        start = time.perf_counter()
+        with db_connection(self.db_path, row_factory=sqlite3.Row) as conn:
+            rows = conn.execute("""
+                SELECT id, passage_text, book_title, dimension_tags, relevance_score, embedding
+                FROM book_passages
+                WHERE advisor_id = ? AND embedding IS NOT NULL
+                ORDER BY relevance_score DESC, rowid
+            """, (self.advisor_id,)).fetchall()
+
+        vectors = []
+        passages = []
+        for row in rows:
+            vec = np.frombuffer(row['embedding'], dtype=np.float32)
+            if vectors and vec.shape[0] != vectors[0].shape[0]:
+                logger.warning(f"[PassageIndex] Skipping passage {row['id']}: embedding has dim {vec.shape[0]}")
+                continue
+            vectors.append(vec)
+            passages.append({
+                'passage_text': row['passage_text'],
+                'book_title': row['book_title'],
+                'dimensions': json.loads(row['dimension_tags']),
+                'relevance_score': row['relevance_score'],
+            })
+
+        if vectors:
+            matrix = np.vstack(vectors).astype(np.float32)
+            self.vectors = matrix / (np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-8)
+            relevance = np.asarray([p['relevance_score'] or 0.0 for p in passages], dtype=np.float32)
+            top = relevance.max()
+            self.priors = relevance / top if top > 0 else np.zeros_like(relevance)
+        self.passages = passages
+        self.version = version
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        logger.info(f"[PassageIndex] Loaded {len(passages)} passages for advisor '{self.advisor_id}' in {elapsed_ms:.1f}ms")
+        return self
+
+    def __len__(self):
+        return len(self.passages)
+
+    @property
+    def dim(self) -> int:
+        return self.vectors.shape[1] if len(self) else 0
+
+    def search(self, query: np.ndarray, top_k: int = 6,
+               prior_weight: float = PASSAGE_PRIOR_WEIGHT) -> List[Dict[str, Any]]:
+        """
+        Top-k passages for a query embedding (same space as the passage embeddings).
+
+        Returns:
+            Passage dicts (as get_top_book_passages) plus 'semantic_similarity'
+            and 'passage_score', best first
+        """
+        if len(self) == 0 or top_k <= 0:
+            return []
+        q = np.asarray(query, dtype=np.float32).reshape(-1)
+        if q.shape[0] != self.dim:
+            raise ValueError(f"Query has dim {q.shape[0]}, passages have dim {self.dim}")
+        q = q / (np.linalg.norm(q) + 1e-8)
+
+        sims = self.vectors @ q
+        scores = (1.0 - prior_weight) * sims + prior_weight * self.priors
+        k = min(top_k, len(self))
+        top = np.argpartition(-scores, k - 1)[:k] if k < len(self) else np.arange(len(self))
+        top = top[np.argsort(-scores[top], kind='stable')]
+
+        out = []
+        for i in top:
+            item = dict(self.passages[int(i)])
+            item['semantic_similarity'] = float(sims[i])
+            item['passage_score'] = float(scores[i])
+            out.append(item)
+        return out
+
+
+def get_passage_index(db_path: str, advisor_id: str) -> AdvisorPassageIndex:
+    """Return the cached passage index for an advisor, reloading it if book_passages changed."""
+    version = get_passages_version(db_path)
+    key = (db_path, advisor_id)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is not None and index.version == version:
+            return index
+        load_lock = _load_locks.setdefault(key, threading.Lock())
+
+    with load_lock:
+        # Another thread may have loaded it while this one waited
+        with _indexes_lock:
+            index = _indexes.get(key)
+        if index is not None and index.version == version:
+            return index
+        index = AdvisorPassageIndex(db_path, advisor_id).load(version)
+        with _indexes_lock:
+            _indexes[key] = index
+        return index
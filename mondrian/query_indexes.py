@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Indexes for the Hot Queries
+
+The services' per-request and per-poll queries, and the index that serves
+each (see scripts/migrations/add_hot_query_indexes.sql):
+
+- jobs
+  - claim_next_job (status IN ..., ORDER BY created_at): idx_jobs_claim,
+    created with the lease columns by mondrian/job_queue.py
+  - stale-job check and queue counts by status: idx_jobs_claim
+  - GET /jobs and the queue monitor's active jobs (ORDER BY created_at
+    DESC LIMIT n): idx_jobs_created_at
+- dimensional_profiles
+  - top reference images per advisor, ordered by the mean of the eight
+    scores: idx_dimensional_profiles_advisor_overall (expression index,
+    so the top rows are read in order instead of sorting every row of the
+    advisor)
+  - the user's latest profile for an image: idx_dimensional_profiles_image_path
+  - best image per dimension: the covering (advisor_id, score) indexes
+    created by rag_retrieval.ensure_exemplar_schema
+- book_passages
+  - top passages per advisor by relevance_score:
+    idx_book_passages_advisor_relevance
+
+test/unit/test_query_plans.py runs EXPLAIN QUERY PLAN on each of these
+queries and fails on a full table scan.
+
+Do not ANALYZE the jobs table: nearly every row is 'completed', and
+without per-value statistics (stat4) the planner then estimates a status
+lookup as a large fraction of the table and prefers scanning by created_at.
+claim_next_job pins idx_jobs_claim (INDEXED BY) so the worker loop is
+unaffected either way.
+"""
+
+import sqlite3
+import logging
+from typing import List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Mean of the eight dimension scores, as ordered by get_top_reference_images
+OVERALL_SCORE_EXPR = """(
+    COALESCE(composition_score, 0) + COALESCE(lighting_score, 0) +
+    COALESCE(focus_sharpness_score, 0) + COALESCE(color_harmony_score, 0) +
+    COALESCE(subject_isolation_score, 0) + COALESCE(depth_perspective_score, 0) +
+    COALESCE(visual_balance_score, 0) + COALESCE(emotional_impact_score, 0)
+) / 8.0"""
+
+# (table, index name, CREATE INDEX statement)
+QUERY_INDEXES: List[Tuple[str, str, str]] = [
+    ('jobs', 'idx_jobs_created_at',
+     "CREATE INDEX IF NOT EXISTS idx_jobs_created_at ON jobs (created_at)"),
+    ('dimensional_profiles', 'idx_dimensional_profiles_advisor_overall',
+     f"CREATE INDEX IF NOT EXISTS idx_dimensional_profiles_advisor_overall "
+     f"ON dimensional_profiles (advisor_id, ({OVERALL_SCORE_EXPR}))"),
+    ('dimensional_profiles', 'idx_dimensional_profiles_image_path',
+     "CREATE INDEX IF NOT EXISTS idx_dimensional_profiles_image_path ON dimensional_profiles (image_path, created_at)"),
+    ('book_passages', 'idx_book_passages_advisor_relevance',
+     "CREATE INDEX IF NOT EXISTS idx_book_passages_advisor_relevance ON book_passages (advisor_id, relevance_score DESC)"),
+]
+
+
+def ensure_query_indexes(conn: sqlite3.Connection) -> List[str]:
+    """
+    Create the hot-query indexes for the tables that exist.
+
+    Returns:
+        Names of the indexes that were created
+    """
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    created = []
+    for table, name, sql in QUERY_INDEXES:
+        if table not in tables or name in existing:
+            continue
+        try:
+            conn.execute(sql)
+        except sqlite3.OperationalError as e:
+            # Older schema without one of the indexed columns
+            logger.warning(f"[QueryIndexes] Skipping {name}: {e}")
+            continue
+        logger.info(f"[QueryIndexes] Created {name}")
+        created.append(name)
+    conn.commit()
+    return created
+
+
+def query_plan(conn: sqlite3.Connection, sql: str, params=()) -> List[str]:
+    """EXPLAIN QUERY PLAN detail lines for a statement."""
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+
+
+def full_scans(plan: List[str], tables=('jobs', 'dimensional_profiles', 'book_passages')) -> List[str]:
+    """Plan lines that read a whole table without an index."""
+    return [line for line in plan
+            if any(line == f"SCAN {table}" or line.startswith(f"SCAN {table} ") and 'INDEX' not in line
+                   for table in tables)]
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Token-budget-aware RAG context builder.
+
+The single-pass prompt offers the LLM a pool of citation candidates (book
+quotes and reference images). Injecting every candidate regardless of length
+inflates prefill tokens, so this module measures each candidate segment with
+the loaded tokenizer and packs the highest-value segments into a fixed token
+budget.
+
+Quotes and images are valued on different scales (passage score vs. mean
+strong dimension score), so each type is packed against its own share of
+the budget, ranked only against its own kind; a share one type leaves
+unused goes to the other.
+
+Segment renderers live here so that what gets measured is exactly what
+`QwenAdvisor._build_rag_prompt` emits. An image segment carries the
+*_instructive texts of its strong dimensions, so their tokens are paid for
+by the image that brings them, in the baseline and the packed prompt alike.
+"""
+
+import hashlib
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Default budget for the reference-material section of the prompt
+DEFAULT_MAX_CONTEXT_TOKENS = 1800
+
+# Quote previews are truncated to this many words
+QUOTE_PREVIEW_WORDS = 75
+
+# Images are listed with the dimensions they score at or above this value
+STRONG_DIMENSION_THRESHOLD = 8.0
+
+# Instructive texts under an image are truncated to this many words
+INSTRUCTIVE_PREVIEW_WORDS = 40
+
+# Share of the budget quotes are packed into first (images get the rest)
+QUOTE_BUDGET_SHARE = 0.5
+
+REFERENCE_DIMENSIONS = [
+    'composition', 'lighting', 'focus_sharpness', 'color_harmony',
+    'subject_isolation', 'depth_perspective', 'visual_balance', 'emotional_impact'
+]
+
+
+# ==================== SEGMENT RENDERING ====================
+
+def _preview(text: str, max_words: int) -> str:
+    words = text.split()
+    preview = ' '.join(words[:max_words])
+    return preview + "..." if len(words) > max_words else preview
+
+
+def render_quote_segment(quote_id: str, passage: Dict[str, Any]) -> str:
+    """Render a book passage as it appears in the prompt."""
+    preview = _preview(passage.get('passage_text', ''), QUOTE_PREVIEW_WORDS)
+
+    dims = passage.get('dimensions') or []
+    segment = f"[{quote_id}] From \"{passage.get('book_title', '')}\" (relevant to: {', '.join(dims)})\n"
+    segment += f'  "{preview}"\n\n'
+    return segment
+
+
+def get_strong_dimensions(img: Dict[str, Any]) -> List[Tuple[str, float]]:
+    """Return (dimension, score) pairs for dimensions scored >= 8.0."""
+    strong = []
+    for dim in REFERENCE_DIMENSIONS:
+        score = img.get(f"{dim}_score", 0)
+        if score and score >= STRONG_DIMENSION_THRESHOLD:
+            strong.append((dim, score))
+    return strong
+
+
+def render_image_segment(img_id: str, img: Dict[str, Any]) -> str:
+    """Render a reference image entry, with its strong dimensions' instructive texts."""
+    img_title = img.get('image_title') or (img.get('image_path') or '').split('/')[-1]
+    year = img.get('date_taken', '')
+    location = img.get('location', '')
+
+    strong = get_strong_dimensions(img)
+    strong_dims = [f"{dim.replace('_', ' ').title()}={score:.1f}" for dim, score in strong]
+
+    segment = f"[{img_id}] \"{img_title}\" ({year})\n"
+    if location:
+        segment += f"  Location: {location}\n"
+    if strong_dims:
+        segment += f"  📸 Master-level in: {', '.join(strong_dims)}\n"
+        segment += f"  💡 When citing this image: Explain the SPECIFIC TECHNIQUE that creates this excellence and HOW the user can apply it.\n"
+        segment += f"     Example: Don't say 'good composition' - say 'three-plane depth with foreground anchor'\n"
+    for dim, _ in strong:
+        instructive = (img.get(f"{dim}_instructive") or '').strip()
+        if instructive:
+            segment += f"  🎓 {dim.replace('_', ' ').title()}: {_preview(instructive, INSTRUCTIVE_PREVIEW_WORDS)}\n"
+    return segment
+
+
+# ==================== BUILDER ====================
+
+class RAGContextBuilder:
+    """
+    Measures RAG candidate segments in real tokens and packs them into a budget.
+
+    Token counts are cached per advisor, keyed by a hash of the rendered
+    segment text, so repeated requests against the same advisor only
+    tokenize segments whose text actually changed.
+    """
+
+    def __init__(self, tokenizer=None, max_context_tokens: int = DEFAULT_MAX_CONTEXT_TOKENS,
+                 quote_budget_share: float = QUOTE_BUDGET_SHARE):
+        """
+        Args:
+            tokenizer: HuggingFace tokenizer (e.g. processor.tokenizer). When None,
+                       token counts fall back to a chars/4 estimate.
+            max_context_tokens: Token budget for candidate segments
+            quote_budget_share: Fraction of the budget reserved for quotes
+        """
+        self.tokenizer = tokenizer
+        self.max_context_tokens = max_context_tokens
+        self.quote_budget_share = quote_budget_share
+        self._segment_tokens: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+        if tokenizer is None:
+            logger.warning("[RAGContext] No tokenizer provided - using approximate token counts")
+
+    def count_tokens(self, text: str) -> int:
+        """Count tokens in text using the loaded tokenizer."""
+        if not text:
+            return 0
+        if self.tokenizer is None:
+            return max(1, len(text) // 4)
+        return len(self.tokenizer.encode(text, add_special_tokens=False))
+
+    def segment_tokens(self, advisor_id: str, text: str) -> int:
+        """Token count for a rendered segment, cached per advisor."""
+        key = hashlib.sha1(text.encode('utf-8')).hexdigest()
+        with self._lock:
+            cache = self._segment_tokens.setdefault(advisor_id, {})
+            cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+        n_tokens = self.count_tokens(text)
+        with self._lock:
+            self._segment_tokens.setdefault(advisor_id, {})[key] = n_tokens
+        return n_tokens
+
+    def invalidate(self, advisor_id: Optional[str] = None):
+        """Drop cached token counts for one advisor (or all advisors)."""
+        with self._lock:
+            if advisor_id is None:
+                self._segment_tokens.clear()
+            else:
+                self._segment_tokens.pop(advisor_id, None)
+
+    def cache_stats(self) -> Dict[str, int]:
+        """Number of cached segments per advisor."""
+        with self._lock:
+            return {advisor_id: len(cache) for advisor_id, cache in self._segment_tokens.items()}
+
+    def pack(self, advisor_id: str, reference_images: List[Dict[str, Any]],
+             book_passages: List[Dict[str, Any]]) -> Tuple[List[Dict], List[Dict], Dict[str, Any]]:
+        """
+        Select the highest-value candidates that fit in the token budget.
+
+        Quotes are valued by passage_score (semantic ranking) or else
+        relevance_score, images by their mean strong dimension score. As the
+        two scales are not comparable, quotes are packed into their share of
+        the budget, images into what is left, and quotes then into whatever
+        budget the images did not use. Candidates keep their retrieval order
+        so citation IDs stay stable relative to ranking.
+
+        Args:
+            advisor_id: Advisor whose segment cache to use
+            reference_images: Candidate reference images (retrieval order)
+            book_passages: Candidate book passages (retrieval order)
+
+        Returns:
+            (selected_images, selected_passages, stats)
+        """
+        # Citation IDs are rendered with the candidate's original position so
+        # the measured text matches the longest ID the prompt could contain.
+        quotes = []
+        for idx, passage in enumerate(book_passages, 1):
+            text = render_quote_segment(f"QUOTE_{idx}", passage)
+            value = float(passage.get('passage_score', passage.get('relevance_score')) or 0.0)
+            quotes.append((idx - 1, value, self.segment_tokens(advisor_id, text)))
+
+        images = []
+        for idx, img in enumerate(reference_images, 1):
+            text = render_image_segment(f"IMG_{idx}", img)
+            strong = get_strong_dimensions(img)
+            value = sum(score for _, score in strong) / len(strong) if strong else 0.0
+            images.append((idx - 1, value, self.segment_tokens(advisor_id, text)))
+
+        chosen_quotes = set()
+        chosen_images = set()
+        quote_tokens = _pack_greedy(quotes, int(self.max_context_tokens * self.quote_budget_share), chosen_quotes)
+        image_tokens = _pack_greedy(images, self.max_context_tokens - quote_tokens, chosen_images)
+        quote_tokens += _pack_greedy(quotes, self.max_context_tokens - quote_tokens - image_tokens,
+                                     chosen_quotes)
+        used = quote_tokens + image_tokens
+
+        selected_passages = [p for i, p in enumerate(book_passages) if i in chosen_quotes]
+        selected_images = [img for i, img in enumerate(reference_images) if i in chosen_images]
+
+        stats = {
+            'budget_tokens': self.max_context_tokens,
+            'packed_tokens': used,
+            'quote_tokens': quote_tokens,
+            'image_tokens': image_tokens,
+            'quotes_offered': len(book_passages),
+            'quotes_selected': len(selected_passages),
+            'images_offered': len(reference_images),
+            'images_selected': len(selected_images),
+        }
+        logger.info(
+            f"[RAGContext] {advisor_id}: packed {used}/{self.max_context_tokens} tokens | "
+            f"quotes {len(selected_passages)}/{len(book_passages)} ({quote_tokens} tokens) | "
+            f"images {len(selected_images)}/{len(reference_images)} ({image_tokens} tokens)"
+        )
+        return selected_images, selected_passages, stats
+
+
+def _pack_greedy(candidates: List[Tuple[int, float, int]], budget: int, chosen: set) -> int:
+    """
+    Add the highest-value (position, value, tokens) candidates not yet in
+    chosen that fit in budget; returns the tokens added.
+    """
+    used = 0
+    # Stable sort keeps retrieval order among equal values
+    for pos, value, n_tokens in sorted(candidates, key=lambda c: c[1], reverse=True):
+        if pos in chosen or used + n_tokens > budget:
+            continue
+        used += n_tokens
+        chosen.add(pos)
+    return used
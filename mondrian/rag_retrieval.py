@@ -5,11 +5,20 @@ Handles reference image retrieval, case study computation, and RAG context augme
 """
 
 import os
+import json
 import sqlite3
+import threading
 import logging
+from datetime import datetime
 from typing import Dict, Any, List, Optional
 from pathlib import Path
 
+import numpy as np
+
+from mondrian.db_pool import db_connection
+from mondrian.embedding_store import has_ref_columns, load_vector
+from mondrian.embedding_index import VERSION_CHECK_INTERVAL, ensure_version_tracking, get_profiles_version
+
 logger = logging.getLogger(__name__)
 
 # Database path - project root
@@ -94,10 +103,6 @@ def get_similar_images_from_db(db_path: str, advisor_id: str, top_k: int = 3) ->
         List of similar image records with their dimensional scores
     """
     try:
-        conn = sqlite3.connect(db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
         # Get reference images for this advisor
         # For now, just get the best-rated images as context
         query = """
@@ -120,9 +125,8 @@ def get_similar_images_from_db(db_path: str, advisor_id: str, top_k: int = 3) ->
             LIMIT ?
         """
         
-        cursor.execute(query, (advisor_id, top_k))
-        rows = cursor.fetchall()
-        conn.close()
+        with db_connection(db_path, row_factory=sqlite3.Row) as conn:
+            rows = conn.execute(query, (advisor_id, top_k)).fetchall()
         
         if not rows:
             logger.warning(f"No reference images found for advisor: {advisor_id}")
@@ -169,10 +173,6 @@ def get_top_reference_images(db_path: str, advisor_id: str, max_total: int = 10)
         List of top reference images sorted by overall quality
     """
     try:
-        conn = sqlite3.connect(db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
         # Get top images by average dimensional score (no weak dimension filter)
         query = """
             SELECT id, image_path, composition_score, lighting_score, 
@@ -196,9 +196,8 @@ def get_top_reference_images(db_path: str, advisor_id: str, max_total: int = 10)
             LIMIT ?
         """
         
-        cursor.execute(query, (advisor_id, max_total))
-        rows = cursor.fetchall()
-        conn.close()
+        with db_connection(db_path, row_factory=sqlite3.Row) as conn:
+            rows = conn.execute(query, (advisor_id, max_total)).fetchall()
         
         if not rows:
             logger.warning(f"No reference images found for advisor: {advisor_id}")
@@ -249,10 +248,6 @@ def get_images_for_weak_dimensions(db_path: str, advisor_id: str, weak_dimension
         if not weak_dimensions:
             return []
         
-        conn = sqlite3.connect(db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
         # Build query to find images that excel in the weak dimensions
         score_columns = []
         for dim in weak_dimensions[:3]:  # Limit to top 3 weak dimensions
@@ -286,9 +281,8 @@ def get_images_for_weak_dimensions(db_path: str, advisor_id: str, weak_dimension
             LIMIT ?
         """
         
-        cursor.execute(query, (advisor_id, max_images))
-        rows = cursor.fetchall()
-        conn.close()
+        with db_connection(db_path, row_factory=sqlite3.Row) as conn:
+            rows = conn.execute(query, (advisor_id, max_images)).fetchall()
         
         if not rows:
             logger.warning(f"No reference images found with high scores (>= 8.0) in target dimensions: {weak_dimensions}")
@@ -366,62 +360,228 @@ def deduplicate_reference_images(images: List[Dict[str, Any]], used_paths: set,
     return deduplicated
 
 
-def get_best_image_per_dimension(db_path: str, advisor_id: str) -> Dict[str, Dict[str, Any]]:
+# Minimum dimension score for an image to be a dimension exemplar
+EXEMPLAR_MIN_SCORE = 8.0
+
+# Profile columns returned for each exemplar (no embedding BLOB)
+EXEMPLAR_PROFILE_COLUMNS = [
+    'id', 'image_path', 'composition_score', 'lighting_score',
+    'focus_sharpness_score', 'color_harmony_score',
+    'subject_isolation_score', 'depth_perspective_score',
+    'visual_balance_score', 'emotional_impact_score',
+    'overall_grade', 'image_description', 'image_title', 'date_taken',
+    'composition_instructive', 'lighting_instructive',
+    'focus_sharpness_instructive', 'color_harmony_instructive',
+    'subject_isolation_instructive', 'depth_perspective_instructive',
+    'visual_balance_instructive', 'emotional_impact_instructive',
+]
+
+EXEMPLAR_SCHEMA_SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS advisor_dimension_exemplars (
+        advisor_id TEXT NOT NULL,
+        dimension TEXT NOT NULL,
+        profile_id TEXT NOT NULL,
+        score REAL NOT NULL,
+        image_exists INTEGER NOT NULL DEFAULT 1,
+        PRIMARY KEY (advisor_id, dimension)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS advisor_dimension_exemplars_state (
+        advisor_id TEXT PRIMARY KEY,
+        source_version TEXT NOT NULL,
+        built_at TEXT NOT NULL
+    )
+    """,
+]
+
+_exemplar_lock = threading.Lock()
+# (db_path, advisor_id, profiles version) already reported as out of date
+_stale_exemplars_logged = set()
+
+
+def ensure_exemplar_schema(conn: sqlite3.Connection):
+    """Create the exemplar tables and covering (advisor_id, score) indexes."""
+    for sql in EXEMPLAR_SCHEMA_SQL:
+        conn.execute(sql)
+    for db_column in sorted({DIMENSION_TO_DB_COLUMN[d] for d in DIMENSIONS}):
+        conn.execute(f"""
+            CREATE INDEX IF NOT EXISTS idx_dimensional_profiles_advisor_{db_column}
+            ON dimensional_profiles (advisor_id, {db_column} DESC, id, image_path)
+        """)
+    conn.commit()
+
+
+def refresh_dimension_exemplars(db_path: str, advisor_id: Optional[str] = None) -> int:
+    """
+    Materialize the best image per dimension into advisor_dimension_exemplars.
+    
+    Called by the indexing scripts (scripts/compute_embeddings.py) and by the
+    advisor service's POST /cache/invalidate, never on the request path.
+    File existence is checked here, once: the best-scoring image whose file
+    exists wins, falling back to the best row (image_exists=0) if none do.
+    
+    Args:
+        db_path: Path to the SQLite database
+        advisor_id: Advisor to rebuild (default: all advisors)
+        
+    Returns:
+        Number of exemplar rows written
+    """
+    with _exemplar_lock:
+        ensure_version_tracking(db_path)
+        conn = sqlite3.connect(db_path, timeout=30)
+        try:
+            ensure_exemplar_schema(conn)
+            if advisor_id:
+                advisors = [advisor_id]
+            else:
+                advisors = [row[0] for row in conn.execute(
+                    "SELECT DISTINCT advisor_id FROM dimensional_profiles WHERE advisor_id IS NOT NULL"
+                )]
+            
+            written = 0
+            for advisor in advisors:
+                # Read the version first so a concurrent write forces another rebuild
+                version = json.dumps(list(get_profiles_version(db_path, advisor)))
+                rows = [(advisor, *row) for row in _select_exemplars(conn, advisor)]
+                
+                with conn:
+                    conn.execute("DELETE FROM advisor_dimension_exemplars WHERE advisor_id = ?", (advisor,))
+                    conn.executemany("""
+                        INSERT INTO advisor_dimension_exemplars
+                        (advisor_id, dimension, profile_id, score, image_exists)
+                        VALUES (?, ?, ?, ?, ?)
+                    """, rows)
+                    conn.execute("""
+                        INSERT OR REPLACE INTO advisor_dimension_exemplars_state (advisor_id, source_version, built_at)
+                        VALUES (?, ?, ?)
+                    """, (advisor, version, datetime.now().isoformat()))
+                written += len(rows)
+                missing = sum(1 for row in rows if not row[4])
+                logger.info(f"[CaseStudy] Materialized {len(rows)} dimension exemplars for '{advisor}'"
+                            + (f" ({missing} with missing image files)" if missing else ""))
+            return written
+        finally:
+            conn.close()
+
+
+def _select_exemplars(conn: sqlite3.Connection, advisor_id: str) -> List[tuple]:
+    """(dimension, profile_id, score, image_exists) of the best image per dimension, read live."""
+    rows = []
+    for dim_name in DIMENSIONS:
+        db_column = DIMENSION_TO_DB_COLUMN[dim_name]
+        cursor = conn.execute(f"""
+            SELECT id, image_path, {db_column}
+            FROM dimensional_profiles
+            WHERE advisor_id = ? AND {db_column} >= ?
+            ORDER BY {db_column} DESC
+        """, (advisor_id, EXEMPLAR_MIN_SCORE))
+        best = None
+        for profile_id, image_path, score in cursor:
+            exists = bool(image_path) and os.path.exists(image_path)
+            if best is None or exists:
+                best = (dim_name, profile_id, score, int(exists))
+            if exists:
+                break
+        if best is not None:
+            rows.append(best)
+    return rows
+
+
+def _exemplar_source_version(conn: sqlite3.Connection, advisor_id: str) -> Optional[str]:
+    """dimensional_profiles version the advisor's exemplars were built from (None if never built)."""
+    try:
+        row = conn.execute(
+            "SELECT source_version FROM advisor_dimension_exemplars_state WHERE advisor_id = ?",
+            (advisor_id,)
+        ).fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return row[0] if row else None
+
+
+def get_best_image_per_dimension(db_path: str, advisor_id: str,
+                                 include_embeddings: bool = False) -> Dict[str, Dict[str, Any]]:
     """
     Retrieve the single best reference image for EACH dimension separately.
     This ensures diversity - each dimension gets its own best exemplar.
     
+    Reads the materialized advisor_dimension_exemplars table in one query.
+    Nothing is written here: if dimensional_profiles changed since the table
+    was built, the existing exemplars are served until it is rebuilt
+    (refresh_dimension_exemplars), and an advisor never materialized is
+    read with the live per-dimension queries.
+    
     Args:
         db_path: Path to the SQLite database
         advisor_id: Advisor to search (e.g., 'ansel')
+        include_embeddings: Keep the stored CLIP vector under '_embedding'
         
     Returns:
         Dict mapping dimension name to best image for that dimension
         e.g., {'composition': {...}, 'lighting': {...}, ...}
+        Each image carries 'image_exists' (checked when the table was built).
     """
     try:
-        conn = sqlite3.connect(db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        result = {}
-        
-        for dim_name in DIMENSIONS:
-            db_column = DIMENSION_TO_DB_COLUMN.get(dim_name)
-            if not db_column:
-                continue
-            
-            # Get the single best image for this dimension (score >= 8.0, ordered by score DESC)
-            query = f"""
-                SELECT id, image_path, composition_score, lighting_score, 
-                       focus_sharpness_score, color_harmony_score,
-                       subject_isolation_score, depth_perspective_score,
-                       visual_balance_score, emotional_impact_score,
-                       overall_grade, image_description, image_title, date_taken, embedding,
-                       composition_instructive, lighting_instructive,
-                       focus_sharpness_instructive, color_harmony_instructive,
-                       subject_isolation_instructive, depth_perspective_instructive,
-                       visual_balance_instructive, emotional_impact_instructive
-                FROM dimensional_profiles
-                WHERE advisor_id = ?
-                  AND {db_column} >= 8.0
-                  AND {db_column} IS NOT NULL
-                ORDER BY {db_column} DESC
-                LIMIT 1
-            """
+        with db_connection(db_path, row_factory=sqlite3.Row) as conn:
+            source_version = _exemplar_source_version(conn, advisor_id)
+            if source_version is not None:
+                exemplars_cte, exemplars_table, params = '', 'advisor_dimension_exemplars', [advisor_id]
+                version = json.dumps(list(get_profiles_version(db_path, advisor_id, max_age=VERSION_CHECK_INTERVAL)))
+                if source_version != version and (db_path, advisor_id, version) not in _stale_exemplars_logged:
+                    _stale_exemplars_logged.add((db_path, advisor_id, version))
+                    logger.info(f"[CaseStudy] Dimension exemplars for '{advisor_id}' are out of date - serving them "
+                                f"until rebuilt. Run: python scripts/compute_embeddings.py --advisor {advisor_id} "
+                                f"(or POST /cache/invalidate)")
+            else:
+                # Not materialized: the same rows, selected live
+                live = _select_exemplars(conn, advisor_id)
+                if not live:
+                    logger.warning("[CaseStudy] No reference images found for any dimension")
+                    return {}
+                exemplars_cte = (f"WITH live (dimension, profile_id, score, image_exists, advisor_id) "
+                                 f"AS (VALUES {', '.join(['(?, ?, ?, ?, ?)'] * len(live))})")
+                exemplars_table = 'live'
+                params = [value for row in live for value in (*row, advisor_id)] + [advisor_id]
             
-            cursor.execute(query, (advisor_id,))
-            row = cursor.fetchone()
+            if has_ref_columns(conn):
+                has_embedding = "(p.embedding IS NOT NULL OR p.embedding_ref IS NOT NULL)"
+                vector_select = ", p.embedding_ref AS embedding_ref, CASE WHEN p.embedding_ref IS NULL THEN p.embedding END AS embedding_blob"
+            else:
+                has_embedding = "p.embedding IS NOT NULL"
+                vector_select = ", NULL AS embedding_ref, p.embedding AS embedding_blob"
             
-            if row:
-                img_dict = dict(row)
-                # Don't include raw embedding in dict to avoid log clutter
-                if 'embedding' in img_dict:
-                    img_dict['has_embedding'] = img_dict['embedding'] is not None
-                    del img_dict['embedding']
-                result[dim_name] = img_dict
-        
-        conn.close()
+            rows = conn.execute(f"""
+                {exemplars_cte}
+                SELECT e.dimension, e.image_exists,
+                       {', '.join('p.' + col for col in EXEMPLAR_PROFILE_COLUMNS)},
+                       {has_embedding} AS has_embedding
+                       {vector_select if include_embeddings else ''}
+                FROM {exemplars_table} e
+                JOIN dimensional_profiles p ON p.id = e.profile_id
+                WHERE e.advisor_id = ?
+            """, params).fetchall()
+        
+        by_dimension = {}
+        for row in rows:
+            img_dict = dict(row)
+            dim_name = img_dict.pop('dimension')
+            img_dict['image_exists'] = bool(img_dict['image_exists'])
+            img_dict['has_embedding'] = bool(img_dict['has_embedding'])
+            ref = img_dict.pop('embedding_ref', None)
+            blob = img_dict.pop('embedding_blob', None)
+            if include_embeddings:
+                vec = load_vector(db_path, ref) if ref is not None else (
+                    np.frombuffer(blob, dtype=np.float32) if blob is not None else None
+                )
+                if vec is not None:
+                    img_dict['_embedding'] = vec
+            by_dimension[dim_name] = img_dict
+        
+        # Keep DIMENSIONS order (case-study selection is first-match-wins)
+        result = {dim: by_dimension[dim] for dim in DIMENSIONS if dim in by_dimension}
         
         logger.info(f"[CaseStudy] Retrieved best images for {len(result)}/{len(DIMENSIONS)} dimensions")
         return result
@@ -461,13 +621,76 @@ def compute_visual_relevance(user_image_path: str, ref_image_path: str) -> float
         return 0.5  # Default to moderate relevance on error
 
 
+class CaseStudyContext:
+    """
+    Per-request state for case-study scoring.
+    
+    Computes the user image's CLIP embedding at most once and scores all
+    reference candidates against it in a single matrix-vector product, using
+    the embeddings already stored in dimensional_profiles. References without
+    a stored embedding fall back to embedding the file on disk.
+    """
+    
+    def __init__(self, user_image_path: Optional[str] = None):
+        self.user_image_path = user_image_path
+        self._user_embedding = None
+        self._user_embedding_computed = False
+    
+    @property
+    def user_embedding(self) -> Optional[np.ndarray]:
+        """Normalized CLIP embedding of the user image (computed once)."""
+        if not self._user_embedding_computed:
+            self._user_embedding_computed = True
+            if self.user_image_path:
+                from mondrian.embedding_retrieval import compute_image_embedding
+                self._user_embedding = compute_image_embedding(self.user_image_path)
+        return self._user_embedding
+    
+    def score_relevance(self, ref_images: List[Dict[str, Any]]) -> List[float]:
+        """
+        Visual relevance of each reference image to the user image.
+        
+        Args:
+            ref_images: Reference dicts, ideally carrying '_embedding'
+            
+        Returns:
+            Cosine similarity per reference (0.5 where it cannot be computed,
+            matching compute_visual_relevance)
+        """
+        if not ref_images:
+            return []
+        
+        user_emb = self.user_embedding
+        if user_emb is None:
+            logger.warning("Could not compute embeddings for relevance check")
+            return [0.5] * len(ref_images)
+        
+        vectors = []
+        for ref in ref_images:
+            vec = ref.get('_embedding')
+            if vec is None and ref.get('image_path'):
+                from mondrian.embedding_retrieval import compute_image_embedding
+                vec = compute_image_embedding(ref['image_path'])
+            vectors.append(vec)
+        
+        relevance = [0.5] * len(ref_images)
+        have = [i for i, vec in enumerate(vectors) if vec is not None and vec.shape == user_emb.shape]
+        if have:
+            matrix = np.vstack([vectors[i] for i in have])
+            sims = (matrix @ user_emb) / (np.linalg.norm(matrix, axis=1) * np.linalg.norm(user_emb) + 1e-8)
+            for i, sim in zip(have, sims):
+                relevance[i] = float(sim)
+        return relevance
+
+
 def compute_case_studies(
     db_path: str,
     advisor_id: str,
     user_dimensions: List[Dict[str, Any]], 
     user_image_path: str = None,
     max_case_studies: int = 3,
-    relevance_threshold: float = 0.25
+    relevance_threshold: float = 0.25,
+    context: Optional[CaseStudyContext] = None
 ) -> List[Dict[str, Any]]:
     """
     Compute which dimensions should get case studies based on:
@@ -482,6 +705,7 @@ def compute_case_studies(
         user_image_path: Path to user's image for relevance scoring
         max_case_studies: Maximum number of case studies to include (1-3)
         relevance_threshold: Minimum visual similarity to include (0.0-1.0)
+        context: Per-request CaseStudyContext (reuses the user embedding across calls)
         
     Returns:
         List of case study dicts, each containing:
@@ -492,8 +716,8 @@ def compute_case_studies(
         - gap: ref_score - user_score
         - relevance: Visual similarity score (if computed)
     """
-    # Get best reference image for each dimension
-    best_per_dim = get_best_image_per_dimension(db_path, advisor_id)
+    # Get best reference image for each dimension (with stored CLIP vectors)
+    best_per_dim = get_best_image_per_dimension(db_path, advisor_id, include_embeddings=True)
     
     if not best_per_dim:
         logger.warning("[CaseStudy] No reference images found for any dimension")
@@ -521,6 +745,21 @@ def compute_case_studies(
     
     logger.info(f"[CaseStudy] User scores: {user_scores}")
     
+    # Score visual relevance for every reference that could be selected in one pass
+    if context is None:
+        context = CaseStudyContext(user_image_path)
+    relevance_by_path = {}
+    if user_image_path:
+        to_score = {}
+        for dim_name, ref_img in best_per_dim.items():
+            db_column = DIMENSION_TO_DB_COLUMN.get(dim_name)
+            ref_path = ref_img.get('image_path', '')
+            if not db_column or not ref_path or ref_path in to_score:
+                continue
+            if ref_img.get(db_column, 0) - user_scores.get(dim_name, 10) > 0 and ref_img.get('image_exists'):
+                to_score[ref_path] = ref_img
+        relevance_by_path = dict(zip(to_score, context.score_relevance(list(to_score.values()))))
+    
     # Calculate gaps and relevance for each dimension
     candidates = []
     used_image_paths = set()
@@ -548,8 +787,8 @@ def compute_case_studies(
         
         # Compute visual relevance if user image provided
         relevance = 1.0  # Default to high relevance if no user image
-        if user_image_path and ref_path and os.path.exists(ref_path):
-            relevance = compute_visual_relevance(user_image_path, ref_path)
+        if ref_path in relevance_by_path:
+            relevance = relevance_by_path[ref_path]
             logger.info(f"[CaseStudy] {dim_name}: gap={gap:.1f}, relevance={relevance:.2f}, ref='{ref_img.get('image_title')}'")
         else:
             logger.info(f"[CaseStudy] {dim_name}: gap={gap:.1f}, relevance=N/A, ref='{ref_img.get('image_title')}'")
@@ -565,7 +804,7 @@ def compute_case_studies(
         candidates.append({
             'dimension_name': dim_name,
             'user_score': user_score,
-            'ref_image': ref_img,
+            'ref_image': {k: v for k, v in ref_img.items() if k != '_embedding'},
             'ref_score': ref_score,
             'gap': gap,
             'relevance': relevance
@@ -599,23 +838,17 @@ def get_user_dimensional_profile(db_path: str, image_path: str) -> Optional[Dict
         Dictionary of dimensional scores, or None if not found
     """
     try:
-        conn = sqlite3.connect(db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
         # Get most recent profile for this image
-        cursor.execute("""
-            SELECT composition_score, lighting_score, focus_sharpness_score,
-                   color_harmony_score, subject_isolation_score, depth_perspective_score,
-                   visual_balance_score, emotional_impact_score
-            FROM dimensional_profiles
-            WHERE image_path = ?
-            ORDER BY created_at DESC
-            LIMIT 1
-        """, (image_path,))
-        
-        row = cursor.fetchone()
-        conn.close()
+        with db_connection(db_path, row_factory=sqlite3.Row) as conn:
+            row = conn.execute("""
+                SELECT composition_score, lighting_score, focus_sharpness_score,
+                       color_harmony_score, subject_isolation_score, depth_perspective_score,
+                       visual_balance_score, emotional_impact_score
+                FROM dimensional_profiles
+                WHERE image_path = ?
+                ORDER BY created_at DESC
+                LIMIT 1
+            """, (image_path,)).fetchone()
         
         if not row:
             return None
@@ -18,6 +18,7 @@ from flask import Flask, request, jsonify, Response
 
 # Configure logging
 from mondrian.logging_config import setup_service_logging
+from mondrian.db_pool import db_connection
 logger = setup_service_logging('summary_service')
 
 app = Flask(__name__)
@@ -27,12 +28,8 @@ def get_job_data(job_id):
     """Retrieve job data from database"""
     try:
         db_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'mondrian.db')
-        conn = sqlite3.connect(db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM jobs WHERE id = ?', (job_id,))
-        row = cursor.fetchone()
-        conn.close()
+        with db_connection(db_path, row_factory=sqlite3.Row) as conn:
+            row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
         
         if row:
             return dict(row)
@@ -13,10 +13,21 @@ SERVICE_HEALTH_CHECK_TIMEOUT = 5  # seconds - quick health check timeout
 AI_ADVISOR_REQUEST_TIMEOUT = 600  # seconds (10 minutes) - max for analysis requests
 AI_ADVISOR_STARTUP_TIMEOUT = 30  # seconds - startup wait timeout
 
+# Embedding service timeouts
+EMBEDDING_SERVICE_TIMEOUT = 30  # seconds - one embed request (includes batching wait and forward pass)
+
 # Job processing timeouts
 JOB_SUBMISSION_TIMEOUT = 30  # seconds - submit job API call
 JOB_STATUS_CHECK_TIMEOUT = 10  # seconds - poll job status API call
 JOB_PROCESSING_TIMEOUT = 600  # seconds (10 minutes) - max wait for job completion
+JOB_LEASE_TIMEOUT = 60  # seconds - a worker's claim on a job without a heartbeat (crashed workers' jobs are re-claimed after this)
+JOB_HEARTBEAT_INTERVAL = 15  # seconds - lease renewal period while a job is generating
+GENERATION_STALL_TIMEOUT = 120  # seconds - no new token for this long = generation hung, stop renewing the lease
+GENERATION_CANCEL_WAIT = 30  # seconds - a worker taking over a stalled job waits this long for the old generation to stop
+JOB_QUEUE_IDLE_WAIT = 5  # seconds - idle workers re-check the table (jobs from other processes, expired leases)
+JOB_STREAM_KEEPALIVE_INTERVAL = 3  # seconds - SSE re-sends the current status this often while a job is analyzing
+JOB_STREAM_RESYNC_INTERVAL = 10  # seconds - SSE checks the database for changes made outside this process
+COMPLETED_ARTIFACT_MAX_AGE = 31536000  # seconds (1 year) - clients cache a completed job's analysis/summary/export (Cache-Control: immutable)
 
 # E2E test timeouts (by model/mode)
 E2E_TEST_BASELINE_TIMEOUT = 90  # seconds
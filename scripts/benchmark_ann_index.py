@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Benchmark the IVF ANN index against exact search
+
+Reports recall@k (ANN top-k vs exact top-k) and per-query latency for
+exact matmul+argpartition and IVF search across corpus sizes.
+
+By default vectors are synthetic: clustered unit vectors that roughly mimic
+the cluster structure of CLIP image embeddings. Pass --db/--advisor to
+benchmark against real embeddings in dimensional_profiles instead.
+
+Usage:
+    python scripts/benchmark_ann_index.py
+    python scripts/benchmark_ann_index.py --sizes 1000 10000 100000 --dim 512 --k 10
+    python scripts/benchmark_ann_index.py --db mondrian.db --advisor ansel
+"""
+
+import sys
+import time
+import argparse
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from mondrian.ann_index import IVFIndex, default_nprobe
+
+
+def synthetic_corpus(n: int, dim: int, n_clusters: int = 64, seed: int = 0) -> np.ndarray:
+    """Clustered unit vectors"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((n_clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, n_clusters, size=n)
+    x = centers[labels] + 0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def exact_topk(vectors: np.ndarray, q: np.ndarray, k: int) -> np.ndarray:
+    sims = vectors @ q
+    top = np.argpartition(-sims, k - 1)[:k]
+    return top[np.argsort(-sims[top])]
+
+
+def benchmark(vectors: np.ndarray, queries: np.ndarray, k: int, nprobe: int = None):
+    n = vectors.shape[0]
+    ids = np.arange(n).astype(str)
+
+    build_start = time.perf_counter()
+    index = IVFIndex.build(vectors, ids)
+    build_s = time.perf_counter() - build_start
+
+    # Persist and memory-map, as the services do
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'bench.ivf'
+        index.save(path)
+        index = IVFIndex.load(path, mmap=True)
+        nprobe = nprobe or default_nprobe(index.nlist)
+
+        exact_results = []
+        start = time.perf_counter()
+        for q in queries:
+            exact_results.append(exact_topk(vectors, q, k))
+        exact_ms = (time.perf_counter() - start) / len(queries) * 1000
+
+        recalls = []
+        start = time.perf_counter()
+        ann_results = [index.search(q, top_k=k, nprobe=nprobe)[0] for q in queries]
+        ann_ms = (time.perf_counter() - start) / len(queries) * 1000
+
+        for exact, approx in zip(exact_results, ann_results):
+            approx_ids = {int(index.ids[p]) for p in approx}
+            recalls.append(len(approx_ids & set(exact.tolist())) / k)
+
+        nlist = index.nlist
+        del index  # release the memory map before the directory is removed
+
+    return {
+        'n': n,
+        'nlist': nlist,
+        'nprobe': nprobe,
+        'build_s': build_s,
+        'exact_ms': exact_ms,
+        'ann_ms': ann_ms,
+        'recall': float(np.mean(recalls)),
+    }
+
+
+def load_db_vectors(db_path: str, advisor_id: str, column: str) -> np.ndarray:
+    from mondrian.embedding_index import AdvisorEmbeddingIndex
+    return AdvisorEmbeddingIndex(db_path, advisor_id, column).load().vectors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark IVF ANN index recall and latency")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 50000, 100000])
+    parser.add_argument('--dim', type=int, default=512, help='512 (CLIP) or 384 (MiniLM)')
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--queries', type=int, default=100)
+    parser.add_argument('--nprobe', type=int, default=None)
+    parser.add_argument('--db', type=str, default=None, help='Benchmark real embeddings from this database')
+    parser.add_argument('--advisor', type=str, default='ansel')
+    parser.add_argument('--column', type=str, default='embedding', choices=['embedding', 'text_embedding'])
+    args = parser.parse_args()
+
+    print("=" * 78)
+    print(f"IVF ANN benchmark (recall@{args.k}, {args.queries} queries)")
+    print("=" * 78)
+    print(f"{'N':>8} {'nlist':>6} {'nprobe':>6} {'build(s)':>9} {'exact(ms)':>10} {'ann(ms)':>9} {'recall':>7}")
+
+    if args.db:
+        corpora = [load_db_vectors(args.db, args.advisor, args.column)]
+    else:
+        corpora = [synthetic_corpus(n, args.dim, seed=n) for n in args.sizes]
+
+    rng = np.random.default_rng(123)
+    for vectors in corpora:
+        if vectors.shape[0] <= args.k:
+            print(f"{vectors.shape[0]:>8} too few vectors for k={args.k}")
+            continue
+        # Queries: perturbed corpus members (like a user photo near a reference)
+        picks = rng.choice(vectors.shape[0], args.queries)
+        queries = vectors[picks] + 0.3 * rng.standard_normal((args.queries, vectors.shape[1])).astype(np.float32)
+        queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+        r = benchmark(vectors, queries, args.k, args.nprobe)
+        print(f"{r['n']:>8} {r['nlist']:>6} {r['nprobe']:>6} {r['build_s']:>9.2f} "
+              f"{r['exact_ms']:>10.3f} {r['ann_ms']:>9.3f} {r['recall']:>7.3f}")
+
+    print("=" * 78)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Benchmark ONNX Runtime CLIP against PyTorch on CPU
+
+Encodes the same images with the PyTorch CLIP model, the fp32 ONNX export
+and (if present) the int8 export, and reports per-image latency at each
+batch size plus parity: the cosine between each backend's embedding and the
+PyTorch one, and the agreement of similarity rankings (how often the
+nearest neighbour within the set is the same as under PyTorch).
+
+Images come from --images (a directory) or, by default, the advisor
+reference images referenced in the database.
+
+Usage:
+    python scripts/export_clip_onnx.py --int8
+    python scripts/benchmark_clip_onnx.py
+    python scripts/benchmark_clip_onnx.py --images source/advisor/photographer/ansel --limit 64
+    python scripts/benchmark_clip_onnx.py --batch-sizes 1 8 32 --threads 4
+"""
+
+import sys
+import time
+import sqlite3
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from mondrian.clip_onnx import CLIP_MODEL_NAME, ONNX_DIR, OnnxClipEncoder, onnx_paths
+
+DB_PATH = PROJECT_ROOT / "mondrian.db"
+
+
+def image_paths(args):
+    if args.images:
+        paths = sorted(p for p in Path(args.images).rglob('*')
+                       if p.suffix.lower() in ('.jpg', '.jpeg', '.png', '.webp'))
+    else:
+        with sqlite3.connect(args.db) as conn:
+            rows = conn.execute("SELECT image_path FROM dimensional_profiles WHERE image_path IS NOT NULL").fetchall()
+        paths = [PROJECT_ROOT / r[0] if not Path(r[0]).is_absolute() else Path(r[0]) for r in rows]
+        paths = [p for p in paths if p.exists()]
+    return paths[:args.limit]
+
+
+def torch_encoder(threads: int):
+    import torch
+    from transformers import CLIPModel, CLIPProcessor
+
+    if threads:
+        torch.set_num_threads(threads)
+    model = CLIPModel.from_pretrained(CLIP_MODEL_NAME).eval()
+    processor = CLIPProcessor.from_pretrained(CLIP_MODEL_NAME)
+
+    def encode(images):
+        with torch.no_grad():
+            features = model.get_image_features(**processor(images=images, return_tensors="pt"))
+        x = features.numpy().astype(np.float32)
+        return x / np.linalg.norm(x, axis=1, keepdims=True)
+    return encode
+
+
+def timed(encode, images, batch_size: int):
+    """(embeddings, ms per image) after one warm-up batch"""
+    encode(images[:batch_size])
+    start = time.perf_counter()
+    out = np.vstack([encode(images[i:i + batch_size]) for i in range(0, len(images), batch_size)])
+    return out, (time.perf_counter() - start) / len(images) * 1000
+
+
+def nearest_neighbour_agreement(reference: np.ndarray, other: np.ndarray) -> float:
+    def nn(x):
+        sims = x @ x.T
+        np.fill_diagonal(sims, -np.inf)
+        return sims.argmax(axis=1)
+    return float(np.mean(nn(reference) == nn(other)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare ONNX Runtime and PyTorch CLIP latency/parity")
+    parser.add_argument('--images', type=str, default=None, help='Directory of images (default: reference images in the DB)')
+    parser.add_argument('--db', type=str, default=str(DB_PATH))
+    parser.add_argument('--limit', type=int, default=64)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 16])
+    parser.add_argument('--threads', type=int, default=0, help='CPU threads for both backends (0 = default)')
+    args = parser.parse_args()
+
+    from PIL import Image
+
+    paths = image_paths(args)
+    if len(paths) < 2:
+        print("[ERROR] Need at least 2 images (use --images)")
+        sys.exit(1)
+    images = [Image.open(p).convert('RGB') for p in paths]
+
+    backends = {'torch': torch_encoder(args.threads)}
+    for quantized in (False, True):
+        if onnx_paths(ONNX_DIR, quantized)[0].exists():
+            encoder = OnnxClipEncoder(quantized=quantized, threads=args.threads or None)
+            backends['onnx-int8' if quantized else 'onnx'] = encoder.encode_images
+    if len(backends) == 1:
+        print("[ERROR] No ONNX export found. Run: python scripts/export_clip_onnx.py --int8")
+        sys.exit(1)
+
+    print("=" * 78)
+    print(f"CLIP image encoder on CPU ({len(images)} images)")
+    print("=" * 78)
+    print(f"{'backend':>10} {'batch':>6} {'ms/image':>9} {'speedup':>8} {'cos min':>8} {'cos mean':>9} {'NN agree':>9}")
+
+    for batch_size in args.batch_sizes:
+        reference, torch_ms = timed(backends['torch'], images, batch_size)
+        for name, encode in backends.items():
+            embeds, ms = (reference, torch_ms) if name == 'torch' else timed(encode, images, batch_size)
+            cos = np.sum(embeds * reference, axis=1)
+            print(f"{name:>10} {batch_size:>6} {ms:>9.2f} {torch_ms / ms:>7.2f}x "
+                  f"{cos.min():>8.4f} {cos.mean():>9.4f} {nearest_neighbour_agreement(reference, embeds):>9.3f}")
+
+    print("=" * 78)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Benchmark SQLite lock contention under concurrent SSE load
+
+Replays the job service's database traffic against a scratch database:
+SSE streams polling their job row (--streams), job workers writing progress
+and growing llm_thinking text (--writers) and the queue monitor counting jobs
+by status. Runs it twice - once opening a new connection per query in the
+default rollback-journal mode (the old behaviour) and once through
+mondrian.db_pool (WAL, busy timeout, pooled connections) - and reports
+read/write throughput, latency percentiles and "database is locked" errors.
+
+Usage:
+    python scripts/benchmark_db_contention.py
+    python scripts/benchmark_db_contention.py --streams 50 --writers 4 --duration 20
+"""
+
+import sys
+import time
+import sqlite3
+import argparse
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from mondrian.db_pool import close_pools, db_connection
+
+JOB_COLUMNS = """id, filename, status, advisor, mode, created_at, current_step, progress_percentage,
+                 enable_rag, llm_thinking, analysis_html, last_activity"""
+
+
+def create_db(path: str, jobs: int):
+    with sqlite3.connect(path) as conn:
+        conn.execute("""
+            CREATE TABLE jobs (id TEXT PRIMARY KEY, filename TEXT, status TEXT, advisor TEXT, mode TEXT,
+                               created_at TEXT, current_step TEXT, progress_percentage INTEGER,
+                               enable_rag INTEGER, llm_thinking TEXT, analysis_html TEXT, last_activity TEXT)
+        """)
+        now = datetime.now().isoformat()
+        conn.executemany(
+            "INSERT INTO jobs VALUES (?, ?, 'analyzing', 'ansel', 'rag', ?, 'Analyzing', 10, 1, '', '', ?)",
+            [(f"job-{i:04d}", f"uploads/{i}.jpg", now, now) for i in range(jobs)]
+        )
+
+
+@contextmanager
+def direct_connection(db_path: str):
+    """Old behaviour: a new connection per query, default journal mode."""
+    conn = sqlite3.connect(db_path)
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def run(connect, db_path: str, args) -> dict:
+    stop = threading.Event()
+    lock = threading.Lock()
+    results = {'read_ms': [], 'write_ms': [], 'locked': 0, 'errors': 0}
+
+    def timed(kind, fn):
+        start = time.perf_counter()
+        try:
+            fn()
+        except sqlite3.OperationalError as e:
+            with lock:
+                results['locked' if 'locked' in str(e) else 'errors'] += 1
+            return
+        elapsed = (time.perf_counter() - start) * 1000
+        with lock:
+            results[kind].append(elapsed)
+
+    def stream(i):
+        job_id = f"job-{i % args.jobs:04d}"
+
+        def poll():
+            with connect(db_path) as conn:
+                conn.execute(f"SELECT {JOB_COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+        while not stop.is_set():
+            timed('read_ms', poll)
+            time.sleep(args.poll_interval)
+
+    def writer(i):
+        job_id = f"job-{i % args.jobs:04d}"
+        chunk = "Considering the tonal range of the foreground rocks. " * 4
+        progress = 10
+
+        def write():
+            with connect(db_path) as conn:
+                conn.execute(
+                    "UPDATE jobs SET progress_percentage = ?, llm_thinking = llm_thinking || ?, last_activity = ? WHERE id = ?",
+                    (progress, chunk, datetime.now().isoformat(), job_id)
+                )
+
+        while not stop.is_set():
+            timed('write_ms', write)
+            progress = progress % 90 + 1
+            time.sleep(args.write_interval)
+
+    def monitor():
+        def count():
+            with connect(db_path) as conn:
+                conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+
+        while not stop.is_set():
+            timed('read_ms', count)
+            time.sleep(0.1)
+
+    threads = [threading.Thread(target=stream, args=(i,)) for i in range(args.streams)]
+    threads += [threading.Thread(target=writer, args=(i,)) for i in range(args.writers)]
+    threads.append(threading.Thread(target=monitor))
+    for t in threads:
+        t.start()
+    time.sleep(args.duration)
+    stop.set()
+    for t in threads:
+        t.join()
+    return results
+
+
+def summarize(name: str, r: dict, duration: float):
+    def pct(values, q):
+        return float(np.percentile(values, q)) if values else float('nan')
+
+    print(f"{name:<10} {len(r['read_ms']) / duration:>9.0f} {pct(r['read_ms'], 50):>8.2f} {pct(r['read_ms'], 99):>8.2f} "
+          f"{len(r['write_ms']) / duration:>9.0f} {pct(r['write_ms'], 50):>8.2f} {pct(r['write_ms'], 99):>8.2f} "
+          f"{max(r['write_ms'], default=float('nan')):>8.1f} {r['locked']:>7} {r['errors']:>6}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark SQLite contention: per-query connections vs mondrian.db_pool")
+    parser.add_argument('--streams', type=int, default=20, help='Concurrent SSE streams polling a job')
+    parser.add_argument('--writers', type=int, default=2, help='Job workers writing progress')
+    parser.add_argument('--jobs', type=int, default=200)
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds per mode')
+    parser.add_argument('--poll-interval', type=float, default=0.05, help='Seconds between polls per stream')
+    parser.add_argument('--write-interval', type=float, default=0.01, help='Seconds between writes per worker')
+    args = parser.parse_args()
+
+    print("=" * 96)
+    print(f"SQLite contention: {args.streams} SSE streams, {args.writers} writers, monitor; {args.duration:.0f}s per mode")
+    print("=" * 96)
+    print(f"{'mode':<10} {'reads/s':>9} {'r p50':>8} {'r p99':>8} {'writes/s':>9} {'w p50':>8} {'w p99':>8} "
+          f"{'w max':>8} {'locked':>7} {'other':>6}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, connect in (('direct', direct_connection), ('pooled', db_connection)):
+            # Fresh file per mode: WAL mode persists in the database file
+            db_path = str(Path(tmp) / f"{name}.db")
+            create_db(db_path, args.jobs)
+            summarize(name, run(connect, db_path, args), args.duration)
+        close_pools()
+
+    print("=" * 96)
+    print("Latencies in ms; 'locked' = operations that failed with 'database is locked'")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Check int8 embedding quantization against the float32 index
+
+For each advisor and embedding column, loads the retrieval index twice
+(float32 and int8 with exact rescoring) and reports resident memory and
+ranking overlap@k / top-1 agreement over queries drawn from the corpus
+(perturbed stored vectors, like a user photo close to a reference).
+
+Memory savings are only realised for advisors whose embeddings live in
+the memory-mapped store (python scripts/compute_embeddings.py --migrate-to-store).
+
+Usage:
+    python scripts/check_embedding_quantization.py
+    python scripts/check_embedding_quantization.py --advisor ansel --k 10 --queries 200
+    python scripts/check_embedding_quantization.py --synthetic 100000
+"""
+
+import sys
+import sqlite3
+import argparse
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from mondrian.embedding_index import (
+    EMBEDDING_COLUMNS, SCORE_COLUMNS, AdvisorEmbeddingIndex, ranking_overlap
+)
+from mondrian.embedding_store import EmbeddingStore, ensure_ref_columns, make_ref
+
+DB_PATH = PROJECT_ROOT / "mondrian.db"
+
+# Fail the check below this overlap@k
+MIN_OVERLAP = 0.99
+
+
+def synthetic_db(path: str, n: int, dim: int = 512, seed: int = 0):
+    """Store-backed dimensional_profiles with clustered unit vectors."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((64, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, 64, size=n)] + 0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+
+    conn = sqlite3.connect(path)
+    conn.execute(f"""
+        CREATE TABLE dimensional_profiles (
+            id TEXT PRIMARY KEY, advisor_id TEXT, image_path TEXT, image_title TEXT,
+            date_taken TEXT, image_description TEXT,
+            {', '.join(c + ' REAL' for c in SCORE_COLUMNS)},
+            overall_grade TEXT, embedding BLOB, text_embedding BLOB
+        )
+    """)
+    ensure_ref_columns(conn)
+    ids = [f"img-{i}" for i in range(n)]
+    store = EmbeddingStore.open_for_write(path, 'synthetic', 'openai/clip-vit-base-patch32', dim)
+    slots = store.upsert(ids, vectors)
+    scores = rng.uniform(5, 10, size=(n, len(SCORE_COLUMNS)))
+    conn.executemany(
+        f"INSERT INTO dimensional_profiles (id, advisor_id, {', '.join(SCORE_COLUMNS)}, embedding_ref) "
+        f"VALUES (?, 'synthetic', {', '.join('?' * len(SCORE_COLUMNS))}, ?)",
+        [(row_id, *scores[i].tolist(), make_ref(store.name, slot)) for i, (row_id, slot) in enumerate(zip(ids, slots))]
+    )
+    conn.commit()
+    conn.close()
+
+
+def check(db_path: str, advisor_id: str, column: str, k: int, n_queries: int, rng) -> bool:
+    exact = AdvisorEmbeddingIndex(db_path, advisor_id, column, 'none').load()
+    if len(exact) <= k:
+        print(f"{advisor_id:>10} {column:>15} {len(exact):>8}  too few vectors for k={k}")
+        return True
+    quant = AdvisorEmbeddingIndex(db_path, advisor_id, column, 'int8').load()
+
+    picks = rng.choice(len(exact), n_queries)
+    queries = exact.exact_vectors(picks) + 0.3 * rng.standard_normal((n_queries, exact.vectors.shape[1])).astype(np.float32)
+
+    overlap = ranking_overlap(exact, quant, queries, top_k=k)
+    top1 = ranking_overlap(exact, quant, queries, top_k=1)
+    float_mb = exact.memory_bytes() / 1e6
+    int8_mb = quant.memory_bytes() / 1e6
+    ok = overlap >= MIN_OVERLAP
+
+    print(f"{advisor_id:>10} {column:>15} {len(exact):>8} {float_mb:>10.2f} {int8_mb:>9.2f} "
+          f"{float_mb / max(int8_mb, 1e-9):>6.1f}x {overlap:>10.4f} {top1:>6.3f}  {'OK' if ok else 'FAIL'}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare int8 and float32 embedding retrieval")
+    parser.add_argument('--advisor', type=str, default='all', help='Advisor ID or all')
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--queries', type=int, default=100)
+    parser.add_argument('--synthetic', type=int, default=None,
+                        help='Check a synthetic store-backed corpus of this size instead of mondrian.db')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(123)
+    tmp = None
+    if args.synthetic:
+        tmp = tempfile.TemporaryDirectory()
+        db_path = str(Path(tmp.name) / 'synthetic.db')
+        synthetic_db(db_path, args.synthetic)
+        advisors, columns = ['synthetic'], ['embedding']
+    else:
+        db_path = str(DB_PATH)
+        columns = list(EMBEDDING_COLUMNS)
+        if args.advisor != 'all':
+            advisors = [args.advisor]
+        else:
+            with sqlite3.connect(db_path) as conn:
+                advisors = [row[0] for row in conn.execute(
+                    "SELECT DISTINCT advisor_id FROM dimensional_profiles WHERE advisor_id IS NOT NULL"
+                )]
+
+    print("=" * 86)
+    print(f"Embedding quantization check (overlap@{args.k}, {args.queries} queries, rescoring exact)")
+    print("=" * 86)
+    print(f"{'advisor':>10} {'column':>15} {'rows':>8} {'f32(MB)':>10} {'int8(MB)':>9} {'saved':>7} "
+          f"{'overlap':>10} {'top1':>6}")
+
+    all_ok = True
+    for advisor in advisors:
+        for column in columns:
+            all_ok &= check(db_path, advisor, column, args.k, args.queries, rng)
+
+    print("=" * 86)
+    if tmp is not None:
+        tmp.cleanup()
+    sys.exit(0 if all_ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,22 @@
-# CLIP Service Script (Canonical)
+#!/usr/bin/env python3
+"""
+CLIP Service launcher
 
-This is the canonical CLIP service script, moved from mondrian/clip_service.py as part of project consolidation. All logic is preserved.
+CLIP image embeddings are served by the combined embedding service
+(mondrian/embedding_service.py, POST /embed/image), which also holds the
+MiniLM text model so both share one process and one batching queue.
+This entry point is kept for existing start scripts.
 
-[...existing code from mondrian/clip_service.py...]
+Usage:
+    python3 scripts/clip_service.py --port 5008
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from mondrian.embedding_service import main
+
+if __name__ == "__main__":
+    main()
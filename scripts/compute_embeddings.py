@@ -6,19 +6,38 @@ This script:
 1. Loads CLIP model for visual embeddings
 2. Loads sentence-transformer for text embeddings
 3. Computes embeddings for all advisor images in dimensional_profiles
-4. Stores embeddings as BLOBs in the database
+4. Writes embeddings to the memory-mapped embedding store
+   (embedding_store/<advisor>__<model>/); rows keep only a pointer
+5. Builds the on-disk ANN (IVF) index per advisor for large corpora
+6. Rebuilds the advisor_dimension_exemplars table used for case studies
+
+When the embedding service (mondrian/embedding_service.py) is running, the
+models are not loaded here: batches are sent to the service instead.
+
+Images are read/decoded in a worker pool, encoded in batches and written with
+executemany in large transactions. Rows whose content hash and model version
+are unchanged are skipped, and an interrupted run resumes from its checkpoint.
 
 Usage:
     python scripts/compute_embeddings.py --advisor ansel
     python scripts/compute_embeddings.py --advisor all
     python scripts/compute_embeddings.py --advisor ansel --verify-only
+    python scripts/compute_embeddings.py --advisor ansel --build-ann-only
+    python scripts/compute_embeddings.py --advisor all --batch-size 64 --workers 8
+    python scripts/compute_embeddings.py --advisor all --migrate-to-store
+    python scripts/compute_embeddings.py --advisor all --compact-store
+    python scripts/compute_embeddings.py --advisor all --no-service
 """
 
 import os
 import sys
+import json
+import time
 import sqlite3
 import argparse
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 from pathlib import Path
 
 # Add project root to path
@@ -27,11 +46,22 @@ sys.path.insert(0, str(PROJECT_ROOT))
 
 DB_PATH = PROJECT_ROOT / "mondrian.db"
 
+from mondrian.embedding_cache import get_embedding_cache, content_hash, package_version
+from mondrian.embedding_client import get_embedding_client
+from mondrian.embedding_store import EmbeddingStore, base_name, compact_store, ensure_ref_columns, make_ref, store_root
+from mondrian.rag_retrieval import refresh_dimension_exemplars
+
+CLIP_MODEL_NAME = "openai/clip-vit-base-patch32"
+TEXT_MODEL_NAME = "all-MiniLM-L6-v2"
+
 # Lazy load models to avoid import time
 _clip_model = None
 _clip_processor = None
 _text_model = None
 
+# Embedding service client when one is running (models are then not loaded here)
+_service = None
+
 
 def get_clip_model():
     """Lazy load CLIP model"""
@@ -42,8 +72,8 @@ def get_clip_model():
             from transformers import CLIPProcessor, CLIPModel
             import torch
             
-            _clip_model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32")
-            _clip_processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch32")
+            _clip_model = CLIPModel.from_pretrained(CLIP_MODEL_NAME)
+            _clip_processor = CLIPProcessor.from_pretrained(CLIP_MODEL_NAME)
             
             # Try to use GPU, fall back to CPU if it fails
             try:
@@ -73,7 +103,7 @@ def get_text_model():
         print("[INFO] Loading text embedding model (all-MiniLM-L6-v2)...")
         try:
             from sentence_transformers import SentenceTransformer
-            _text_model = SentenceTransformer('all-MiniLM-L6-v2')
+            _text_model = SentenceTransformer(TEXT_MODEL_NAME)
             print("[INFO] Text model loaded")
         except ImportError as e:
             print(f"[ERROR] Failed to import sentence_transformers: {e}")
@@ -82,111 +112,61 @@ def get_text_model():
     return _text_model
 
 
-def compute_clip_embedding(image_path: str) -> np.ndarray:
-    """Compute CLIP visual embedding for an image"""
-    from PIL import Image
-    import torch
-    
-    model, processor = get_clip_model()
-    
-    try:
-        image = Image.open(image_path).convert('RGB')
-        inputs = processor(images=image, return_tensors="pt")
-        
-        if torch.cuda.is_available():
-            inputs = {k: v.cuda() for k, v in inputs.items()}
-        
-        with torch.no_grad():
-            image_features = model.get_image_features(**inputs)
-        
-        # Normalize embedding
-        embedding = image_features.cpu().numpy().flatten()
-        embedding = embedding / np.linalg.norm(embedding)
-        
-        return embedding
-    except Exception as e:
-        print(f"[ERROR] Failed to compute CLIP embedding for {image_path}: {e}")
-        return None
-
-
-def compute_text_embedding(text: str) -> np.ndarray:
-    """Compute text embedding for description/significance"""
-    model = get_text_model()
+def ensure_tracking_columns():
+    """Add content-hash / model-version tracking and store pointer columns if missing"""
+    conn = sqlite3.connect(DB_PATH)
+    cursor = conn.cursor()
+    cursor.execute("PRAGMA table_info(dimensional_profiles)")
+    columns = {row[1] for row in cursor.fetchall()}
     
-    try:
-        embedding = model.encode(text, normalize_embeddings=True)
-        return embedding
-    except Exception as e:
-        print(f"[ERROR] Failed to compute text embedding: {e}")
-        return None
+    for column in ('embedding_hash', 'embedding_model', 'text_embedding_hash', 'text_embedding_model'):
+        if column not in columns:
+            print(f"[INFO] Adding '{column}' column to dimensional_profiles")
+            conn.execute(f"ALTER TABLE dimensional_profiles ADD COLUMN {column} TEXT DEFAULT NULL")
+    conn.commit()
+    ensure_ref_columns(conn)
+    conn.close()
 
 
-def get_advisor_images(advisor_id: str = None):
-    """Get advisor images that need embeddings computed"""
+def get_advisor_images(advisor_id: str = None, after_rowid: int = 0):
+    """Get advisor images that need embeddings computed (ordered by rowid for resume)"""
     conn = sqlite3.connect(DB_PATH)
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     
     if advisor_id and advisor_id != 'all':
         cursor.execute("""
-            SELECT rowid, image_path, image_title, image_description, image_significance,
-                   embedding, text_embedding
+            SELECT rowid, id, advisor_id, image_path, image_title, image_description, image_significance,
+                   (embedding IS NOT NULL OR embedding_ref IS NOT NULL) AS has_clip,
+                   (text_embedding IS NOT NULL OR text_embedding_ref IS NOT NULL) AS has_text,
+                   embedding_hash, embedding_model, text_embedding_hash, text_embedding_model
             FROM dimensional_profiles
             WHERE advisor_id = ?
               AND composition_score IS NOT NULL
-        """, (advisor_id,))
+              AND rowid > ?
+            ORDER BY rowid
+        """, (advisor_id, after_rowid))
     else:
         cursor.execute("""
-            SELECT rowid, image_path, image_title, image_description, image_significance,
-                   embedding, text_embedding, advisor_id
+            SELECT rowid, id, advisor_id, image_path, image_title, image_description, image_significance,
+                   (embedding IS NOT NULL OR embedding_ref IS NOT NULL) AS has_clip,
+                   (text_embedding IS NOT NULL OR text_embedding_ref IS NOT NULL) AS has_text,
+                   embedding_hash, embedding_model, text_embedding_hash, text_embedding_model
             FROM dimensional_profiles
             WHERE composition_score IS NOT NULL
               AND advisor_id IS NOT NULL
-        """)
+              AND rowid > ?
+            ORDER BY rowid
+        """, (after_rowid,))
     
     rows = [dict(row) for row in cursor.fetchall()]
     conn.close()
     return rows
 
 
-def save_embeddings(profile_id: str, clip_embedding: np.ndarray = None, text_embedding: np.ndarray = None):
-    """Save embeddings to database"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    if clip_embedding is not None and text_embedding is not None:
-        cursor.execute("""
-            UPDATE dimensional_profiles
-            SET embedding = ?, text_embedding = ?
-            WHERE rowid = ?
-        """, (clip_embedding.tobytes(), text_embedding.tobytes(), profile_id))
-        rows_affected = cursor.rowcount
-    elif clip_embedding is not None:
-        cursor.execute("""
-            UPDATE dimensional_profiles
-            SET embedding = ?
-            WHERE rowid = ?
-        """, (clip_embedding.tobytes(), profile_id))
-        rows_affected = cursor.rowcount
-    elif text_embedding is not None:
-        cursor.execute("""
-            UPDATE dimensional_profiles
-            SET text_embedding = ?
-            WHERE rowid = ?
-        """, (text_embedding.tobytes(), profile_id))
-        rows_affected = cursor.rowcount
-    else:
-        rows_affected = 0
-    
-    conn.commit()
-    conn.close()
-    
-    if rows_affected == 0:
-        print(f"  [WARN] No rows updated for profile_id={profile_id}")
-
-
 def verify_embeddings(advisor_id: str = None):
     """Verify embedding status for advisor images"""
+    ensure_tracking_columns()
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
     
@@ -201,18 +181,26 @@ def verify_embeddings(advisor_id: str = None):
     cursor.execute(f"SELECT COUNT(*) FROM dimensional_profiles {where_clause}", params)
     total = cursor.fetchone()[0]
     
+    has_clip = "(embedding IS NOT NULL OR embedding_ref IS NOT NULL)"
+    has_text = "(text_embedding IS NOT NULL OR text_embedding_ref IS NOT NULL)"
+    
     # With CLIP embeddings
-    cursor.execute(f"SELECT COUNT(*) FROM dimensional_profiles {where_clause} AND embedding IS NOT NULL", params)
+    cursor.execute(f"SELECT COUNT(*) FROM dimensional_profiles {where_clause} AND {has_clip}", params)
     with_clip = cursor.fetchone()[0]
     
     # With text embeddings
-    cursor.execute(f"SELECT COUNT(*) FROM dimensional_profiles {where_clause} AND text_embedding IS NOT NULL", params)
+    cursor.execute(f"SELECT COUNT(*) FROM dimensional_profiles {where_clause} AND {has_text}", params)
     with_text = cursor.fetchone()[0]
     
     # With both
-    cursor.execute(f"SELECT COUNT(*) FROM dimensional_profiles {where_clause} AND embedding IS NOT NULL AND text_embedding IS NOT NULL", params)
+    cursor.execute(f"SELECT COUNT(*) FROM dimensional_profiles {where_clause} AND {has_clip} AND {has_text}", params)
     with_both = cursor.fetchone()[0]
     
+    # Still stored as BLOBs (not yet moved to the embedding store)
+    cursor.execute(f"SELECT COUNT(*) FROM dimensional_profiles {where_clause} "
+                   f"AND (embedding IS NOT NULL OR text_embedding IS NOT NULL)", params)
+    with_blobs = cursor.fetchone()[0]
+    
     conn.close()
     
     print("\n" + "=" * 60)
@@ -222,67 +210,370 @@ def verify_embeddings(advisor_id: str = None):
     print(f"With CLIP embedding: {with_clip} ({100*with_clip/total:.1f}%)" if total > 0 else "With CLIP embedding: 0")
     print(f"With text embedding: {with_text} ({100*with_text/total:.1f}%)" if total > 0 else "With text embedding: 0")
     print(f"With BOTH:           {with_both} ({100*with_both/total:.1f}%)" if total > 0 else "With BOTH: 0")
+    print(f"Legacy BLOB rows:    {with_blobs}" + (" (run with --migrate-to-store)" if with_blobs else ""))
     print("=" * 60 + "\n")
     
     return with_both == total
 
 
-def compute_all_embeddings(advisor_id: str = None, force: bool = False):
-    """Compute embeddings for all advisor images"""
-    images = get_advisor_images(advisor_id)
+def clip_model_key() -> str:
+    if _service is not None and _service.model_keys.get('image'):
+        return _service.model_keys['image']
+    return f"{CLIP_MODEL_NAME}@{package_version('transformers')}"
+
+
+def text_model_key() -> str:
+    if _service is not None and _service.model_keys.get('text'):
+        return _service.model_keys['text']
+    return f"{TEXT_MODEL_NAME}@{package_version('sentence-transformers')}"
+
+
+def clip_version() -> str:
+    """Version part of the CLIP model key (embedding cache key)"""
+    return clip_model_key().rsplit('@', 1)[1]
+
+
+def text_content_for(img: dict) -> str:
+    """Text used for the MiniLM embedding: title, description and significance"""
+    title = img.get('image_title') or 'Unknown'
+    description = img.get('image_description') or ''
+    significance = img.get('image_significance') or ''
+    return f"{title}. {description} {significance}".strip()
+
+
+def load_image_job(img: dict, force: bool = False):
+    """
+    Worker-pool task: read and hash the file, then resolve its CLIP embedding
+    from the stored row or the embedding cache, decoding only on a miss.
     
-    print(f"\n[INFO] Processing {len(images)} images for {advisor_id or 'all advisors'}")
+    Returns:
+        dict with keys: img, digest, status ('unchanged', 'cached', 'decoded', 'error'),
+        embedding (for 'cached'), image (PIL, for 'decoded'; raw image_bytes instead
+        when the embedding service decodes), error
+    """
+    from PIL import Image
+    import io
     
-    success_count = 0
-    skip_count = 0
-    error_count = 0
+    # Rows embedded before hashes were tracked are kept unless --force (previous behaviour)
+    if not force and img['has_clip'] and img.get('embedding_hash') is None:
+        return {'img': img, 'status': 'unchanged'}
     
-    for i, img in enumerate(images):
-        profile_id = img['rowid']
-        image_path = img['image_path']
-        title = img.get('image_title', 'Unknown')
-        description = img.get('image_description', '')
-        significance = img.get('image_significance', '')
-        
-        # Check if already computed
-        has_clip = img.get('embedding') is not None
-        has_text = img.get('text_embedding') is not None
-        
-        if has_clip and has_text and not force:
-            skip_count += 1
-            continue
+    image_path = img['image_path']
+    if not image_path or not os.path.exists(image_path):
+        return {'img': img, 'status': 'error', 'error': f"Image not found: {image_path}"}
+    try:
+        with open(image_path, 'rb') as f:
+            image_bytes = f.read()
+        digest = content_hash(image_bytes)
         
-        print(f"\n[{i+1}/{len(images)}] {title}")
+        if not force:
+            if (img['has_clip'] and img.get('embedding_hash') == digest
+                    and img.get('embedding_model') == clip_model_key()):
+                return {'img': img, 'digest': digest, 'status': 'unchanged'}
+            cached = get_embedding_cache().get(CLIP_MODEL_NAME, clip_version(), digest)
+            if cached is not None:
+                return {'img': img, 'digest': digest, 'status': 'cached', 'embedding': cached}
         
-        # Compute CLIP embedding if needed
-        clip_emb = None
-        if not has_clip or force:
-            if os.path.exists(image_path):
-                print(f"  Computing CLIP embedding...")
-                clip_emb = compute_clip_embedding(image_path)
-                if clip_emb is not None:
-                    print(f"  ✓ CLIP embedding: {clip_emb.shape}")
-            else:
-                print(f"  ✗ Image not found: {image_path}")
-                error_count += 1
-                continue
+        if _service is not None:
+            return {'img': img, 'digest': digest, 'status': 'decoded', 'image_bytes': image_bytes}
+        image = Image.open(io.BytesIO(image_bytes)).convert('RGB')
+        return {'img': img, 'digest': digest, 'status': 'decoded', 'image': image}
+    except Exception as e:
+        return {'img': img, 'status': 'error', 'error': f"Failed to decode {image_path}: {e}"}
+
+
+def encode_clip_batch(images: list) -> np.ndarray:
+    """Batched CLIP forward pass; returns L2-normalized float32 rows"""
+    import torch
+    
+    model, processor = get_clip_model()
+    inputs = processor(images=images, return_tensors="pt")
+    device = next(model.parameters()).device
+    inputs = {k: v.to(device) for k, v in inputs.items()}
+    
+    with torch.no_grad():
+        features = model.get_image_features(**inputs)
+    
+    embeddings = features.cpu().numpy().astype(np.float32)
+    return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+
+def encode_text_batch(texts: list, batch_size: int) -> np.ndarray:
+    """Batched MiniLM encoding; returns L2-normalized float32 rows"""
+    model = get_text_model()
+    return np.asarray(
+        model.encode(texts, batch_size=batch_size, normalize_embeddings=True),
+        dtype=np.float32
+    )
+
+
+def save_embeddings_batch(clip_updates: list, text_updates: list):
+    """
+    Write embeddings to the per-advisor stores, point the rows at them in
+    one transaction (BLOB columns are cleared), then publish the new slots.
+    
+    Args:
+        clip_updates: [(img, embedding, content_hash, model_key), ...]
+        text_updates: [(img, embedding, content_hash, model_key), ...]
+    """
+    if not clip_updates and not text_updates:
+        return
+    clip_rows, clip_stores = store_embeddings(clip_updates, CLIP_MODEL_NAME)
+    text_rows, text_stores = store_embeddings(text_updates, TEXT_MODEL_NAME)
+    
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    with conn:
+        if clip_rows:
+            conn.executemany("""
+                UPDATE dimensional_profiles
+                SET embedding = NULL, embedding_ref = ?, embedding_hash = ?, embedding_model = ?
+                WHERE rowid = ?
+            """, clip_rows)
+        if text_rows:
+            conn.executemany("""
+                UPDATE dimensional_profiles
+                SET text_embedding = NULL, text_embedding_ref = ?, text_embedding_hash = ?, text_embedding_model = ?
+                WHERE rowid = ?
+            """, text_rows)
+    conn.close()
+    for store in clip_stores + text_stores:
+        store.publish()
+
+
+def store_embeddings(updates: list, model_name: str) -> list:
+    """
+    Append embeddings to the (advisor, model) stores, unpublished: call
+    publish() on the returned stores once the pointers are committed.
+    
+    Returns:
+        ([(pointer, content_hash, model_key, rowid), ...] for the row UPDATE, stores written)
+    """
+    by_advisor = {}
+    for update in updates:
+        by_advisor.setdefault(update[0]['advisor_id'], []).append(update)
+    
+    rows = []
+    stores = []
+    for advisor, group in by_advisor.items():
+        vectors = np.vstack([emb for _, emb, _, _ in group])
+        store = EmbeddingStore.open_for_write(str(DB_PATH), advisor, model_name, vectors.shape[1])
+        slots = store.upsert([img['id'] for img, _, _, _ in group], vectors, publish=False)
+        for (img, _, digest, model_key), slot in zip(group, slots):
+            rows.append((make_ref(store.name, slot), digest, model_key, img['rowid']))
+        stores.append(store)
+    return rows, stores
+
+
+def migrate_blobs_to_store(advisor_id: str = None, chunk_size: int = 1024):
+    """Move existing embedding BLOBs into the embedding store, keeping hash/model columns"""
+    ensure_tracking_columns()
+    
+    where = "advisor_id = ?" if advisor_id and advisor_id != 'all' else "advisor_id IS NOT NULL"
+    params = (advisor_id,) if advisor_id and advisor_id != 'all' else ()
+    
+    for column, ref_column, model_name in (('embedding', 'embedding_ref', CLIP_MODEL_NAME),
+                                           ('text_embedding', 'text_embedding_ref', TEXT_MODEL_NAME)):
+        moved = 0
+        while True:
+            conn = sqlite3.connect(DB_PATH, timeout=30)
+            conn.row_factory = sqlite3.Row
+            rows = conn.execute(f"""
+                SELECT rowid, id, advisor_id, {column} AS blob
+                FROM dimensional_profiles
+                WHERE {where} AND {column} IS NOT NULL
+                ORDER BY rowid
+                LIMIT ?
+            """, params + (chunk_size,)).fetchall()
+            conn.close()
+            if not rows:
+                break
+            
+            updates = [(dict(row), np.frombuffer(row['blob'], dtype=np.float32), None, None) for row in rows]
+            pointers, stores = store_embeddings(updates, model_name)
+            
+            conn = sqlite3.connect(DB_PATH, timeout=30)
+            with conn:
+                conn.executemany(
+                    f"UPDATE dimensional_profiles SET {column} = NULL, {ref_column} = ? WHERE rowid = ?",
+                    [(pointer, rowid) for pointer, _, _, rowid in pointers]
+                )
+            conn.close()
+            for store in stores:
+                store.publish()
+            moved += len(rows)
         
-        # Compute text embedding if needed
-        text_emb = None
-        if not has_text or force:
-            # Combine description and significance for richer embedding
-            text_content = f"{title}. {description} {significance}".strip()
-            if text_content:
-                print(f"  Computing text embedding...")
-                text_emb = compute_text_embedding(text_content)
-                if text_emb is not None:
-                    print(f"  ✓ Text embedding: {text_emb.shape}")
+        print(f"[INFO] Moved {moved} {column} BLOBs to the embedding store")
+    
+    print("[INFO] Run 'VACUUM' on the database to reclaim the space freed by the BLOBs")
+
+
+def compact_stores(advisor_id: str = None):
+    """Drop superseded slots from the advisor's embedding stores and repoint rows (see compact_store)"""
+    root = store_root(str(DB_PATH))
+    pattern = f"{advisor_id}__*" if advisor_id and advisor_id != 'all' else "*__*"
+    bases = sorted({base_name(path.name) for path in root.glob(pattern) if path.is_dir()}) if root.exists() else []
+    if not bases:
+        print("[INFO] No embedding stores to compact")
+        return
+    for base in bases:
+        result = compact_store(str(DB_PATH), base)
+        print(f"[INFO] {base}: kept {result['rows']} rows, dropped {result['dropped']} slots -> {result['store']}")
+
+
+def checkpoint_path(advisor_id: str) -> Path:
+    return PROJECT_ROOT / f".compute_embeddings_{advisor_id or 'all'}.checkpoint.json"
+
+
+def load_checkpoint(advisor_id: str) -> int:
+    """Last fully written rowid from an interrupted run (0 if none/mismatched)"""
+    path = checkpoint_path(advisor_id)
+    if not path.exists():
+        return 0
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return 0
+    if data.get('clip_model') != clip_model_key() or data.get('text_model') != text_model_key():
+        print("[INFO] Checkpoint was written with different model versions - starting over")
+        return 0
+    return int(data.get('last_rowid', 0))
+
+
+def save_checkpoint(advisor_id: str, last_rowid: int):
+    path = checkpoint_path(advisor_id)
+    tmp = path.with_suffix('.tmp')
+    with open(tmp, 'w') as f:
+        json.dump({
+            'advisor_id': advisor_id,
+            'last_rowid': last_rowid,
+            'clip_model': clip_model_key(),
+            'text_model': text_model_key(),
+            'updated_at': datetime.now().isoformat()
+        }, f)
+    os.replace(tmp, path)
+
+
+def compute_all_embeddings(advisor_id: str = None, force: bool = False,
+                           batch_size: int = 32, workers: int = 4,
+                           commit_every: int = 256, resume: bool = True):
+    """
+    Compute embeddings for all advisor images as a batched pipeline.
+    
+    Stages: worker-pool file read/hash/decode -> batched CLIP and MiniLM
+    encoding -> bulk executemany writes every `commit_every` images.
+    Rows whose content hash and model version match what is stored are skipped,
+    and progress is checkpointed by rowid so an interrupted run resumes.
+    """
+    ensure_tracking_columns()
+    
+    start_rowid = load_checkpoint(advisor_id) if (resume and not force) else 0
+    if start_rowid:
+        print(f"[INFO] Resuming after rowid {start_rowid}")
+    
+    images = get_advisor_images(advisor_id, after_rowid=start_rowid)
+    clip_key = clip_model_key()
+    text_key = text_model_key()
+    cache = get_embedding_cache()
+    
+    print(f"\n[INFO] Processing {len(images)} images for {advisor_id or 'all advisors'} "
+          f"(batch_size={batch_size}, workers={workers})")
+    
+    success_count = 0
+    skip_count = 0
+    error_count = 0
+    clip_encoded = 0
+    start_time = time.time()
+    
+    pending_clip = []
+    pending_text = []
+    pending_since_commit = 0
+    
+    def flush(last_rowid):
+        nonlocal pending_clip, pending_text, pending_since_commit
+        save_embeddings_batch(pending_clip, pending_text)
+        save_checkpoint(advisor_id, last_rowid)
+        pending_clip, pending_text, pending_since_commit = [], [], 0
+    
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for batch_start in range(0, len(images), batch_size):
+            batch = images[batch_start:batch_start + batch_size]
+            
+            # Stage 1: read, hash, cache lookup and decode in the worker pool
+            loaded = list(pool.map(lambda img: load_image_job(img, force), batch))
+            written = set()
+            
+            # Stage 2a: CLIP - one batched forward pass for cache misses only
+            to_encode = []
+            for item in loaded:
+                img = item['img']
+                if item['status'] == 'error':
+                    print(f"  ✗ {item['error']}")
+                    error_count += 1
+                elif item['status'] == 'cached':
+                    pending_clip.append((img, item['embedding'], item['digest'], clip_key))
+                    written.add(img['rowid'])
+                elif item['status'] == 'decoded':
+                    to_encode.append(item)
+            
+            if to_encode:
+                if _service is not None:
+                    embeddings = _service.embed_images([item['image_bytes'] for item in to_encode])
+                else:
+                    embeddings = encode_clip_batch([item['image'] for item in to_encode])
+                clip_encoded += len(to_encode)
+                for item, emb in zip(to_encode, embeddings):
+                    cache.put(CLIP_MODEL_NAME, clip_version(), item['digest'], emb)
+                    pending_clip.append((item['img'], emb, item['digest'], clip_key))
+                    written.add(item['img']['rowid'])
+            
+            # Stage 2b: text - skip rows whose text hash and model are unchanged
+            text_rows = []
+            for item in loaded:
+                img = item['img']
+                if item['status'] == 'error':
+                    continue
+                text = text_content_for(img)
+                digest = content_hash(text.encode('utf-8'))
+                unchanged = img['has_text'] and (
+                    img.get('text_embedding_hash') is None
+                    or (img.get('text_embedding_hash') == digest and img.get('text_embedding_model') == text_key)
+                )
+                if text and (force or not unchanged):
+                    text_rows.append((img, text, digest))
+            
+            if text_rows:
+                texts = [text for _, text, _ in text_rows]
+                if _service is not None:
+                    embeddings = _service.embed_texts(texts)
+                else:
+                    embeddings = encode_text_batch(texts, batch_size)
+                for (img, _, digest), emb in zip(text_rows, embeddings):
+                    pending_text.append((img, emb, digest, text_key))
+                    written.add(img['rowid'])
+            
+            batch_errors = sum(1 for item in loaded if item['status'] == 'error')
+            success_count += len(written)
+            skip_count += len(batch) - len(written) - batch_errors
+            pending_since_commit += len(batch)
+            
+            if pending_since_commit >= commit_every:
+                flush(batch[-1]['rowid'])
+            
+            done = batch_start + len(batch)
+            elapsed = time.time() - start_time
+            print(f"[{done}/{len(images)}] {done / elapsed:.1f} images/sec "
+                  f"(CLIP forward: {clip_encoded}, skipped: {skip_count})")
         
-        # Save to database
-        if clip_emb is not None or text_emb is not None:
-            save_embeddings(profile_id, clip_emb, text_emb)
-            success_count += 1
-            print(f"  ✓ Saved to database")
+        if images:
+            flush(images[-1]['rowid'])
+    
+    # Completed runs do not need a checkpoint
+    if checkpoint_path(advisor_id).exists():
+        checkpoint_path(advisor_id).unlink()
+    
+    elapsed = time.time() - start_time
+    rate = len(images) / elapsed if elapsed > 0 else 0.0
     
     print("\n" + "=" * 60)
     print("Summary")
@@ -290,10 +581,40 @@ def compute_all_embeddings(advisor_id: str = None, force: bool = False):
     print(f"Processed: {success_count}")
     print(f"Skipped:   {skip_count}")
     print(f"Errors:    {error_count}")
+    print(f"Elapsed:   {elapsed:.1f}s ({rate:.1f} images/sec, {clip_encoded} CLIP forward passes)")
     print("=" * 60 + "\n")
+    
+    cache_stats = get_embedding_cache().get_stats()
+    print(f"[INFO] Embedding cache: {cache_stats['memory_hits'] + cache_stats['disk_hits']} hits, "
+          f"{cache_stats['misses']} misses (hit rate {cache_stats['hit_rate']:.0%})")
+
+
+def build_ann_indexes(advisor_id: str = None):
+    """Build and persist IVF indexes over embedding and text_embedding"""
+    from mondrian.ann_index import ANN_MIN_ROWS, build_ann_index
+    
+    conn = sqlite3.connect(DB_PATH)
+    if advisor_id and advisor_id != 'all':
+        advisors = [advisor_id]
+    else:
+        advisors = [row[0] for row in conn.execute(
+            "SELECT DISTINCT advisor_id FROM dimensional_profiles WHERE advisor_id IS NOT NULL"
+        ).fetchall()]
+    conn.close()
+    
+    for advisor in advisors:
+        for column in ('embedding', 'text_embedding'):
+            path = build_ann_index(str(DB_PATH), advisor, column)
+            if path is None:
+                print(f"[INFO] ANN index {advisor}/{column}: no vectors, skipped")
+            else:
+                print(f"[INFO] ANN index {advisor}/{column}: {path}")
+    
+    print(f"[INFO] ANN indexes are used by the services once an advisor has >= {ANN_MIN_ROWS} images")
 
 
 def main():
+    global _service
     parser = argparse.ArgumentParser(description="Compute CLIP and text embeddings for advisor images")
     parser.add_argument('--advisor', type=str, default='ansel',
                         help='Advisor ID (ansel, okeefe, mondrian, all)')
@@ -301,6 +622,26 @@ def main():
                         help='Only verify embedding status, do not compute')
     parser.add_argument('--force', action='store_true',
                         help='Recompute even if embeddings exist')
+    parser.add_argument('--build-ann-only', action='store_true',
+                        help='Only rebuild the ANN indexes from stored embeddings')
+    parser.add_argument('--no-ann', action='store_true',
+                        help='Skip building ANN indexes after computing embeddings')
+    parser.add_argument('--batch-size', type=int, default=32,
+                        help='Images/texts per encoder batch (default: 32)')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='Image decoding worker threads (default: 4)')
+    parser.add_argument('--commit-every', type=int, default=256,
+                        help='Images per write transaction and checkpoint (default: 256)')
+    parser.add_argument('--no-resume', action='store_true',
+                        help='Ignore any checkpoint from an interrupted run')
+    parser.add_argument('--migrate-to-store', action='store_true',
+                        help='Move existing embedding BLOBs into the memory-mapped embedding store')
+    parser.add_argument('--compact-store', action='store_true',
+                        help='Rewrite the embedding stores without superseded slots (after re-embeds)')
+    parser.add_argument('--service-url', type=str, default=None,
+                        help='Embedding service URL (default: EMBEDDING_SERVICE_URL or http://127.0.0.1:5008)')
+    parser.add_argument('--no-service', action='store_true',
+                        help='Load CLIP/MiniLM in this process even if the embedding service is running')
     args = parser.parse_args()
     
     print("=" * 60)
@@ -312,9 +653,36 @@ def main():
     
     if args.verify_only:
         verify_embeddings(args.advisor)
+    elif args.build_ann_only:
+        build_ann_indexes(args.advisor)
+    elif args.migrate_to_store:
+        migrate_blobs_to_store(args.advisor)
+        verify_embeddings(args.advisor)
+    elif args.compact_store:
+        compact_stores(args.advisor)
+        verify_embeddings(args.advisor)
+        if not args.no_ann:
+            build_ann_indexes(args.advisor)
     else:
-        compute_all_embeddings(args.advisor, force=args.force)
+        if not args.no_service:
+            _service = get_embedding_client(args.service_url)
+            if _service is not None:
+                print(f"[INFO] Encoding via embedding service at {_service.url}")
+        compute_all_embeddings(
+            args.advisor,
+            force=args.force,
+            batch_size=args.batch_size,
+            workers=args.workers,
+            commit_every=args.commit_every,
+            resume=not args.no_resume
+        )
         verify_embeddings(args.advisor)
+        if not args.no_ann:
+            build_ann_indexes(args.advisor)
+
+        advisor = None if args.advisor == 'all' else args.advisor
+        count = refresh_dimension_exemplars(str(DB_PATH), advisor)
+        print(f"[INFO] Materialized {count} dimension exemplars")
 
 
 if __name__ == "__main__":
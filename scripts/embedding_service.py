@@ -1,5 +1,25 @@
-# Embedding Service Script (Canonical)
+#!/usr/bin/env python3
+"""
+Embedding Service launcher
 
-This is the canonical embedding service script, moved from mondrian/embedding_service.py as part of project consolidation. All logic is preserved.
+Starts mondrian/embedding_service.py: CLIP (images) and all-MiniLM-L6-v2
+(text) loaded once, concurrent requests micro-batched. The advisor service,
+scripts/compute_embeddings.py and scripts/import_book_passages.py use it
+automatically when it is running (EMBEDDING_SERVICE_URL overrides the
+default http://127.0.0.1:5008).
 
-[...existing code from mondrian/embedding_service.py...]
+Usage:
+    python3 scripts/embedding_service.py
+    python3 scripts/embedding_service.py --port 5008 --batch-window-ms 5 --max-batch 64
+    python3 scripts/embedding_service.py --socket /tmp/mondrian-embedding.sock
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from mondrian.embedding_service import main
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Export the CLIP vision and text towers to ONNX
+
+Writes models/onnx/clip-vit-base-patch32/{vision,text}.onnx for
+mondrian/clip_onnx.py, which runs them with ONNX Runtime on nodes without
+CUDA. The graphs include the projection heads, so their outputs are the same
+image_embeds/text_embeds as CLIPModel.get_image_features/get_text_features
+(unnormalized; the encoder normalizes). Batch (and text sequence) axes are
+dynamic.
+
+--int8 additionally writes vision.int8.onnx/text.int8.onnx with dynamic
+(weight-only) int8 quantization of the MatMul/Gemm layers, roughly 4x smaller.
+Check its parity with scripts/benchmark_clip_onnx.py before enabling
+clip_onnx_int8 in model_config.json.
+
+Requires torch, transformers and onnx (see requirements_linux.txt); serving
+needs only onnxruntime.
+
+Usage:
+    python scripts/export_clip_onnx.py
+    python scripts/export_clip_onnx.py --int8
+    python scripts/export_clip_onnx.py --output-dir /tmp/clip-onnx --opset 17
+"""
+
+import sys
+import json
+import argparse
+from datetime import datetime
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from mondrian.clip_onnx import CLIP_MODEL_NAME, IMAGE_SIZE, ONNX_DIR, onnx_paths
+from mondrian.embedding_cache import package_version
+
+
+def export(output_dir: Path, opset: int):
+    import torch
+    from transformers import CLIPModel
+
+    class VisionTower(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, pixel_values):
+            return self.model.get_image_features(pixel_values=pixel_values)
+
+    class TextTower(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask):
+            return self.model.get_text_features(input_ids=input_ids, attention_mask=attention_mask)
+
+    model = CLIPModel.from_pretrained(CLIP_MODEL_NAME).eval()
+    vision_path, text_path = onnx_paths(output_dir)
+
+    print(f"[INFO] Exporting vision tower to {vision_path}")
+    with torch.no_grad():
+        torch.onnx.export(
+            VisionTower(model),
+            (torch.zeros(1, 3, IMAGE_SIZE, IMAGE_SIZE),),
+            str(vision_path),
+            input_names=['pixel_values'],
+            output_names=['image_embeds'],
+            dynamic_axes={'pixel_values': {0: 'batch'}, 'image_embeds': {0: 'batch'}},
+            opset_version=opset,
+        )
+
+    print(f"[INFO] Exporting text tower to {text_path}")
+    tokens = torch.ones(1, 8, dtype=torch.int64)
+    with torch.no_grad():
+        torch.onnx.export(
+            TextTower(model),
+            (tokens, torch.ones_like(tokens)),
+            str(text_path),
+            input_names=['input_ids', 'attention_mask'],
+            output_names=['text_embeds'],
+            dynamic_axes={
+                'input_ids': {0: 'batch', 1: 'sequence'},
+                'attention_mask': {0: 'batch', 1: 'sequence'},
+                'text_embeds': {0: 'batch'},
+            },
+            opset_version=opset,
+        )
+
+
+def quantize(output_dir: Path):
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    for src, dst in zip(onnx_paths(output_dir), onnx_paths(output_dir, quantized=True)):
+        print(f"[INFO] Quantizing {src.name} -> {dst.name} (dynamic int8)")
+        quantize_dynamic(str(src), str(dst), weight_type=QuantType.QInt8)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export CLIP to ONNX for CPU inference")
+    parser.add_argument('--output-dir', type=Path, default=ONNX_DIR)
+    parser.add_argument('--opset', type=int, default=17)
+    parser.add_argument('--int8', action='store_true', help='Also write int8 dynamically quantized models')
+    args = parser.parse_args()
+
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+    export(args.output_dir, args.opset)
+    if args.int8:
+        quantize(args.output_dir)
+
+    info = {
+        'model': CLIP_MODEL_NAME,
+        'transformers': package_version('transformers'),
+        'torch': package_version('torch'),
+        'onnxruntime': package_version('onnxruntime'),
+        'opset': args.opset,
+        'int8': args.int8,
+        'exported_at': datetime.now().isoformat(),
+    }
+    (args.output_dir / 'export.json').write_text(json.dumps(info, indent=2))
+
+    for path in sorted(args.output_dir.glob('*.onnx')):
+        print(f"[INFO] {path.name}: {path.stat().st_size / 1e6:.1f} MB")
+    print("[INFO] Verify with: python scripts/benchmark_clip_onnx.py")
+
+
+if __name__ == "__main__":
+    main()
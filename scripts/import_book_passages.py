@@ -20,23 +20,55 @@ import numpy as np
 
 # Project paths
 PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
 DB_PATH = PROJECT_ROOT / "mondrian.db"
 PASSAGES_DIR = PROJECT_ROOT / "training" / "book_passages"
 
 
+_text_model = None
+
+
 def compute_text_embedding(text: str) -> np.ndarray:
-    """Compute sentence-transformer embedding for text passage."""
+    """Compute sentence-transformer embedding for text passage (cached by text hash).
+    
+    Uses the embedding service when it is running, otherwise loads the model once.
+    """
+    global _text_model
     try:
-        from sentence_transformers import SentenceTransformer
+        from mondrian.embedding_cache import get_embedding_cache, content_hash, package_version
+        from mondrian.embedding_client import get_embedding_client
         
-        # Use same model as image text embeddings for consistency
-        model = SentenceTransformer('all-MiniLM-L6-v2')
-        embedding = model.encode(text, normalize_embeddings=True)
-        return embedding.astype(np.float32)
+        cache = get_embedding_cache()
+        digest = content_hash(text.encode('utf-8'))
+        
+        client = get_embedding_client()
+        if client is not None:
+            # Cached under the model key the service reports, not the local package version
+            model_version = client.model_keys.get('text', '').rpartition('@')[2]
+            cached = cache.get('all-MiniLM-L6-v2', model_version, digest) if model_version else None
+            if cached is not None:
+                return cached
+            embedding = client.embed_texts([text])[0]
+            model_version = client.model_keys.get('text', '').rpartition('@')[2]
+        else:
+            model_version = package_version('sentence-transformers')
+            cached = cache.get('all-MiniLM-L6-v2', model_version, digest)
+            if cached is not None:
+                return cached
+            if _text_model is None:
+                from sentence_transformers import SentenceTransformer
+                
+                # Use same model as image text embeddings for consistency
+                _text_model = SentenceTransformer('all-MiniLM-L6-v2')
+            embedding = _text_model.encode(text, normalize_embeddings=True).astype(np.float32)
+        if model_version:
+            cache.put('all-MiniLM-L6-v2', model_version, digest, embedding)
+        return embedding
     
     except ImportError:
-        print("Error: sentence-transformers not installed")
+        print("Error: sentence-transformers not installed (and no embedding service running)")
         print("Install with: pip install sentence-transformers")
+        print("Or start:     python3 scripts/embedding_service.py")
         sys.exit(1)
     except Exception as e:
         print(f"Error computing embedding: {e}")
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Load test /stream/<job_id>: threaded Flask server vs ASGI mode
+
+Starts the job service against a scratch database (jobs held in 'analyzing'
+under a far-future lease, so no worker touches them) once per mode and
+stream count, opens that many concurrent SSE connections and measures:
+
+- connect: time until a stream's first status_update
+- fan-out: time from a PUT /jobs/<job_id> status change until each stream
+  watching that job receives it (several rounds)
+- server memory (RSS) and thread count while all streams are open
+
+Usage:
+    python scripts/loadtest_job_streams.py
+    python scripts/loadtest_job_streams.py --streams 100 1000 5000 --jobs 50 --rounds 5
+
+ASGI mode needs uvicorn (pip install uvicorn). Opening thousands of sockets
+needs a high open-files limit; the script raises its soft limit to the hard
+limit (the server inherits it).
+"""
+
+import os
+import sys
+import time
+import sqlite3
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+import requests
+
+PROJECT_ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from mondrian.job_queue import ensure_lease_columns
+
+SERVICE = PROJECT_ROOT / 'mondrian' / 'job_service_v2.3.py'
+STATUSES = ('queued', 'pending')  # Alternated per round; neither triggers keepalives
+
+
+def create_db(path: str, jobs: int):
+    with sqlite3.connect(path) as conn:
+        conn.execute("""
+            CREATE TABLE jobs (id TEXT PRIMARY KEY, filename TEXT, status TEXT, advisor TEXT, mode TEXT,
+                               created_at TEXT, current_step TEXT, progress_percentage INTEGER, enable_rag INTEGER,
+                               prompt TEXT, llm_prompt TEXT, analysis_markdown TEXT, llm_thinking TEXT,
+                               analysis_html TEXT, advisor_bio TEXT, llm_outputs TEXT, summary_html TEXT,
+                               advisor_bio_html TEXT, model TEXT, adapter TEXT, prompt_tokens_before INTEGER,
+                               prompt_tokens_after INTEGER, last_activity TEXT, error TEXT, retry_count INTEGER DEFAULT 0)
+        """)
+        ensure_lease_columns(conn)
+        now = datetime.now()
+        conn.executemany(
+            "INSERT INTO jobs (id, filename, status, advisor, mode, created_at, current_step, progress_percentage, "
+            "enable_rag, llm_thinking, last_activity, lease_owner, lease_expires_at) "
+            "VALUES (?, ?, 'analyzing', 'ansel', 'rag', ?, 'Analyzing', 30, 1, ?, ?, 'loadtest', ?)",
+            [(f"job-{i:04d}", f"uploads/{i}.jpg", now.isoformat(), "Considering the foreground. " * 40,
+              now.isoformat(), (now + timedelta(days=1)).isoformat()) for i in range(jobs)]
+        )
+
+
+def server_usage(pid: int) -> dict:
+    """RSS (MB) and thread count of a process."""
+    status_file = Path(f"/proc/{pid}/status")
+    if status_file.exists():
+        fields = dict(line.split(':', 1) for line in status_file.read_text().splitlines() if ':' in line)
+        return {'rss_mb': int(fields['VmRSS'].split()[0]) / 1024, 'threads': int(fields['Threads'])}
+    import psutil
+    process = psutil.Process(pid)
+    return {'rss_mb': process.memory_info().rss / 2**20, 'threads': process.num_threads()}
+
+
+def start_server(mode: str, port: int, db_path: str, workdir: str) -> subprocess.Popen:
+    cmd = [sys.executable, str(SERVICE), '--port', str(port), '--db', db_path, '--host', '127.0.0.1', '--workers', '1']
+    if mode == 'asgi':
+        cmd.append('--asgi')
+    env = dict(os.environ, PYTHONPATH=str(PROJECT_ROOT.resolve()))
+    server = subprocess.Popen(cmd, cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(300):
+        try:
+            if requests.get(f"http://127.0.0.1:{port}/health", timeout=1).status_code == 200:
+                return server
+        except requests.RequestException:
+            pass
+        if server.poll() is not None:
+            raise RuntimeError(f"{mode} server exited with {server.returncode}")
+        time.sleep(0.1)
+    server.kill()
+    raise RuntimeError(f"{mode} server did not become healthy")
+
+
+async def run_streams(port: int, streams: int, jobs: int, rounds: int, usage_of) -> dict:
+    results = {'connect_ms': [], 'fanout_ms': [], 'failed': 0, 'missed': 0}
+    current = {'status': None, 'sent_at': {}, 'seen': set()}
+    connections = []
+
+    async def stream(i: int, connected: asyncio.Event):
+        job_id = f"job-{i % jobs:04d}"
+        start = time.perf_counter()
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port), 30)
+            connections.append(writer)
+            writer.write(f"GET /stream/{job_id} HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\n"
+                         f"Accept: text/event-stream\r\n\r\n".encode())
+            await writer.drain()
+            while True:
+                line = await asyncio.wait_for(reader.readline(), 60)
+                if not line:
+                    return
+                if line.startswith(b'data:') and b'status_update' in line:
+                    break
+        except (OSError, asyncio.TimeoutError):
+            results['failed'] += 1
+            connected.set()
+            return
+        results['connect_ms'].append((time.perf_counter() - start) * 1000)
+        connected.set()
+
+        while True:
+            line = await reader.readline()
+            if not line:
+                return
+            status = current['status']
+            if status and line.startswith(b'data:') and f'"status": "{status}"'.encode() in line and i not in current['seen']:
+                current['seen'].add(i)
+                results['fanout_ms'].append((time.perf_counter() - current['sent_at'][job_id]) * 1000)
+
+    tasks = []
+    for batch_start in range(0, streams, 200):
+        batch = [asyncio.Event() for _ in range(batch_start, min(streams, batch_start + 200))]
+        tasks += [asyncio.ensure_future(stream(batch_start + k, event)) for k, event in enumerate(batch)]
+        await asyncio.gather(*(event.wait() for event in batch))
+
+    await asyncio.sleep(2)
+    results.update(usage_of())
+
+    loop = asyncio.get_running_loop()
+    session = requests.Session()
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        for r in range(rounds):
+            status = STATUSES[r % 2]
+            current.update(status=status, sent_at={}, seen=set())
+
+            def put(job_id):
+                current['sent_at'][job_id] = time.perf_counter()
+                session.put(f"http://127.0.0.1:{port}/jobs/{job_id}", json={'status': status}, timeout=30)
+
+            await asyncio.gather(*(loop.run_in_executor(pool, put, f"job-{j:04d}") for j in range(min(jobs, streams))))
+            deadline = time.perf_counter() + 30
+            expected = streams - results['failed']
+            while len(current['seen']) < expected and time.perf_counter() < deadline:
+                await asyncio.sleep(0.05)
+            results['missed'] += expected - len(current['seen'])
+            await asyncio.sleep(0.5)
+
+    for writer in connections:
+        writer.close()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test /stream: threaded Flask server vs ASGI mode")
+    parser.add_argument('--streams', type=int, nargs='+', default=[100, 1000, 5000])
+    parser.add_argument('--modes', nargs='+', default=['threaded', 'asgi'], choices=['threaded', 'asgi'])
+    parser.add_argument('--jobs', type=int, default=50, help='Jobs the streams are spread over')
+    parser.add_argument('--rounds', type=int, default=5, help='Status changes broadcast per run')
+    parser.add_argument('--port', type=int, default=5405)
+    args = parser.parse_args()
+
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ImportError, ValueError, OSError):
+        pass
+
+    print("=" * 104)
+    print(f"/stream load test: {args.jobs} jobs, {args.rounds} fan-out rounds per run")
+    print("=" * 104)
+    print(f"{'mode':<10} {'streams':>8} {'failed':>7} {'conn p50':>9} {'conn p99':>9} {'fan p50':>9} {'fan p99':>9} "
+          f"{'missed':>7} {'RSS MB':>8} {'KB/strm':>8} {'threads':>8}")
+
+    def pct(values, q):
+        return float(np.percentile(values, q)) if values else float('nan')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in args.modes:
+            for streams in args.streams:
+                db_path = str(Path(tmp) / f"{mode}-{streams}.db")
+                create_db(db_path, args.jobs)
+                server = start_server(mode, args.port, db_path, tmp)
+                try:
+                    baseline = server_usage(server.pid)['rss_mb']
+                    r = asyncio.run(run_streams(args.port, streams, args.jobs, args.rounds,
+                                                lambda: server_usage(server.pid)))
+                finally:
+                    server.terminate()
+                    try:
+                        server.wait(timeout=10)
+                    except subprocess.TimeoutExpired:
+                        server.kill()
+                        server.wait()
+                per_stream_kb = (r['rss_mb'] - baseline) * 1024 / max(1, streams - r['failed'])
+                print(f"{mode:<10} {streams:>8} {r['failed']:>7} {pct(r['connect_ms'], 50):>9.1f} "
+                      f"{pct(r['connect_ms'], 99):>9.1f} {pct(r['fanout_ms'], 50):>9.1f} {pct(r['fanout_ms'], 99):>9.1f} "
+                      f"{r['missed']:>7} {r['rss_mb']:>8.1f} {per_stream_kb:>8.1f} {r['threads']:>8}")
+
+    print("=" * 104)
+    print("Latencies in ms. conn = until the first status_update; fan = PUT /jobs/<id> until each watching")
+    print("stream receives it; missed = stream/round pairs that did not arrive within 30s; KB/strm = RSS")
+    print("growth over the idle server per open stream")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Database Migration: Move Job Payloads to the Results Store
+
+Copies the result payloads of existing jobs from the jobs columns into
+result_blobs/job_results (see mondrian/job_results.py) and clears the
+columns, compresses blobs stored uncompressed, then reports how much the
+content addressing and the compression saved.
+
+The job service reads jobs that were not migrated from the old columns, so
+this can run at any time (it skips jobs already in the store).
+
+Usage:
+    python scripts/migrate_job_results.py --db mondrian.db
+    python scripts/migrate_job_results.py --db mondrian.db --vacuum
+"""
+
+import json
+import sqlite3
+import sys
+import os
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mondrian.job_results import (
+    RESULT_FIELDS, compress_result_blobs, ensure_results_schema, format_analysis_markdown, results_stats,
+    save_job_results
+)
+
+
+def legacy_results(advisor: str, row: dict) -> dict:
+    """The store's fields for a job's old payload columns."""
+    results = {field: row[field] for field in RESULT_FIELDS if row.get(field)}
+    try:
+        outputs = json.loads(results.get('llm_outputs') or 'null')
+    except ValueError:
+        outputs = None
+    if isinstance(outputs, dict) and isinstance(outputs.get('response'), str):
+        # analysis_markdown written by the worker is rebuilt from the summary and response
+        expected = format_analysis_markdown(advisor or '', outputs.get('summary', ''), outputs['response'])
+        if results.get('analysis_markdown') == expected:
+            del results['analysis_markdown']
+    return results
+
+
+def migrate_job_results(db_path="mondrian.db", batch_size=200, vacuum=False):
+    """
+    Move the payloads of all jobs to the results store.
+
+    Args:
+        db_path: Path to SQLite database
+        batch_size: Jobs per transaction
+        vacuum: VACUUM afterwards to return the freed pages to the filesystem
+
+    Returns:
+        Number of jobs migrated
+    """
+    print(f"[INFO] Migrating database: {db_path}")
+
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    ensure_results_schema(conn)
+
+    compressed = compress_result_blobs(conn, batch_size)
+    if compressed:
+        print(f"[INFO] Compressed {compressed} blobs stored uncompressed")
+
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+    payload_columns = [field for field in RESULT_FIELDS if field in columns]
+    if not payload_columns:
+        print("[INFO] jobs has no payload columns - nothing to migrate")
+        conn.close()
+        return 0
+
+    any_payload = ' OR '.join(f"{column} IS NOT NULL" for column in payload_columns)
+    legacy_bytes = conn.execute(
+        f"SELECT COALESCE(SUM({' + '.join(f'COALESCE(LENGTH(CAST({c} AS BLOB)), 0)' for c in payload_columns)}), 0) "
+        f"FROM jobs WHERE {any_payload}"
+    ).fetchone()[0]
+    print(f"[INFO] Payload columns: {', '.join(payload_columns)} ({legacy_bytes / 1024:.1f} KB)")
+
+    migrated = 0
+    while True:
+        rows = conn.execute(
+            f"""SELECT id, advisor, {', '.join(payload_columns)} FROM jobs
+                WHERE ({any_payload})
+                  AND NOT EXISTS (SELECT 1 FROM job_results r WHERE r.job_id = jobs.id)
+                LIMIT ?""",
+            (batch_size,)
+        ).fetchall()
+        if not rows:
+            break
+        for row in rows:
+            results = legacy_results(row['advisor'], dict(row))
+            if results:
+                save_job_results(conn, row['id'], results)
+            conn.execute(
+                f"UPDATE jobs SET {', '.join(f'{c} = NULL' for c in payload_columns)} WHERE id = ?", (row['id'],)
+            )
+        conn.commit()
+        migrated += len(rows)
+        print(f"[INFO] Migrated {migrated} jobs...")
+
+    stats = results_stats(conn)
+    print(f"[INFO] {stats['references']} payloads in {stats['blobs']} blobs")
+    print(f"[INFO] Referenced: {stats['referenced_bytes'] / 1024:.1f} KB, "
+          f"stored: {stats['stored_bytes'] / 1024:.1f} KB, "
+          f"compressed: {stats['compressed_bytes'] / 1024:.1f} KB")
+    if legacy_bytes:
+        print(f"[INFO] Payload text {legacy_bytes / 1024:.1f} KB -> {stats['compressed_bytes'] / 1024:.1f} KB "
+              f"({100 * (1 - stats['compressed_bytes'] / legacy_bytes):.0f}% smaller)")
+
+    if vacuum:
+        print("[INFO] Vacuuming...")
+        conn.execute("VACUUM")
+
+    conn.close()
+    print(f"\n[SUCCESS] Migrated {migrated} jobs")
+    return migrated
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Move job payloads from the jobs table to the results store")
+    parser.add_argument("--db", type=str, default="mondrian.db", help="Database path")
+    parser.add_argument("--batch-size", type=int, default=200, help="Jobs per transaction")
+    parser.add_argument("--vacuum", action="store_true", help="VACUUM afterwards to shrink the database file")
+    args = parser.parse_args()
+
+    migrate_job_results(args.db, args.batch_size, args.vacuum)
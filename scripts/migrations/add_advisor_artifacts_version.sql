@@ -0,0 +1,85 @@
+-- Migration: Add change counter for advisor prompt/RAG artifacts
+-- Purpose: Lets the advisor artifact cache (mondrian/advisor_cache.py) tell
+--          admin writes to config/advisors/dimensional_profiles/book_passages
+--          apart from job traffic, which also moves PRAGMA data_version
+-- Date: 2026-10-18
+-- Note: mondrian/advisor_cache.py applies the same statements on first use
+
+CREATE TABLE IF NOT EXISTS advisor_artifacts_version (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version INTEGER NOT NULL DEFAULT 0
+);
+
+INSERT OR IGNORE INTO advisor_artifacts_version (id, version) VALUES (1, 0);
+
+CREATE TRIGGER IF NOT EXISTS trg_advisor_artifacts_config_insert
+AFTER INSERT ON config
+BEGIN
+    UPDATE advisor_artifacts_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_advisor_artifacts_config_update
+AFTER UPDATE ON config
+BEGIN
+    UPDATE advisor_artifacts_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_advisor_artifacts_config_delete
+AFTER DELETE ON config
+BEGIN
+    UPDATE advisor_artifacts_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_advisor_artifacts_advisors_insert
+AFTER INSERT ON advisors
+BEGIN
+    UPDATE advisor_artifacts_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_advisor_artifacts_advisors_update
+AFTER UPDATE ON advisors
+BEGIN
+    UPDATE advisor_artifacts_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_advisor_artifacts_advisors_delete
+AFTER DELETE ON advisors
+BEGIN
+    UPDATE advisor_artifacts_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_advisor_artifacts_dimensional_profiles_insert
+AFTER INSERT ON dimensional_profiles
+BEGIN
+    UPDATE advisor_artifacts_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_advisor_artifacts_dimensional_profiles_update
+AFTER UPDATE ON dimensional_profiles
+BEGIN
+    UPDATE advisor_artifacts_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_advisor_artifacts_dimensional_profiles_delete
+AFTER DELETE ON dimensional_profiles
+BEGIN
+    UPDATE advisor_artifacts_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_advisor_artifacts_book_passages_insert
+AFTER INSERT ON book_passages
+BEGIN
+    UPDATE advisor_artifacts_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_advisor_artifacts_book_passages_update
+AFTER UPDATE ON book_passages
+BEGIN
+    UPDATE advisor_artifacts_version SET version = version + 1 WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_advisor_artifacts_book_passages_delete
+AFTER DELETE ON book_passages
+BEGIN
+    UPDATE advisor_artifacts_version SET version = version + 1 WHERE id = 1;
+END;
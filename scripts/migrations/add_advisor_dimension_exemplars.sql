@@ -0,0 +1,42 @@
+-- Migration: Materialize the best reference image per dimension
+-- Purpose: Case-study retrieval reads one row per (advisor, dimension) from
+--          advisor_dimension_exemplars instead of running a full-row
+--          ORDER BY query per dimension and stat()ing image files per request
+-- Date: 2026-10-18
+-- Note: Rows are written by scripts/compute_embeddings.py, or on the first
+--       request after dimensional_profiles changes (mondrian/rag_retrieval.py
+--       applies the same statements via ensure_exemplar_schema)
+
+CREATE TABLE IF NOT EXISTS advisor_dimension_exemplars (
+    advisor_id TEXT NOT NULL,
+    dimension TEXT NOT NULL,
+    profile_id TEXT NOT NULL,
+    score REAL NOT NULL,
+    image_exists INTEGER NOT NULL DEFAULT 1,
+    PRIMARY KEY (advisor_id, dimension)
+);
+
+CREATE TABLE IF NOT EXISTS advisor_dimension_exemplars_state (
+    advisor_id TEXT PRIMARY KEY,
+    source_version TEXT NOT NULL,
+    built_at TEXT NOT NULL
+);
+
+-- Covering indexes: top-scoring rows per advisor without touching the table
+CREATE INDEX IF NOT EXISTS idx_dimensional_profiles_advisor_composition_score
+ON dimensional_profiles (advisor_id, composition_score DESC, id, image_path);
+
+CREATE INDEX IF NOT EXISTS idx_dimensional_profiles_advisor_depth_perspective_score
+ON dimensional_profiles (advisor_id, depth_perspective_score DESC, id, image_path);
+
+CREATE INDEX IF NOT EXISTS idx_dimensional_profiles_advisor_emotional_impact_score
+ON dimensional_profiles (advisor_id, emotional_impact_score DESC, id, image_path);
+
+CREATE INDEX IF NOT EXISTS idx_dimensional_profiles_advisor_focus_sharpness_score
+ON dimensional_profiles (advisor_id, focus_sharpness_score DESC, id, image_path);
+
+CREATE INDEX IF NOT EXISTS idx_dimensional_profiles_advisor_lighting_score
+ON dimensional_profiles (advisor_id, lighting_score DESC, id, image_path);
+
+CREATE INDEX IF NOT EXISTS idx_dimensional_profiles_advisor_visual_balance_score
+ON dimensional_profiles (advisor_id, visual_balance_score DESC, id, image_path);
@@ -0,0 +1,42 @@
+-- Migration: Add per-advisor change counters for dimensional_profiles
+-- Purpose: Lets the in-memory embedding index (mondrian/embedding_index.py)
+--          detect writes from any process and reload only the matrices of
+--          the advisors that were written
+-- Date: 2026-10-18
+-- Note: mondrian/embedding_index.py applies the same statements on first use.
+--       Replaces the database-wide dimensional_profiles_version counter
+
+DROP TRIGGER IF EXISTS trg_dimensional_profiles_version_insert;
+DROP TRIGGER IF EXISTS trg_dimensional_profiles_version_update;
+DROP TRIGGER IF EXISTS trg_dimensional_profiles_version_delete;
+DROP TABLE IF EXISTS dimensional_profiles_version;
+
+CREATE TABLE IF NOT EXISTS dimensional_profiles_advisor_version (
+    advisor_id TEXT PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TRIGGER IF NOT EXISTS trg_dimensional_profiles_advisor_version_insert
+AFTER INSERT ON dimensional_profiles
+BEGIN
+    INSERT OR IGNORE INTO dimensional_profiles_advisor_version (advisor_id) VALUES (COALESCE(NEW.advisor_id, ''));
+    UPDATE dimensional_profiles_advisor_version SET version = version + 1
+    WHERE advisor_id = COALESCE(NEW.advisor_id, '');
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_dimensional_profiles_advisor_version_update
+AFTER UPDATE ON dimensional_profiles
+BEGIN
+    INSERT OR IGNORE INTO dimensional_profiles_advisor_version (advisor_id) VALUES (COALESCE(OLD.advisor_id, ''));
+    INSERT OR IGNORE INTO dimensional_profiles_advisor_version (advisor_id) VALUES (COALESCE(NEW.advisor_id, ''));
+    UPDATE dimensional_profiles_advisor_version SET version = version + 1
+    WHERE advisor_id IN (COALESCE(OLD.advisor_id, ''), COALESCE(NEW.advisor_id, ''));
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_dimensional_profiles_advisor_version_delete
+AFTER DELETE ON dimensional_profiles
+BEGIN
+    INSERT OR IGNORE INTO dimensional_profiles_advisor_version (advisor_id) VALUES (COALESCE(OLD.advisor_id, ''));
+    UPDATE dimensional_profiles_advisor_version SET version = version + 1
+    WHERE advisor_id = COALESCE(OLD.advisor_id, '');
+END;
@@ -0,0 +1,37 @@
+-- Migration: Indexes for the hot queries
+-- Purpose: The job claim, GET /jobs, the queue monitor, SSE polling and RAG
+--          retrieval read jobs, dimensional_profiles and book_passages by
+--          status, advisor or image with an ordering; these indexes turn
+--          each into an index search instead of a table scan and sort
+-- Date: 2026-10-18
+-- Note: The job service applies the same statements on startup
+--       (mondrian/job_queue.py ensure_lease_columns,
+--       mondrian/query_indexes.py ensure_query_indexes), as does
+--       init_database.py. test/unit/test_query_plans.py checks the plans.
+
+-- Job claim: runnable statuses oldest first, covering the claim columns
+-- (replaces idx_jobs_status_created_at)
+CREATE INDEX IF NOT EXISTS idx_jobs_claim
+ON jobs (status, created_at, retry_count, lease_expires_at, id);
+DROP INDEX IF EXISTS idx_jobs_status_created_at;
+
+-- GET /jobs and the queue monitor: newest first
+CREATE INDEX IF NOT EXISTS idx_jobs_created_at
+ON jobs (created_at);
+
+-- Top reference images per advisor by mean dimension score
+CREATE INDEX IF NOT EXISTS idx_dimensional_profiles_advisor_overall
+ON dimensional_profiles (advisor_id, ((
+    COALESCE(composition_score, 0) + COALESCE(lighting_score, 0) +
+    COALESCE(focus_sharpness_score, 0) + COALESCE(color_harmony_score, 0) +
+    COALESCE(subject_isolation_score, 0) + COALESCE(depth_perspective_score, 0) +
+    COALESCE(visual_balance_score, 0) + COALESCE(emotional_impact_score, 0)
+) / 8.0));
+
+-- Latest profile for the user's image
+CREATE INDEX IF NOT EXISTS idx_dimensional_profiles_image_path
+ON dimensional_profiles (image_path, created_at);
+
+-- Top book passages per advisor
+CREATE INDEX IF NOT EXISTS idx_book_passages_advisor_relevance
+ON book_passages (advisor_id, relevance_score DESC);
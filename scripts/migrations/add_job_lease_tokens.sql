@@ -0,0 +1,9 @@
+-- Migration: Fencing token for job leases
+-- Purpose: claim_next_job increments lease_token on every claim and workers
+--          condition all their writes on it, so a worker whose lease lapsed
+--          (and whose job was re-run elsewhere) cannot overwrite the result
+-- Date: 2026-10-18
+-- Note: The job service adds this on startup as well
+--       (mondrian/job_queue.py ensure_lease_columns)
+
+ALTER TABLE jobs ADD COLUMN lease_token INTEGER DEFAULT 0;
@@ -0,0 +1,14 @@
+-- Migration: Worker leases on jobs
+-- Purpose: Job workers claim a job with one UPDATE ... RETURNING that sets
+--          lease_owner/lease_expires_at, so several workers (threads or
+--          processes) can share the queue without double-processing a job;
+--          an 'analyzing' job whose lease expired is picked up again
+-- Date: 2026-10-18
+-- Note: The job service adds these on startup as well
+--       (mondrian/job_queue.py ensure_lease_columns)
+
+ALTER TABLE jobs ADD COLUMN lease_owner TEXT DEFAULT NULL;
+ALTER TABLE jobs ADD COLUMN lease_expires_at TEXT DEFAULT NULL;
+
+-- Queue scan: runnable statuses oldest first
+CREATE INDEX IF NOT EXISTS idx_jobs_status_created_at ON jobs(status, created_at);
@@ -0,0 +1,31 @@
+-- Migration: Content-addressed job results
+-- Purpose: Move the large per-job payloads (analysis/summary HTML, advisor
+--          bio, thinking, prompts, model output) out of the jobs row, so
+--          status polls and the job queue's scans read small rows, and
+--          store each distinct text once (a job's prompt and llm_prompt,
+--          the response inside llm_outputs and analysis_markdown, every
+--          job's copy of an advisor bio)
+-- Date: 2026-10-18
+-- Note: The job service and init_database.py create these tables on
+--       startup (mondrian/job_results.py ensure_results_schema). Existing
+--       payloads stay readable from the jobs columns; move them with
+--       python scripts/migrate_job_results.py
+
+-- Each distinct text once, keyed by its SHA-256
+CREATE TABLE IF NOT EXISTS result_blobs (
+    hash TEXT PRIMARY KEY,
+    content TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at TEXT
+);
+
+-- Which text each job's field holds
+CREATE TABLE IF NOT EXISTS job_results (
+    job_id TEXT NOT NULL,
+    field TEXT NOT NULL,
+    blob_hash TEXT NOT NULL REFERENCES result_blobs(hash),
+    PRIMARY KEY (job_id, field)
+) WITHOUT ROWID;
+
+-- Garbage collection of unreferenced blobs
+CREATE INDEX IF NOT EXISTS idx_job_results_blob ON job_results (blob_hash);
@@ -0,0 +1,13 @@
+-- Migration: Compressed job results
+-- Purpose: Store result blobs (analysis HTML with inline base64 images,
+--          summary and bio HTML, prompts, model output) gzip-compressed,
+--          and send the stored bytes as they are to clients that accept
+--          gzip (GET /analysis, /summary)
+-- Date: 2026-10-18
+-- Note: The job service adds the column on startup
+--       (mondrian/job_results.py ensure_results_schema). New blobs are
+--       compressed when written; compress existing ones with
+--       python scripts/migrate_job_results.py
+
+-- NULL: content is the text itself; 'gzip': content is the gzip of it
+ALTER TABLE result_blobs ADD COLUMN encoding TEXT DEFAULT NULL;
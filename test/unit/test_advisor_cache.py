@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Advisor Artifact Cache Unit Test
+================================
+
+Verifies that cached prompt/RAG artifacts are served without touching the
+loader, survive unrelated writes (job traffic), and are dropped when the
+tracked tables change or /cache/invalidate is called. Runs against a
+temporary SQLite database.
+
+Usage:
+    python3 -m pytest test/unit/test_advisor_cache.py
+"""
+
+import sqlite3
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from mondrian.advisor_cache import AdvisorArtifactCache
+
+
+def _create_db(path):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE config (key TEXT PRIMARY KEY, value TEXT)")
+    conn.execute("CREATE TABLE advisors (id TEXT PRIMARY KEY, prompt TEXT)")
+    conn.execute("CREATE TABLE jobs (id TEXT PRIMARY KEY, status TEXT)")
+    conn.execute("INSERT INTO config VALUES ('system_prompt', 'v1')")
+    conn.execute("INSERT INTO advisors VALUES ('ansel', 'zone system')")
+    conn.commit()
+    conn.close()
+
+
+def _loader(db_path, calls):
+    def load():
+        calls.append(1)
+        with sqlite3.connect(db_path) as conn:
+            return conn.execute("SELECT value FROM config WHERE key = 'system_prompt'").fetchone()[0]
+    return load
+
+
+def test_hits_skip_loader_until_tracked_table_changes(tmp_path):
+    db_path = str(tmp_path / 'cache.db')
+    _create_db(db_path)
+    cache = AdvisorArtifactCache(db_path, check_interval=0)
+    calls = []
+
+    assert cache.get_or_load(('config', 'system_prompt'), _loader(db_path, calls)) == 'v1'
+    assert cache.get_or_load(('config', 'system_prompt'), _loader(db_path, calls)) == 'v1'
+    assert len(calls) == 1
+
+    # Job traffic moves data_version but not the artifact version
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("INSERT INTO jobs VALUES ('job-1', 'pending')")
+    assert cache.get_or_load(('config', 'system_prompt'), _loader(db_path, calls)) == 'v1'
+    assert len(calls) == 1
+
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("UPDATE config SET value = 'v2' WHERE key = 'system_prompt'")
+    assert cache.get_or_load(('config', 'system_prompt'), _loader(db_path, calls)) == 'v2'
+    assert len(calls) == 2
+
+
+def test_explicit_invalidate_by_advisor(tmp_path):
+    db_path = str(tmp_path / 'cache.db')
+    _create_db(db_path)
+    cache = AdvisorArtifactCache(db_path, check_interval=60)
+
+    cache.get_or_load(('config', 'system_prompt'), lambda: 'prompt')
+    cache.get_or_load(('reference_images', 'ansel', 10), lambda: [{'id': 'a'}])
+    cache.get_or_load(('reference_images', 'okeefe', 10), lambda: [{'id': 'o'}])
+
+    # Returned values are copies; callers may annotate them
+    images = cache.get_or_load(('reference_images', 'ansel', 10), lambda: [])
+    images[0]['_instructive_dims'] = ['lighting']
+    assert cache.get_or_load(('reference_images', 'ansel', 10), lambda: []) == [{'id': 'a'}]
+
+    assert cache.invalidate('ansel') == 1
+    assert cache.get_or_load(('reference_images', 'ansel', 10), lambda: [{'id': 'b'}]) == [{'id': 'b'}]
+    assert cache.invalidate() == 3
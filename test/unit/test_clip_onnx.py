@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+ONNX CLIP Encoder Unit Test
+===========================
+
+Checks the NumPy re-implementation of CLIP image preprocessing, backend
+selection, and (when torch, transformers and onnxruntime are installed)
+cosine parity of the exported ONNX vision tower with the PyTorch model.
+
+Usage:
+    python3 -m pytest test/unit/test_clip_onnx.py
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from mondrian.clip_onnx import CLIP_MEAN, CLIP_STD, IMAGE_SIZE, preprocess_images
+from mondrian import embedding_retrieval
+
+
+def test_preprocess_resizes_short_side_and_center_crops():
+    # Wide image: red left third, green middle, blue right third
+    wide = np.zeros((300, 900, 3), dtype=np.uint8)
+    wide[:, :300, 0] = 255
+    wide[:, 300:600, 1] = 255
+    wide[:, 600:, 2] = 255
+    tall = Image.fromarray(np.full((640, 320, 3), 128, dtype=np.uint8))
+
+    batch = preprocess_images([Image.fromarray(wide), tall])
+
+    assert batch.shape == (2, 3, IMAGE_SIZE, IMAGE_SIZE)
+    assert batch.dtype == np.float32
+    # The center crop of the wide image is all green
+    green = (np.array([0.0, 1.0, 0.0], dtype=np.float32) - CLIP_MEAN) / CLIP_STD
+    np.testing.assert_allclose(batch[0, :, :, 112], np.repeat(green[:, None], IMAGE_SIZE, axis=1), atol=1e-5)
+    gray = (128 / 255.0 - CLIP_MEAN) / CLIP_STD
+    np.testing.assert_allclose(batch[1].mean(axis=(1, 2)), gray, atol=1e-4)
+
+
+def test_backend_selection():
+    try:
+        embedding_retrieval.set_clip_backend('torch')
+        assert embedding_retrieval.get_onnx_image_encoder() is None
+        with pytest.raises(ValueError):
+            embedding_retrieval.set_clip_backend('tensorrt')
+    finally:
+        embedding_retrieval.set_clip_backend('auto')
+
+
+def test_onnx_matches_pytorch(tmp_path):
+    torch = pytest.importorskip('torch')
+    pytest.importorskip('onnxruntime')
+    transformers = pytest.importorskip('transformers')
+    sys.path.insert(0, str(Path(__file__).parent.parent.parent / 'scripts'))
+    from export_clip_onnx import export
+    from mondrian.clip_onnx import CLIP_MODEL_NAME, OnnxClipEncoder
+
+    export(tmp_path, opset=17)
+    encoder = OnnxClipEncoder(model_dir=tmp_path)
+
+    rng = np.random.default_rng(0)
+    images = [Image.fromarray(rng.integers(0, 256, (h, w, 3), dtype=np.uint8))
+              for h, w in [(224, 224), (480, 640), (600, 300)]]
+
+    model = transformers.CLIPModel.from_pretrained(CLIP_MODEL_NAME).eval()
+    processor = transformers.CLIPProcessor.from_pretrained(CLIP_MODEL_NAME)
+    with torch.no_grad():
+        reference = model.get_image_features(**processor(images=images, return_tensors='pt')).numpy()
+    reference /= np.linalg.norm(reference, axis=1, keepdims=True)
+
+    cosines = np.sum(encoder.encode_images(images) * reference, axis=1)
+    assert cosines.min() > 0.999
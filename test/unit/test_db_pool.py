@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Database Pool Unit Test
+=======================
+
+Checks that pooled connections come configured (WAL, busy timeout), are
+reused across blocks and shared by nested blocks on one thread, that
+row_factory is scoped to its block, that only the outermost block commits
+or rolls back, and that a reader is not blocked by an open write
+transaction.
+
+Usage:
+    python3 -m pytest test/unit/test_db_pool.py
+"""
+
+import sqlite3
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from mondrian.db_pool import close_pools, db_connection, get_pool
+from mondrian.timeouts import DATABASE_LOCK_TIMEOUT
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / 'pool.db')
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE jobs (id TEXT PRIMARY KEY, status TEXT)")
+        conn.execute("INSERT INTO jobs VALUES ('a', 'pending')")
+    yield path
+    close_pools(path)
+
+
+def test_connections_are_configured_and_reused(db_path):
+    with db_connection(db_path) as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+        assert conn.execute("PRAGMA busy_timeout").fetchone()[0] == DATABASE_LOCK_TIMEOUT * 1000
+        first = conn
+        with db_connection(db_path, row_factory=sqlite3.Row) as inner:
+            assert inner is conn
+            assert inner.execute("SELECT * FROM jobs").fetchone()['status'] == 'pending'
+        # The inner block's row factory does not leak into the outer one
+        assert conn.execute("SELECT status FROM jobs").fetchone() == ('pending',)
+
+    with db_connection(db_path) as conn:
+        assert conn is first
+    assert get_pool(db_path).stats['opened'] == 1
+
+
+def test_error_rolls_back(db_path):
+    with pytest.raises(ValueError):
+        with db_connection(db_path) as conn:
+            conn.execute("UPDATE jobs SET status = 'completed'")
+            raise ValueError("boom")
+    with db_connection(db_path) as conn:
+        assert conn.execute("SELECT status FROM jobs").fetchone()[0] == 'pending'
+
+
+def test_nested_block_leaves_transaction_to_owner(db_path):
+    with pytest.raises(ValueError):
+        with db_connection(db_path) as conn:
+            conn.execute("UPDATE jobs SET status = 'analyzing'")
+            with db_connection(db_path) as inner:
+                inner.execute("SELECT status FROM jobs").fetchone()
+            # Still the caller's open transaction, not committed by the inner block
+            assert conn.in_transaction
+            raise ValueError("boom")
+    with db_connection(db_path) as conn:
+        assert conn.execute("SELECT status FROM jobs").fetchone()[0] == 'pending'
+
+    # An error inside a nested block does not roll back the caller's writes
+    with db_connection(db_path) as conn:
+        conn.execute("UPDATE jobs SET status = 'queued'")
+        with pytest.raises(ValueError):
+            with db_connection(db_path):
+                raise ValueError("inner")
+    with db_connection(db_path) as conn:
+        assert conn.execute("SELECT status FROM jobs").fetchone()[0] == 'queued'
+
+
+def test_reader_not_blocked_by_open_write(db_path):
+    with db_connection(db_path):
+        pass  # switches the file to WAL
+    writer = sqlite3.connect(db_path, timeout=0)
+    writer.execute("BEGIN IMMEDIATE")
+    writer.execute("UPDATE jobs SET status = 'analyzing'")
+    try:
+        with db_connection(db_path) as conn:
+            # Sees the last committed state instead of waiting for the writer
+            assert conn.execute("SELECT status FROM jobs").fetchone()[0] == 'pending'
+    finally:
+        writer.rollback()
+        writer.close()
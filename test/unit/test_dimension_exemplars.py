@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Dimension Exemplars Unit Test
+=============================
+
+Verifies that the materialized best-image-per-dimension table picks the
+highest-scoring image whose file exists and is served by a single query,
+that requests never write it (live queries before it is built, the existing
+rows while it is out of date, until refresh_dimension_exemplars), and that case studies embed the
+user image once per request and score references with their stored vectors
+(store-backed and BLOB rows alike) exactly as the per-pair
+compute_visual_relevance did. Runs against a temporary SQLite database; no
+models required.
+
+Usage:
+    python3 -m pytest test/unit/test_dimension_exemplars.py
+"""
+
+import sqlite3
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from mondrian import embedding_retrieval, rag_retrieval
+from mondrian.embedding_index import SCORE_COLUMNS
+from mondrian.embedding_store import EmbeddingStore, ensure_ref_columns, make_ref
+from mondrian.rag_retrieval import (
+    DIMENSIONS, CaseStudyContext, compute_case_studies, compute_visual_relevance, get_best_image_per_dimension,
+    refresh_dimension_exemplars
+)
+
+INSTRUCTIVE_COLUMNS = [c.replace('_score', '_instructive') for c in SCORE_COLUMNS]
+
+
+def _create_db(path, images):
+    conn = sqlite3.connect(path)
+    conn.execute(f"""
+        CREATE TABLE dimensional_profiles (
+            id TEXT PRIMARY KEY, advisor_id TEXT, image_path TEXT, image_title TEXT,
+            date_taken TEXT, image_description TEXT,
+            {', '.join(c + ' REAL' for c in SCORE_COLUMNS)},
+            {', '.join(c + ' TEXT' for c in INSTRUCTIVE_COLUMNS)},
+            overall_grade TEXT, embedding BLOB, text_embedding BLOB
+        )
+    """)
+    for row_id, image_path, score in images:
+        conn.execute(
+            f"INSERT INTO dimensional_profiles (id, advisor_id, image_path, image_title, "
+            f"{', '.join(SCORE_COLUMNS)}) VALUES (?, 'ansel', ?, ?, {', '.join('?' * len(SCORE_COLUMNS))})",
+            (row_id, image_path, row_id, *([score] * len(SCORE_COLUMNS)))
+        )
+    conn.commit()
+    conn.close()
+
+
+def test_best_existing_image_is_materialized(tmp_path):
+    existing = tmp_path / 'dunes.jpg'
+    existing.write_bytes(b'jpeg')
+    db_path = str(tmp_path / 'exemplars.db')
+    _create_db(db_path, [
+        ('missing', str(tmp_path / 'gone.jpg'), 9.8),
+        ('dunes', str(existing), 9.1),
+        ('weak', str(existing), 6.0),
+    ])
+
+    # Not built yet: selected live, nothing written
+    live = get_best_image_per_dimension(db_path, 'ansel')
+    with sqlite3.connect(db_path) as conn:
+        assert not conn.execute("SELECT name FROM sqlite_master WHERE name = 'advisor_dimension_exemplars'").fetchall()
+
+    assert refresh_dimension_exemplars(db_path, 'ansel') == len(DIMENSIONS)
+    best = get_best_image_per_dimension(db_path, 'ansel')
+    assert best == live
+    assert list(best) == DIMENSIONS
+    assert all(img['id'] == 'dunes' and img['image_exists'] for img in best.values())
+    assert '_embedding' not in best['lighting']
+
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM advisor_dimension_exemplars").fetchone()[0] == len(DIMENSIONS)
+
+
+def test_exemplars_rebuilt_by_refresh_only(tmp_path, monkeypatch):
+    first = tmp_path / 'first.jpg'
+    second = tmp_path / 'second.jpg'
+    first.write_bytes(b'jpeg')
+    second.write_bytes(b'jpeg')
+    db_path = str(tmp_path / 'exemplars.db')
+    _create_db(db_path, [('first', str(first), 9.0), ('second', str(second), 8.5)])
+
+    refresh_dimension_exemplars(db_path)
+    assert get_best_image_per_dimension(db_path, 'ansel')['composition']['id'] == 'first'
+
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("UPDATE dimensional_profiles SET composition_score = 9.9 WHERE id = 'second'")
+        built_at = conn.execute("SELECT built_at FROM advisor_dimension_exemplars_state").fetchone()
+    # Out of date: served as built until the rebuild
+    monkeypatch.setattr(rag_retrieval, 'VERSION_CHECK_INTERVAL', 0.0)
+    assert get_best_image_per_dimension(db_path, 'ansel')['composition']['id'] == 'first'
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT built_at FROM advisor_dimension_exemplars_state").fetchone() == built_at
+    refresh_dimension_exemplars(db_path, 'ansel')
+    best = get_best_image_per_dimension(db_path, 'ansel')
+    assert best['composition']['id'] == 'second'
+    assert best['lighting']['id'] == 'first'
+
+    # Only the best-but-missing image qualifies: kept, flagged as missing
+    second.unlink()
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("DELETE FROM dimensional_profiles WHERE id = 'first'")
+    refresh_dimension_exemplars(db_path, 'ansel')
+    best = get_best_image_per_dimension(db_path, 'ansel')
+    assert best['composition']['id'] == 'second'
+    assert best['composition']['image_exists'] is False
+
+
+def test_case_studies_embed_user_image_once(tmp_path, monkeypatch):
+    rng = np.random.default_rng(0)
+    paths = {name: tmp_path / f"{name}.jpg" for name in ('store', 'blob', 'other', 'user')}
+    for path in paths.values():
+        path.write_bytes(b'jpeg')
+    vectors = {name: rng.standard_normal(16).astype(np.float32) for name in paths}
+
+    db_path = str(tmp_path / 'exemplars.db')
+    _create_db(db_path, [(name, str(paths[name]), 8.5) for name in ('store', 'blob', 'other')])
+    conn = sqlite3.connect(db_path)
+    # A different best image for composition, lighting and the rest
+    conn.execute("UPDATE dimensional_profiles SET composition_score = 9.5 WHERE id = 'store'")
+    conn.execute("UPDATE dimensional_profiles SET lighting_score = 9.5 WHERE id = 'blob'")
+    conn.execute("UPDATE dimensional_profiles SET focus_sharpness_score = 9.5 WHERE id = 'other'")
+    ensure_ref_columns(conn)
+    store = EmbeddingStore.open_for_write(db_path, 'ansel', 'test-model', 16)
+    (slot,) = store.upsert(['store'], vectors['store'][None, :])
+    conn.execute("UPDATE dimensional_profiles SET embedding_ref = ? WHERE id = 'store'", (make_ref(store.name, slot),))
+    for name in ('blob', 'other'):
+        conn.execute("UPDATE dimensional_profiles SET embedding = ? WHERE id = ?", (vectors[name].tobytes(), name))
+    conn.commit()
+    conn.close()
+
+    by_path = {str(path): vectors[name] for name, path in paths.items()}
+    embedded = []
+
+    def counting_compute_image_embedding(image_path):
+        embedded.append(image_path)
+        return by_path[image_path]
+
+    monkeypatch.setattr(embedding_retrieval, 'compute_image_embedding', counting_compute_image_embedding)
+
+    user_dimensions = [{'name': dim, 'score': 4} for dim in DIMENSIONS]
+    context = CaseStudyContext(str(paths['user']))
+    selected = compute_case_studies(db_path, 'ansel', user_dimensions, str(paths['user']),
+                                    max_case_studies=3, relevance_threshold=-1.0, context=context)
+    # Reused by a second call in the same request
+    compute_case_studies(db_path, 'ansel', user_dimensions, str(paths['user']),
+                         max_case_studies=3, relevance_threshold=-1.0, context=context)
+    assert embedded == [str(paths['user'])]
+    assert sorted(c['ref_image']['id'] for c in selected) == ['blob', 'other', 'store']
+
+    # Same scores as embedding both images per pair
+    for case_study in selected:
+        expected = compute_visual_relevance(str(paths['user']), case_study['ref_image']['image_path'])
+        assert np.isclose(case_study['relevance'], expected, atol=1e-5)
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Embedding Cache Unit Test
+=========================
+
+Verifies the LRU and SQLite tiers of the content-hash embedding cache.
+
+Usage:
+    python3 -m pytest test/unit/test_embedding_cache.py
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from mondrian.embedding_cache import EmbeddingCache, content_hash
+
+
+def test_memory_and_disk_tiers(tmp_path):
+    db_path = str(tmp_path / 'cache.db')
+    digest = content_hash(b'image bytes')
+    vec = np.arange(512, dtype=np.float32)
+
+    cache = EmbeddingCache(db_path, lru_size=2)
+    assert cache.get('clip', '4.40', digest) is None
+    cache.put('clip', '4.40', digest, vec)
+    assert np.array_equal(cache.get('clip', '4.40', digest), vec)
+
+    # A fresh process only has the disk tier
+    restarted = EmbeddingCache(db_path, lru_size=2)
+    assert np.array_equal(restarted.get('clip', '4.40', digest), vec)
+    assert restarted.get('clip', '4.40', digest) is not None
+
+    stats = restarted.get_stats()
+    assert stats['disk_hits'] == 1 and stats['memory_hits'] == 1 and stats['misses'] == 0
+
+
+def test_model_version_is_part_of_key(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / 'cache.db'))
+    digest = content_hash(b'same content')
+    cache.put('clip', '4.40', digest, np.ones(4, dtype=np.float32))
+    assert cache.get('clip', '4.41', digest) is None
+    assert cache.get('minilm', '4.40', digest) is None
+
+
+def test_lru_eviction_without_disk():
+    cache = EmbeddingCache(db_path=None, lru_size=2)
+    for i in range(3):
+        cache.put('clip', 'v', str(i), np.full(2, i, dtype=np.float32))
+    assert cache.get('clip', 'v', '0') is None
+    assert cache.get('clip', 'v', '2') is not None
+    assert cache.get_stats()['memory_entries'] == 2
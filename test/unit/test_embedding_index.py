@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Embedding Index Unit Test
+=========================
+
+Verifies the in-memory dimensional_profiles index against a brute-force scan
+and checks that writes to dimensional_profiles invalidate it. Runs against a
+temporary SQLite database; no models or services required.
+
+Usage:
+    python3 -m pytest test/unit/test_embedding_index.py
+"""
+
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from mondrian import embedding_index
+from mondrian.embedding_index import SCORE_COLUMNS, get_embedding_index, get_profiles_version
+
+
+def _create_db(path, n, dim=512, seed=0):
+    rng = np.random.default_rng(seed)
+    conn = sqlite3.connect(path)
+    conn.execute(f"""
+        CREATE TABLE dimensional_profiles (
+            id TEXT PRIMARY KEY, advisor_id TEXT, image_path TEXT, image_title TEXT,
+            date_taken TEXT, image_description TEXT,
+            {', '.join(c + ' REAL' for c in SCORE_COLUMNS)},
+            overall_grade TEXT, embedding BLOB, text_embedding BLOB
+        )
+    """)
+    vectors = rng.standard_normal((n, dim)).astype(np.float32)
+    scores = rng.uniform(5, 10, size=(n, len(SCORE_COLUMNS)))
+    rows = []
+    for i in range(n):
+        rows.append((f"img-{i}", 'ansel', f"/tmp/img-{i}.jpg", f"Image {i}", '', '',
+                     *scores[i].tolist(), 'A', vectors[i].tobytes(), None))
+    conn.executemany(
+        f"INSERT INTO dimensional_profiles VALUES ({', '.join('?' * (9 + len(SCORE_COLUMNS)))})",
+        rows
+    )
+    conn.commit()
+    conn.close()
+    return vectors, scores
+
+
+def test_topk_matches_bruteforce(tmp_path):
+    db_path = str(tmp_path / 'index.db')
+    vectors, scores = _create_db(db_path, 500)
+    query = np.random.default_rng(1).standard_normal(512).astype(np.float32)
+
+    index = get_embedding_index(db_path, 'ansel', 'embedding')
+    lighting = SCORE_COLUMNS.index('lighting_score')
+    mask = index.filter_mask(['lighting_score'], 8.0)
+    rows, sims = index.search(query, top_k=5, mask=mask)
+
+    normed = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    brute = normed @ (query / np.linalg.norm(query))
+    brute[scores[:, lighting] < 8.0] = -np.inf
+    expected = np.argsort(-brute)[:5]
+
+    assert [index.metadata[r]['id'] for r in rows] == [f"img-{i}" for i in expected]
+    assert np.allclose(sims, brute[expected], atol=1e-5)
+
+
+def test_index_reloads_after_write(tmp_path, monkeypatch):
+    monkeypatch.setattr(embedding_index, 'VERSION_CHECK_INTERVAL', 0.0)
+    db_path = str(tmp_path / 'index.db')
+    _create_db(db_path, 10)
+    index = get_embedding_index(db_path, 'ansel', 'embedding')
+    assert len(index) == 10
+    assert get_embedding_index(db_path, 'ansel', 'embedding') is index
+
+    conn = sqlite3.connect(db_path)
+    conn.execute("DELETE FROM dimensional_profiles WHERE id = 'img-0'")
+    conn.commit()
+    conn.close()
+
+    reloaded = get_embedding_index(db_path, 'ansel', 'embedding')
+    assert reloaded is not index
+    assert len(reloaded) == 9
+
+
+def test_write_reloads_only_written_advisor(tmp_path, monkeypatch):
+    db_path = str(tmp_path / 'index.db')
+    _create_db(db_path, 10)
+    conn = sqlite3.connect(db_path)
+    conn.execute("UPDATE dimensional_profiles SET advisor_id = 'okeefe' WHERE id IN ('img-0', 'img-1')")
+    conn.commit()
+    ansel = get_embedding_index(db_path, 'ansel', 'embedding')
+    okeefe = get_embedding_index(db_path, 'okeefe', 'embedding')
+    assert (len(ansel), len(okeefe)) == (8, 2)
+
+    # Within the check interval the counters are not read again
+    version = get_profiles_version(db_path, 'okeefe')
+    conn.execute("DELETE FROM dimensional_profiles WHERE id = 'img-0'")
+    conn.commit()
+    assert get_embedding_index(db_path, 'okeefe', 'embedding') is okeefe
+
+    monkeypatch.setattr(embedding_index, 'VERSION_CHECK_INTERVAL', 0.0)
+    assert get_profiles_version(db_path, 'okeefe') != version
+    assert get_embedding_index(db_path, 'ansel', 'embedding') is ansel
+    assert len(get_embedding_index(db_path, 'okeefe', 'embedding')) == 1
+    conn.close()
+
+
+def test_hybrid_search_matches_per_image_loop(tmp_path):
+    db_path = str(tmp_path / 'hybrid.db')
+    vectors, scores = _create_db(db_path, 800, dim=64)
+    query = np.random.default_rng(5).standard_normal(64).astype(np.float32)
+    gap_columns = ['lighting_score', 'composition_score']
+    user = {'lighting_score': 6.5, 'composition_score': 8.0}
+
+    index = get_embedding_index(db_path, 'ansel', 'embedding')
+    mask = index.filter_mask(['lighting_score'], 8.0)
+    rows, hybrid, sims, gaps = index.hybrid_search(
+        query, gap_columns, [user[c] for c in gap_columns], top_k=5,
+        visual_weight=0.6, score_weight=0.4, mask=mask
+    )
+
+    # Reference: the original per-image loop over every candidate
+    q = query / np.linalg.norm(query)
+    expected = []
+    for i in range(800):
+        if scores[i, SCORE_COLUMNS.index('lighting_score')] < 8.0:
+            continue
+        max_gap = 0
+        for col in gap_columns:
+            max_gap = max(max_gap, scores[i, SCORE_COLUMNS.index(col)] - user[col])
+        sim = vectors[i] @ q / np.linalg.norm(vectors[i])
+        expected.append((0.6 * sim + 0.4 * min(max_gap / 10.0, 1.0), f"img-{i}"))
+    expected.sort(reverse=True)
+
+    assert [index.metadata[r]['id'] for r in rows] == [img_id for _, img_id in expected[:5]]
+    assert np.allclose(hybrid, [score for score, _ in expected[:5]], atol=1e-5)
+    assert np.allclose(hybrid, 0.6 * sims + 0.4 * np.minimum(gaps / 10.0, 1.0), atol=1e-6)
+
+
+def test_search_latency_at_100k(tmp_path):
+    db_path = str(tmp_path / 'large.db')
+    _create_db(db_path, 100_000, dim=512)
+    index = get_embedding_index(db_path, 'ansel', 'embedding')
+    query = np.random.default_rng(2).standard_normal(512).astype(np.float32)
+
+    index.search(query, top_k=10)
+    start = time.perf_counter()
+    for _ in range(20):
+        index.search(query, top_k=10)
+    per_query_ms = (time.perf_counter() - start) / 20 * 1000
+    assert per_query_ms < 100, f"100k x 512 search: {per_query_ms:.2f} ms/query"
+
+
+def test_ann_index_attached_and_consistent(tmp_path):
+    from mondrian.ann_index import build_ann_index
+
+    db_path = str(tmp_path / 'ann.db')
+    _create_db(db_path, 2000)
+    assert build_ann_index(db_path, 'ansel', 'embedding') is not None
+
+    from mondrian.embedding_index import AdvisorEmbeddingIndex
+    index = AdvisorEmbeddingIndex(db_path, 'ansel', 'embedding').load()
+    assert index.attach_ann(min_rows=1000)
+
+    query = np.random.default_rng(3).standard_normal(512).astype(np.float32)
+    ann_rows, ann_sims = index.search(query, top_k=10)
+    index.ann = None
+    exact_rows, exact_sims = index.search(query, top_k=10)
+
+    assert len(ann_rows) == 10
+    assert np.all(np.diff(ann_sims) <= 1e-6)
+    # Every ANN hit is a genuine row scored against the live vectors
+    assert np.allclose(ann_sims, index.vectors[ann_rows] @ (query / np.linalg.norm(query)), atol=1e-5)
+    assert ann_sims[0] <= exact_sims[0] + 1e-6
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Embedding Service Unit Test
+===========================
+
+Verifies that the micro-batcher coalesces concurrent requests into shared
+forward passes, that the client round-trips float32 vectors over HTTP
+and a Unix socket, and that vectors from the service are cached under the
+model key it reports. Stub encoders stand in for CLIP/MiniLM; no models
+required.
+
+Usage:
+    python3 -m pytest test/unit/test_embedding_service.py
+"""
+
+import io
+import sys
+import threading
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+from werkzeug.serving import make_server
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from mondrian import embedding_retrieval, embedding_service
+from mondrian.embedding_cache import EmbeddingCache, package_version
+from mondrian.embedding_client import EmbeddingServiceClient, get_embedding_client
+from mondrian.embedding_service import MicroBatcher
+
+
+def _encode_lengths(items):
+    return np.asarray([[len(item), 1.0] for item in items], dtype=np.float32)
+
+
+def test_concurrent_submits_share_batches():
+    calls = []
+
+    def encode(items):
+        calls.append(len(items))
+        return _encode_lengths(items)
+
+    batcher = MicroBatcher(encode, 'test', max_batch=64, window_ms=50)
+    results = {}
+
+    def submit(i):
+        results[i] = batcher.submit(['x' * i])
+
+    threads = [threading.Thread(target=submit, args=(i,)) for i in range(1, 17)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert all(results[i][0, 0] == i for i in range(1, 17))
+    assert sum(calls) == 16
+    assert len(calls) < 16
+    assert batcher.get_stats()['requests'] == 16
+
+    # Oversized requests are split into max_batch forward passes
+    calls.clear()
+    small = MicroBatcher(encode, 'small', max_batch=4, window_ms=0)
+    assert small.submit(['a'] * 10).shape == (10, 2)
+    assert calls == [4, 4, 2]
+
+
+def _png(width):
+    buf = io.BytesIO()
+    Image.new('RGB', (width, 8)).save(buf, format='PNG')
+    return buf.getvalue()
+
+
+def test_client_round_trip_http_and_unix_socket(tmp_path):
+    embedding_service.image_batcher = MicroBatcher(
+        lambda images: np.asarray([[img.size[0], 0.0, 1.0] for img in images], dtype=np.float32), 'image'
+    )
+    embedding_service.text_batcher = MicroBatcher(_encode_lengths, 'text')
+
+    socket_path = str(tmp_path / 'embed.sock')
+    servers = [make_server('127.0.0.1', 0, embedding_service.app, threaded=True),
+               make_server(f"unix://{socket_path}", 0, embedding_service.app, threaded=True)]
+    for server in servers:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        for url in (f"http://127.0.0.1:{servers[0].server_port}", f"unix://{socket_path}"):
+            client = EmbeddingServiceClient(url)
+            assert client.health()['status'] == 'healthy'
+
+            vectors = client.embed_images([_png(5), _png(12)])
+            assert vectors.dtype == np.float32
+            assert vectors[:, 0].tolist() == [5.0, 12.0]
+            assert client.model_keys['image'].startswith('openai/clip-vit-base-patch32@')
+
+            assert client.embed_texts(['ab', 'abcd'])[:, 0].tolist() == [2.0, 4.0]
+    finally:
+        for server in servers:
+            server.shutdown()
+        embedding_service.image_batcher = None
+        embedding_service.text_batcher = None
+
+
+def test_unreachable_service_falls_back():
+    assert get_embedding_client('http://127.0.0.1:9') is None
+
+
+def test_service_vectors_cached_under_service_model_key(tmp_path, monkeypatch):
+    embedding_service.image_batcher = MicroBatcher(
+        lambda images: np.asarray([[img.size[0], 0.0, 1.0] for img in images], dtype=np.float32), 'image'
+    )
+    embedding_service.text_batcher = MicroBatcher(_encode_lengths, 'text')
+    monkeypatch.setitem(embedding_service.model_keys, 'image', 'openai/clip-vit-base-patch32@4.0+onnx-int8')
+    monkeypatch.setitem(embedding_service.model_keys, 'text', 'all-MiniLM-L6-v2@3.0')
+    server = make_server('127.0.0.1', 0, embedding_service.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        client = EmbeddingServiceClient(f"http://127.0.0.1:{server.server_port}")
+        client.health()
+        cache = EmbeddingCache(db_path=None)
+        monkeypatch.setattr(embedding_retrieval, 'get_onnx_image_encoder', lambda: None)
+        monkeypatch.setattr(embedding_retrieval, 'get_embedding_client', lambda: client)
+        monkeypatch.setattr(embedding_retrieval, 'get_embedding_cache', lambda: cache)
+
+        image_path = tmp_path / 'photo.png'
+        image_path.write_bytes(_png(7))
+        digest = embedding_retrieval.content_hash(image_path.read_bytes())
+        # A vector from the local encoder must not be returned for the service's encoder
+        local = np.asarray([9.0, 9.0, 9.0], dtype=np.float32)
+        cache.put(embedding_retrieval.CLIP_MODEL_NAME, package_version('transformers'), digest, local)
+
+        vector = embedding_retrieval.compute_image_embedding(str(image_path))
+        assert vector[0] == 7.0
+        assert cache.get(embedding_retrieval.CLIP_MODEL_NAME, '4.0+onnx-int8', digest)[0] == 7.0
+        assert cache.get(embedding_retrieval.CLIP_MODEL_NAME, package_version('transformers'), digest)[0] == 9.0
+
+        # Text vectors likewise
+        text_digest = embedding_retrieval.content_hash('abc'.encode('utf-8'))
+        cache.put(embedding_retrieval.TEXT_MODEL_NAME, package_version('sentence-transformers'), text_digest, local)
+        assert embedding_retrieval.compute_text_embedding('abc')[0] == 3.0
+        assert cache.get(embedding_retrieval.TEXT_MODEL_NAME, '3.0', text_digest)[0] == 3.0
+        assert cache.get(embedding_retrieval.TEXT_MODEL_NAME, package_version('sentence-transformers'), text_digest)[0] == 9.0
+    finally:
+        server.shutdown()
+        embedding_service.image_batcher = None
+        embedding_service.text_batcher = None
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Embedding Store Unit Test
+=========================
+
+Verifies the memory-mapped embedding store (slot reuse, capacity growth,
+reopen, compaction of superseded slots with the SQLite pointers) and that the dimensional_profiles index reads store pointers as a
+zero-copy view, including int8 quantized indexes with exact rescoring.
+Runs against temporary files; no models required.
+
+Usage:
+    python3 -m pytest test/unit/test_embedding_store.py
+"""
+
+import sqlite3
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from mondrian.embedding_store import (
+    INITIAL_CAPACITY, EmbeddingStore, compact_store, ensure_ref_columns, get_store, load_vector, make_ref, store_name
+)
+from mondrian import embedding_index
+from mondrian.embedding_index import AdvisorEmbeddingIndex, get_embedding_index, ranking_overlap
+
+from test_embedding_index import _create_db
+
+
+def test_upsert_grow_and_reopen(tmp_path):
+    db_path = str(tmp_path / 'store.db')
+    rng = np.random.default_rng(0)
+    store = EmbeddingStore.open_for_write(db_path, 'ansel', 'openai/clip-vit-base-patch32', 8)
+
+    n = INITIAL_CAPACITY + 10
+    vectors = rng.standard_normal((n, 8)).astype(np.float32)
+    slots = store.upsert([f"img-{i}" for i in range(n)], vectors)
+    assert slots == list(range(n))
+    assert store.meta['capacity'] >= n
+
+    reader = get_store(db_path, store.name)
+    view = reader.get(5).copy()
+
+    # Re-embedding appends: the old slot stays intact for readers holding views of it
+    assert store.upsert(['img-5'], np.ones((1, 8))) == [n]
+    assert np.array_equal(reader.get(5), view)
+    assert store.superseded == 1
+
+    reader = get_store(db_path, store.name)
+    assert len(reader) == n + 1
+    assert reader.slot_of('img-7') == 7 and reader.slot_of('img-5') == n
+    assert np.allclose(reader.get(n), np.ones(8) / np.sqrt(8), atol=1e-6)
+    expected = vectors[9] / np.linalg.norm(vectors[9])
+    assert np.allclose(load_vector(db_path, make_ref(store.name, 9)), expected, atol=1e-6)
+
+
+def test_slots_published_after_pointer_commit(tmp_path):
+    db_path = str(tmp_path / 'store.db')
+    store = EmbeddingStore.open_for_write(db_path, 'ansel', 'test-model', 4)
+    store.upsert(['a', 'b'], np.eye(4)[:2])
+
+    slots = store.upsert(['a', 'c'], np.eye(4)[2:], publish=False)
+    assert slots == [2, 3]
+    assert len(get_store(db_path, store.name)) == 2
+    store.publish()
+    assert len(get_store(db_path, store.name)) == 4
+
+    # A run interrupted between its pointer commit and publish(): the next
+    # writer adopts the slots it wrote, and drops a half-written id line
+    store.upsert(['d'], np.ones((1, 4)), publish=False)
+    with open(store.path / 'ids.txt', 'a') as f:
+        f.write('trunc')
+    writer = EmbeddingStore.open_for_write(db_path, 'ansel', 'test-model', 4)
+    assert len(writer) == 5 and writer.slot_of('d') == 4
+    assert (store.path / 'ids.txt').read_text().splitlines()[-1] == 'd'
+    assert np.allclose(get_store(db_path, store.name).get(4), np.ones(4) / 2, atol=1e-6)
+
+
+def _store_backed_db(db_path, n, dim):
+    vectors, _ = _create_db(db_path, n, dim=dim)
+
+    conn = sqlite3.connect(db_path)
+    ensure_ref_columns(conn)
+    ids = [row[0] for row in conn.execute("SELECT id FROM dimensional_profiles ORDER BY rowid")]
+    store = EmbeddingStore.open_for_write(db_path, 'ansel', 'test-model', dim)
+    slots = store.upsert(ids, vectors)
+    conn.executemany(
+        "UPDATE dimensional_profiles SET embedding = NULL, embedding_ref = ? WHERE id = ?",
+        [(make_ref(store.name, slot), row_id) for row_id, slot in zip(ids, slots)]
+    )
+    conn.commit()
+    conn.close()
+    return vectors
+
+
+def test_index_uses_zero_copy_store_view(tmp_path):
+    db_path = str(tmp_path / 'index.db')
+    vectors = _store_backed_db(db_path, 50, dim=16)
+
+    index = get_embedding_index(db_path, 'ansel', 'embedding')
+    assert len(index) == 50
+    assert isinstance(index.vectors, np.memmap)
+
+    query = vectors[3]
+    rows, sims = index.search(query, top_k=1)
+    assert index.metadata[rows[0]]['id'] == 'img-3'
+    assert np.isclose(sims[0], 1.0, atol=1e-5)
+
+
+def test_compaction_restores_zero_copy_view(tmp_path, monkeypatch):
+    monkeypatch.setattr(embedding_index, 'VERSION_CHECK_INTERVAL', 0.0)
+    db_path = str(tmp_path / 'index.db')
+    vectors = _store_backed_db(db_path, 50, dim=16)
+
+    # Re-embed two rows: their new slots follow the old ones
+    store = EmbeddingStore.open_for_write(db_path, 'ansel', 'test-model', 16)
+    fresh = np.random.default_rng(5).standard_normal((2, 16)).astype(np.float32)
+    slots = store.upsert(['img-3', 'img-7'], fresh, publish=False)
+    conn = sqlite3.connect(db_path)
+    conn.executemany("UPDATE dimensional_profiles SET embedding_ref = ? WHERE id = ?",
+                     [(make_ref(store.name, slot), row_id) for row_id, slot in zip(['img-3', 'img-7'], slots)])
+    conn.commit()
+    store.publish()
+    assert store.superseded == 2
+    assert not isinstance(get_embedding_index(db_path, 'ansel', 'embedding').vectors, np.memmap)
+
+    result = compact_store(db_path, store_name('ansel', 'test-model'))
+    assert result['rows'] == 50 and result['dropped'] == 2
+    assert not store.path.exists()
+
+    index = get_embedding_index(db_path, 'ansel', 'embedding')
+    assert isinstance(index.vectors, np.memmap) and len(index) == 50
+    refs = dict(conn.execute("SELECT id, embedding_ref FROM dimensional_profiles"))
+    assert all(ref.startswith(f"{result['store']}:") for ref in refs.values())
+    assert np.allclose(load_vector(db_path, refs['img-3']), fresh[0] / np.linalg.norm(fresh[0]), atol=1e-6)
+    assert np.allclose(load_vector(db_path, refs['img-4']), vectors[4] / np.linalg.norm(vectors[4]), atol=1e-6)
+
+    # Writers append to the compacted generation; compacting again is a no-op
+    writer = EmbeddingStore.open_for_write(db_path, 'ansel', 'test-model', 16)
+    assert writer.name == result['store'] and writer.superseded == 0
+    assert compact_store(db_path, store_name('ansel', 'test-model'))['dropped'] == 0
+    conn.close()
+
+
+def test_int8_index_matches_float32_ranking(tmp_path):
+    db_path = str(tmp_path / 'quant.db')
+    vectors = _store_backed_db(db_path, 3000, dim=128)
+
+    exact = AdvisorEmbeddingIndex(db_path, 'ansel', 'embedding', 'none').load()
+    quant = AdvisorEmbeddingIndex(db_path, 'ansel', 'embedding', 'int8').load()
+    assert quant.qvectors.dtype == np.int8
+
+    rng = np.random.default_rng(4)
+    queries = vectors[rng.choice(3000, 50)] + 0.3 * rng.standard_normal((50, 128)).astype(np.float32)
+    assert ranking_overlap(exact, quant, queries, top_k=10) >= 0.99
+
+    # Rescored similarities are exact float32 scores
+    q = queries[0] / np.linalg.norm(queries[0])
+    rows, sims = quant.search(q, top_k=5, mask=quant.filter_mask(['lighting_score'], 8.0))
+    assert np.allclose(sims, exact.vectors[rows] @ q, atol=1e-5)
+
+    assert quant.memory_bytes() * 3 < exact.memory_bytes()
+
+
+def test_int8_needs_store_backed_rows(tmp_path):
+    db_path = str(tmp_path / 'blobs.db')
+    _create_db(db_path, 200, dim=64)
+
+    exact = AdvisorEmbeddingIndex(db_path, 'ansel', 'embedding', 'none').load()
+    quant = AdvisorEmbeddingIndex(db_path, 'ansel', 'embedding', 'int8').load()
+    # Legacy BLOB rows are resident float32 anyway: no int8 copy on top
+    assert quant.qvectors is None and quant.quantization == 'none'
+    assert quant.memory_bytes() == exact.memory_bytes()
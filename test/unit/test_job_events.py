@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Job Event Bus Unit Test
+=======================
+
+Checks that a waiting stream wakes as soon as an update is published, that
+a client reconnecting with Last-Event-ID is sent exactly what it missed (and
+told when it missed too much), that thinking deltas replay idempotently,
+that syncing from the database publishes only real changes, once per
+interval however many streams watch the job, and that the SSE encoding sends
+thinking as deltas (full text only when a connection cannot resume).
+
+Usage:
+    python3 -m pytest test/unit/test_job_events.py
+"""
+
+import json
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from mondrian.job_events import JobEventBus, JobStreamEncoder
+
+
+def test_wait_wakes_on_publish():
+    bus = JobEventBus()
+    cursor = bus.cursor('job-1')
+    received = []
+
+    def stream():
+        received.extend(bus.wait('job-1', cursor, timeout=5))
+
+    thread = threading.Thread(target=stream)
+    start = time.monotonic()
+    thread.start()
+    time.sleep(0.05)
+    bus.publish('job-2', 'status', status='analyzing')  # Other jobs do not wake it with events
+    bus.publish('job-1', 'status', status='analyzing', progress_percentage=30)
+    thread.join()
+
+    assert time.monotonic() - start < 1
+    assert [e.data['progress_percentage'] for e in received] == [30]
+    assert bus.wait('job-1', received[-1].id, timeout=0.01) == []
+
+
+def test_replay_after_last_event_id():
+    bus = JobEventBus()
+    first = bus.publish('job-1', 'status', status='analyzing', progress_percentage=10)
+    bus.publish('job-1', 'status', status='analyzing', progress_percentage=30)
+    bus.publish('job-1', 'complete', analysis_html='<p>ok</p>')
+    bus.publish('job-1', 'done')
+
+    events, complete = bus.replay('job-1', first.id)
+    assert complete
+    assert [e.type for e in events] == ['status', 'complete', 'done']
+
+    state = bus.snapshot('job-1')
+    assert state['progress_percentage'] == 30 and state['analysis_html'] == '<p>ok</p>' and state['done']
+
+
+def test_replay_reports_gaps():
+    bus = JobEventBus(buffer_size=4)
+    first = bus.publish('job-1', 'status', status='analyzing', progress_percentage=0)
+
+    # Id from before a restart, or for a job this process knows nothing about
+    assert bus.replay('job-1', 'deadbeef-1') == ([], False)
+    assert bus.replay('job-9', first.id) == ([], False)
+
+    for progress in range(1, 10):
+        bus.publish('job-1', 'status', status='analyzing', progress_percentage=progress)
+    events, complete = bus.replay('job-1', first.id)
+    assert not complete
+    assert len(events) == 4
+
+    # Still complete from an id inside the buffer
+    events, complete = bus.replay('job-1', events[0].id)
+    assert complete and len(events) == 3
+
+
+def test_thinking_deltas_replay_idempotently():
+    bus = JobEventBus()
+    a = bus.publish_thinking('job-1', 'Looking at ')
+    b = bus.publish_thinking('job-1', 'Looking at the sky')
+    assert bus.publish_thinking('job-1', 'Looking at the sky') is None
+    assert (b.data['offset'], b.data['text']) == (len('Looking at '), 'the sky')
+
+    # Applying the same deltas twice (a client replaying) gives the same text
+    state = {}
+    for event in (a, b, a, b):
+        JobEventBus._apply(state, event.type, event.data)
+    assert state['llm_thinking'] == 'Looking at the sky'
+
+    # Text that does not extend what was sent replaces it
+    c = bus.publish_thinking('job-1', 'Rewritten')
+    assert c.data['offset'] == 0
+    assert bus.snapshot('job-1')['llm_thinking'] == 'Rewritten'
+
+
+def test_sync_publishes_only_changes_once_per_interval():
+    bus = JobEventBus()
+    bus.publish('job-1', 'status', status='analyzing', progress_percentage=30, current_step='Analyzing')
+
+    assert bus.sync('job-1', 'analyzing', 30, 'Analyzing') is None
+    event = bus.sync('job-1', 'analyzing', 70, 'Processing analysis...')
+    assert event is not None and event.data['progress_percentage'] == 70
+    assert bus.get_stats()['synced'] == 1
+
+    # Many streams on one job: one of them reads the database per interval
+    claims = [bus.claim_sync('job-1', interval=60) for _ in range(20)]
+    assert claims.count(True) == 1
+
+
+def _client(chunks, text=''):
+    """What an SSE client rebuilds from the chunks: (thinking text, event names)."""
+    names = []
+    for chunk in chunks:
+        lines = dict(line.split(': ', 1) for line in chunk.strip().split('\n') if ': ' in line and line[0] != ':')
+        if 'event' not in lines:
+            continue
+        names.append(lines['event'])
+        payload = json.loads(lines['data'])
+        if lines['event'] == 'thinking_delta':
+            text = text[:payload['offset']] + payload['text']
+        elif 'llm_thinking' in payload.get('job_data', {}):
+            text = payload['job_data']['llm_thinking']
+    return text, names
+
+
+def _stream(bus, job_id, state, events_since, compact=False, resumed=False):
+    encoder = JobStreamEncoder(job_id, state, f"http://localhost:5005/analysis/{job_id}", compact=compact, resumed=resumed)
+    chunks = []
+    if not resumed:
+        chunks += [encoder.connected(), encoder.status_update(events_since, full_thinking=True)]
+    batch, done_id = encoder.batch(bus.replay(job_id, events_since)[0])
+    chunks += batch
+    if done_id:
+        chunks += encoder.finish(done_id)
+    return chunks
+
+
+def test_thinking_is_sent_as_deltas():
+    bus = JobEventBus(buffer_size=1000)
+    bus.publish('job-1', 'status', status='analyzing', progress_percentage=30, current_step='Analyzing')
+    encoder = JobStreamEncoder('job-1', bus.snapshot('job-1'), 'http://localhost:5005/analysis/job-1')
+    cursor = bus.cursor('job-1')
+
+    thinking = ''
+    chunks = []
+    for i in range(300):
+        thinking += f"Step {i}: the shadows on the left need more separation. "
+        bus.publish_thinking('job-1', thinking)
+        events = bus.wait('job-1', cursor, timeout=0)
+        cursor = events[-1].id
+        batch, _ = encoder.batch(events)
+        chunks += batch
+        if i % 10 == 0:
+            chunks.append(encoder.keepalive(cursor))
+
+    text, names = _client(chunks)
+    assert text == thinking
+    assert set(names) == {'thinking_delta', 'status_update'}
+    # Linear in the thinking length, not quadratic (full text per update would be ~150x)
+    assert sum(len(chunk) for chunk in chunks) < 2 * len(json.dumps(thinking)) + 300 * 200
+
+
+def test_reconnect_gets_full_text_or_missed_deltas():
+    bus = JobEventBus()
+    bus.publish('job-1', 'status', status='analyzing', progress_percentage=30, current_step='Analyzing')
+    bus.publish_thinking('job-1', 'First look. ')
+    seen = bus.cursor('job-1')
+    bus.publish_thinking('job-1', 'First look. Then the sky.')
+    bus.publish('job-1', 'status', status='completed', progress_percentage=100, current_step='Analysis complete')
+    bus.publish('job-1', 'complete', analysis_html='<p>ok</p>')
+    bus.publish('job-1', 'done')
+
+    # Resumed: only the missing tail of the thinking, applied to what the client had
+    chunks = _stream(bus, 'job-1', bus.snapshot('job-1'), seen, resumed=True)
+    text, names = _client(chunks, text='First look. ')
+    assert text == 'First look. Then the sky.'
+    assert names == ['thinking_delta', 'status_update', 'analysis_complete', 'done']
+    assert 'First look' not in chunks[0]
+
+    # Could not resume: full text in the first status_update
+    state = {'status': 'analyzing', 'llm_thinking': 'First look. '}
+    text, names = _client(_stream(bus, 'job-1', state, seen))
+    assert text == 'First look. Then the sky.'
+    assert names[:2] == ['connected', 'status_update']
+
+
+def test_compact_mode_sends_changes_only():
+    bus = JobEventBus()
+    encoder = JobStreamEncoder('job-1', {'status': 'analyzing', 'progress_percentage': 10, 'current_step': 'Summoning'},
+                               'http://localhost:5005/analysis/job-1', compact=True)
+    first = encoder.status_update(bus.cursor('job-1'), full_thinking=True)
+    assert ' ' not in first.split('data: ', 1)[1].replace('Summoning', '')
+
+    events = [bus.publish('job-1', 'status', status='analyzing', progress_percentage=30, current_step='Summoning')]
+    chunks, _ = encoder.batch(events)
+    assert json.loads(chunks[0].split('data: ', 1)[1])['job_data'] == {'progress_percentage': 30}
+    # Nothing changed: nothing sent; keepalive is an SSE comment
+    assert encoder.batch([bus.publish('job-1', 'status', status='analyzing', progress_percentage=30,
+                                      current_step='Summoning')]) == ([], None)
+    assert encoder.keepalive(events[-1].id).startswith(':')
+
+    encoder.state.update(status='completed', analysis_html='<p>' + 'x' * 10000 + '</p>')
+    complete = encoder.finish(events[-1].id)[0]
+    assert 'analysis_url' in complete and 'xxxx' not in complete
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Job Queue Unit Test
+===================
+
+Verifies that concurrent workers each claim distinct jobs, that a job
+whose lease expired is taken over (counting as a retry) and the previous
+holder's late writes are fenced off, that heartbeats keep a lease only while
+generation progresses (borrowing a pooled connection per renewal), that a
+stalled generation can be cancelled before its job is re-run, and that an
+idle worker wakes as soon as a job is queued instead of on its poll interval.
+Runs against a temporary SQLite database.
+
+Usage:
+    python3 -m pytest test/unit/test_job_queue.py
+"""
+
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+import pytest
+
+from mondrian.db_pool import get_pool
+from mondrian.generation_progress import GenerationTracker
+from mondrian.job_queue import (
+    JobNotifier, LeaseHeartbeat, LeaseLost, claim_next_job, ensure_lease_columns, fenced_update
+)
+from mondrian.job_results import ensure_results_schema, save_job_results
+
+
+def _create_db(path, jobs=0):
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        CREATE TABLE jobs (id TEXT PRIMARY KEY, filename TEXT, advisor TEXT, mode TEXT, status TEXT,
+                           error TEXT, retry_count INTEGER DEFAULT 0, current_step TEXT,
+                           progress_percentage INTEGER, created_at TEXT, last_activity TEXT,
+                           enable_rag INTEGER DEFAULT 0, llm_thinking TEXT)
+    """)
+    ensure_lease_columns(conn)
+    for i in range(jobs):
+        _queue(conn, f"job-{i:03d}", created_at=f"2026-01-01T00:00:{i:02d}")
+    conn.close()
+
+
+def _queue(conn, job_id, created_at=None):
+    conn.execute("INSERT INTO jobs (id, filename, advisor, mode, status, created_at) VALUES (?, ?, 'ansel', 'rag', 'queued', ?)",
+                 (job_id, f"uploads/{job_id}.jpg", created_at or datetime.now().isoformat()))
+    conn.commit()
+
+
+def test_concurrent_workers_claim_each_job_once(tmp_path):
+    db_path = str(tmp_path / 'jobs.db')
+    _create_db(db_path, jobs=40)
+    claimed = {}
+    lock = threading.Lock()
+
+    def worker(owner):
+        conn = sqlite3.connect(db_path, timeout=10)
+        while True:
+            job = claim_next_job(conn, owner)
+            if job is None:
+                break
+            with lock:
+                claimed.setdefault(job['id'], []).append(owner)
+        conn.close()
+
+    threads = [threading.Thread(target=worker, args=(f"w{i}",)) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(claimed) == 40
+    assert all(len(owners) == 1 for owners in claimed.values())
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'analyzing' AND lease_owner IS NOT NULL").fetchone()[0] == 40
+
+
+def test_expired_lease_is_reclaimed_as_retry(tmp_path):
+    db_path = str(tmp_path / 'jobs.db')
+    _create_db(db_path, jobs=1)
+    conn = sqlite3.connect(db_path)
+
+    first = claim_next_job(conn, 'w1', lease_seconds=60)
+    assert first['id'] == 'job-000' and not first['recovered']
+    # Lease still valid: nothing to claim
+    assert claim_next_job(conn, 'w2') is None
+
+    expired = (datetime.now() - timedelta(seconds=1)).isoformat()
+    conn.execute("UPDATE jobs SET lease_expires_at = ?", (expired,))
+    conn.commit()
+    second = claim_next_job(conn, 'w2')
+    assert second['id'] == 'job-000'
+    assert second['recovered'] and second['retry_count'] == 1
+    assert conn.execute("SELECT lease_owner FROM jobs").fetchone()[0] == 'w2'
+    assert second['lease_token'] == first['lease_token'] + 1
+
+    # The first worker finishes late: its write (and its results, same transaction) is rejected, the re-run's is kept
+    ensure_results_schema(conn)
+    with pytest.raises(LeaseLost):
+        save_job_results(conn, 'job-000', {'analysis_html': '<p>stale</p>'})
+        fenced_update(conn, 'job-000', first['lease_token'], "status = ?, llm_thinking = ?", ('completed', 'stale'))
+    assert conn.execute("SELECT COUNT(*) FROM job_results").fetchone()[0] == 0
+    fenced_update(conn, 'job-000', second['lease_token'], "status = ?, llm_thinking = ?", ('completed', 'fresh'))
+    assert conn.execute("SELECT status, llm_thinking FROM jobs").fetchone() == ('completed', 'fresh')
+    conn.close()
+
+
+def test_heartbeat_renews_only_while_generation_progresses(tmp_path):
+    db_path = str(tmp_path / 'jobs.db')
+    _create_db(db_path, jobs=1)
+    conn = sqlite3.connect(db_path)
+    job = claim_next_job(conn, 'w1', lease_seconds=0.3)
+    tracker = GenerationTracker()
+    tracker.start(job['id'])
+
+    def alive():
+        progress = tracker.get(job['id'])
+        return progress is None or progress['idle_seconds'] < 0.2
+
+    with LeaseHeartbeat(db_path, job['id'], job['lease_token'], alive=alive,
+                        interval=0.05, lease_seconds=0.3) as heartbeat:
+        # Generating: tokens keep arriving, the lease outlives its 0.3 s length
+        for _ in range(10):
+            tracker.step(job['id'])
+            time.sleep(0.05)
+        assert claim_next_job(sqlite3.connect(db_path), 'w2') is None
+        # Stalled: no tokens, renewals stop and the lease lapses
+        time.sleep(0.6)
+        taken_over = claim_next_job(sqlite3.connect(db_path), 'w2')
+        assert taken_over is not None and taken_over['recovered']
+        time.sleep(0.1)
+
+    assert heartbeat.beats > 0
+    # After the takeover the old lease token can no longer be renewed
+    tracker.step(job['id'])
+    with LeaseHeartbeat(db_path, job['id'], job['lease_token'], interval=0.02) as stale:
+        time.sleep(0.1)
+    assert stale.lost
+    conn.close()
+
+
+def test_heartbeat_returns_connection_between_beats(tmp_path):
+    db_path = str(tmp_path / 'jobs.db')
+    _create_db(db_path, jobs=1)
+    conn = sqlite3.connect(db_path)
+    job = claim_next_job(conn, 'w1')
+
+    with LeaseHeartbeat(db_path, job['id'], job['lease_token'], interval=0.05) as heartbeat:
+        time.sleep(0.3)
+        assert heartbeat.beats > 0
+        assert len(get_pool(db_path)._idle) == 1
+    conn.close()
+
+
+def test_stalled_generation_cancelled():
+    tracker = GenerationTracker()
+    assert not tracker.cancel('job-1')  # Not generating
+
+    tracker.start('job-1')
+    assert not tracker.cancelled('job-1')
+    assert tracker.cancel('job-1')
+    assert tracker.cancelled('job-1') and tracker.get('job-1')['cancelled']
+
+    # The generation ends: nothing left to cancel, and a re-run starts clean
+    tracker.finish('job-1')
+    assert tracker.get('job-1') is None and not tracker.cancelled('job-1')
+    tracker.start('job-1')
+    assert not tracker.cancelled('job-1')
+
+
+def test_idle_worker_wakes_on_notify(tmp_path):
+    db_path = str(tmp_path / 'jobs.db')
+    _create_db(db_path)
+    notifier = JobNotifier()
+    picked = []
+
+    def worker():
+        conn = sqlite3.connect(db_path)
+        deadline = time.monotonic() + 5
+        while not picked and time.monotonic() < deadline:
+            generation = notifier.generation
+            job = claim_next_job(conn, 'w1')
+            if job:
+                picked.append(time.perf_counter())
+                break
+            notifier.wait(generation, timeout=5)
+        conn.close()
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    time.sleep(0.1)  # worker is now idle
+
+    with sqlite3.connect(db_path) as conn:
+        _queue(conn, 'job-new')
+    queued_at = time.perf_counter()
+    notifier.notify()
+    thread.join(timeout=5)
+
+    assert picked, "worker did not pick up the job"
+    assert picked[0] - queued_at < 0.5
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Job Results Store Unit Test
+===========================
+
+Checks that result payloads round-trip through the content-addressed store
+(llm_outputs and analysis_markdown rebuilt as the worker wrote them), that
+identical text is stored once across fields and jobs, that a read touches
+only the fields asked for, that large documents are stored gzip-compressed
+(and handed out still compressed for sending as is, their hash - the
+ETag - without reading them), that jobs written
+before the store are still read from their columns, and that
+scripts/migrate_job_results.py moves them without changing what readers get.
+
+Usage:
+    python3 -m pytest test/unit/test_job_results.py
+"""
+
+import gzip
+import json
+import sqlite3
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+sys.path.insert(0, str(PROJECT_ROOT / 'scripts'))
+
+from mondrian.job_queue import JOB_STATUS_SQL
+from mondrian.job_results import (
+    RESULT_FIELDS, compress_result_blobs, content_hash, delete_job_results, ensure_results_schema,
+    format_analysis_markdown, load_job_results, load_result_document, result_hash, results_stats, save_job_results
+)
+from mondrian.query_indexes import query_plan
+from migrate_job_results import migrate_job_results
+
+BIO = "Ansel Adams (1902-1984) was an American landscape photographer. " * 20
+PROMPT = "Analyze this photograph across eight dimensions. " * 50
+
+
+def _create_db(path):
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        CREATE TABLE jobs (id TEXT PRIMARY KEY, filename TEXT, status TEXT, advisor TEXT, mode TEXT, created_at TEXT,
+                           current_step TEXT, progress_percentage INTEGER, enable_rag INTEGER, error TEXT,
+                           model TEXT, adapter TEXT, prompt_tokens_before INTEGER, prompt_tokens_after INTEGER,
+                           prompt TEXT, llm_prompt TEXT, analysis_markdown TEXT, llm_thinking TEXT,
+                           analysis_html TEXT, advisor_bio TEXT, llm_outputs TEXT, summary_html TEXT,
+                           advisor_bio_html TEXT)
+    """)
+    ensure_results_schema(conn)
+    return conn
+
+
+def _worker_results(i):
+    """What the job service worker saves for a completed job."""
+    response = f"Job {i}: the foreground rocks carry the composition. " * 40
+    return {
+        'analysis_html': f"<html><p>analysis {i}</p></html>", 'summary_html': f"<p>summary {i}</p>",
+        'advisor_bio': BIO, 'advisor_bio_html': f"<p>{BIO}</p>", 'llm_thinking': f"Thinking about {i}",
+        'prompt': PROMPT, 'llm_prompt': PROMPT, 'llm_response': response,
+        'llm_outputs': json.dumps({'prompt': PROMPT, 'response': response, 'summary': f"Summary {i}",
+                                   'model': 'qwen', 'timestamp': '2026-10-18T10:00:00', 'rag_context': None}),
+    }
+
+
+def test_round_trip_and_dedup(tmp_path):
+    conn = _create_db(tmp_path / 'jobs.db')
+    for i in range(10):
+        conn.execute("INSERT INTO jobs (id, advisor, status) VALUES (?, 'ansel', 'completed')", (f"job-{i}",))
+        save_job_results(conn, f"job-{i}", _worker_results(i))
+
+    job = load_job_results(conn, 'job-3')
+    expected = _worker_results(3)
+    assert set(job) == set(RESULT_FIELDS)
+    for field in ('analysis_html', 'summary_html', 'advisor_bio', 'llm_thinking', 'prompt', 'llm_prompt'):
+        assert job[field] == expected[field]
+    # Same JSON as the worker wrote, prompt and response included
+    assert json.loads(job['llm_outputs']) == json.loads(expected['llm_outputs'])
+    assert job['analysis_markdown'] == format_analysis_markdown('ansel', 'Summary 3', expected['llm_response'])
+
+    # Prompt (x2 fields) and bio (text and HTML) stored once for all jobs; the response once per job
+    stats = results_stats(conn)
+    assert stats['blobs'] == 3 + 10 * 5
+    single_copy = sum(len(v) for i in range(10) for k, v in _worker_results(i).items() if k != 'llm_outputs')
+    assert stats['stored_bytes'] < single_copy / 3
+
+    # Only what is asked for
+    assert load_job_results(conn, 'job-3', ('analysis_html',)) == {'analysis_html': expected['analysis_html']}
+
+    # Blobs other jobs still use survive deleting a job
+    delete_job_results(conn, ['job-3'])
+    assert load_job_results(conn, 'job-3', ('prompt',)) == {'prompt': ''}
+    assert load_job_results(conn, 'job-4', ('prompt',)) == {'prompt': PROMPT}
+    delete_job_results(conn)
+    assert results_stats(conn)['blobs'] == 0
+
+
+def test_documents_stored_compressed(tmp_path):
+    conn = _create_db(tmp_path / 'jobs.db')
+    html = "<html><body>" + "".join(f"<p>Zone {i % 10}: hold the shadows.</p>" for i in range(2000)) + "</body></html>"
+    conn.execute("INSERT INTO jobs (id, advisor, status) VALUES ('job-1', 'ansel', 'completed')")
+    save_job_results(conn, 'job-1', {'analysis_html': html, 'summary_html': '<p>short</p>'})
+
+    document = load_result_document(conn, 'job-1', 'analysis_html')
+    assert document.encoding == 'gzip' and document.hash == content_hash(html)
+    assert gzip.decompress(document.data).decode('utf-8') == html == document.text()
+    assert document.size == len(html) and len(document.data) < len(html) / 10
+    assert load_job_results(conn, 'job-1', ('analysis_html',)) == {'analysis_html': html}
+    assert result_hash(conn, 'job-1', 'analysis_html') == document.hash
+    # Too small to be worth it
+    assert load_result_document(conn, 'job-1', 'summary_html').encoding is None
+    assert load_result_document(conn, 'job-1', 'advisor_bio') is None
+    stats = results_stats(conn)
+    assert stats['compressed_bytes'] < stats['stored_bytes'] / 10
+
+    # Blobs written uncompressed (before compression) are compressed in place
+    conn.execute("INSERT INTO jobs (id, advisor, status, analysis_html) VALUES ('job-2', 'ansel', 'completed', ?)",
+                 (html + ' ',))
+    assert load_result_document(conn, 'job-2', 'analysis_html').encoding is None  # Legacy column
+    assert result_hash(conn, 'job-2', 'analysis_html') == content_hash(html + ' ')
+    assert result_hash(conn, 'job-2', 'summary_html') is None
+    conn.execute("INSERT INTO result_blobs (hash, content, size) VALUES (?, ?, ?)",
+                 (content_hash(html * 2), html * 2, len(html) * 2))
+    conn.execute("INSERT INTO job_results (job_id, field, blob_hash) VALUES ('job-3', 'analysis_html', ?)",
+                 (content_hash(html * 2),))
+    assert compress_result_blobs(conn) == 1
+    assert load_result_document(conn, 'job-3', 'analysis_html').text() == html * 2
+
+
+def test_reads_are_index_lookups(tmp_path):
+    conn = _create_db(tmp_path / 'jobs.db')
+    assert not any('SCAN' in line for line in query_plan(conn, JOB_STATUS_SQL, ('job-1',)))
+    sql = ("SELECT r.field, b.content FROM job_results r JOIN result_blobs b ON b.hash = r.blob_hash "
+           "WHERE r.job_id = ? AND r.field IN (?, ?)")
+    assert not any('SCAN' in line for line in query_plan(conn, sql, ('job-1', 'prompt', 'analysis_html')))
+    # ETag lookup: the job_results key only, no blob
+    plan = query_plan(conn, "SELECT blob_hash FROM job_results WHERE job_id = ? AND field = ?", ('job-1', 'prompt'))
+    assert not any('SCAN' in line or 'result_blobs' in line for line in plan)
+
+
+def test_legacy_rows_read_and_migrate(tmp_path):
+    db_path = tmp_path / 'jobs.db'
+    conn = _create_db(db_path)
+    expected = {}
+    for i in range(5):
+        results = _worker_results(i)
+        outputs = json.loads(results['llm_outputs'])
+        row = {field: results[field] for field in RESULT_FIELDS if field in results}
+        row['analysis_markdown'] = format_analysis_markdown('ansel', outputs['summary'], outputs['response'])
+        conn.execute(f"INSERT INTO jobs (id, advisor, status, {', '.join(row)}) "
+                     f"VALUES (?, 'ansel', 'completed', {', '.join('?' * len(row))})", (f"job-{i}", *row.values()))
+        expected[f"job-{i}"] = row
+    # A hand-edited markdown is kept as it is
+    conn.execute("UPDATE jobs SET analysis_markdown = 'edited' WHERE id = 'job-0'")
+    expected['job-0']['analysis_markdown'] = 'edited'
+    conn.commit()
+
+    before = {job_id: load_job_results(conn, job_id) for job_id in expected}
+    assert before['job-1']['analysis_markdown'] == expected['job-1']['analysis_markdown']
+    conn.close()
+
+    assert migrate_job_results(str(db_path)) == 5
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("SELECT COUNT(*) FROM jobs WHERE prompt IS NOT NULL OR analysis_html IS NOT NULL").fetchone()[0] == 0
+    for job_id, job in before.items():
+        after = load_job_results(conn, job_id)
+        assert json.loads(after.pop('llm_outputs')) == json.loads(job.pop('llm_outputs'))
+        assert after == job
+    assert migrate_job_results(str(db_path)) == 0
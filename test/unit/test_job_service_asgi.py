@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Job Service ASGI Unit Test
+==========================
+
+Drives mondrian.job_service_asgi.JobServiceASGI in-process (no server):
+Flask routes keep working through the thread-pool bridge (query strings,
+headers, multipart uploads), and hundreds of /stream connections wait on
+one event loop, all wake on a publish, and release their bus waiters when
+the client disconnects.
+
+Usage:
+    python3 -m pytest test/unit/test_job_service_asgi.py
+"""
+
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+from flask import Flask, jsonify, request
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from mondrian.job_events import JobEventBus, JobStream
+from mondrian.job_service_asgi import JobServiceASGI
+
+
+def _make_app(jobs):
+    app = Flask(__name__)
+
+    @app.route('/status/<job_id>')
+    def status(job_id):
+        return jsonify({'job_id': job_id, 'verbose': request.args.get('verbose'),
+                        'agent': request.headers.get('User-Agent')})
+
+    @app.route('/upload', methods=['POST'])
+    def upload():
+        file = request.files['image']
+        return jsonify({'filename': file.filename, 'size': len(file.read()), 'advisor': request.form['advisor']}), 201
+
+    bus = JobEventBus()
+
+    def open_stream(job_id, host, args, headers):
+        return JobStream(bus, job_id, load_job=jobs.get, resync=lambda job_id: job_id in jobs,
+                         analysis_url=f"http://{host}/analysis/{job_id}",
+                         last_event_id=headers.get('Last-Event-ID'), compact=args.get('compact') == '1')
+
+    return JobServiceASGI(app, open_stream, bus, threads=4), bus
+
+
+async def _request(app, method, path, query=b'', headers=(), body=b''):
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {'type': 'http', 'method': method, 'path': path, 'query_string': query,
+             'headers': [(k.encode(), v.encode()) for k, v in headers], 'server': ('testserver', 5005)}
+    await app(scope, receive, send)
+    return sent[0]['status'], b''.join(m.get('body', b'') for m in sent[1:])
+
+
+def test_flask_routes_through_thread_pool():
+    app, _ = _make_app({})
+
+    async def run():
+        status, body = await _request(app, 'GET', '/status/job-1', query=b'verbose=1',
+                                      headers=[('User-Agent', 'iOS/1.0')])
+        assert status == 200
+        assert json.loads(body) == {'job_id': 'job-1', 'verbose': '1', 'agent': 'iOS/1.0'}
+
+        boundary = 'XyZ'
+        form = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"advisor\"\r\n\r\nansel\r\n"
+                f"--{boundary}\r\nContent-Disposition: form-data; name=\"image\"; filename=\"a.jpg\"\r\n"
+                f"Content-Type: image/jpeg\r\n\r\n").encode() + b'\xff' * 5000 + f"\r\n--{boundary}--\r\n".encode()
+        status, body = await _request(app, 'POST', '/upload', body=form,
+                                      headers=[('Content-Type', f'multipart/form-data; boundary={boundary}')])
+        assert status == 201
+        assert json.loads(body) == {'filename': 'a.jpg', 'size': 5000, 'advisor': 'ansel'}
+
+        status, _ = await _request(app, 'GET', '/stream/missing')
+        assert status == 404
+
+    asyncio.run(run())
+
+
+def test_many_streams_on_one_loop():
+    jobs = {'job-1': {'status': 'analyzing', 'progress_percentage': 30, 'current_step': 'Analyzing'}}
+    app, bus = _make_app(jobs)
+    streams = 300
+
+    async def run():
+        received = [[] for _ in range(streams)]
+        disconnect = asyncio.Event()
+
+        async def client(i, job_id='job-1'):
+            async def receive():
+                await disconnect.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                received[i].append(message)
+
+            scope = {'type': 'http', 'method': 'GET', 'path': f'/stream/{job_id}', 'query_string': b'',
+                     'headers': [(b'host', b'localhost:5005')]}
+            await app(scope, receive, send)
+
+        tasks = [asyncio.ensure_future(client(i)) for i in range(streams)]
+        while bus.get_stats()['async_waiters'] < streams:
+            await asyncio.sleep(0.01)
+        assert app.open_streams == streams
+
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, lambda: bus.publish('job-1', 'status', status='analyzing',
+                                                            progress_percentage=70, current_step='Processing'))
+        while not all(any(b'"progress_percentage": 70' in m.get('body', b'') for m in r) for r in received):
+            await asyncio.sleep(0.01)
+
+        # Completed job: every stream ends on its own
+        await loop.run_in_executor(None, lambda: bus.publish('job-1', 'complete', analysis_html='<p>ok</p>'))
+        await loop.run_in_executor(None, lambda: bus.publish('job-1', 'done'))
+        await asyncio.wait_for(asyncio.gather(*tasks), timeout=10)
+        for messages in received:
+            assert messages[0]['status'] == 200
+            assert b'event: done' in messages[-2]['body'] and messages[-1]['more_body'] is False
+
+        # A client that goes away releases its waiter
+        jobs['job-2'] = {'status': 'analyzing'}
+        gone = asyncio.ensure_future(client(0, 'job-2'))
+        while bus.get_stats()['async_waiters'] < 1:
+            await asyncio.sleep(0.01)
+        disconnect.set()
+        await asyncio.wait_for(gone, timeout=5)
+        assert bus.get_stats()['async_waiters'] == 0 and app.open_streams == 0
+
+    asyncio.run(run())
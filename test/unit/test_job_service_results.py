@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Job Service Result Delivery Unit Test
+=====================================
+
+Drives /analysis and /summary of mondrian/job_service_v2.3.py through the
+Flask test client: a matching If-None-Match (for the gzip and the plain
+ETag) gets a 304 without the payload being read, clients that accept gzip
+get the stored compressed bytes as they are, other clients the text, a job
+still running is not cached, and GET /jobs/<id> JSON is gzipped per request.
+
+Usage:
+    python3 -m pytest test/unit/test_job_service_results.py
+"""
+
+import gzip
+import importlib.util
+import json
+import sqlite3
+import sys
+from pathlib import Path
+
+import pytest
+
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from mondrian.job_results import content_hash, ensure_results_schema, save_job_results
+
+ANALYSIS_HTML = "<html><body>" + "".join(f"<p>Zone {i % 10}: hold the shadows.</p>" for i in range(2000)) + "</body></html>"
+SUMMARY_HTML = "<p>Top 3: lower the horizon.</p>"
+THINKING = "The foreground rocks carry the composition. " * 100
+
+
+def _load_service():
+    spec = importlib.util.spec_from_file_location('job_service_v2_3', PROJECT_ROOT / 'mondrian' / 'job_service_v2.3.py')
+    service = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(service)
+    return service
+
+
+@pytest.fixture
+def service(tmp_path):
+    db_path = tmp_path / 'jobs.db'
+    conn = sqlite3.connect(db_path)
+    conn.execute("""
+        CREATE TABLE jobs (id TEXT PRIMARY KEY, filename TEXT, status TEXT, advisor TEXT, mode TEXT, created_at TEXT,
+                           current_step TEXT, progress_percentage INTEGER, enable_rag INTEGER, error TEXT,
+                           model TEXT, adapter TEXT, prompt_tokens_before INTEGER, prompt_tokens_after INTEGER,
+                           prompt TEXT, llm_prompt TEXT, analysis_markdown TEXT, llm_thinking TEXT,
+                           analysis_html TEXT, advisor_bio TEXT, llm_outputs TEXT, summary_html TEXT,
+                           advisor_bio_html TEXT, last_activity TEXT)
+    """)
+    ensure_results_schema(conn)
+    for job_id, status in (('done', 'completed'), ('running', 'analyzing')):
+        conn.execute("INSERT INTO jobs (id, advisor, status) VALUES (?, 'ansel', ?)", (job_id, status))
+        save_job_results(conn, job_id, {'analysis_html': ANALYSIS_HTML, 'summary_html': SUMMARY_HTML,
+                                        'llm_thinking': THINKING})
+    conn.commit()
+    conn.close()
+
+    service = _load_service()
+    service.job_db = service.JobDatabase(str(db_path))
+
+    # Count payload reads
+    reads = []
+    get_result_document = service.job_db.get_result_document
+
+    def counting_get_result_document(job_id, field):
+        reads.append((job_id, field))
+        return get_result_document(job_id, field)
+
+    service.job_db.get_result_document = counting_get_result_document
+    service.reads = reads
+    return service
+
+
+def test_gzip_stored_bytes_sent_as_is(service):
+    client = service.app.test_client()
+    digest = content_hash(ANALYSIS_HTML)
+
+    response = client.get('/analysis/done', headers={'Accept-Encoding': 'gzip, deflate'})
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.headers['ETag'] == f'"{digest}-gzip"'
+    assert response.headers['Cache-Control'] == service.IMMUTABLE_CACHE_CONTROL
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert len(response.data) < len(ANALYSIS_HTML) / 10
+    assert gzip.decompress(response.data).decode('utf-8') == ANALYSIS_HTML
+
+
+def test_text_for_clients_without_gzip(service):
+    client = service.app.test_client()
+
+    for headers in ({}, {'Accept-Encoding': 'gzip;q=0, identity'}):
+        response = client.get('/analysis/done', headers=headers)
+        assert response.status_code == 200
+        assert 'Content-Encoding' not in response.headers
+        assert response.headers['ETag'] == f'"{content_hash(ANALYSIS_HTML)}"'
+        assert response.get_data(as_text=True) == ANALYSIS_HTML
+
+    # Stored uncompressed (too small): the same for everyone
+    response = client.get('/summary/done', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
+    assert response.headers['ETag'] == f'"{content_hash(SUMMARY_HTML)}"'
+    assert response.get_data(as_text=True) == SUMMARY_HTML
+
+
+def test_not_modified_without_reading_payload(service):
+    client = service.app.test_client()
+    digest = content_hash(ANALYSIS_HTML)
+
+    for etag, accept in ((f'"{digest}-gzip"', 'gzip'), (f'"{digest}"', ''), (f'W/"{digest}-gzip"', 'gzip')):
+        response = client.get('/analysis/done', headers={'If-None-Match': etag, 'Accept-Encoding': accept})
+        assert response.status_code == 304
+        assert response.data == b''
+        assert response.headers['ETag'] == etag.removeprefix('W/')
+        assert response.headers['Cache-Control'] == service.IMMUTABLE_CACHE_CONTROL
+    assert service.reads == []
+
+    # A stale ETag gets the document
+    response = client.get('/analysis/done', headers={'If-None-Match': '"0000-gzip"', 'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert service.reads == [('done', 'analysis_html')]
+
+
+def test_running_job_not_cached(service):
+    client = service.app.test_client()
+
+    response = client.get('/analysis/running', headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == 'no-cache'
+    # Still revalidated cheaply
+    response = client.get('/analysis/running', headers={'If-None-Match': response.headers['ETag']})
+    assert response.status_code == 304
+    assert response.headers['Cache-Control'] == 'no-cache'
+
+    assert client.get('/analysis/missing').status_code == 404
+    assert client.get('/summary/running').status_code == 400
+
+
+def test_job_json_gzipped_per_request(service):
+    client = service.app.test_client()
+
+    response = client.get('/jobs/done', headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    job = json.loads(gzip.decompress(response.data))
+    assert job['llm_thinking'] == THINKING and 'analysis_html' not in job
+
+    response = client.get('/jobs/done')
+    assert 'Content-Encoding' not in response.headers
+    assert json.loads(response.data)['llm_thinking'] == THINKING
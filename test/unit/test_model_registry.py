@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Model Registry Unit Test
+========================
+
+Checks byte accounting, LRU offload to host when the device budget is full,
+LRU unload when the host budget is full, and that pinned and in-use models
+are never evicted, that nothing is evicted for a model that cannot fit (nor
+its promotion retried until room may have appeared), and that loaders run
+outside the registry lock. Uses stand-in modules (tensors with a device and
+a size) so it runs without torch.
+
+Usage:
+    python3 -m pytest test/unit/test_model_registry.py
+"""
+
+import sys
+import threading
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from mondrian.model_registry import ModelRegistry, module_nbytes
+
+MB = 1000 * 1000
+
+
+class _Device:
+    def __init__(self, type_):
+        self.type = type_
+
+
+class _Tensor:
+    def __init__(self, nbytes, device='cpu'):
+        self.nbytes = nbytes
+        self.device = _Device(device)
+
+    def nelement(self):
+        return self.nbytes // 4
+
+    def element_size(self):
+        return 4
+
+
+class _Module:
+    """Stand-in for torch.nn.Module: named_parameters/named_buffers/to"""
+
+    def __init__(self, params):
+        self.params = {name: _Tensor(nbytes) for name, nbytes in params.items()}
+
+    def named_parameters(self):
+        return list(self.params.items())
+
+    def named_buffers(self):
+        return []
+
+    def to(self, device):
+        for tensor in self.params.values():
+            tensor.device = _Device(device.split(':')[0])
+        return self
+
+
+def _loader(nbytes, loads):
+    def load():
+        loads.append(1)
+        return _Module({'weight': nbytes})
+    return load
+
+
+def test_module_nbytes_splits_device_and_host_and_filters_names():
+    module = _Module({'base.weight': 8 * MB, 'base.lora_A.weight': 1 * MB})
+    module.params['base.weight'].device = _Device('cuda')
+
+    assert module_nbytes(module) == {'device': 8 * MB, 'host': 1 * MB}
+    assert module_nbytes((module, 'processor'), name_filter=lambda n: 'lora_' in n) == {'device': 0, 'host': 1 * MB}
+
+
+def test_lru_offload_then_unload_respects_pinned_and_in_use():
+    registry = ModelRegistry(device_budget=100 * MB, host_budget=60 * MB)
+    qwen = _Module({'weight': 60 * MB}).to('cuda')
+    registry.register('advisor:qwen', qwen, device='cuda')
+
+    loads = []
+    clip = registry.acquire('clip', _loader(30 * MB, loads), device='cuda')
+    assert module_nbytes(clip)['device'] == 30 * MB
+
+    # Text model does not fit next to Qwen + CLIP: CLIP (LRU) is offloaded to host
+    with registry.use('text', _loader(30 * MB, loads), device='cuda') as text:
+        assert module_nbytes(text)['device'] == 30 * MB
+        stats = registry.get_stats()
+        assert stats['models']['clip']['resident'] == 'host'
+        assert stats['models']['advisor:qwen']['resident'] == 'device'
+        assert stats['device_used_mb'] == 90.0
+
+        # CLIP back on the device: text is in use, so CLIP stays on host
+        registry.acquire('clip', _loader(30 * MB, loads), device='cuda')
+        assert registry.get_stats()['models']['clip']['resident'] == 'host'
+
+    # Host budget too small for two offloaded models: the LRU one is unloaded
+    onnx = registry.acquire('clip-onnx', _loader(40 * MB, loads), device='cpu')
+    assert onnx is not None
+    stats = registry.get_stats()
+    assert stats['models']['clip']['resident'] is None
+    assert stats['models']['clip']['unloads'] == 1
+    assert stats['host_used_mb'] <= 60.0
+
+    # Unloaded models are reloaded on demand
+    registry.acquire('clip', _loader(30 * MB, loads), device='cuda')
+    assert registry.get_stats()['models']['clip']['loads'] == 2
+    assert registry.get_stats()['models']['advisor:qwen']['resident'] == 'device'
+
+
+def test_nothing_evicted_for_a_model_that_cannot_fit():
+    registry = ModelRegistry(device_budget=100 * MB)
+    registry.register('advisor:qwen', _Module({'weight': 60 * MB}).to('cuda'), device='cuda')
+    registry.acquire('clip', _loader(30 * MB, []), device='cuda')
+
+    # 60 pinned + 50 > 100 even without CLIP: CLIP stays on the device
+    registry.acquire('big', _loader(50 * MB, []), device='cuda')
+    stats = registry.get_stats()
+    assert stats['models']['clip']['device_mb'] == 30 and stats['models']['clip']['offloads'] == 0
+    assert stats['models']['big']['device_mb'] == 0 and stats['models']['big']['host_mb'] == 50
+
+    # Not retried on every acquire, only once room may have appeared
+    device_checks = []
+    make_room = registry._make_room
+
+    def counting_make_room(kind, needed, keep=None):
+        if kind == 'device':
+            device_checks.append(needed)
+        return make_room(kind, needed, keep)
+
+    registry._make_room = counting_make_room
+    for _ in range(3):
+        registry.acquire('big', _loader(50 * MB, []), device='cuda')
+    assert device_checks == []
+
+    registry.configure(device_budget=120 * MB)
+    registry.acquire('big', _loader(50 * MB, []), device='cuda')
+    assert device_checks == [0, 50 * MB]  # configure, then the promotion
+    stats = registry.get_stats()
+    assert stats['models']['big']['device_mb'] == 50 and stats['models']['clip']['offloads'] == 1
+
+
+def test_loader_runs_outside_the_lock():
+    registry = ModelRegistry()
+    registry.acquire('text', _loader(10 * MB, []), device='cpu')
+
+    started, release = threading.Event(), threading.Event()
+    loads = []
+
+    def slow_load():
+        loads.append(1)
+        started.set()
+        release.wait(5)
+        return _Module({'weight': 30 * MB})
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(registry.acquire('clip', slow_load)))
+               for _ in range(2)]
+    threads[0].start()
+    assert started.wait(5)
+    threads[1].start()
+
+    # Other models stay available during the load
+    done = threading.Event()
+    threading.Thread(target=lambda: (registry.acquire('text', _loader(10 * MB, [])), done.set())).start()
+    assert done.wait(5)
+
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(loads) == 1 and len(results) == 2 and results[0] is results[1]
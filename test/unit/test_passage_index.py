@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Book Passage Index Unit Test
+============================
+
+Verifies semantic passage ranking with relevance_score as a prior, reload
+after book_passages changes, and the fallback to static ordering when no
+query embedding can be built. Runs against a temporary SQLite database; no
+models required.
+
+Usage:
+    python3 -m pytest test/unit/test_passage_index.py
+"""
+
+import json
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from mondrian import embedding_retrieval
+from mondrian.advisor_cache import get_artifact_cache
+from mondrian.passage_index import get_passage_index
+from mondrian.embedding_retrieval import get_book_passages_for_image
+
+
+def _create_db(path, passages):
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        CREATE TABLE book_passages (
+            id TEXT PRIMARY KEY, advisor_id TEXT NOT NULL, book_title TEXT NOT NULL,
+            passage_text TEXT NOT NULL, dimension_tags TEXT NOT NULL, embedding BLOB,
+            relevance_score REAL, source TEXT, notes TEXT
+        )
+    """)
+    _insert(conn, passages)
+    conn.close()
+
+
+def _insert(conn, passages):
+    conn.executemany(
+        "INSERT INTO book_passages (id, advisor_id, book_title, passage_text, dimension_tags, embedding, relevance_score) "
+        "VALUES (?, 'ansel', 'The Print', ?, ?, ?, ?)",
+        [(pid, f"text {pid}", json.dumps(['lighting']), np.asarray(vec, dtype=np.float32).tobytes(), rel)
+         for pid, vec, rel in passages]
+    )
+    conn.commit()
+
+
+def test_semantic_ranking_with_prior(tmp_path):
+    db_path = str(tmp_path / 'passages.db')
+    _create_db(db_path, [
+        ('popular', [0, 1, 0], 1.0),
+        ('match', [1, 0.1, 0], 0.2),
+        ('near', [1, 0.3, 0], 0.9),
+    ])
+
+    index = get_passage_index(db_path, 'ansel')
+    ranked = index.search(np.array([1, 0, 0]), top_k=3)
+    assert [p['passage_text'] for p in ranked] == ['text near', 'text match', 'text popular']
+    assert ranked[0]['dimensions'] == ['lighting']
+
+    # Without the prior the closest passage wins
+    assert index.search(np.array([1, 0, 0]), top_k=1, prior_weight=0.0)[0]['passage_text'] == 'text match'
+
+    with sqlite3.connect(db_path) as conn:
+        _insert(conn, [('exact', [1, 0, 0], 1.0)])
+    # Picked up at the next (throttled) version check; invalidation forces one
+    assert get_passage_index(db_path, 'ansel') is index
+    get_artifact_cache(db_path).invalidate()
+    reloaded = get_passage_index(db_path, 'ansel')
+    assert reloaded is not index
+    assert reloaded.search(np.array([1, 0, 0]), top_k=1)[0]['passage_text'] == 'text exact'
+
+
+def test_search_latency_and_static_fallback(tmp_path, monkeypatch):
+    db_path = str(tmp_path / 'passages.db')
+    rng = np.random.default_rng(0)
+    _create_db(db_path, [(f"p{i}", rng.standard_normal(384), float(i)) for i in range(2000)])
+
+    index = get_passage_index(db_path, 'ansel')
+    query = rng.standard_normal(384)
+    index.search(query)
+    start = time.perf_counter()
+    for _ in range(50):
+        index.search(query, top_k=6)
+    assert (time.perf_counter() - start) / 50 * 1000 < 5
+
+    # No image/text query available: static relevance_score ordering, read once
+    reads = []
+    get_top_book_passages = embedding_retrieval.get_top_book_passages
+    monkeypatch.setattr(embedding_retrieval, 'get_top_book_passages',
+                        lambda *args, **kwargs: reads.append(args) or get_top_book_passages(*args, **kwargs))
+    for _ in range(3):
+        passages = get_book_passages_for_image('ansel', max_passages=3, db_path=db_path)
+        assert [p['passage_text'] for p in passages] == ['text p1999', 'text p1998', 'text p1997']
+    assert len(reads) == 1
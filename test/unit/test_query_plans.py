@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Query Plan Unit Test
+====================
+
+Runs EXPLAIN QUERY PLAN on every hot query against jobs, dimensional_profiles
+and book_passages and fails if one reads a whole table without an index, so
+a missing index shows up here rather than as the jobs table grows into the
+hundreds of thousands of rows. The SQL is captured from the real code paths
+(job claim, RAG retrieval, passage and embedding index loads) with a trace
+callback. The indexes come either from the services' startup code or from
+scripts/migrations/add_hot_query_indexes.sql.
+
+Usage:
+    python3 -m pytest test/unit/test_query_plans.py
+"""
+
+import json
+import re
+import sqlite3
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from mondrian.db_pool import close_pools
+from mondrian.embedding_index import AdvisorEmbeddingIndex
+from mondrian.embedding_retrieval import get_book_passages_for_dimensions, get_top_book_passages
+from mondrian.job_queue import (
+    ACTIVE_JOBS_SQL, JOB_STATUS_SQL, RECENT_JOBS_SQL, STALE_JOBS_SQL, claim_next_job, ensure_lease_columns,
+    queue_counts
+)
+from mondrian.passage_index import AdvisorPassageIndex
+from mondrian.query_indexes import ensure_query_indexes, full_scans, query_plan
+from mondrian.rag_retrieval import (
+    ensure_exemplar_schema, get_images_for_weak_dimensions, get_similar_images_from_db,
+    get_top_reference_images, get_user_dimensional_profile
+)
+
+MIGRATION = PROJECT_ROOT / 'scripts' / 'migrations' / 'add_hot_query_indexes.sql'
+HOT_TABLES = ('jobs', 'dimensional_profiles', 'book_passages')
+SCORES = ['composition', 'lighting', 'focus_sharpness', 'color_harmony',
+          'subject_isolation', 'depth_perspective', 'visual_balance', 'emotional_impact']
+
+
+def _create_db(path, index_source):
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        CREATE TABLE jobs (id TEXT PRIMARY KEY, filename TEXT, advisor TEXT, mode TEXT, status TEXT, error TEXT,
+                           retry_count INTEGER DEFAULT 0, current_step TEXT, progress_percentage INTEGER,
+                           created_at TEXT, last_activity TEXT, enable_rag INTEGER DEFAULT 0, llm_thinking TEXT,
+                           model TEXT, adapter TEXT, prompt_tokens_before INTEGER, prompt_tokens_after INTEGER)
+    """)
+    conn.execute(f"""
+        CREATE TABLE dimensional_profiles (
+            id TEXT PRIMARY KEY, job_id TEXT, advisor_id TEXT NOT NULL, image_path TEXT NOT NULL,
+            {', '.join(f'{s}_score REAL, {s}_instructive TEXT' for s in SCORES)},
+            overall_grade TEXT, image_description TEXT, image_title TEXT, date_taken TEXT,
+            embedding BLOB, text_embedding BLOB, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE book_passages (id TEXT PRIMARY KEY, advisor_id TEXT NOT NULL, book_title TEXT NOT NULL,
+                                    passage_text TEXT NOT NULL, dimension_tags TEXT NOT NULL, embedding BLOB,
+                                    relevance_score REAL)
+    """)
+
+    # Mostly finished jobs, a handful runnable - the production shape
+    conn.executemany(
+        "INSERT INTO jobs (id, filename, advisor, mode, status, created_at, last_activity) VALUES (?, ?, 'ansel', 'rag', ?, ?, ?)",
+        [(f"job-{i:06d}", f"uploads/{i}.jpg", 'completed' if i % 500 else 'queued',
+          f"2026-01-01T{i:09d}", f"2026-01-01T{i:09d}") for i in range(20000)]
+    )
+    rng = np.random.default_rng(0)
+    for advisor in ('ansel', 'okeefe', 'watkins'):
+        conn.executemany(
+            f"INSERT INTO dimensional_profiles (id, advisor_id, image_path, {', '.join(s + '_score' for s in SCORES)}, embedding) "
+            f"VALUES (?, ?, ?, {', '.join('?' * len(SCORES))}, ?)",
+            [(f"{advisor}-{i}", advisor, f"refs/{advisor}/{i}.jpg", *rng.uniform(5, 10, len(SCORES)).tolist(),
+              rng.standard_normal(8).astype(np.float32).tobytes()) for i in range(300)]
+        )
+        conn.executemany(
+            "INSERT INTO book_passages VALUES (?, ?, 'The Print', ?, ?, ?, ?)",
+            [(f"{advisor}-p{i}", advisor, f"passage {i}", json.dumps(['lighting']),
+              rng.standard_normal(4).astype(np.float32).tobytes(), float(rng.uniform())) for i in range(200)]
+        )
+    conn.commit()
+
+    ensure_lease_columns(conn)
+    if index_source == 'startup':
+        ensure_query_indexes(conn)
+    else:
+        conn.executescript(MIGRATION.read_text())
+    ensure_exemplar_schema(conn)
+    conn.close()
+
+
+@pytest.fixture(params=['startup', 'migration'])
+def traced_db(request, tmp_path, monkeypatch):
+    """Database with the hot-query indexes; yields (db_path, statements run against it)."""
+    db_path = str(tmp_path / 'mondrian.db')
+    _create_db(db_path, request.param)
+
+    statements = []
+    connect = sqlite3.connect
+
+    def traced_connect(*args, **kwargs):
+        conn = connect(*args, **kwargs)
+        conn.set_trace_callback(statements.append)
+        return conn
+
+    close_pools()
+    monkeypatch.setattr(sqlite3, 'connect', traced_connect)
+    yield db_path, statements
+    monkeypatch.undo()
+    close_pools()
+
+
+def _hot_statements(statements):
+    """Reads and updates touching the hot tables."""
+    hot = []
+    for sql in statements:
+        text = sql.strip()
+        if not re.match(r'(SELECT|UPDATE|DELETE|WITH)\b', text, re.IGNORECASE):
+            continue
+        if re.search(r'\b(FROM|UPDATE)\s+(' + '|'.join(HOT_TABLES) + r')\b', text, re.IGNORECASE):
+            hot.append(text)
+    return hot
+
+
+def _assert_indexed(conn, sql, params=()):
+    plan = query_plan(conn, sql, params)
+    assert not full_scans(plan), f"Full table scan:\n{sql}\n{plan}"
+    if re.search(r'\bWHERE\b', sql, re.IGNORECASE):
+        # Filtered queries must seek, not walk a whole index
+        walks = [line for line in plan if re.match(r'SCAN (' + '|'.join(HOT_TABLES) + r')\b', line)]
+        assert not walks, f"Filtered query walks a whole index:\n{sql}\n{plan}"
+    return plan
+
+
+def test_hot_queries_use_indexes(traced_db):
+    db_path, statements = traced_db
+
+    with sqlite3.connect(db_path) as conn:
+        assert claim_next_job(conn, 'w1') is not None
+        queue_counts(conn)
+
+    get_top_reference_images(db_path, 'ansel', max_total=10)
+    get_similar_images_from_db(db_path, 'ansel', top_k=3)
+    get_images_for_weak_dimensions(db_path, 'ansel', ['lighting', 'composition'])
+    get_user_dimensional_profile(db_path, 'refs/ansel/1.jpg')
+    get_top_book_passages('ansel', db_path=db_path)
+    get_book_passages_for_dimensions('ansel', ['lighting'], db_path=db_path)
+    AdvisorPassageIndex(db_path, 'ansel').load()
+    AdvisorEmbeddingIndex(db_path, 'ansel', 'embedding').load()
+
+    hot = _hot_statements(statements)
+    assert len(hot) >= 10
+    conn = sqlite3.connect(db_path)
+    try:
+        for sql in hot:
+            _assert_indexed(conn, sql)
+
+        # Job service queries (mondrian/job_service_v2.3.py)
+        now = datetime.now().isoformat()
+        _assert_indexed(conn, RECENT_JOBS_SQL, (100,))
+        _assert_indexed(conn, ACTIVE_JOBS_SQL, (3,))
+        _assert_indexed(conn, STALE_JOBS_SQL, (now, now))
+        _assert_indexed(conn, "SELECT * FROM jobs WHERE id = ?", ('job-000001',))
+        _assert_indexed(conn, JOB_STATUS_SQL, ('job-000001',))
+
+        # Ordered reads come straight off the index, no sort step
+        for sql in hot:
+            if 'relevance_score DESC' in sql and 'LIMIT' in sql or '/ 8.0 DESC' in sql:
+                assert not any('TEMP B-TREE' in line for line in query_plan(conn, sql)), sql
+        assert not any('TEMP B-TREE' in line for line in query_plan(conn, RECENT_JOBS_SQL, (100,)))
+    finally:
+        conn.close()
+
+
+def test_claim_stays_indexed_with_statistics(tmp_path):
+    db_path = str(tmp_path / 'mondrian.db')
+    _create_db(db_path, 'startup')
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("ANALYZE")
+        statements = []
+        conn.set_trace_callback(statements.append)
+        assert claim_next_job(conn, 'w1') is not None
+        claim = next(sql for sql in statements if sql.lstrip().upper().startswith('UPDATE'))
+        plan = query_plan(conn, claim)
+    assert not full_scans(plan), plan
+    assert any('idx_jobs_claim' in line for line in plan), plan
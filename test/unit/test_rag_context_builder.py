@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+RAG Context Builder Unit Test
+=============================
+
+Verifies token-budget packing of citation candidates without loading a model.
+A whitespace tokenizer stands in for processor.tokenizer.
+
+Usage:
+    python3 -m pytest test/unit/test_rag_context_builder.py
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+from mondrian.rag_context_builder import INSTRUCTIVE_PREVIEW_WORDS, RAGContextBuilder, render_image_segment
+
+
+class WhitespaceTokenizer:
+    def __init__(self):
+        self.calls = 0
+
+    def encode(self, text, add_special_tokens=False):
+        self.calls += 1
+        return text.split()
+
+
+def _passages():
+    return [
+        {'passage_text': 'word ' * 100, 'book_title': 'The Negative', 'dimensions': ['lighting'], 'relevance_score': 9.0},
+        {'passage_text': 'short quote', 'book_title': 'The Print', 'dimensions': ['composition'], 'relevance_score': 4.0},
+    ]
+
+
+def _images():
+    return [
+        {'image_title': 'Moonrise', 'date_taken': '1941', 'lighting_score': 9.5,
+         'lighting_instructive': 'Expose for the shadows and develop for the highlights.'},
+        {'image_title': 'Clearing Storm', 'date_taken': '1944', 'composition_score': 8.0},
+    ]
+
+
+def test_pack_respects_budget_and_keeps_order():
+    builder = RAGContextBuilder(tokenizer=WhitespaceTokenizer(), max_context_tokens=120)
+    images, passages, stats = builder.pack('ansel', _images(), _passages())
+
+    assert stats['packed_tokens'] <= 120
+    assert stats['packed_tokens'] == stats['quote_tokens'] + stats['image_tokens']
+    # The 100-word quote does not fit in the quotes' half; both images fit in the rest
+    assert [img['image_title'] for img in images] == ['Moonrise', 'Clearing Storm']
+    assert [p['book_title'] for p in passages] == ['The Print']
+
+
+def test_types_packed_against_own_share():
+    # Quote scores (0-1 similarity) are far below image scores (0-10): with a
+    # shared ranking images would take the whole budget
+    passages = [{'passage_text': 'word ' * 30, 'book_title': f'Book {i}', 'dimensions': ['lighting'],
+                 'passage_score': 0.9 - i / 10} for i in range(4)]
+    images = [{'image_title': f'Image {i}', 'date_taken': '1941', 'lighting_score': 9.0, 'location': 'x ' * 40}
+              for i in range(4)]
+    builder = RAGContextBuilder(tokenizer=WhitespaceTokenizer(), max_context_tokens=200)
+    selected_images, selected_passages, stats = builder.pack('ansel', images, passages)
+
+    assert selected_images and selected_passages
+    # Best-scored quotes first
+    assert [p['book_title'] for p in selected_passages] == [f'Book {i}' for i in range(len(selected_passages))]
+    assert stats['packed_tokens'] <= 200
+
+    # A share the other type leaves unused is not wasted
+    _, only_passages, stats = builder.pack('ansel', [], passages)
+    assert len(only_passages) > len(selected_passages) and stats['image_tokens'] == 0
+
+
+def test_segment_tokens_cached_per_advisor():
+    tokenizer = WhitespaceTokenizer()
+    builder = RAGContextBuilder(tokenizer=tokenizer, max_context_tokens=10_000)
+    builder.pack('ansel', _images(), _passages())
+    calls = tokenizer.calls
+    builder.pack('ansel', _images(), _passages())
+    assert tokenizer.calls == calls
+
+    builder.pack('okeefe', _images(), _passages())
+    assert tokenizer.calls > calls
+    assert set(builder.cache_stats()) == {'ansel', 'okeefe'}
+
+
+def test_segment_count_matches_rendered_text():
+    builder = RAGContextBuilder(tokenizer=WhitespaceTokenizer())
+    text = render_image_segment('IMG_1', _images()[0])
+    assert builder.segment_tokens('ansel', text) == len(text.split())
+
+
+def test_instructive_texts_counted_in_image_segment():
+    moonrise = _images()[0]
+    text = render_image_segment('IMG_1', moonrise)
+    assert moonrise['lighting_instructive'] in text
+
+    # A long instructive text is truncated and makes its image cost more
+    wordy = dict(moonrise, lighting_instructive='zone ' * 200)
+    wordy_text = render_image_segment('IMG_1', wordy)
+    assert len(text.split()) < len(wordy_text.split()) < len(text.split()) + INSTRUCTIVE_PREVIEW_WORDS
+
+    builder = RAGContextBuilder(tokenizer=WhitespaceTokenizer(), max_context_tokens=len(wordy_text.split()) - 1)
+    images, _, stats = builder.pack('ansel', [wordy], [])
+    assert images == [] and stats['image_tokens'] == 0
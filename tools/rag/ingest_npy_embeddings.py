@@ -5,6 +5,10 @@ Ingest .npy embedding files into image_captions table.
 This script bridges the gap between compute_image_embeddings.py (which generates .npy files)
 and the RAG service (which queries the database).
 
+Vectors are written to the memory-mapped embedding store
+(embedding_store/<advisor>__<model>/, see mondrian/embedding_store.py);
+image_captions rows keep only a pointer in embedding_ref.
+
 Usage:
     python ingest_npy_embeddings.py --advisor_dir mondrian/source/advisor/photographer/ansel/ --advisor_id ansel
     
@@ -13,6 +17,7 @@ Usage:
 """
 
 import os
+import sys
 import argparse
 from pathlib import Path
 import numpy as np
@@ -21,8 +26,15 @@ import uuid
 import json
 from datetime import datetime
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+
+from mondrian.embedding_store import EmbeddingStore, ensure_ref_columns, make_ref
+
 DB_PATH = "mondrian.db"
 
+# Model used by compute_image_embeddings.py
+DEFAULT_MODEL = "ViT-B/32"
+
 def ensure_table():
     """Ensure image_captions table exists"""
     conn = sqlite3.connect(DB_PATH)
@@ -39,15 +51,17 @@ def ensure_table():
         )
     ''')
     conn.commit()
+    ensure_ref_columns(conn, 'image_captions')
     conn.close()
 
-def ingest_npy_embeddings(advisor_dir, advisor_id):
+def ingest_npy_embeddings(advisor_dir, advisor_id, model=DEFAULT_MODEL):
     """
-    Load .npy embeddings and insert into database.
+    Load .npy embeddings into the embedding store and index them in the database.
     
     Args:
         advisor_dir: Directory containing images and their .npy embedding files
         advisor_id: Advisor identifier (e.g., 'ansel', 'okeefe')
+        model: Model that produced the .npy files (selects the store)
     """
     advisor_dir = Path(advisor_dir)
     
@@ -72,6 +86,7 @@ def ingest_npy_embeddings(advisor_dir, advisor_id):
     success_count = 0
     skip_count = 0
     error_count = 0
+    pending = []
     
     for npy_path in npy_files:
         try:
@@ -114,40 +129,59 @@ def ingest_npy_embeddings(advisor_dir, advisor_id):
                 error_count += 1
                 continue
             
-            # Create metadata
+            if pending and len(embedding) != len(pending[0][2]):
+                print(f"[ERROR] Embedding dim {len(embedding)} for {npy_path} does not match {len(pending[0][2])}")
+                error_count += 1
+                continue
+            
+            pending.append((str(uuid.uuid4()), image_path, embedding.astype(np.float32), npy_path))
+            
+        except Exception as e:
+            print(f"[ERROR] Failed to ingest {npy_path}: {e}")
+            error_count += 1
+    
+    if pending:
+        # One store write for the whole directory, then one insert batch of pointers
+        store = EmbeddingStore.open_for_write(DB_PATH, advisor_id, model, len(pending[0][2]))
+        slots = store.upsert([row_id for row_id, _, _, _ in pending],
+                             np.vstack([emb for _, _, emb, _ in pending]), publish=False)
+        
+        rows = []
+        for (row_id, image_path, embedding, npy_path), slot in zip(pending, slots):
             metadata = {
                 "embedding_dim": len(embedding),
                 "embedding_source": "compute_image_embeddings.py",
+                "embedding_model": model,
                 "npy_path": str(npy_path),
                 "ingested_at": datetime.now().isoformat()
             }
-            
-            # Insert into database
-            cursor.execute("""
-                INSERT INTO image_captions
-                (id, job_id, image_path, caption, caption_type, embedding, metadata, created_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                str(uuid.uuid4()),
+            rows.append((
+                row_id,
                 f"{advisor_id}-{image_path.stem}",
                 str(image_path),
                 f"CLIP embedding for {image_path.name}",  # Placeholder caption
                 'clip_embedding',
-                embedding.tobytes(),
+                make_ref(store.name, slot),
                 json.dumps(metadata),
                 datetime.now().isoformat()
             ))
-            
             print(f"[OK] Ingested: {image_path.name} (dim={len(embedding)})")
-            success_count += 1
-            
-        except Exception as e:
-            print(f"[ERROR] Failed to ingest {npy_path}: {e}")
-            error_count += 1
+        
+        cursor.executemany("""
+            INSERT INTO image_captions
+            (id, job_id, image_path, caption, caption_type, embedding_ref, metadata, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+        success_count = len(rows)
     
     conn.commit()
     conn.close()
     
+    if pending:
+        # The new slots become visible once the pointers to them are committed
+        store.publish()
+        print(f"[INFO] Embedding store: {store.path} ({len(store)} vectors)")
+    
     print("\n" + "="*60)
     print(f"[SUMMARY] Ingestion complete:")
     print(f"  ✅ Success: {success_count}")
@@ -173,7 +207,7 @@ def verify_database():
     
     cursor.execute("""
         SELECT COUNT(*) FROM image_captions 
-        WHERE embedding IS NOT NULL
+        WHERE embedding IS NOT NULL OR embedding_ref IS NOT NULL
     """)
     
     embedding_count = cursor.fetchone()[0]
@@ -197,6 +231,12 @@ def main():
         required=True,
         help="Advisor identifier (e.g., 'ansel', 'okeefe', 'all')"
     )
+    parser.add_argument(
+        "--model",
+        type=str,
+        default=DEFAULT_MODEL,
+        help=f"Model that produced the .npy files (default: {DEFAULT_MODEL})"
+    )
     parser.add_argument(
         "--verify",
         action="store_true",
@@ -212,7 +252,7 @@ def main():
     print(f"Database: {DB_PATH}")
     print("="*60 + "\n")
     
-    ingest_npy_embeddings(args.advisor_dir, args.advisor_id)
+    ingest_npy_embeddings(args.advisor_dir, args.advisor_id, args.model)
     
     if args.verify:
         verify_database()